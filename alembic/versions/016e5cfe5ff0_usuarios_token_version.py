@@ -0,0 +1,31 @@
+"""coluna token_version em usuarios (revogação de sessões)
+
+Revision ID: 016e5cfe5ff0
+Revises: eb6d59439a9e
+Create Date: 2026-10-19 07:20:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '016e5cfe5ff0'
+down_revision: Union[str, Sequence[str], None] = 'eb6d59439a9e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        'usuarios',
+        sa.Column('token_version', sa.Integer(), server_default='0', nullable=False),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('usuarios', 'token_version')
@@ -0,0 +1,47 @@
+"""tabela outbound_messages (outbox de envios WhatsApp)
+
+Revision ID: 1725a4df7597
+Revises: c5347fd7511b
+Create Date: 2026-10-19 07:40:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1725a4df7597'
+down_revision: Union[str, Sequence[str], None] = 'c5347fd7511b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'outbound_messages',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('empresa_id', sa.Integer(), sa.ForeignKey('empresas.id'), nullable=False),
+        sa.Column('to_number', sa.String(length=64), nullable=False),
+        sa.Column('body', sa.Text(), nullable=True),
+        sa.Column('template_sid', sa.String(length=64), nullable=True),
+        sa.Column('variables', sa.JSON(), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('next_attempt_at', sa.TIMESTAMP(), server_default=sa.func.now()),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('message_sid', sa.String(length=64), nullable=True),
+        sa.Column('created_at', sa.TIMESTAMP(), server_default=sa.func.now()),
+        sa.Column('sent_at', sa.TIMESTAMP(), nullable=True),
+    )
+    op.create_index('ix_outbound_messages_status', 'outbound_messages', ['status', 'next_attempt_at'])
+    op.create_index('ix_outbound_messages_conversa', 'outbound_messages', ['empresa_id', 'to_number', 'id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_outbound_messages_conversa', table_name='outbound_messages')
+    op.drop_index('ix_outbound_messages_status', table_name='outbound_messages')
+    op.drop_table('outbound_messages')
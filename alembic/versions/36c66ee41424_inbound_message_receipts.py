@@ -0,0 +1,37 @@
+"""tabela inbound_message_receipts (deduplicação de webhooks)
+
+Revision ID: 36c66ee41424
+Revises: 1725a4df7597
+Create Date: 2026-10-19 07:50:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '36c66ee41424'
+down_revision: Union[str, Sequence[str], None] = '1725a4df7597'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'inbound_message_receipts',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('message_sid', sa.String(length=64), nullable=False, unique=True),
+        sa.Column('empresa_slug', sa.String(length=100), nullable=True),
+        sa.Column('wa_id', sa.String(length=64), nullable=True),
+        sa.Column('received_at', sa.TIMESTAMP(), server_default=sa.func.now()),
+    )
+    op.create_index('ix_inbound_message_receipts_received_at', 'inbound_message_receipts', ['received_at'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_inbound_message_receipts_received_at', table_name='inbound_message_receipts')
+    op.drop_table('inbound_message_receipts')
@@ -0,0 +1,41 @@
+"""tabela trinks_client_identities (cache waid/CPF → cliente Trinks)
+
+Revision ID: 90bd048a68fb
+Revises: 36c66ee41424
+Create Date: 2026-10-19 08:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '90bd048a68fb'
+down_revision: Union[str, Sequence[str], None] = '36c66ee41424'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'trinks_client_identities',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('empresa_id', sa.Integer(), sa.ForeignKey('empresas.id'), nullable=False),
+        sa.Column('waid', sa.String(length=64), nullable=False),
+        sa.Column('cpf', sa.String(length=14), nullable=True),
+        sa.Column('trinks_cliente_id', sa.String(length=64), nullable=False),
+        sa.Column('nome', sa.String(length=255), nullable=True),
+        sa.Column('last_verified_at', sa.TIMESTAMP(), server_default=sa.func.now()),
+        sa.Column('created_at', sa.TIMESTAMP(), server_default=sa.func.now()),
+        sa.UniqueConstraint('empresa_id', 'waid', name='_trinks_client_identity_waid_uc'),
+    )
+    op.create_index('ix_trinks_client_identities_cpf', 'trinks_client_identities', ['empresa_id', 'cpf'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_trinks_client_identities_cpf', table_name='trinks_client_identities')
+    op.drop_table('trinks_client_identities')
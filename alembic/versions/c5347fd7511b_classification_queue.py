@@ -0,0 +1,43 @@
+"""tabela classification_queue (classificação em background)
+
+Revision ID: c5347fd7511b
+Revises: 016e5cfe5ff0
+Create Date: 2026-10-19 07:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5347fd7511b'
+down_revision: Union[str, Sequence[str], None] = '016e5cfe5ff0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'classification_queue',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('empresa_id', sa.Integer(), sa.ForeignKey('empresas.id'), nullable=False),
+        sa.Column('cliente_id', sa.String(length=100), nullable=False),
+        sa.Column('message_id', sa.Integer(), sa.ForeignKey('messages.id'), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('locked_at', sa.TIMESTAMP(), nullable=True),
+        sa.Column('processed_at', sa.TIMESTAMP(), nullable=True),
+        sa.Column('created_at', sa.TIMESTAMP(), server_default=sa.func.now()),
+        sa.UniqueConstraint('message_id', name='_classification_message_uc'),
+    )
+    op.create_index('ix_classification_queue_status', 'classification_queue', ['status', 'id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_classification_queue_status', table_name='classification_queue')
+    op.drop_table('classification_queue')
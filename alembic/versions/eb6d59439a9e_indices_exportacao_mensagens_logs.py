@@ -0,0 +1,40 @@
+"""índices (empresa_id, timestamp) para exportação de mensagens e logs
+
+Revision ID: eb6d59439a9e
+Revises: 
+Create Date: 2026-10-19 07:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'eb6d59439a9e'
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CONCURRENTLY não roda dentro de transação; messages e logs são tabelas
+    # grandes em produção e não podem ficar bloqueadas para escrita.
+    with op.get_context().autocommit_block():
+        op.execute(
+            'CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_messages_empresa_timestamp '
+            'ON messages (empresa_id, "timestamp")'
+        )
+        op.execute(
+            'CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_logs_empresa_timestamp '
+            'ON logs (empresa_id, "timestamp")'
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS ix_logs_empresa_timestamp')
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS ix_messages_empresa_timestamp')
@@ -42,29 +42,51 @@ from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
 from langchain_core.tools import tool as lc_tool
 import logging
 import json
+import threading
+import time
 import requests
 from datetime import datetime
 
 # Importar TrinksRules diretamente
 from rules.trinks_rules import TrinksRules
+from services.llm_gateway import get_llm, turn_budget, CHAT, MATCHING, CLASSIFICATION
+from services.structured_output import JSON_MODE, MatchResult, ProfessionalPreference, parse
 
 logger = logging.getLogger(__name__)
 
+# Instruções fixas do LLM da empresa: primeiro segmento do prompt (prefixo estável, reaproveitado em cache)
+COMPANY_LLM_INSTRUCTIONS = """INSTRUÇÕES:
+Analise a mensagem do usuário e responda de acordo com o prompt da empresa, considerando o contexto da conversa e as regras de negócio.
+
+PROIBIÇÕES (críticas):
+- NUNCA use respostas genéricas como "Vou processar sua solicitação", "Vou verificar", "Estou processando" ou similares.
+- NUNCA inclua a palavra "processar" como um reconhecimento vazio. Sua resposta deve ser imediatamente útil.
+
+REGRAS ESPECÍFICAS PARA AGENDAMENTO:
+- Se a intenção envolver agendamento e houver data presente, mas faltar horário (ex.: missing_data contém "horario" OU extracted_data tem "data" e "horario" ausente):
+  - Pergunte diretamente o horário preferido OU ofereça 2–3 opções claras.
+  - Não aguarde confirmação técnica nem informe que vai processar; vá direto à pergunta/alternativas.
+
+IMPORTANTE - MÚLTIPLAS MENSAGENS:
+Se você receber múltiplas mensagens (como agora), NÃO responda cada uma separadamente.
+Analise tudo junto e dê UMA resposta inteligente que aborde o contexto completo.
+
+EXEMPLO: Se o usuário disser 'Oi' + 'Tudo bem?', responda 'Oi! Tudo bem sim, obrigado! 😊 Como posso te ajudar hoje?'"""
+
 class SmartAgent:
     """Agente inteligente que usa LLM para identificar intenções e TrinksRules para executar fluxos"""
     
+    # Protege as entradas de _conversation_cache (turnos e resumos em background)
+    _conversation_cache_lock = threading.Lock()
+    
     def __init__(self, empresa_config: Dict[str, Any]):
         self.empresa_config = empresa_config
         
         # TrinksRules para operações específicas da API Trinks
         self.trinks_rules = TrinksRules()
         
-        # LLM para identificação inteligente de intenções
-        self.llm = ChatOpenAI(
-            api_key=empresa_config.get('openai_key'),
-            temperature=0.1,
-            model="gpt-4o"
-        )
+        # LLM da resposta ao cliente (modelo/timeout conforme a política da empresa no gateway)
+        self.llm = get_llm(CHAT, empresa_config, temperature=0.1)
         
         # Memory para contexto da conversa
         self.memory = ConversationBufferWindowMemory(
@@ -81,6 +103,12 @@ class SmartAgent:
         # Cache global de contextos por waid (WhatsApp ID)
         if not hasattr(SmartAgent, '_conversation_cache'):
             SmartAgent._conversation_cache = {}
+        
+        # Resumo das mensagens antigas e posição absoluta da 1ª mensagem em memória
+        self._conversation_summary = ""
+        self._memory_base = 0
+        # Campo(s) que o último turno do bot pediu (ver services/slot_filling.py)
+        self._awaiting = None
     
     def _save_log_to_db(self, level: str, message: str, details: dict = None):
         """Salva log no banco de dados com empresa_id"""
@@ -415,6 +443,7 @@ class SmartAgent:
             
             # ✅ ADICIONAR ao contexto para as Rules
             context['conversation_history'] = conversation_history
+            context['conversation_summary'] = self._conversation_summary
             context['waid'] = waid
             
             # ✅ NOVO: PASSAR CACHE TEMPORÁRIO como contexto
@@ -453,6 +482,13 @@ class SmartAgent:
             context['extracted_data'] = merged_data
             context['intent'] = intent
 
+            # ✅ PREFETCH: agenda do dia (e do próximo dia útil) em segundo plano enquanto o LLM planeja
+            try:
+                from services.availability_cache import prefetch_for_turn
+                prefetch_for_turn(self.empresa_config, intent, merged_data.get('data'), merged_data.get('servico_id'))
+            except Exception as e:
+                logger.warning(f"Falha ao disparar prefetch de agenda: {e}")
+
             # ✅ ARQUITETURA: 3) LLM de PRÓXIMOS PASSOS (Rules orquestra, Tools operam)
             try:
                 next_steps = self.trinks_rules.decide_next_steps(intent, context, self.empresa_config)
@@ -471,6 +507,7 @@ class SmartAgent:
             # ✅ DEBUG: Log da action recebida
             action = next_steps.get("action")
             logger.info(f"🎯 Action recebida: {action}")
+            awaited_missing = next_steps.get('missing_data', []) or []
             
             # ✅ DEBUG: Verificar se precisa executar action
             if action:
@@ -507,6 +544,7 @@ class SmartAgent:
                     for item in (suggested_missing + calc_missing):
                         if item not in missing_data:
                             missing_data.append(item)
+                    awaited_missing = missing_data
                     # Preparar results para o formatador
                     if result.get('status') == 'actions_executadas':
                         results_payload = result.get('results', {})
@@ -530,6 +568,10 @@ class SmartAgent:
                 # Para manter simplicidade: usar a mensagem pronta da LLM de próximos passos
                 result = next_steps.get("agent_response") or "Certo, me diga por favor o próximo detalhe (data/horário/CPF)."
             
+            # ✅ Registrar o que o bot está aguardando: a próxima resposta pode ser resolvida sem LLM
+            from services.slot_filling import build_awaiting
+            self._awaiting = build_awaiting(intent, awaited_missing, merged_data)
+            
             # ✅ ADICIONAR mensagem atual à memória LangChain
             self.memory.chat_memory.add_user_message(message)
             
@@ -589,15 +631,33 @@ class SmartAgent:
             "empresa": self.empresa_config.get('nome', 'N/A')
         }
     
+    def _reset_memory(self) -> None:
+        """Esvazia a memória LangChain (o cache por waid é a fonte de verdade)"""
+        try:
+            self.memory.chat_memory.clear()
+        except Exception:
+            self.memory.chat_memory.messages = []
+
     def _load_conversation_context(self, waid: str) -> None:
         """Carrega contexto de conversa do cache global"""
+        # Sempre recarregar do zero: agentes reutilizados não podem duplicar o histórico
+        self._reset_memory()
+        self._conversation_summary = ""
+        self._memory_base = 0
+        self._awaiting = None
         if waid in SmartAgent._conversation_cache:
-            cached_data = SmartAgent._conversation_cache[waid]
+            with SmartAgent._conversation_cache_lock:
+                cached_data = SmartAgent._conversation_cache[waid]
+                if isinstance(cached_data, dict):
+                    cached_data = dict(cached_data, messages=list(cached_data.get('messages', [])))
             logger.info(f"Carregando contexto para waid {waid}: {len(cached_data.get('messages', []))} mensagens")
             
             # ✅ CORREÇÃO: Acessar a estrutura correta do cache
             if isinstance(cached_data, dict) and 'messages' in cached_data:
                 cached_messages = cached_data['messages']
+                self._conversation_summary = cached_data.get('summary', '') or ''
+                self._memory_base = int(cached_data.get('base', 0))
+                self._awaiting = cached_data.get('awaiting')
                 # Log resumido do extracted_data salvo no cache
                 try:
                     ed = cached_data.get('extracted_data', {}) or {}
@@ -645,13 +705,30 @@ class SmartAgent:
                 # Fallback para diferentes tipos de mensagem
                 messages.append({'type': 'unknown', 'content': str(msg.content)})
         
-        # ✅ Salvar mensagens + dados extraídos
-        cache_data = {
-            'messages': messages,
-            'extracted_data': extracted_data or {}
-        }
+        # ✅ Salvar mensagens + dados extraídos (atualiza a entrada no lugar: um resumo
+        # em andamento continua válido e descarta as mensagens que ele já cobre)
+        from config import Config
+        from services.conversation_memory import trim_summarized, schedule_summarization
+        with SmartAgent._conversation_cache_lock:
+            cache_data = SmartAgent._conversation_cache.get(waid)
+            if not isinstance(cache_data, dict):
+                cache_data = {}
+                SmartAgent._conversation_cache[waid] = cache_data
+            cache_data['messages'] = messages
+            cache_data['base'] = self._memory_base
+            cache_data['awaiting'] = self._awaiting
+            cache_data['extracted_data'] = extracted_data or {}
+            trim_summarized(cache_data)
         
-        SmartAgent._conversation_cache[waid] = cache_data
+        # Resumir mensagens antigas em background quando acumular um lote
+        try:
+            schedule_summarization(
+                SmartAgent._conversation_cache, SmartAgent._conversation_cache_lock, waid,
+                self.empresa_config.get('openai_key'),
+                Config.MEMORY_RECENT_MESSAGES, Config.MEMORY_SUMMARY_BATCH
+            )
+        except Exception as e:
+            logger.error(f"Erro ao agendar resumo da conversa {waid}: {e}")
         logger.info(f"🗄️ Contexto + dados extraídos salvos para waid {waid}: {len(messages)} mensagens + {len(extracted_data) if extracted_data else 0} campos")
         try:
             ed = extracted_data or {}
@@ -828,7 +905,7 @@ class SmartAgent:
         """Executa verificação de disponibilidade com suporte a busca por profissional OU procedimento"""
         try:
             # Obter regras expandidas da API
-            api_rules = self.trinks_rules.get_availability_check_rules_expanded()
+            api_rules = self.trinks_rules.get_availability_check_rules_expanded(self.empresa_config)
             if not api_rules:
                 return "Erro: Regras de disponibilidade não configuradas"
             
@@ -1394,37 +1471,22 @@ RESPONDA APENAS em JSON válido."""
                 HumanMessage(content=f"Identifique o profissional '{nome_procurado}' na lista fornecida.")
             ]
             
-            response = self.llm.invoke(messages)
+            response = get_llm(MATCHING, self.empresa_config, temperature=0.1).invoke(messages, **JSON_MODE)
             logger.info(f"Resposta do LLM para match: {response.content}")
             
-            # Limpar e parsear resposta
-            content = response.content.strip()
-            if content.startswith('```json'):
-                content = content[7:-3]  # Remove ```json e ```
-            elif content.startswith('```'):
-                content = content[3:-3]  # Remove ``` genérico
+            match_result = parse('smart_agent.match_professional', response, MatchResult)
+            if match_result is None:
+                return None
             
-            content = content.strip()
-            logger.info(f"Conteúdo limpo para parse: {content}")
+            # Buscar o profissional completo na lista original
+            for prof in profissionais:
+                if str(prof.get('id')) == str(match_result.id):
+                    logger.info(f"LLM encontrou profissional: {prof['nome']} (confiança: {match_result.confianca or 'N/A'})")
+                    logger.info(f"Razão do match: {match_result.razao or 'N/A'}")
+                    return prof
             
-            try:
-                match_result = json.loads(content)
-                
-                # Buscar o profissional completo na lista original
-                profissional_id = match_result.get('id')
-                for prof in profissionais:
-                    if str(prof.get('id')) == str(profissional_id):
-                        logger.info(f"LLM encontrou profissional: {prof['nome']} (confiança: {match_result.get('confianca', 'N/A')})")
-                        logger.info(f"Razão do match: {match_result.get('razao', 'N/A')}")
-                        return prof
-                
-                logger.error(f"ID retornado pelo LLM não encontrado na lista: {profissional_id}")
-                return None
-                
-            except json.JSONDecodeError as e:
-                logger.error(f"Erro ao parsear resposta do LLM: {e}")
-                logger.error(f"Resposta recebida: {response.content}")
-                return None
+            logger.error(f"ID retornado pelo LLM não encontrado na lista: {match_result.id}")
+            return None
             
         except Exception as e:
             logger.error(f"Erro no match inteligente com LLM: {e}")
@@ -1602,35 +1664,21 @@ RESPONDA APENAS em JSON válido."""
                 HumanMessage(content=f"Identifique o serviço '{nome_procurado}' na lista fornecida.")
             ]
             
-            response = self.llm.invoke(messages)
+            response = get_llm(MATCHING, self.empresa_config, temperature=0.1).invoke(messages, **JSON_MODE)
             logger.info(f"Resposta do LLM para match de serviço: {response.content}")
             
-            # Limpar e parsear resposta
-            content = response.content.strip()
-            if content.startswith('```json'):
-                content = content[7:-3]  # Remove ```json e ```
-            elif content.startswith('```'):
-                content = content[3:-3]  # Remove ``` genérico
-            
-            content = content.strip()
-            logger.info(f"Conteúdo limpo para parse: {content}")
-            
-            match_result = json.loads(content)
+            match_result = parse('smart_agent.match_service', response, MatchResult)
+            if match_result is None:
+                return None
             
             # Buscar o serviço completo na lista original
-            servico_id = match_result.get('id')
             for serv in servicos:
-                if str(serv.get('id')) == str(servico_id):
-                    logger.info(f"LLM encontrou serviço: {serv['nome']} (confiança: {match_result.get('confianca', 'N/A')})")
-                    logger.info(f"Razão do match: {match_result.get('razao', 'N/A')}")
+                if str(serv.get('id')) == str(match_result.id):
+                    logger.info(f"LLM encontrou serviço: {serv['nome']} (confiança: {match_result.confianca or 'N/A'})")
+                    logger.info(f"Razão do match: {match_result.razao or 'N/A'}")
                     return serv
             
-            logger.error(f"ID retornado pelo LLM não encontrado na lista: {servico_id}")
-            return None
-            
-        except json.JSONDecodeError as e:
-            logger.error(f"Erro ao parsear resposta do LLM: {e}")
-            logger.error(f"Resposta recebida: {response.content}")
+            logger.error(f"ID retornado pelo LLM não encontrado na lista: {match_result.id}")
             return None
         
         except Exception as e:
@@ -1770,26 +1818,14 @@ RESPONDA APENAS em JSON válido."""
                 HumanMessage(content=mensagem)
             ]
             
-            response = self.llm.invoke(messages)
-            content = response.content.strip()
-            
-            # Limpar resposta do LLM
-            if content.startswith('```json'):
-                content = content[7:-3]
-            elif content.startswith('```'):
-                content = content[3:-3]
+            response = get_llm(CLASSIFICATION, self.empresa_config, temperature=0.1).invoke(messages, **JSON_MODE)
+            logger.info(f"Resposta do LLM para preferência: {response.content}")
             
-            content = content.strip()
-            logger.info(f"Resposta do LLM para preferência: {content}")
-            
-            # Parsear JSON
-            try:
-                result = json.loads(content)
-                logger.info(f"Preferência detectada: {result}")
-                return result
-            except json.JSONDecodeError as e:
-                logger.error(f"Erro ao parsear JSON da preferência: {e}")
+            result = parse('smart_agent.professional_preference', response, ProfessionalPreference)
+            if result is None:
                 return {"tem_preferencia": True, "profissional_especifico": None, "razao": "Erro no parse"}
+            logger.info(f"Preferência detectada: {result}")
+            return result.model_dump()
                 
         except Exception as e:
             logger.error(f"Erro ao detectar preferência de profissional: {e}")
@@ -1990,35 +2026,46 @@ RESPONDA APENAS em JSON válido."""
             }
     
     def _execute_multiple_actions(self, actions: list, extracted_data: Dict[str, Any], next_steps: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
-        """✅ NOVA FUNÇÃO: Executa múltiplas actions em sequência e retorna resultados estruturados"""
+        """✅ NOVA FUNÇÃO: Executa múltiplas actions e retorna resultados estruturados
+
+        Actions independentes (ex.: buscar_profissional e buscar_servico) rodam em paralelo
+        conforme TrinksRules.get_step_specs(); resultados e cache_instructions são aplicados
+        na ordem do plano, e a execução para no primeiro erro (services/step_graph.py).
+        """
         try:
-            logger.info(f"🔄 Executando {len(actions)} actions em sequência: {actions}")
-            
-            results = {}
-            for i, action in enumerate(actions):
-                logger.info(f"🔄 Executando action {i+1}/{len(actions)}: {action}")
-                
-                # Executar action individual
-                step_result = self.trinks_rules.execute_step(action, extracted_data, self.empresa_config, context)
+            from services.step_graph import execute_plan
+            from services.llm_gateway import bind_turn, current_turn
+
+            logger.info(f"🔄 Executando {len(actions)} actions: {actions}")
+            turn = current_turn()
+
+            def _run(action: str, data: Dict[str, Any]) -> Dict[str, Any]:
+                # Threads do executor herdam o prazo do turno (LLM gateway)
+                with bind_turn(turn):
+                    return self.trinks_rules.execute_step(action, data, self.empresa_config, context)
+
+            def _apply(action: str, step_result: Dict[str, Any]) -> None:
                 logger.info(f"🔧 Resultado da execução {action}: {step_result}")
-                
                 # ✅ NOVO: Seguir instruções de cache das Rules
                 if step_result.get('cache_instructions'):
                     logger.info(f"📋 Seguindo instruções de cache para {action}: {step_result.get('cache_instructions')}")
                     self._update_cache_from_instructions(step_result.get('cache_instructions'), extracted_data)
-                
-                # Armazenar resultado estruturado
-                results[action] = step_result
-                
-                # Se falhou, parar execução
                 if step_result.get('status') == 'erro':
                     logger.error(f"❌ Action {action} falhou, parando execução")
-                    break
-            
+
+            plan = execute_plan(
+                actions,
+                self.trinks_rules.get_step_specs(),
+                extracted_data,
+                _run,
+                _apply,
+                lambda step_result: step_result.get('status') == 'erro'
+            )
+
             # Retornar resultados estruturados para análise posterior
             return {
                 "status": "actions_executadas",
-                "results": results,
+                "results": plan['results'],
                 "actions_executadas": actions
             }
                 
@@ -2114,6 +2161,19 @@ RESPONDA APENAS em JSON válido."""
             logger.error(f"Erro ao formatar knowledge: {e}")
             return "Erro ao carregar informações da empresa"
 
+    def _select_company_knowledge(self, query: str):
+        """Knowledge relevante para a consulta via índice BM25 da empresa. Retorna (texto, modo)"""
+        try:
+            from services.knowledge_index import select_knowledge
+            return select_knowledge(
+                self.empresa_config.get('empresa_id') or 0,
+                self.empresa_config.get('knowledge_json', {}),
+                query
+            )
+        except Exception as e:
+            logger.error(f"Erro na recuperação de knowledge, usando base completa: {e}")
+            return self._format_company_knowledge(), 'full'
+
     def _format_conversation_history(self, messages: List) -> str:
         """Formata histórico da conversa para o prompt"""
         if not messages:
@@ -2127,14 +2187,26 @@ RESPONDA APENAS em JSON válido."""
         
         return "\n".join(formatted)
 
-    def _analyze_with_company_llm(self, message: str, context: Dict) -> str:
-        """LLM da empresa analisa TUDO e decide o caminho"""
-        
-        # ✅ OBTER histórico da memória LangChain
-        conversation_history = []
-        if self.memory.chat_memory.messages:
-            conversation_history = self.memory.chat_memory.messages[-6:]
-        
+    def _build_analysis_prompt(self, message: str, conversation_history: List, context: Dict,
+                               conversation_state: str = None):
+        """Prompt em camadas do LLM da empresa.
+
+        Com `conversation_state` (turno de FAQ que vai para o cache de respostas) o prompt
+        leva só instruções + empresa + knowledge: nada do cliente entra na resposta compartilhada.
+        """
+        from services.prompt_builder import PromptBuilder, STATIC, TENANT, CONVERSATION, TURN
+        if conversation_state:
+            builder = PromptBuilder('smart_agent.analyze')
+            builder.add(STATIC, COMPANY_LLM_INSTRUCTIONS)
+            builder.add(TENANT, f"Você é um assistente virtual da {self.empresa_config.get('nome', 'Empresa')}.")
+            builder.add(TENANT, self.empresa_config.get('prompt', ''), title="PROMPT DA EMPRESA", max_tokens=2000)
+            knowledge_text, knowledge_mode = self._select_company_knowledge(message)
+            builder.add(TENANT if knowledge_mode == 'full' else TURN, knowledge_text,
+                        title="KNOWLEDGE DA EMPRESA", max_tokens=3000)
+            builder.add(TURN, "Conversa em andamento: responda sem saudação inicial." if conversation_state == 'andamento'
+                        else "Início de conversa.", title="ESTADO DA CONVERSA")
+            return builder
+
         # ✅ OBTER regras de negócio do contexto
         business_rules = context.get('business_rules', [])
         
@@ -2149,57 +2221,80 @@ RESPONDA APENAS em JSON válido."""
         # ✅ COMBINAR para contemplar ambos os casos de uso
         tools_data = results if results else action_data
         
-        system_prompt = f"""Você é um assistente virtual da {self.empresa_config.get('nome', 'Empresa')}.
-
-PROMPT DA EMPRESA:
-{self.empresa_config.get('prompt', '')}
-
-KNOWLEDGE DA EMPRESA:
-{self._format_company_knowledge()}
-
-HISTÓRICO DA CONVERSA (últimas 6 mensagens):
-{self._format_conversation_history(conversation_history)}
-
-REGRAS DE NEGÓCIO:
-{business_rules if business_rules else 'Nenhuma regra específica definida'}
-
-DADOS EXTRAÍDOS:
-{json.dumps(extracted_data, indent=2, ensure_ascii=False, default=str) if extracted_data else 'Nenhum dado extraído'}
-
-TIPO DE AÇÃO:
-{action_type}
-
-DADOS DA AÇÃO:
-{json.dumps(tools_data, indent=2, ensure_ascii=False, default=str) if tools_data else 'Nenhum dado de ação'}
-
-MISSING_DATA (se houver):
-{json.dumps((tools_data or {}).get('missing_data', []), indent=2, ensure_ascii=False, default=str)}
-
-INSTRUÇÕES:
-Analise a mensagem do usuário e responda de acordo com o prompt da empresa, considerando o contexto da conversa e as regras de negócio.
-
-PROIBIÇÕES (críticas):
-- NUNCA use respostas genéricas como "Vou processar sua solicitação", "Vou verificar", "Estou processando" ou similares.
-- NUNCA inclua a palavra "processar" como um reconhecimento vazio. Sua resposta deve ser imediatamente útil.
-
-REGRAS ESPECÍFICAS PARA AGENDAMENTO:
-- Se a intenção envolver agendamento e houver data presente, mas faltar horário (ex.: missing_data contém "horario" OU extracted_data tem "data" e "horario" ausente):
-  - Pergunte diretamente o horário preferido OU ofereça 2–3 opções claras.
-  - Não aguarde confirmação técnica nem informe que vai processar; vá direto à pergunta/alternativas.
-
-IMPORTANTE - MÚLTIPLAS MENSAGENS:
-Se você receber múltiplas mensagens (como agora), NÃO responda cada uma separadamente.
-Analise tudo junto e dê UMA resposta inteligente que aborde o contexto completo.
+        # ✅ PROMPT EM CAMADAS: instruções fixas → empresa → conversa → dados do turno
+        # (prefixo idêntico entre turnos e empresas = cache de prompt do provedor)
+        builder = PromptBuilder('smart_agent.analyze')
+        builder.add(STATIC, COMPANY_LLM_INSTRUCTIONS)
+        builder.add(TENANT, f"Você é um assistente virtual da {self.empresa_config.get('nome', 'Empresa')}.")
+        builder.add(TENANT, self.empresa_config.get('prompt', ''), title="PROMPT DA EMPRESA", max_tokens=2000)
+        # Knowledge: base pequena vai inteira (prefixo estável); base grande só com os itens
+        # relevantes para a mensagem + histórico recente, no fim do prompt (varia por turno)
+        knowledge_query = " ".join([message] + [str(getattr(m, 'content', '')) for m in conversation_history[-2:]])
+        knowledge_text, knowledge_mode = self._select_company_knowledge(knowledge_query)
+        knowledge_level = TENANT if knowledge_mode == 'full' else TURN
+        builder.add(knowledge_level, knowledge_text, title="KNOWLEDGE DA EMPRESA", max_tokens=3000)
+        builder.add(CONVERSATION, self._conversation_summary, title="RESUMO DA CONVERSA ANTERIOR", max_tokens=400)
+        builder.add(CONVERSATION, self._format_conversation_history(conversation_history),
+                    title="HISTÓRICO DA CONVERSA (últimas 6 mensagens)", max_tokens=1500, keep='tail')
+        builder.add(TURN, business_rules if business_rules else 'Nenhuma regra específica definida',
+                    title="REGRAS DE NEGÓCIO", max_tokens=500)
+        builder.add(TURN, extracted_data if extracted_data else 'Nenhum dado extraído', title="DADOS EXTRAÍDOS", max_tokens=500)
+        builder.add(TURN, action_type, title="TIPO DE AÇÃO")
+        builder.add(TURN, tools_data if tools_data else 'Nenhum dado de ação', title="DADOS DA AÇÃO", max_tokens=1500)
+        builder.add(TURN, (tools_data or {}).get('missing_data', []) or '[]', title="MISSING_DATA (se houver)")
+        return builder
 
-EXEMPLO: Se o usuário disser 'Oi' + 'Tudo bem?', responda 'Oi! Tudo bem sim, obrigado! 😊 Como posso te ajudar hoje?'"""
+    def _analyze_with_company_llm(self, message: str, context: Dict) -> str:
+        """LLM da empresa analisa TUDO e decide o caminho"""
+        
+        # ✅ OBTER histórico da memória LangChain
+        conversation_history = []
+        if self.memory.chat_memory.messages:
+            conversation_history = self.memory.chat_memory.messages[-6:]
+        
+        # ✅ CACHE DE FAQ: perguntas independentes do contexto têm a mesma resposta para o mesmo prompt/knowledge.
+        # Esses turnos são respondidos com um prompt SEM dados do cliente (resumo, histórico, dados extraídos,
+        # dados das tools): a resposta guardada é compartilhada entre todos os clientes da empresa.
+        from services import response_cache
+        from config import Config
+        cache_args = None
+        if Config.RESPONSE_CACHE_ENABLED:
+            if response_cache.is_context_free(message, self._awaiting):
+                cache_args = (
+                    self.empresa_config.get('empresa_id') or self.empresa_config.get('slug') or 0,
+                    response_cache.knowledge_version(self.empresa_config),
+                    message,
+                    response_cache.conversation_state(bool(conversation_history or self._conversation_summary)),
+                )
+                cached = response_cache.lookup(*cache_args)
+                if cached is not None:
+                    return cached
+            else:
+                response_cache.count_skip()
+        
+        builder = self._build_analysis_prompt(message, conversation_history, context,
+                                              conversation_state=cache_args[3] if cache_args else None)
+        system_prompt = builder.build()
 
         # ✅ UMA CHAMADA LLM que decide tudo
+        from services.prompt_builder import record_usage
+        started = time.perf_counter()
         response = self.llm.invoke([
             SystemMessage(content=system_prompt),
             HumanMessage(content=message)
         ])
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        record_usage('smart_agent.analyze', response, builder)
+        content = response.content.strip()
         
-        return response.content.strip()
+        # Só respostas diretas entram no cache ("vou processar" segue para o fluxo completo)
+        if cache_args and content and "processar" not in content.lower():
+            from services.prompt_builder import _extract_usage
+            usage = _extract_usage(response)
+            response_cache.store(*cache_args, content, elapsed_ms,
+                                 usage.get('prompt_tokens', 0) + usage.get('completion_tokens', 0))
+        
+        return content
 
     def _call_complete_flow(self, message: str, waid: str, context: Dict) -> str:
         """Chama o fluxo completo baseado na API ativa da empresa"""
@@ -2240,13 +2335,32 @@ EXEMPLO: Se o usuário disser 'Oi' + 'Tudo bem?', responda 'Oi! Tudo bem sim, ob
             )
 
     def analyze_and_respond(self, message: str, waid: str, context: Dict[str, Any] = None) -> str:
-        """Método principal que analisa e decide o caminho"""
+        """Método principal: processa o turno dentro do prazo do gateway de LLM.
+
+        Se o gateway recusar chamadas (circuito aberto, fila cheia ou prazo esgotado),
+        responde com a mensagem de instabilidade em vez de esperar o provedor.
+        """
+        with turn_budget() as turn:
+            response = self._analyze_and_respond(message, waid, context)
+        if turn.get('degraded'):
+            from config import Config
+            logger.warning(f"🚧 Resposta degradada para {waid}: {turn['degraded']}")
+            return Config.LLM_DEGRADED_REPLY
+        return response
+
+    def _analyze_and_respond(self, message: str, waid: str, context: Dict[str, Any] = None) -> str:
+        """Analisa a mensagem e decide o caminho"""
         try:
             logger.info(f"Analisando mensagem para waid {waid}")
             
             # ✅ CARREGAR contexto do cache por waid
             self._load_conversation_context(waid)
             
+            # ✅ CAMINHO RÁPIDO: resposta a um campo que o bot pediu (CPF, horário, menu 1/2/3)
+            fast_response = self._try_slot_filling(message, waid, context)
+            if fast_response is not None:
+                return fast_response
+            
             # ✅ PRIMEIRO: Análise inteligente com LLM da empresa
             response = self._analyze_with_company_llm(message, context)
             
@@ -2271,6 +2385,124 @@ EXEMPLO: Se o usuário disser 'Oi' + 'Tudo bem?', responda 'Oi! Tudo bem sim, ob
             logger.error(f"Erro na análise: {e}")
             return "Ocorreu um erro. Tente novamente."
 
+    def _plan_slot_filling(self, awaiting: Dict[str, Any], resolved: Dict[str, Any], data: Dict[str, Any]):
+        """Decide de forma determinística (intent, passos, campos faltantes) para os campos resolvidos.
+
+        Retorna None quando o caso não é coberto pelo caminho rápido (segue para os LLMs).
+        """
+        intent = awaiting.get('intent') or 'general'
+
+        choice = resolved.get('menu')
+        if choice:
+            agendamento_id = data.get('agendamento_id') or data.get('appointment_id')
+            if choice == 'remarcar':
+                data['data_atual'] = data.get('data')
+                return 'reagendar_consulta', [], ['nova_data']
+            if not agendamento_id:
+                return None
+            data['agendamento_id'] = agendamento_id
+            if choice == 'confirmar':
+                return 'confirmar_agendamento', ['confirmar_presenca'], []
+            if choice == 'cancelar':
+                data['motivo'] = 'Cliente cancelou pela resposta ao lembrete de confirmação'
+                return 'cancelar_consulta', ['cancelar_agendamento'], []
+            return None
+
+        if intent != 'agendar_consulta':
+            return None
+
+        if 'data' in resolved and 'horario' not in resolved:
+            # Nova data invalida o horário anterior
+            data.pop('horario', None)
+        if 'data' in resolved or 'horario' in resolved:
+            return intent, ['verificar_disponibilidade'], []
+
+        missing = [f for f in ('cpf', 'nome') if not data.get(f)]
+        if data.get('cliente_id') or not missing:
+            if data.get('data') and data.get('horario'):
+                return intent, ['coletar_cliente', 'criar_reserva'], []
+            return None
+        return intent, [], missing
+
+    def _try_slot_filling(self, message: str, waid: str, context: Dict[str, Any] = None):
+        """Caminho rápido sem LLM de análise/extração: se o turno anterior pediu um campo
+        (CPF, nome, horário ou opção de menu) e a mensagem é reconhecida pelos parsers locais,
+        executa os passos direto via TrinksRules.execute_step. Retorna None para seguir o fluxo normal.
+        """
+        try:
+            from services.slot_filling import resolve_awaited, build_awaiting, slot_available
+            awaiting = self._awaiting
+            if not awaiting or not self.empresa_config.get('trinks_enabled'):
+                return None
+
+            resolved = resolve_awaited(awaiting, message)
+            if not resolved:
+                logger.info(f"🧩 Campo aguardado {awaiting.get('fields')} não reconhecido - seguindo para o LLM")
+                return None
+
+            with SmartAgent._conversation_cache_lock:
+                cached = SmartAgent._conversation_cache.get(waid) or {}
+                merged_data = dict(cached.get('extracted_data') or {})
+            merged_data.update({k: v for k, v in resolved.items() if k != 'menu'})
+
+            plan = self._plan_slot_filling(awaiting, resolved, merged_data)
+            if not plan:
+                logger.info(f"🧩 Campos {resolved} sem plano determinístico - seguindo para o LLM")
+                return None
+            intent, steps, missing_data = plan
+            logger.info(f"⚡ Slot-filling: {resolved} → intent={intent}, passos={steps}, faltando={missing_data}")
+
+            if context is None:
+                context = {}
+            context['conversation_history'] = self.memory.chat_memory.messages[-10:]
+            context['conversation_summary'] = self._conversation_summary
+            context['waid'] = waid
+            context['extracted_data'] = merged_data
+            context['intent'] = intent
+
+            self._last_enriched_extracted_data = None
+            if steps:
+                result = self._execute_multiple_actions(steps, merged_data, {}, context)
+                results = result.get('results', {})
+                first = results.get(steps[0]) if isinstance(results, dict) else None
+                if result.get('status') == 'erro' or (isinstance(first, dict) and first.get('status') == 'erro'):
+                    # Ex.: serviço ainda não identificado - o fluxo completo resolve
+                    return None
+            else:
+                results = {}
+
+            # Horário pedido indisponível (ou só data informada): aguarda horário (o formatador oferece as opções)
+            if 'verificar_disponibilidade' in results:
+                if not merged_data.get('horario'):
+                    missing_data = ['horario']
+                elif slot_available(results['verificar_disponibilidade'], merged_data.get('horario')):
+                    missing_data = [f for f in ('cpf', 'nome') if not merged_data.get(f)] if not merged_data.get('cliente_id') else []
+                else:
+                    merged_data['horario_solicitado'] = merged_data.pop('horario', None)
+                    missing_data = ['horario']
+
+            formatter_payload = {
+                'results': results,
+                'extracted_data': merged_data,
+                'business_rules': [],
+                'missing_data': missing_data,
+                'context': context
+            }
+            response = self._generate_response_with_company_prompt(intent, formatter_payload, context)
+
+            self.memory.chat_memory.add_user_message(message)
+            self.memory.chat_memory.add_ai_message(response)
+            self._awaiting = build_awaiting(intent, missing_data, merged_data)
+
+            enriched = getattr(self, '_last_enriched_extracted_data', None)
+            data_to_cache = dict(merged_data, **enriched) if isinstance(enriched, dict) and enriched else merged_data
+            self._save_conversation_context(waid, data_to_cache)
+            return response
+
+        except Exception as e:
+            logger.error(f"Erro no caminho rápido de slot-filling, seguindo para o LLM: {e}")
+            return None
+
     def _call_trinks_flow(self, message: str, waid: str, context: Dict) -> str:
         """Chama fluxo Trinks (process_message atual)"""
         return self.process_message(message, waid, context)
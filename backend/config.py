@@ -23,6 +23,10 @@ class Config:
     # JWT
     SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here-change-in-production")
     ALGORITHM = "HS256"
+    # TTL (segundos) do cache de usuário autenticado (claims do token com versão conferida no
+    # banco) em get_current_user. O cache é local a cada réplica: tokens revogados em outra
+    # réplica (senha/permissões alteradas) ainda valem aqui por até esse tempo (0 desativa o cache)
+    AUTH_PRINCIPAL_CACHE_TTL = int(os.getenv("AUTH_PRINCIPAL_CACHE_TTL", "60"))
     
     # Twilio
     TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID", "")
@@ -30,6 +34,84 @@ class Config:
     
     # OpenAI
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
+
+    # Classificação de mensagens por label (worker em background)
+    CLASSIFICATION_WORKER_ENABLED = os.getenv("CLASSIFICATION_WORKER_ENABLED", "true").lower() == "true"
+    CLASSIFIER_BATCH_SIZE = int(os.getenv("CLASSIFIER_BATCH_SIZE", "20"))  # mensagens por chamada ao LLM
+    CLASSIFIER_CALLS_PER_MINUTE = int(os.getenv("CLASSIFIER_CALLS_PER_MINUTE", "30"))  # por empresa
+    CLASSIFIER_POLL_SECONDS = float(os.getenv("CLASSIFIER_POLL_SECONDS", "2"))
+    
+    # Knowledge da empresa no prompt: bases até este tamanho vão inteiras; maiores usam recuperação top-k
+    KNOWLEDGE_FULL_MAX_TOKENS = int(os.getenv("KNOWLEDGE_FULL_MAX_TOKENS", "800"))
+    KNOWLEDGE_TOP_K = int(os.getenv("KNOWLEDGE_TOP_K", "6"))
+
+    # Memória de conversa: últimas mensagens literais + resumo incremental das anteriores
+    MEMORY_RECENT_MESSAGES = int(os.getenv("MEMORY_RECENT_MESSAGES", "6"))
+    MEMORY_SUMMARY_BATCH = int(os.getenv("MEMORY_SUMMARY_BATCH", "6"))  # mensagens acumuladas antes de resumir
+    MEMORY_SUMMARY_MAX_TOKENS = int(os.getenv("MEMORY_SUMMARY_MAX_TOKENS", "300"))
+    MEMORY_SUMMARY_MODEL = os.getenv("MEMORY_SUMMARY_MODEL", "gpt-4o-mini")
+
+    # Gateway de LLM: política global por tarefa (JSON), ex.: {"matching": {"model": "gpt-4o-mini", "timeout": 8}}
+    # Empresas podem sobrescrever em openai_config.llm_policy (services/llm_gateway.py)
+    LLM_POLICY = os.getenv("LLM_POLICY", "")
+    # Resiliência do gateway: prazo do turno, concorrência, circuit breaker e hedge
+    LLM_TURN_BUDGET_SECONDS = float(os.getenv("LLM_TURN_BUDGET_SECONDS", "60"))
+    LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+    LLM_TENANT_MAX_CONCURRENCY = int(os.getenv("LLM_TENANT_MAX_CONCURRENCY", "8"))
+    LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "10"))
+    LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+    LLM_BREAKER_COOLDOWN_SECONDS = float(os.getenv("LLM_BREAKER_COOLDOWN_SECONDS", "30"))
+    LLM_HEDGE_WORKERS = int(os.getenv("LLM_HEDGE_WORKERS", "8"))
+    LLM_DEGRADED_REPLY = os.getenv(
+        "LLM_DEGRADED_REPLY",
+        "Recebemos sua mensagem! Estamos com uma instabilidade momentânea e já retornamos em instantes."
+    )
+
+    # Cache de respostas de FAQ por empresa (services/response_cache.py)
+    RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+    RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "500"))  # por empresa
+    RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.85"))  # Jaccard; 0 desativa
+
+    # Agenda do dia (/agendamentos/profissionais/{data}): cache curto + prefetch especulativo no turno
+    AVAILABILITY_PREFETCH_ENABLED = os.getenv("AVAILABILITY_PREFETCH_ENABLED", "true").lower() == "true"
+    AVAILABILITY_CACHE_TTL_SECONDS = int(os.getenv("AVAILABILITY_CACHE_TTL_SECONDS", "60"))
+    AVAILABILITY_PREFETCH_WORKERS = int(os.getenv("AVAILABILITY_PREFETCH_WORKERS", "4"))
+
+    # Passos independentes de um plano (buscar_profissional, buscar_servico...) em paralelo
+    FLOW_STEP_WORKERS = int(os.getenv("FLOW_STEP_WORKERS", "4"))
+
+    # Pipeline de mensagens recebidas: turnos do agente em paralelo por processo
+    INBOUND_MAX_CONCURRENCY = int(os.getenv("INBOUND_MAX_CONCURRENCY", "16"))
+    INBOUND_DEDUPE_MEMORY_SIZE = int(os.getenv("INBOUND_DEDUPE_MEMORY_SIZE", "20000"))  # MessageSids lembrados em memória
+    INBOUND_DEDUPE_RETENTION_HOURS = int(os.getenv("INBOUND_DEDUPE_RETENTION_HOURS", "48"))  # limpeza da tabela de recibos
+
+    # Cache de identidade de clientes Trinks (waid/CPF → cliente_id)
+    CLIENT_IDENTITY_TTL_DAYS = int(os.getenv("CLIENT_IDENTITY_TTL_DAYS", "30"))  # depois disso o cliente é revalidado na API
+    CLIENT_IDENTITY_MEMORY_SIZE = int(os.getenv("CLIENT_IDENTITY_MEMORY_SIZE", "20000"))  # entradas lembradas em memória
+
+    # Transcrição de áudio (Whisper)
+    TRANSCRIPTION_WORKERS = int(os.getenv("TRANSCRIPTION_WORKERS", "4"))  # transcrições em paralelo
+    TRANSCRIPTION_MAX_BYTES = int(os.getenv("TRANSCRIPTION_MAX_BYTES", str(16 * 1024 * 1024)))  # limite do download
+    TRANSCRIPTION_CACHE_SIZE = int(os.getenv("TRANSCRIPTION_CACHE_SIZE", "1000"))  # transcrições lembradas por media SID
+
+    # Outbox de mensagens Twilio
+    OUTBOX_WORKER_ENABLED = os.getenv("OUTBOX_WORKER_ENABLED", "true").lower() == "true"
+    OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", "8"))  # conversas enviadas em paralelo
+    OUTBOX_SENDS_PER_SECOND = float(os.getenv("OUTBOX_SENDS_PER_SECOND", "10"))  # por número remetente
+    OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+    OUTBOX_PART_DELAY_SECONDS = float(os.getenv("OUTBOX_PART_DELAY_SECONDS", "0.5"))  # pausa entre partes da mesma conversa
+
+    # Lembretes de confirmação
+    CONFIRMATION_PREFETCH_WORKERS = int(os.getenv("CONFIRMATION_PREFETCH_WORKERS", "8"))  # buscas paralelas de clientes na Trinks
+    CONFIRMATION_SEND_WORKERS = int(os.getenv("CONFIRMATION_SEND_WORKERS", "4"))  # envios paralelos via Twilio
+    CONFIRMATION_SENDS_PER_SECOND = float(os.getenv("CONFIRMATION_SENDS_PER_SECOND", "5"))
+    REMINDER_SCHEDULER_ENABLED = os.getenv("REMINDER_SCHEDULER_ENABLED", "true").lower() == "true"
+    REMINDER_SCHEDULER_WORKERS = int(os.getenv("REMINDER_SCHEDULER_WORKERS", "4"))  # empresas executadas em paralelo
+    TRINKS_RANGE_FETCH_WORKERS = int(os.getenv("TRINKS_RANGE_FETCH_WORKERS", "4"))  # páginas/dias da agenda buscados em paralelo
+    TRINKS_RANGE_PAGE_SIZE = int(os.getenv("TRINKS_RANGE_PAGE_SIZE", "50"))  # agendamentos por página
+    TRINKS_RANGE_MEMO_SECONDS = int(os.getenv("TRINKS_RANGE_MEMO_SECONDS", "600"))  # listagem reaproveitada dentro da execução dos lembretes
+    REMINDER_CATCHUP_HOURS = float(os.getenv("REMINDER_CATCHUP_HOURS", "6"))  # atraso máximo para recuperar execução perdida
     
     # Google
     GOOGLE_CREDENTIALS = os.getenv("GOOGLE_CREDENTIALS", "")
@@ -1,6 +1,7 @@
 import openai
 import logging
-from typing import Dict, Any, Optional
+import time
+from typing import Dict, Any, List, Optional
 # from ..config import Config  # not required here
 
 logger = logging.getLogger(__name__)
@@ -11,6 +12,25 @@ class OpenAIService:
     def __init__(self, api_key: str):
         self.client = openai.OpenAI(api_key=api_key)
     
+    def _classification_completion(self, messages: List[Dict[str, Any]], max_tokens: int):
+        """Chamada de classificação com modelo/timeout da política do gateway (tarefa 'classification')"""
+        from services.llm_gateway import resolve_policy, record_call, CLASSIFICATION
+        policy = resolve_policy(CLASSIFICATION)
+        started = time.perf_counter()
+        try:
+            response = self.client.chat.completions.create(
+                model=policy['model'],
+                messages=messages,
+                temperature=0.2,
+                max_tokens=max_tokens,
+                timeout=policy.get('timeout')
+            )
+        except Exception:
+            record_call(CLASSIFICATION, policy['model'], (time.perf_counter() - started) * 1000, error=True)
+            raise
+        record_call(CLASSIFICATION, policy['model'], (time.perf_counter() - started) * 1000, response)
+        return response
+    
     def process_text_message(self, message: str, context: Dict[str, Any], empresa_config: Dict[str, Any]) -> str:
         """Processa mensagem de texto usando OpenAI"""
         try:
@@ -72,37 +92,114 @@ class OpenAIService:
             logger.error(f"Erro ao gerar resposta com contexto: {e}")
             return "Desculpe, tive um problema técnico."
     
-    def transcribe_audio(self, audio_url: str, twilio_sid: str, twilio_token: str) -> str:
-        """Transcreve áudio usando OpenAI"""
+    def transcribe_audio(self, audio_url: str, twilio_sid: str, twilio_token: str,
+                         max_bytes: int = 16 * 1024 * 1024, timeout: Any = (5, 30)) -> str:
+        """Transcreve áudio usando OpenAI.
+
+        O download é feito em streaming para um arquivo temporário em memória/disco
+        (SpooledTemporaryFile) e abortado se passar de `max_bytes`.
+        """
+        import tempfile
+        import requests
         try:
             # Baixar áudio da URL com autenticação do Twilio
-            import requests
-            response = requests.get(audio_url, auth=(twilio_sid, twilio_token))
-            response.raise_for_status()
-            
-            # Salvar temporariamente
-            import tempfile
-            with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as temp_file:
-                temp_file.write(response.content)
-                temp_file_path = temp_file.name
-            
-            # Transcrever
-            with open(temp_file_path, "rb") as audio_file:
-                transcript = self.client.audio.transcriptions.create(
-                    model="whisper-1",
-                    file=audio_file
-                )
-            
-            # Limpar arquivo temporário
-            import os
-            os.unlink(temp_file_path)
+            with requests.get(audio_url, auth=(twilio_sid, twilio_token), stream=True, timeout=timeout) as response:
+                response.raise_for_status()
+                declared = int(response.headers.get('Content-Length') or 0)
+                if declared and declared > max_bytes:
+                    logger.warning(f"Áudio ignorado: {declared} bytes excede o limite de {max_bytes}")
+                    return ""
+                content_type = (response.headers.get('Content-Type') or 'audio/ogg').split(';')[0].strip()
+
+                with tempfile.SpooledTemporaryFile(max_size=1024 * 1024) as audio_file:
+                    size = 0
+                    for chunk in response.iter_content(chunk_size=64 * 1024):
+                        if not chunk:
+                            continue
+                        size += len(chunk)
+                        if size > max_bytes:
+                            logger.warning(f"Áudio ignorado: download excedeu o limite de {max_bytes} bytes")
+                            return ""
+                        audio_file.write(chunk)
+                    audio_file.seek(0)
+
+                    # Transcrever (a extensão do nome orienta o formato para o Whisper)
+                    extension = self._AUDIO_EXTENSIONS.get(content_type, 'ogg')
+                    transcript = self.client.audio.transcriptions.create(
+                        model="whisper-1",
+                        file=(f"audio.{extension}", audio_file, content_type)
+                    )
             
             return transcript.text
             
         except Exception as e:
             logger.error(f"Erro ao transcrever áudio: {e}")
             return ""
+
+    _AUDIO_EXTENSIONS = {
+        'audio/ogg': 'ogg',
+        'audio/opus': 'ogg',
+        'audio/mpeg': 'mp3',
+        'audio/mp3': 'mp3',
+        'audio/mp4': 'm4a',
+        'audio/aac': 'm4a',
+        'audio/amr': 'mp3',
+        'audio/wav': 'wav',
+        'audio/x-wav': 'wav',
+        'audio/webm': 'webm',
+    }
     
+    @staticmethod
+    def _labels_brief(labels: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Resumo das labels ativas enviado ao classificador"""
+        labels_brief = []
+        for lb in labels:
+            if not lb.get('active', True):
+                continue
+            labels_brief.append({
+                'slug': lb.get('slug') or lb.get('title'),
+                'title': lb.get('title'),
+                'description': lb.get('description', ''),
+                'positive_examples': lb.get('positive_examples', [])[:5],
+                'negative_examples': lb.get('negative_examples', [])[:5],
+                'observations_instructions': lb.get('observations_instructions', '')
+            })
+        return labels_brief
+
+    @staticmethod
+    def _parse_json_block(raw: str, pattern: str = r"\{[\s\S]*\}") -> Optional[Any]:
+        import json as pyjson
+        import re
+        try:
+            return pyjson.loads(raw)
+        except Exception:
+            # Tentar extrair bloco JSON
+            m = re.search(pattern, raw)
+            if not m:
+                return None
+            try:
+                return pyjson.loads(m.group(0))
+            except Exception:
+                return None
+
+    @staticmethod
+    def _sanitize_classification(data: Dict[str, Any], labels: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Sanitização básica: label precisa estar entre os slugs ativos"""
+        if not isinstance(data, dict):
+            return {"label": None, "confidence": 0.0, "observacoes": {}, "rationale": "invalid json"}
+        if data.get('label') is None:
+            return {"label": None, "confidence": float(data.get('confidence', 0.0) or 0.0), "observacoes": data.get('observacoes') or {}, "rationale": data.get('rationale', '')}
+        # Garantir que o label está entre os slugs
+        slugs = { (lb.get('slug') or lb.get('title')) for lb in labels if lb.get('active', True) }
+        if data.get('label') not in slugs:
+            return {"label": None, "confidence": float(data.get('confidence', 0.0) or 0.0), "observacoes": data.get('observacoes') or {}, "rationale": "label not allowed"}
+        return {
+            "label": data.get('label'),
+            "confidence": float(data.get('confidence', 0.0) or 0.0),
+            "observacoes": data.get('observacoes') or {},
+            "rationale": data.get('rationale', '')
+        }
+
     def classify_message(self, message: str, labels_json: Dict[str, Any]) -> Dict[str, Any]:
         """Classifica uma mensagem em uma das labels definidas no labels_json.
         Retorna dict: { 'label': str|None, 'confidence': float, 'observacoes': dict, 'rationale': str }
@@ -121,18 +218,7 @@ class OpenAIService:
                 "Responda SOMENTE em JSON com as chaves: label, confidence, observacoes, rationale."
             )
 
-            labels_brief = []
-            for lb in labels:
-                if not lb.get('active', True):
-                    continue
-                labels_brief.append({
-                    'slug': lb.get('slug') or lb.get('title'),
-                    'title': lb.get('title'),
-                    'description': lb.get('description', ''),
-                    'positive_examples': lb.get('positive_examples', [])[:5],
-                    'negative_examples': lb.get('negative_examples', [])[:5],
-                    'observations_instructions': lb.get('observations_instructions', '')
-                })
+            labels_brief = self._labels_brief(labels)
 
             user_prompt = {
                 "role": "user",
@@ -143,44 +229,75 @@ class OpenAIService:
                 )
             }
 
-            response = self.client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    user_prompt
-                ],
-                temperature=0.2,
+            response = self._classification_completion(
+                [{"role": "system", "content": system_prompt}, user_prompt],
                 max_tokens=300
             )
 
             raw = response.choices[0].message.content.strip()
-            import json as pyjson
-            try:
-                data = pyjson.loads(raw)
-            except Exception:
-                # Tentar extrair bloco JSON
-                import re
-                m = re.search(r"\{[\s\S]*\}", raw)
-                if m:
-                    data = pyjson.loads(m.group(0))
-                else:
-                    return {"label": None, "confidence": 0.0, "observacoes": {}, "rationale": "invalid json"}
-            # Sanitização básica
-            if data.get('label') is None:
-                return {"label": None, "confidence": float(data.get('confidence', 0.0)), "observacoes": data.get('observacoes') or {}, "rationale": data.get('rationale', '')}
-            # Garantir que o label está entre os slugs
-            slugs = { (lb.get('slug') or lb.get('title')) for lb in labels if lb.get('active', True) }
-            if data.get('label') not in slugs:
-                return {"label": None, "confidence": float(data.get('confidence', 0.0)), "observacoes": data.get('observacoes') or {}, "rationale": "label not allowed"}
-            return {
-                "label": data.get('label'),
-                "confidence": float(data.get('confidence', 0.0)),
-                "observacoes": data.get('observacoes') or {},
-                "rationale": data.get('rationale', '')
-            }
+            data = self._parse_json_block(raw)
+            if data is None:
+                return {"label": None, "confidence": 0.0, "observacoes": {}, "rationale": "invalid json"}
+            return self._sanitize_classification(data, labels)
         except Exception as e:
             logger.error(f"Erro ao classificar mensagem: {e}")
             return {"label": None, "confidence": 0.0, "observacoes": {}, "rationale": "exception"}
+
+    def classify_messages(self, messages: List[str], labels_json: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Classifica várias mensagens em UMA chamada ao LLM.
+        Retorna uma lista na mesma ordem de `messages`, com o mesmo formato de classify_message.
+        """
+        empty = {"label": None, "confidence": 0.0, "observacoes": {}, "rationale": ""}
+        if not messages:
+            return []
+        if len(messages) == 1:
+            return [self.classify_message(messages[0], labels_json)]
+        try:
+            import json as pyjson
+            labels = (labels_json or {}).get('labels', [])
+            if not labels:
+                return [dict(empty, rationale="no labels") for _ in messages]
+
+            min_conf = (labels_json or {}).get('min_confidence', 0.6)
+
+            system_prompt = (
+                "Você é um classificador disciplinado. Classifique CADA mensagem do cliente em UMA label dentre as fornecidas.\n"
+                "Respeite estritamente os slugs disponíveis. Se não houver label compatível, use null.\n"
+                "Se possível, gere observações sucintas seguindo as instruções de cada label (ex.: nome, data, horário).\n"
+                "Responda SOMENTE em JSON no formato {\"results\": [{\"index\", \"label\", \"confidence\", \"observacoes\", \"rationale\"}]} "
+                "com um item por mensagem, usando o mesmo index recebido."
+            )
+
+            numbered = [{"index": i, "mensagem": m} for i, m in enumerate(messages)]
+            user_prompt = {
+                "role": "user",
+                "content": (
+                    "Mensagens (JSON):\n" + pyjson.dumps(numbered, ensure_ascii=False) + "\n" +
+                    "Labels disponíveis (JSON):\n" + str(self._labels_brief(labels)) + "\n" +
+                    f"Limiar mínimo de confiança: {min_conf}"
+                )
+            }
+
+            response = self._classification_completion(
+                [{"role": "system", "content": system_prompt}, user_prompt],
+                max_tokens=min(4000, 150 * len(messages) + 100)
+            )
+
+            raw = response.choices[0].message.content.strip()
+            data = self._parse_json_block(raw)
+            items = data.get('results', []) if isinstance(data, dict) else (data if isinstance(data, list) else [])
+
+            results = [dict(empty, rationale="missing") for _ in messages]
+            for pos, item in enumerate(items):
+                if not isinstance(item, dict):
+                    continue
+                idx = item.get('index', pos)
+                if isinstance(idx, int) and 0 <= idx < len(messages):
+                    results[idx] = self._sanitize_classification(item, labels)
+            return results
+        except Exception as e:
+            logger.error(f"Erro ao classificar mensagens em lote: {e}")
+            return [dict(empty, rationale="exception") for _ in messages]
     
     def _build_prompt(self, message: str, context: Dict[str, Any], empresa_config: Dict[str, Any]) -> str:
         """Constrói prompt personalizado para a empresa"""
@@ -21,6 +21,8 @@ class TrinksService:
         self.base_url = config.get('trinks_base_url', '')
         self.api_key = config.get('trinks_api_key', '')
         self.estabelecimento_id = config.get('trinks_estabelecimento_id', '')
+        # Timeout (segundos) das requisições HTTP para a Trinks
+        self.timeout = config.get('trinks_timeout', 30)
         
         # Headers padrão para todas as requisições
         self.headers = {
@@ -52,15 +54,15 @@ class TrinksService:
                 logger.info(f"📦 Data: {data}")
             
             if method.upper() == 'GET':
-                response = requests.get(url, headers=self.headers, params=params)
+                response = requests.get(url, headers=self.headers, params=params, timeout=self.timeout)
             elif method.upper() == 'POST':
-                response = requests.post(url, headers=self.headers, json=data)
+                response = requests.post(url, headers=self.headers, json=data, timeout=self.timeout)
             elif method.upper() == 'PUT':
-                response = requests.put(url, headers=self.headers, json=data)
+                response = requests.put(url, headers=self.headers, json=data, timeout=self.timeout)
             elif method.upper() == 'PATCH':
-                response = requests.patch(url, headers=self.headers, json=data)
+                response = requests.patch(url, headers=self.headers, json=data, timeout=self.timeout)
             elif method.upper() == 'DELETE':
-                response = requests.delete(url, headers=self.headers)
+                response = requests.delete(url, headers=self.headers, timeout=self.timeout)
             else:
                 raise ValueError(f"Método HTTP não suportado: {method}")
             
@@ -69,6 +71,11 @@ class TrinksService:
             
             response.raise_for_status()
             
+            # Escrita na agenda: descartar a agenda do dia em cache do estabelecimento
+            if method.upper() != 'GET' and endpoint.startswith('/agendamentos'):
+                from services.availability_cache import invalidate
+                invalidate(self.config)
+            
             # ✅ Tratar status 204 (No Content) - não tem corpo para fazer JSON
             if response.status_code == 204:
                 return {"success": True, "status": "204", "message": "Operação realizada com sucesso"}
@@ -182,6 +189,12 @@ class TrinksService:
         
         return self._make_request('PATCH', endpoint, data=data)
     
+    def confirm_appointment(self, appointment_id: str) -> Dict:
+        """Confirma um agendamento existente"""
+        # ✅ Endpoint da Trinks API: /v1/agendamentos/{agendamentoId}/status/confirmado
+        endpoint = f"/agendamentos/{appointment_id}/status/confirmado"
+        return self._make_request('PATCH', endpoint)
+    
     # ====================
     # DISPONIBILIDADE
     # ====================
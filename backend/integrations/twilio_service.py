@@ -1,11 +1,36 @@
 import requests
 import logging
+import threading
 from typing import Dict, Any
 from urllib.parse import quote
+from requests.adapters import HTTPAdapter
 import json
 
 logger = logging.getLogger(__name__)
 
+# Timeout (conexão, leitura) das chamadas à API da Twilio
+TWILIO_TIMEOUT = (5, 20)
+
+# Sessões HTTP keep-alive por conta Twilio (reaproveitam conexões TLS entre envios)
+_sessions: Dict[str, requests.Session] = {}
+_sessions_lock = threading.Lock()
+
+
+def _get_session(account_sid: str, auth_token: str) -> requests.Session:
+    key = f"{account_sid}:{auth_token}"
+    session = _sessions.get(key)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(key)
+            if session is None:
+                session = requests.Session()
+                session.auth = (account_sid, auth_token)
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32)
+                session.mount("https://", adapter)
+                _sessions[key] = session
+    return session
+
+
 class TwilioService:
     """Serviço para integração com Twilio"""
     
@@ -14,6 +39,7 @@ class TwilioService:
         self.auth_token = auth_token
         self.from_number = from_number
         self.base_url = f"https://api.twilio.com/2010-04-01/Accounts/{account_sid}"
+        self.session = _get_session(account_sid, auth_token)
     
     def send_whatsapp_message(self, to_number: str, message: str) -> Dict[str, Any]:
         """Envia mensagem WhatsApp via Twilio"""
@@ -34,10 +60,10 @@ class TwilioService:
                 'Body': message
             }
             
-            response = requests.post(
+            response = self.session.post(
                 url,
                 data=data,
-                auth=(self.account_sid, self.auth_token)
+                timeout=TWILIO_TIMEOUT
             )
             
             response.raise_for_status()
@@ -55,7 +81,8 @@ class TwilioService:
             logger.error(f"Erro ao enviar mensagem via Twilio: {e}")
             return {
                 'success': False,
-                'error': str(e)
+                'error': str(e),
+                'status_code': getattr(getattr(e, 'response', None), 'status_code', None)
             }
         except Exception as e:
             logger.error(f"Erro inesperado ao enviar mensagem: {e}")
@@ -86,10 +113,10 @@ class TwilioService:
             if parameters:
                 data['ContentVariables'] = json.dumps(parameters)
             
-            response = requests.post(
+            response = self.session.post(
                 url,
                 data=data,
-                auth=(self.account_sid, self.auth_token)
+                timeout=TWILIO_TIMEOUT
             )
             
             response.raise_for_status()
@@ -105,7 +132,8 @@ class TwilioService:
             logger.error(f"Erro ao enviar template via Twilio: {e}")
             return {
                 'success': False,
-                'error': str(e)
+                'error': str(e),
+                'status_code': getattr(getattr(e, 'response', None), 'status_code', None)
             } 
 
     def fetch_template_text(self, template_sid: str) -> Dict[str, Any]:
@@ -115,7 +143,7 @@ class TwilioService:
         try:
             # Twilio Content API (v1)
             url = f"https://content.twilio.com/v1/Content/{template_sid}"
-            resp = requests.get(url, auth=(self.account_sid, self.auth_token))
+            resp = self.session.get(url, timeout=TWILIO_TIMEOUT)
             if resp.status_code != 200:
                 return {'success': False, 'error': f'status {resp.status_code}'}
             data = resp.json() if resp.content else {}
@@ -7,9 +7,11 @@ import json
 from datetime import datetime, timedelta
 import random
 import asyncio
+import threading
 import time
 import traceback
 import pytz
+from contextlib import asynccontextmanager
 
 # Configurar logging limpo
 from config import LOGGING_CONFIG
@@ -48,9 +50,11 @@ def get_db():
     finally:
         db.close()
 
-# Cache global para Smart Agents (acessível por todos os endpoints)
+# Cache global para Smart Agents (acessível por todos os endpoints).
+# Turnos rodam em threads (asyncio.to_thread): leitura, inserção e limpeza sob _smart_agents_lock
 _smart_agents_cache = {}
 _last_cache_cleanup = time.time()
+_smart_agents_lock = threading.Lock()
 
 # =========================================================================
 # LOG DE VERSÕES CRÍTICAS NO STARTUP (para detectar drift em produção)
@@ -213,6 +217,96 @@ def save_log_to_db(session: Session, empresa_id: int, level: str, message: str,
     session.commit()
 
 # Funções de autenticação
+
+class AuthPrincipal:
+    """Snapshot imutável do usuário autenticado (seguro para compartilhar entre requests)"""
+    __slots__ = ('id', 'email', 'is_superuser', 'empresa_id', 'token_version',
+                 'notifications_enabled', 'smart_agent_error_notifications')
+
+    def __init__(self, id, email, is_superuser, empresa_id, token_version=0,
+                 notifications_enabled=False, smart_agent_error_notifications=False):
+        self.id = id
+        self.email = email
+        self.is_superuser = bool(is_superuser)
+        self.empresa_id = empresa_id
+        self.token_version = token_version or 0
+        self.notifications_enabled = bool(notifications_enabled)
+        self.smart_agent_error_notifications = bool(smart_agent_error_notifications)
+
+# Cache de principals: (sub, token_version) -> (expires_at, AuthPrincipal)
+# O principal vem das claims do token (is_superuser, empresa_id, user_id); o banco só é
+# consultado em cache miss, para conferir a versão do token ("ver"). Alterar senha,
+# email, permissões ou empresa incrementa token_version (update_usuario), então claims
+# antigas deixam de valer. O cache é por processo: nas outras réplicas a revogação
+# vale após AUTH_PRINCIPAL_CACHE_TTL expirar (0 desativa o cache).
+_principal_cache: Dict[Tuple[str, int], Tuple[float, AuthPrincipal]] = {}
+_PRINCIPAL_CACHE_MAX = 1000
+
+def _get_cached_principal(email: str, version: int) -> Optional[AuthPrincipal]:
+    entry = _principal_cache.get((email, version))
+    if not entry:
+        return None
+    expires_at, principal = entry
+    if expires_at < time.time():
+        _principal_cache.pop((email, version), None)
+        return None
+    return principal
+
+def _cache_principal(email: str, version: int, principal: AuthPrincipal):
+    if config.AUTH_PRINCIPAL_CACHE_TTL <= 0:
+        return
+    if len(_principal_cache) >= _PRINCIPAL_CACHE_MAX:
+        now = time.time()
+        for key in [k for k, v in _principal_cache.items() if v[0] < now]:
+            _principal_cache.pop(key, None)
+        if len(_principal_cache) >= _PRINCIPAL_CACHE_MAX:
+            _principal_cache.clear()
+    _principal_cache[(email, version)] = (time.time() + config.AUTH_PRINCIPAL_CACHE_TTL, principal)
+
+def invalidate_user_principal(email: Optional[str]):
+    """Remove do cache todas as versões de token de um usuário"""
+    if not email:
+        return
+    for key in [k for k in _principal_cache if k[0] == email]:
+        _principal_cache.pop(key, None)
+
+def _principal_from_claims(payload: Dict[str, Any], email: str, version: int) -> Optional[AuthPrincipal]:
+    """Principal a partir das claims verificadas do token (None se o token não as tiver)"""
+    if payload.get("user_id") is None or "is_superuser" not in payload or "empresa_id" not in payload:
+        return None
+    return AuthPrincipal(payload["user_id"], email, payload["is_superuser"], payload["empresa_id"], token_version=version)
+
+def _load_principal(email: str) -> AuthPrincipal:
+    """Carrega o usuário do banco (com fallback para schema antigo). Retorna None se não existir."""
+    session = SessionLocal()
+    try:
+        try:
+            user = session.query(Usuario).filter(Usuario.email == email).first()
+            if user is None:
+                return None
+            return AuthPrincipal(
+                user.id, user.email, user.is_superuser, user.empresa_id,
+                token_version=getattr(user, 'token_version', 0),
+                notifications_enabled=getattr(user, 'notifications_enabled', False),
+                smart_agent_error_notifications=getattr(user, 'smart_agent_error_notifications', False)
+            )
+        except ProgrammingError as pe:
+            # Limpar transação abortada antes do fallback
+            try:
+                session.rollback()
+            except Exception:
+                pass
+            # Banco antigo sem colunas novas (notifications_*, token_version). Fallback para SELECT manual mínimo.
+            logger.warning(f"Fallback get_current_user (schema antigo): {pe}")
+            row = session.execute(text(
+                "SELECT id, email, is_superuser, empresa_id FROM usuarios WHERE email = :email LIMIT 1"
+            ), {"email": email}).fetchone()
+            if not row:
+                return None
+            return AuthPrincipal(row[0], row[1], row[2], row[3])
+    finally:
+        session.close()
+
 async def get_current_user(token: str = Depends(OAuth2PasswordBearer(tokenUrl="api/login"))):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -224,48 +318,44 @@ async def get_current_user(token: str = Depends(OAuth2PasswordBearer(tokenUrl="a
         email: str = payload.get("sub")
         if email is None:
             raise credentials_exception
+        # Tokens antigos não possuem "ver" => versão 0
+        token_version = int(payload.get("ver") or 0)
     except JWTError as e:
         logger.error(f"JWT decode error: {e}")
         raise credentials_exception
     except Exception as e:
         logger.error(f"Unexpected error in get_current_user: {e}")
         raise credentials_exception
-    
-    session = SessionLocal()
-    try:
-        try:
-            user = session.query(Usuario).filter(Usuario.email == email).first()
-            if user is None:
-                logger.error(f"User not found for email: {email}")
-                raise credentials_exception
-            return user
-        except ProgrammingError as pe:
-            # Limpar transação abortada antes do fallback
-            try:
-                session.rollback()
-            except Exception:
-                pass
-            # Banco antigo sem colunas novas (notifications_*). Fallback para SELECT manual mínimo.
-            logger.warning(f"Fallback get_current_user (schema antigo): {pe}")
-            row = session.execute(text(
-                "SELECT id, email, is_superuser, empresa_id FROM usuarios WHERE email = :email LIMIT 1"
-            ), {"email": email}).fetchone()
-            if not row:
-                raise credentials_exception
 
-            class SimpleUser:
-                def __init__(self, id, email, is_superuser, empresa_id):
-                    self.id = id
-                    self.email = email
-                    self.is_superuser = bool(is_superuser)
-                    self.empresa_id = empresa_id
+    principal = _get_cached_principal(email, token_version)
+    if principal is not None:
+        return principal
 
-            return SimpleUser(row[0], row[1], row[2], row[3])
+    # Cache miss: conferir no banco se a versão do token ainda é a atual
+    try:
+        stored = _load_principal(email)
     except Exception as e:
         logger.error(f"Database error in get_current_user: {e}")
         raise credentials_exception
-    finally:
-        session.close()
+
+    if stored is None:
+        logger.error(f"User not found for email: {email}")
+        raise credentials_exception
+    if stored.token_version != token_version:
+        logger.warning(f"Token revogado para {email} (ver {token_version} != {stored.token_version})")
+        raise credentials_exception
+
+    principal = _principal_from_claims(payload, email, token_version)
+    if principal is None:
+        # Token sem claims de autorização: usar o usuário do banco
+        principal = stored
+    elif (principal.id, principal.is_superuser, principal.empresa_id) != (stored.id, stored.is_superuser, stored.empresa_id):
+        # Permissões alteradas sem nova versão (ex.: direto no banco): claims desatualizadas
+        logger.warning(f"Claims do token desatualizadas para {email}")
+        raise credentials_exception
+
+    _cache_principal(email, token_version, principal)
+    return principal
 
 async def get_current_superuser(current_user: Usuario = Depends(get_current_user)):
     if not current_user.is_superuser:
@@ -319,17 +409,14 @@ metrics_service = MetricsService()
 # ============================================================================
 
 def _compute_next_run_at(timezone_str: str, send_time_local: str):
-    tz = pytz.timezone(timezone_str or 'America/Sao_Paulo')
-    now = datetime.now(tz)
-    try:
-        hh, mm = (send_time_local or '11:00').split(':')
-        target = now.replace(hour=int(hh), minute=int(mm), second=0, microsecond=0)
-        if target <= now:
-            target = target + timedelta(days=1)
-        return target.astimezone(pytz.utc).replace(tzinfo=None)
-    except Exception:
-        target = now.replace(hour=11, minute=0, second=0, microsecond=0) + timedelta(days=1)
-        return target.astimezone(pytz.utc).replace(tzinfo=None)
+    from services.reminder_scheduler import compute_next_run_at
+    return compute_next_run_at(timezone_str, send_time_local)
+
+
+def notify_reminder_changed(reminder_id: Optional[int], deleted: bool = False):
+    """Atualiza o heap do agendador de lembretes após alterações via API"""
+    from services.reminder_scheduler import notify_reminder_changed as _notify
+    _notify(reminder_id, deleted=deleted)
 
 
 def _serialize_reminder(rem: EmpresaReminder) -> dict:
@@ -389,6 +476,7 @@ def create_empresa_reminder(empresa_slug: str, data: dict, current_user: Usuario
         session.add(rem)
         session.commit()
         session.refresh(rem)
+        notify_reminder_changed(rem.id)
         return _serialize_reminder(rem)
     finally:
         session.close()
@@ -418,6 +506,7 @@ def update_empresa_reminder(empresa_slug: str, reminder_id: int, data: dict, cur
         rem.next_run_at = _compute_next_run_at(rem.timezone, rem.send_time_local) if rem.enabled else None
         session.commit()
         session.refresh(rem)
+        notify_reminder_changed(rem.id)
         return _serialize_reminder(rem)
     finally:
         session.close()
@@ -436,6 +525,7 @@ def delete_empresa_reminder(empresa_slug: str, reminder_id: int, current_user: U
             raise HTTPException(status_code=404, detail="Lembrete não encontrado")
         session.delete(rem)
         session.commit()
+        notify_reminder_changed(reminder_id, deleted=True)
         return {"success": True}
     finally:
         session.close()
@@ -521,6 +611,7 @@ def update_empresa_reminders(empresa_slug: str, configuracoes: dict, current_use
         rem.next_run_at = _compute_next_run_at(rem.timezone, rem.send_time_local) if rem.enabled else None
 
         session.commit()
+        notify_reminder_changed(rem.id)
 
         return {
             "enabled": bool(rem.enabled),
@@ -742,8 +833,8 @@ def run_now_empresa_reminders(empresa_slug: str, reminder_id: int = Query(None),
         }
 
         from services.confirmation_worker import run_company_confirmation
-        run_company_confirmation(empresa.id, empresa.slug, cfg)
-        return {"success": True}
+        summary = run_company_confirmation(empresa.id, empresa.slug, cfg)
+        return {"success": True, "summary": summary}
     finally:
         session.close()
 
@@ -1022,6 +1113,180 @@ async def get_empresa_logs(
     finally:
         session.close()
 
+# =========================================================================
+# EXPORTAÇÃO EM STREAMING (NDJSON / CSV) POR EMPRESA
+# =========================================================================
+EXPORT_YIELD_PER = 1000
+
+def _resolve_export_empresa(empresa_slug: str, current_user) -> Tuple[int, str]:
+    """Valida acesso do usuário à empresa e retorna (empresa_id, slug)"""
+    session = SessionLocal()
+    try:
+        if not current_user.is_superuser:
+            if not current_user.empresa_id:
+                raise HTTPException(status_code=403, detail="Usuário não associado a nenhuma empresa")
+            user_empresa = session.query(Empresa).filter(Empresa.id == current_user.empresa_id).first()
+            if not user_empresa or user_empresa.slug != empresa_slug:
+                raise HTTPException(status_code=403, detail="Acesso negado a esta empresa")
+
+        empresa = session.query(Empresa).filter(Empresa.slug == empresa_slug).first()
+        if not empresa:
+            raise HTTPException(status_code=404, detail="Empresa não encontrada")
+        return empresa.id, empresa.slug
+    finally:
+        session.close()
+
+def _parse_export_date(value: Optional[str], field: str) -> Optional[datetime]:
+    """Converte data ISO (YYYY-MM-DD ou datetime completo) do filtro de exportação"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Parâmetro '{field}' inválido, use formato ISO (YYYY-MM-DD)")
+
+def _stream_export(model, empresa_id: int, columns: List[str], row_to_dict, fmt: str,
+                   start: Optional[datetime], end: Optional[datetime], compress: bool):
+    """Gera o arquivo de exportação linha a linha usando cursor no servidor (yield_per).
+
+    A sessão pertence ao gerador e só é fechada ao final do streaming, então a
+    memória fica constante independente do tamanho do histórico.
+    """
+    import csv
+    import io
+    import zlib
+
+    # wbits=31 => container gzip compatível com `gunzip`
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+    def _emit(chunk: str) -> bytes:
+        data = chunk.encode('utf-8')
+        return compressor.compress(data) if compressor else data
+
+    session = SessionLocal()
+    try:
+        query = session.query(model).filter(model.empresa_id == empresa_id)
+        if start:
+            query = query.filter(model.timestamp >= start)
+        if end:
+            query = query.filter(model.timestamp < end)
+        query = query.order_by(model.timestamp.asc(), model.id.asc())
+        query = query.execution_options(stream_results=True).yield_per(EXPORT_YIELD_PER)
+
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction='ignore') if fmt == 'csv' else None
+        if writer:
+            writer.writeheader()
+
+        total = 0
+        for row in query:
+            data = row_to_dict(row)
+            if writer:
+                data = {k: (json.dumps(v, ensure_ascii=False) if isinstance(v, (dict, list)) else v) for k, v in data.items()}
+                writer.writerow(data)
+            else:
+                buffer.write(json.dumps(data, ensure_ascii=False, default=str))
+                buffer.write("\n")
+            total += 1
+
+            # Descarrega o buffer a cada lote para não acumular em memória
+            if total % EXPORT_YIELD_PER == 0:
+                out = _emit(buffer.getvalue())
+                buffer.seek(0)
+                buffer.truncate(0)
+                if out:
+                    yield out
+
+        out = _emit(buffer.getvalue())
+        if out:
+            yield out
+        if compressor:
+            yield compressor.flush()
+        logger.info(f"📤 Exportação {model.__tablename__} empresa {empresa_id}: {total} linhas ({fmt}{', gzip' if compress else ''})")
+    except Exception as e:
+        logger.error(f"Erro na exportação {model.__tablename__} da empresa {empresa_id}: {e}")
+        raise
+    finally:
+        session.close()
+
+def _export_response(generator, empresa_slug: str, name: str, fmt: str, compress: bool):
+    from fastapi.responses import StreamingResponse
+
+    media_type = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    filename = f"{empresa_slug}_{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}"
+    if compress:
+        media_type = 'application/gzip'
+        filename += '.gz'
+    return StreamingResponse(
+        generator,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+def _validate_export_format(fmt: str) -> str:
+    fmt = (fmt or 'ndjson').lower()
+    if fmt not in ('ndjson', 'csv'):
+        raise HTTPException(status_code=400, detail="Formato inválido, use 'ndjson' ou 'csv'")
+    return fmt
+
+@app.get("/api/admin/empresa/{empresa_slug}/export/messages")
+def export_empresa_messages(
+    empresa_slug: str,
+    current_user: Usuario = Depends(get_current_user),
+    format: str = Query('ndjson'),
+    gzip: bool = Query(False),
+    start: Optional[str] = Query(None, description="Data inicial (inclusiva), ISO"),
+    end: Optional[str] = Query(None, description="Data final (exclusiva), ISO")
+):
+    """Exporta todas as mensagens da empresa em streaming (NDJSON ou CSV)"""
+    fmt = _validate_export_format(format)
+    start_dt = _parse_export_date(start, 'start')
+    end_dt = _parse_export_date(end, 'end')
+    empresa_id, slug = _resolve_export_empresa(empresa_slug, current_user)
+
+    columns = ['id', 'cliente_id', 'text', 'is_bot', 'timestamp']
+
+    def _row(m: Mensagem) -> Dict[str, Any]:
+        return {
+            'id': m.id,
+            'cliente_id': m.cliente_id,
+            'text': m.text,
+            'is_bot': m.is_bot,
+            'timestamp': m.timestamp.isoformat() if m.timestamp else None
+        }
+
+    generator = _stream_export(Mensagem, empresa_id, columns, _row, fmt, start_dt, end_dt, gzip)
+    return _export_response(generator, slug, 'messages', fmt, gzip)
+
+@app.get("/api/admin/empresa/{empresa_slug}/export/logs")
+def export_empresa_logs(
+    empresa_slug: str,
+    current_user: Usuario = Depends(get_current_user),
+    format: str = Query('ndjson'),
+    gzip: bool = Query(False),
+    start: Optional[str] = Query(None, description="Data inicial (inclusiva), ISO"),
+    end: Optional[str] = Query(None, description="Data final (exclusiva), ISO")
+):
+    """Exporta todos os logs da empresa em streaming (NDJSON ou CSV)"""
+    fmt = _validate_export_format(format)
+    start_dt = _parse_export_date(start, 'start')
+    end_dt = _parse_export_date(end, 'end')
+    empresa_id, slug = _resolve_export_empresa(empresa_slug, current_user)
+
+    columns = ['id', 'level', 'message', 'details', 'timestamp']
+
+    def _row(log: Log) -> Dict[str, Any]:
+        return {
+            'id': log.id,
+            'level': log.level,
+            'message': log.message,
+            'details': log.details or {},
+            'timestamp': log.timestamp.isoformat() if log.timestamp else None
+        }
+
+    generator = _stream_export(Log, empresa_id, columns, _row, fmt, start_dt, end_dt, gzip)
+    return _export_response(generator, slug, 'logs', fmt, gzip)
+
 @app.get("/api/admin/empresa/logs")
 async def get_empresa_logs_without_slug():
     """Endpoint para capturar chamadas com slug vazio - DEBUG"""
@@ -1100,7 +1365,23 @@ async def test_webhook():
 @app.post("/webhook/{empresa_slug}")
 async def webhook_handler(empresa_slug: str, request: Request):
     """Endpoint para receber webhooks do Twilio com buffer ou resposta direta"""
+    message_sid = None
     try:
+        # Ler o formulário primeiro: reenvios do Twilio (mesmo MessageSid) são descartados
+        # antes de carregar configuração, transcrever áudio ou acionar o LLM
+        form_data = await request.form()
+        webhook_data = dict(form_data)
+        message_sid = webhook_data.get('MessageSid') or webhook_data.get('SmsMessageSid')
+        
+        from services.inbound_dedupe import register_inbound
+        if not await asyncio.to_thread(register_inbound, message_sid, empresa_slug, webhook_data.get('WaId')):
+            return JSONResponse(content={
+                'success': True,
+                'message': 'Mensagem duplicada ignorada',
+                'empresa': empresa_slug,
+                'duplicate': True
+            })
+        
         # Verificar se a empresa existe no banco de dados
         session = SessionLocal()
         try:
@@ -1222,9 +1503,6 @@ async def webhook_handler(empresa_slug: str, request: Request):
             session.close()
         
         # Processar dados do webhook
-        form_data = await request.form()
-        webhook_data = dict(form_data)
-        
         logger.info(f"Webhook recebido para {empresa_slug}: {webhook_data}")
         
         # Verificar se é uma mensagem válida (incluindo áudio, imagem, etc.)
@@ -1268,28 +1546,21 @@ async def webhook_handler(empresa_slug: str, request: Request):
             # Atualizar o webhook_data com o texto descritivo
             webhook_data['Body'] = body
         
-        # Transcrever áudio quando possível
+        # Transcrever áudio em background (pool de threads, cache por media SID).
+        # A mensagem entra no buffer como item pendente com o texto descritivo;
+        # a transcrição é resolvida apenas quando o lote for processado.
         try:
-            media_url = webhook_data.get('MediaUrl0')
-            media_type = webhook_data.get('MediaContentType0', '')
-            is_audio_media = False
-            try:
-                is_audio_media = (message_type == 'audio') or (int(num_media) > 0 and str(media_type).startswith('audio'))
-            except Exception:
-                is_audio_media = (message_type == 'audio')
-
-            if is_audio_media and media_url and empresa_config.get('openai_key'):
-                logger.info("Transcrevendo áudio recebido via WhatsApp...")
-                from integrations.openai_service import OpenAIService
-                oai = OpenAIService(empresa_config.get('openai_key'))
-                transcript = oai.transcribe_audio(media_url, empresa_config.get('twilio_sid'), empresa_config.get('twilio_token'))
-                if transcript:
-                    body = transcript
-                    webhook_data['Body'] = transcript
-                    webhook_data['MessageType'] = 'text'
-                    logger.info("Transcrição de áudio concluída com sucesso")
+            from services.transcription import is_audio_message, submit_transcription
+            if is_audio_message(webhook_data) and empresa_config.get('openai_key'):
+                logger.info("Transcrevendo áudio recebido via WhatsApp em background...")
+                webhook_data['_transcription'] = submit_transcription(
+                    webhook_data.get('MediaUrl0'),
+                    empresa_config.get('openai_key'),
+                    empresa_config.get('twilio_sid'),
+                    empresa_config.get('twilio_token')
+                )
         except Exception as te:
-            logger.error(f"Erro ao transcrever áudio: {te}")
+            logger.error(f"Erro ao agendar transcrição de áudio: {te}")
         
         # BUFFER EM MEMÓRIA (acumula mensagens e processa tudo junto)
         if empresa_config.get('usar_buffer', True):
@@ -1337,131 +1608,34 @@ async def webhook_handler(empresa_slug: str, request: Request):
                 'buffer_count': len(entry['messages'])
             })
         
-        # Se não usar buffer ou se falhar, processar imediatamente
-        # Processar mensagem com Smart Agent (LangGraph + LangChain)
+        # Sem buffer: persistir a mensagem, enfileirar o processamento e responder (ack-first).
+        # Áudio é salvo com o texto descritivo; a transcrição substitui o texto no turno em background.
+        # Se salvar falhar, o handler libera o MessageSid e devolve 500 para o Twilio reenviar
+        from services.services import DatabaseService
+        message_ids = await asyncio.to_thread(
+            DatabaseService().save_messages_bulk,
+            empresa_id=empresa_config.get('empresa_id'),
+            cliente_id=wa_id,
+            texts=[body],
+            is_bot=False,
+            cliente_nome=None
+        )
+        webhook_data['_message_id'] = message_ids[0] if message_ids else None
+        logger.info(f"💾 Mensagem do cliente salva no banco antes do ack: {wa_id}")
+        
         try:
-            # ✅ CACHE GLOBAL de Smart Agents por waid
-            global _smart_agents_cache, _last_cache_cleanup
-            
-            # ✅ LIMPEZA PERIÓDICA do cache (evitar vazamento de memória)
-            current_time = time.time()
-            
-            # Limpar cache a cada 1 hora (3600 segundos)
-            if current_time - _last_cache_cleanup > 3600:
-                old_cache_size = len(_smart_agents_cache)
-                # Manter apenas agentes ativos nas últimas 24 horas
-                cutoff_time = current_time - 86400  # 24 horas
-                _smart_agents_cache = {
-                    waid: agent for waid, agent in _smart_agents_cache.items()
-                    if hasattr(agent, 'last_activity') and agent.last_activity > cutoff_time
-                }
-                _last_cache_cleanup = current_time
-                logger.info(f"🧹 Cache limpo: {old_cache_size} → {len(_smart_agents_cache)} agentes")
-            
-            # ✅ OBTER Smart Agent EXISTENTE ou criar novo
-            if wa_id in _smart_agents_cache:
-                smart_agent = _smart_agents_cache[wa_id]
-                # ✅ ATUALIZAR atividade do agente
-                smart_agent.last_activity = current_time
-                logger.info(f"🔄 Reutilizando Smart Agent existente para waid {wa_id}")
-            else:
-                from agents.smart_agent import SmartAgent
-                smart_agent = SmartAgent(empresa_config)
-                # ✅ ADICIONAR timestamp de atividade
-                smart_agent.last_activity = current_time
-                _smart_agents_cache[wa_id] = smart_agent
-                logger.info(f"🆕 Criando novo Smart Agent para waid {wa_id}")
-            
-            # ✅ SALVAR MENSAGEM DO CLIENTE NO BANCO
-            from services.services import DatabaseService
-            db_service = DatabaseService()
-            
-            try:
-                db_service.save_message(
-                    empresa_id=empresa_config.get('empresa_id'),
-                    cliente_id=wa_id,
-                    text=webhook_data.get('Body', ''),
-                    is_bot=False,
-                    cliente_nome=None
-                )
-                logger.info(f"💾 Mensagem do cliente salva no banco: {wa_id}")
-            except Exception as e:
-                logger.error(f"❌ Erro ao salvar mensagem do cliente: {e}")
-            
-            # ✅ AGORA SIM: Smart Agent tem memória preservada
-            response_message = smart_agent.analyze_and_respond(webhook_data.get('Body', ''), wa_id, {
-                'empresa_slug': empresa_slug,
-                'cliente_id': wa_id,
-                'empresa_config': empresa_config
-            })
-            
-            result = {
-                'success': True,
-                'message': response_message
-            }
-            
-            # Log do processamento
-            logger.info(f"Mensagem processada com Smart Agent para {empresa_slug}:{wa_id}")
-            
-            # Enviar resposta via Twilio
-            if result.get('success'):
-                from integrations.twilio_service import TwilioService
-                twilio_service = TwilioService(
-                    empresa_config.get('twilio_sid'),
-                    empresa_config.get('twilio_token'),
-                    empresa_config.get('twilio_number')
-                )
-                
-                response_message = result.get('message', '')
-                
-                # IMPLEMENTAÇÃO DA MENSAGEM QUEBRADA
-                if empresa_config.get('mensagem_quebrada', False) and len(response_message) > 200:
-                    # Quebrar mensagem longa em partes menores
-                    messages = _break_long_message(response_message)
-                    
-                    # Enviar cada parte separadamente
-                    for i, msg_part in enumerate(messages):
-                        twilio_result = twilio_service.send_whatsapp_message(wa_id, msg_part)
-                        if not twilio_result.get('success'):
-                            logger.error(f"Erro ao enviar parte {i+1} da mensagem: {twilio_result.get('error')}")
-                            break
-                        
-                        # Pequena pausa entre mensagens para não sobrecarregar
-                        if i < len(messages) - 1:
-                            await asyncio.sleep(0.5)
-                    
-                    logger.info(f"Mensagem quebrada enviada em {len(messages)} partes para {empresa_slug}:{wa_id}")
-                else:
-                    # Enviar mensagem completa
-                    twilio_result = twilio_service.send_whatsapp_message(wa_id, response_message)
-                    
-                    if twilio_result.get('success'):
-                        logger.info(f"Mensagem processada e enviada com sucesso para {empresa_slug}:{wa_id}")
-                        
-                        # ✅ SALVAR RESPOSTA DO BOT NO BANCO
-                        try:
-                            db_service.save_message(
-                                empresa_id=empresa_config.get('empresa_id'),
-                                cliente_id=wa_id,
-                                text=response_message,
-                                is_bot=True,
-                                cliente_nome=None
-                            )
-                            logger.info(f"💾 Resposta do bot salva no banco: {wa_id}")
-                        except Exception as e:
-                            logger.error(f"❌ Erro ao salvar resposta do bot: {e}")
-                    else:
-                        logger.error(f"Erro ao enviar mensagem via Twilio: {twilio_result.get('error')}")
+            _spawn_background(_run_conversation_turn(
+                empresa_slug, wa_id, empresa_config, [webhook_data], reuse_agent=True
+            ))
             
             return JSONResponse(content={
-                'success': result.get('success', True),
-                'message': 'Mensagem processada com LangChain Agent',
+                'success': True,
+                'message': 'Mensagem recebida e enfileirada para processamento',
                 'empresa': empresa_slug,
-                'cliente_id': wa_id,
-                'result': result
+                'cliente_id': wa_id
             })
         except Exception as e:
-            logger.error(f"Erro ao processar mensagem para {empresa_slug}: {e}")
+            logger.error(f"Erro ao enfileirar mensagem para {empresa_slug}: {e}")
             
             # Log do erro
             session_log = SessionLocal()
@@ -1487,8 +1661,45 @@ async def webhook_handler(empresa_slug: str, request: Request):
         raise
     except Exception as e:
         logger.error(f"Erro no webhook handler: {e}")
+        # Mensagem não foi aceita: permitir que o reenvio do Twilio seja processado
+        from services.inbound_dedupe import release_inbound
+        await asyncio.to_thread(release_inbound, message_sid)
         raise HTTPException(status_code=500, detail="Erro interno do servidor")
 
+def _send_reply_direct(empresa_config: dict, wa_id: str, parts: List[str]) -> None:
+    """Envia as partes da resposta diretamente pela Twilio, em ordem"""
+    from integrations.twilio_service import TwilioService
+    twilio_service = TwilioService(
+        empresa_config.get('twilio_sid'),
+        empresa_config.get('twilio_token'),
+        empresa_config.get('twilio_number')
+    )
+    for i, part in enumerate(parts):
+        twilio_result = twilio_service.send_whatsapp_message(wa_id, part)
+        if not twilio_result.get('success'):
+            logger.error(f"Erro ao enviar parte {i+1} da mensagem: {twilio_result.get('error')}")
+            break
+
+def _enqueue_bot_reply(empresa_config: dict, wa_id: str, message: str) -> int:
+    """Enfileira a resposta do bot no outbox (quebrada em partes se configurado).
+    Com o worker do outbox desabilitado (ninguém drena a fila) ou o outbox indisponível,
+    envia diretamente pela Twilio. Retorna o número de partes.
+    """
+    if empresa_config.get('mensagem_quebrada', False) and len(message) > 200:
+        parts = _break_long_message(message)
+    else:
+        parts = [message]
+    if not config.OUTBOX_WORKER_ENABLED:
+        _send_reply_direct(empresa_config, wa_id, parts)
+        return len(parts)
+    try:
+        from services.outbox_worker import enqueue_messages
+        enqueue_messages(empresa_config.get('empresa_id'), wa_id, parts)
+    except Exception as e:
+        logger.error(f"Erro ao enfileirar resposta no outbox, enviando diretamente: {e}")
+        _send_reply_direct(empresa_config, wa_id, parts)
+    return len(parts)
+
 def _break_long_message(message: str, max_length: int = 200) -> List[str]:
     """Quebra mensagem longa em partes menores"""
     if len(message) <= max_length:
@@ -1781,6 +1992,7 @@ def login(form_data: OAuth2PasswordRequestForm = Depends()):
             user_email = user.email if user else None
             is_superuser = bool(user.is_superuser) if user else False
             empresa_id = user.empresa_id if user else None
+            token_version = (getattr(user, 'token_version', 0) or 0) if user else 0
         except ProgrammingError as pe:
             # Limpar transação abortada antes do fallback
             try:
@@ -1793,6 +2005,7 @@ def login(form_data: OAuth2PasswordRequestForm = Depends()):
                 "SELECT id, email, senha_hash, is_superuser, empresa_id FROM usuarios WHERE email = :email LIMIT 1"
             ), {"email": form_data.username}).fetchone()
             user = None
+            token_version = 0
             if row:
                 user_id, user_email, senha_hash, is_superuser, empresa_id = row
             else:
@@ -1810,11 +2023,14 @@ def login(form_data: OAuth2PasswordRequestForm = Depends()):
         # Log de login bem-sucedido
         save_log_to_db(session, empresa_id, 'INFO', f'Login bem-sucedido para {user_email}')
         
+        # Dados de autorização embutidos no token (get_current_user monta o usuário a partir deles);
+        # "ver" permite revogar tokens antigos
         data = {
             "sub": user_email, 
             "is_superuser": bool(is_superuser), 
             "empresa_id": empresa_id,
-            "user_id": user_id
+            "user_id": user_id,
+            "ver": token_version
         }
         token = jwt.encode(data, config.SECRET_KEY, algorithm=config.ALGORITHM)
         
@@ -1920,6 +2136,8 @@ def update_usuario(
         usuario = session.query(Usuario).filter(Usuario.id == user_id).first()
         if not usuario:
             raise HTTPException(status_code=404, detail="Usuário não encontrado")
+        previous_email = usuario.email
+        previous_state = (usuario.email, usuario.senha_hash, bool(usuario.is_superuser), usuario.empresa_id)
         
         # Atualizar campos
         if "email" in user_data:
@@ -1941,8 +2159,18 @@ def update_usuario(
         if "empresa_id" in user_data:
             usuario.empresa_id = user_data["empresa_id"] if user_data["empresa_id"] else None
         
+        # Senha, email, permissões ou empresa alterados revogam os tokens já emitidos
+        # (as claims desses tokens deixam de corresponder ao usuário)
+        if (usuario.email, usuario.senha_hash, bool(usuario.is_superuser), usuario.empresa_id) != previous_state:
+            usuario.token_version = (usuario.token_version or 0) + 1
+        
         session.commit()
         
+        # Tokens antigos deixam de valer: nesta réplica já na próxima request;
+        # nas outras, após AUTH_PRINCIPAL_CACHE_TTL
+        invalidate_user_principal(previous_email)
+        invalidate_user_principal(usuario.email)
+        
         return {
             "id": usuario.id,
             "email": usuario.email,
@@ -1967,8 +2195,10 @@ def delete_usuario(
         if usuario.id == current_user.id:
             raise HTTPException(status_code=400, detail="Não é possível deletar seu próprio usuário")
         
+        deleted_email = usuario.email
         session.delete(usuario)
         session.commit()
+        invalidate_user_principal(deleted_email)
         
         return {"message": "Usuário deletado com sucesso"}
     finally:
@@ -2006,9 +2236,9 @@ def clear_conversation_cache(
             logger.info(f"🧹 Cache do SmartAgent limpo para waid {waid}")
         
         # Limpar cache global de agentes do webhook handler
-        global _smart_agents_cache
-        if waid in _smart_agents_cache:
-            del _smart_agents_cache[waid]
+        with _smart_agents_lock:
+            removed = _smart_agents_cache.pop(waid, None)
+        if removed is not None:
             logger.info(f"🧹 Cache de agentes limpo para waid {waid}")
         
         return {
@@ -2351,6 +2581,22 @@ def update_empresa_configuracoes(
         session.commit()
         logger.info(f"Configurações atualizadas com sucesso para empresa {empresa.nome}")
         
+        # Labels/chave OpenAI podem ter mudado: descartar cache do classificador
+        from services.services import DatabaseService
+        DatabaseService.invalidate_classifier_config(empresa.id)
+        
+        # Prompt/knowledge podem ter mudado: descartar respostas de FAQ em cache
+        from services.response_cache import invalidate_tenant
+        invalidate_tenant(empresa.id)
+        
+        # Knowledge mudou: reconstruir o índice de recuperação da empresa
+        if "knowledge_json" in configuracoes:
+            try:
+                from services.knowledge_index import build_index
+                build_index(empresa.id, configuracoes.get("knowledge_json") if isinstance(configuracoes.get("knowledge_json"), dict) else {"items": []})
+            except Exception as e:
+                logger.error(f"Erro ao indexar knowledge da empresa {empresa.id}: {e}")
+        
         # Removido refresh pós-commit para evitar erros de sessão não vinculada
         
         return {"message": "Configurações atualizadas com sucesso"}
@@ -3540,6 +3786,192 @@ DEFAULT_BUFFER_SECONDS = 8  # pode ser tornado configurável por empresa futuram
 def _get_buffer_key(empresa_slug: str, wa_id: str) -> Tuple[str, str]:
     return (empresa_slug, wa_id)
 
+# =========================================================================
+# PIPELINE DE PROCESSAMENTO EM BACKGROUND (ack-first)
+# =========================================================================
+# Um turno por vez por conversa (ordem preservada) e no máximo
+# INBOUND_MAX_CONCURRENCY turnos do agente em paralelo no processo.
+_conversation_slots: Dict[Tuple[str, str], List[Any]] = {}  # key -> [asyncio.Lock, usuários]
+_inbound_semaphore: Optional[asyncio.Semaphore] = None
+_background_tasks: set = set()
+
+def _spawn_background(coro) -> asyncio.Task:
+    """Cria task em background mantendo referência forte até terminar"""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+@asynccontextmanager
+async def _conversation_slot(key: Tuple[str, str]):
+    """Serializa turnos da mesma conversa (FIFO)"""
+    slot = _conversation_slots.get(key)
+    if slot is None:
+        slot = [asyncio.Lock(), 0]
+        _conversation_slots[key] = slot
+    slot[1] += 1
+    try:
+        async with slot[0]:
+            yield
+    finally:
+        slot[1] -= 1
+        if slot[1] == 0:
+            _conversation_slots.pop(key, None)
+
+def _get_cached_smart_agent(wa_id: str, empresa_config: dict):
+    """Obtém Smart Agent do cache global por waid (ou cria), com limpeza periódica do cache"""
+    global _last_cache_cleanup
+    current_time = time.time()
+    
+    with _smart_agents_lock:
+        # Limpar cache a cada 1 hora (3600 segundos)
+        if current_time - _last_cache_cleanup > 3600:
+            old_cache_size = len(_smart_agents_cache)
+            # Manter apenas agentes ativos nas últimas 24 horas
+            cutoff_time = current_time - 86400  # 24 horas
+            for waid in [w for w, agent in _smart_agents_cache.items()
+                         if not (hasattr(agent, 'last_activity') and agent.last_activity > cutoff_time)]:
+                del _smart_agents_cache[waid]
+            _last_cache_cleanup = current_time
+            logger.info(f"🧹 Cache limpo: {old_cache_size} → {len(_smart_agents_cache)} agentes")
+        
+        smart_agent = _smart_agents_cache.get(wa_id)
+        if smart_agent is not None:
+            smart_agent.last_activity = current_time
+    if smart_agent is not None:
+        logger.info(f"🔄 Reutilizando Smart Agent existente para waid {wa_id}")
+        return smart_agent
+    
+    # Criação fora do lock; se outro turno criou ao mesmo tempo, fica o primeiro
+    from agents.smart_agent import SmartAgent
+    created = SmartAgent(empresa_config)
+    created.last_activity = current_time
+    with _smart_agents_lock:
+        smart_agent = _smart_agents_cache.setdefault(wa_id, created)
+    if smart_agent is created:
+        logger.info(f"🆕 Criando novo Smart Agent para waid {wa_id}")
+    return smart_agent
+
+def _process_turn_sync(empresa_slug: str, wa_id: str, empresa_config: dict, message: str, reuse_agent: bool) -> str:
+    """Executa um turno do agente (bloqueante): gera resposta, salva e enfileira o envio"""
+    if reuse_agent:
+        smart_agent = _get_cached_smart_agent(wa_id, empresa_config)
+    else:
+        # Novo Smart Agent: o contexto vem do cache global de conversas
+        from agents.smart_agent import SmartAgent
+        smart_agent = SmartAgent(empresa_config)
+        logger.info(f"🆕 Smart Agent criado para {empresa_slug}:{wa_id} (vai carregar contexto do cache global)")
+    
+    response_message = smart_agent.analyze_and_respond(message, wa_id, {
+        'empresa_slug': empresa_slug,
+        'cliente_id': wa_id,
+        'empresa_config': empresa_config
+    })
+    logger.info(f"✅ Resposta processada para {empresa_slug}:{wa_id}: {str(response_message)[:100]}...")
+    
+    # ✅ SALVAR RESPOSTA DO BOT NO BANCO
+    from services.services import DatabaseService
+    try:
+        DatabaseService().save_message(
+            empresa_id=empresa_config.get('empresa_id'),
+            cliente_id=wa_id,
+            text=response_message,
+            is_bot=True,
+            cliente_nome=None
+        )
+        logger.info(f"💾 Resposta do bot salva no banco: {wa_id}")
+    except Exception as e:
+        logger.error(f"❌ Erro ao salvar resposta do bot: {e}")
+    
+    # Enfileirar resposta no outbox
+    parts_count = _enqueue_bot_reply(empresa_config, wa_id, response_message)
+    logger.info(f"📤 Resposta enfileirada em {parts_count} parte(s) para {empresa_slug}:{wa_id}")
+    return response_message
+
+async def _resolve_inbound_texts(items: List[Dict[str, Any]]) -> List[str]:
+    """Texto de cada mensagem recebida, aguardando transcrições de áudio pendentes"""
+    texts = []
+    for item in items:
+        text = item.get('Body', '')
+        pending = item.pop('_transcription', None)
+        if pending is not None:
+            try:
+                transcript = await asyncio.wrap_future(pending)
+                if transcript:
+                    text = transcript
+                    item['Body'] = transcript
+                    item['MessageType'] = 'text'
+            except Exception as e:
+                logger.error(f"Erro ao transcrever áudio: {e}")
+        texts.append(text)
+    return texts
+
+async def _run_conversation_turn(empresa_slug: str, wa_id: str, empresa_config: dict, items: List[Dict[str, Any]], reuse_agent: bool):
+    """Processa um turno em background respeitando a ordem da conversa:
+    resolve transcrições, salva as mensagens do cliente (ou só a transcrição,
+    se já foram salvas no webhook) e executa o agente
+    """
+    global _inbound_semaphore
+    if _inbound_semaphore is None:
+        _inbound_semaphore = asyncio.Semaphore(config.INBOUND_MAX_CONCURRENCY)
+    key = _get_buffer_key(empresa_slug, wa_id)
+    try:
+        async with _conversation_slot(key):
+            # Transcrições rodam no pool; não ocupam vaga de turno do agente
+            placeholders = [item.get('Body', '') for item in items]
+            texts = await _resolve_inbound_texts(items)
+            
+            # ✅ SALVAR MENSAGENS NO BANCO ANTES DE PROCESSAR (um INSERT; classificação em uma chamada).
+            # Mensagens já salvas no webhook (sem buffer) só recebem o texto da transcrição
+            from services.services import DatabaseService
+            db = DatabaseService()
+            pending_texts = []
+            for item, placeholder, text in zip(items, placeholders, texts):
+                message_id = item.pop('_message_id', None)
+                if message_id is None:
+                    pending_texts.append(text)
+                elif text != placeholder:
+                    try:
+                        await asyncio.to_thread(db.update_message_text, message_id, text)
+                    except Exception as e:
+                        logger.error(f"❌ Erro ao salvar transcrição da mensagem {message_id}: {e}")
+            if pending_texts:
+                try:
+                    await asyncio.to_thread(
+                        db.save_messages_bulk,
+                        empresa_id=empresa_config.get('empresa_id'),
+                        cliente_id=wa_id,
+                        texts=pending_texts,
+                        is_bot=False,
+                        cliente_nome=None  # Será extraído automaticamente se disponível
+                    )
+                    logger.info(f"💾 {len(pending_texts)} mensagem(ns) do cliente salva(s) no banco: {wa_id}")
+                except Exception as e:
+                    logger.error(f"❌ Erro ao salvar mensagens do cliente: {e}")
+            
+            # ✅ PROCESSAR TODAS AS MENSAGENS JUNTAS (não individualmente!)
+            combined_message = "\n".join(texts)
+            if len(texts) > 1:
+                logger.info(f"📝 Mensagem consolidada ({len(texts)} mensagens): {combined_message}")
+            
+            async with _inbound_semaphore:
+                # Agente/LLM são bloqueantes: rodar fora do event loop
+                await asyncio.to_thread(_process_turn_sync, empresa_slug, wa_id, empresa_config, combined_message, reuse_agent)
+    except Exception as e:
+        logger.error(f"❌ Erro no processamento em background para {empresa_slug}:{wa_id}: {e}")
+        logger.error(f"❌ Traceback completo: {traceback.format_exc()}")
+        session_log = SessionLocal()
+        try:
+            save_log_to_db(session_log, empresa_config.get('empresa_id'), 'ERROR', f'Erro ao processar mensagem: {e}', {
+                'empresa': empresa_slug,
+                'cliente_id': wa_id,
+                'error': str(e)
+            })
+        except Exception:
+            pass
+        finally:
+            session_log.close()
+
 async def _buffer_wait_and_process(empresa_slug: str, wa_id: str, empresa_config: dict):
     logger.info(f"🚀 Buffer task iniciada para {empresa_slug}:{wa_id}")
     
@@ -3562,102 +3994,17 @@ async def _buffer_wait_and_process(empresa_slug: str, wa_id: str, empresa_config
         logger.info(f"🔄 Buffer cancelado para {empresa_slug}:{wa_id} - nova mensagem chegou durante espera")
         return  # houve nova mensagem, cancela este processamento
     
-    logger.info(f"✅ Buffer expirou para {empresa_slug}:{wa_id} - processando mensagens...")
+    # Retirar o lote do buffer ANTES de processar: mensagens que chegarem durante o
+    # processamento abrem um novo buffer e viram o próximo turno (na ordem da conversa)
+    buffer_state.pop(key, None)
+    logger.info(f"🧹 Buffer limpo para {empresa_slug}:{wa_id}")
 
     # ✅ PROCESSAR TODAS AS MENSAGENS ACUMULADAS
     messages = latest.get('messages', [])
     logger.info(f"🔄 Buffer expirou para {empresa_slug}:{wa_id}. Processando {len(messages)} mensagens acumuladas")
     
-    try:
-        # ✅ REUTILIZAR SMART AGENT EXISTENTE ou criar novo
-        from agents.smart_agent import SmartAgent
-        
-        # ✅ REUTILIZAR SMART AGENT EXISTENTE ou criar novo
-        # Como estamos em uma função async separada, vamos criar um novo Smart Agent
-        # mas ele vai carregar o contexto do cache global automaticamente
-        smart_agent = SmartAgent(empresa_config)
-        logger.info(f"🆕 Smart Agent criado para {empresa_slug}:{wa_id} (vai carregar contexto do cache global)")
-        
-        # ✅ SALVAR MENSAGENS NO BANCO ANTES DE PROCESSAR
-        from services.services import DatabaseService
-        db_service = DatabaseService()
-        
-        # Salvar cada mensagem do cliente no banco
-        for msg in messages:
-            try:
-                db_service.save_message(
-                    empresa_id=empresa_config.get('empresa_id'),
-                    cliente_id=wa_id,
-                    text=msg.get('Body', ''),
-                    is_bot=False,
-                    cliente_nome=None  # Será extraído automaticamente se disponível
-                )
-                logger.info(f"💾 Mensagem do cliente salva no banco: {wa_id}")
-            except Exception as e:
-                logger.error(f"❌ Erro ao salvar mensagem do cliente: {e}")
-        
-        # ✅ PROCESSAR TODAS AS MENSAGENS JUNTAS (não individualmente!)
-        logger.info(f"📝 Juntando {len(messages)} mensagens para processamento único...")
-        
-        # Juntar todas as mensagens em uma única string
-        combined_message = "\n".join([msg.get('Body', '') for msg in messages])
-        logger.info(f"📝 Mensagem consolidada: {combined_message}")
-        
-        # Processar UMA VEZ com todas as mensagens juntas
-        response_message = smart_agent.analyze_and_respond(combined_message, wa_id, {
-            'empresa_slug': empresa_slug,
-            'cliente_id': wa_id,
-            'empresa_config': empresa_config
-        })
-        
-        logger.info(f"✅ Resposta única processada: {response_message[:100]}...")
-        
-        # ✅ ENVIAR RESPOSTA ÚNICA (não consolidada)
-        final_response = response_message
-        
-        logger.info(f"📤 Enviando resposta única para {empresa_slug}:{wa_id}")
-        
-        from integrations.twilio_service import TwilioService
-        twilio_service = TwilioService(
-            empresa_config.get('twilio_sid'),
-            empresa_config.get('twilio_token'),
-            empresa_config.get('twilio_number')
-        )
-        
-        # ✅ SALVAR RESPOSTA DO BOT NO BANCO
-        try:
-            db_service.save_message(
-                empresa_id=empresa_config.get('empresa_id'),
-                cliente_id=wa_id,
-                text=final_response,
-                is_bot=True,
-                cliente_nome=None
-            )
-            logger.info(f"💾 Resposta do bot salva no banco: {wa_id}")
-        except Exception as e:
-            logger.error(f"❌ Erro ao salvar resposta do bot: {e}")
-        
-        # Enviar resposta única
-        if empresa_config.get('mensagem_quebrada', False) and len(final_response) > 200:
-            parts = _break_long_message(final_response)
-            for i, part in enumerate(parts):
-                twilio_service.send_whatsapp_message(wa_id, part)
-                if i < len(parts) - 1:
-                    await asyncio.sleep(0.5)
-            logger.info(f"📤 Resposta única enviada em {len(parts)} partes")
-        else:
-            twilio_service.send_whatsapp_message(wa_id, final_response)
-            logger.info(f"📤 Resposta única enviada com sucesso")
-        
-        logger.info(f"✅ Buffer processado com sucesso para {empresa_slug}:{wa_id}. {len(messages)} mensagens processadas")
-        
-    except Exception as e:
-        logger.error(f"❌ Erro no processamento do buffer para {empresa_slug}:{wa_id}: {e}")
-        logger.error(f"❌ Traceback completo: {traceback.format_exc()}")
-    finally:
-        # Limpar estado do buffer
-        buffer_state.pop(key, None)
-        logger.info(f"🧹 Buffer limpo para {empresa_slug}:{wa_id}")
+    await _run_conversation_turn(empresa_slug, wa_id, empresa_config, messages, reuse_agent=False)
+    logger.info(f"✅ Buffer processado para {empresa_slug}:{wa_id}. {len(messages)} mensagens processadas")
 
 # ============================================================================
 # ENDPOINT SIMPLES DE NOTIFICAÇÕES
@@ -3909,6 +4256,118 @@ async def test_notification(
         logger.error(f"Erro ao testar notificação: {e}")
         raise HTTPException(status_code=500, detail="Erro interno do servidor")
 
+# =========================================================================
+# WORKERS EM BACKGROUND
+# =========================================================================
+@app.on_event("startup")
+async def start_background_workers():
+    """Inicia os workers de background do processo"""
+    try:
+        from services.classification_worker import start_classification_worker
+        start_classification_worker()
+    except Exception as e:
+        logger.error(f"Erro ao iniciar worker de classificação: {e}")
+    try:
+        from services.reminder_scheduler import start_reminder_scheduler
+        start_reminder_scheduler()
+    except Exception as e:
+        logger.error(f"Erro ao iniciar agendador de lembretes: {e}")
+    try:
+        from services.outbox_worker import start_outbox_worker
+        start_outbox_worker()
+    except Exception as e:
+        logger.error(f"Erro ao iniciar worker do outbox: {e}")
+
+@app.on_event("shutdown")
+async def stop_background_workers():
+    try:
+        from services.classification_worker import stop_classification_worker
+        stop_classification_worker()
+    except Exception as e:
+        logger.error(f"Erro ao parar worker de classificação: {e}")
+    try:
+        from services.reminder_scheduler import get_reminder_scheduler
+        get_reminder_scheduler().stop()
+    except Exception as e:
+        logger.error(f"Erro ao parar agendador de lembretes: {e}")
+    try:
+        from services.outbox_worker import stop_outbox_worker
+        stop_outbox_worker()
+    except Exception as e:
+        logger.error(f"Erro ao parar worker do outbox: {e}")
+    try:
+        from services.transcription import shutdown_transcription_pool
+        shutdown_transcription_pool()
+    except Exception as e:
+        logger.error(f"Erro ao parar pool de transcrição: {e}")
+
+@app.get("/api/admin/reminders/scheduler/status")
+def get_reminder_scheduler_status(current_user: Usuario = Depends(get_current_superuser)):
+    """Estado do agendador de lembretes: liderança, próximos disparos e métricas de duração"""
+    from services.reminder_scheduler import get_reminder_scheduler
+    return get_reminder_scheduler().status()
+
+@app.get("/api/admin/reminders/appointments-fetch/status")
+def get_reminder_appointments_fetch_status(current_user: Usuario = Depends(get_current_superuser)):
+    """Busca paginada da agenda para os lembretes: páginas, fallbacks por dia e listagens reaproveitadas"""
+    from services.appointment_range import get_stats
+    return get_stats()
+
+@app.get("/api/admin/llm/prompt-metrics")
+def get_llm_prompt_metrics(current_user: Usuario = Depends(get_current_superuser)):
+    """Tokens de prompt e fração servida do cache do provedor, por tipo de chamada ao LLM"""
+    from services.prompt_builder import get_prompt_metrics
+    return get_prompt_metrics()
+
+@app.get("/api/admin/llm/prompt-templates")
+def get_llm_prompt_templates(current_user: Usuario = Depends(get_current_superuser)):
+    """Acertos do cache de trechos fixos (catálogo/regras) dos templates de prompt"""
+    from services.prompt_templates import get_template_metrics
+    return get_template_metrics()
+
+@app.get("/api/admin/llm/gateway-metrics")
+def get_llm_gateway_metrics(current_user: Usuario = Depends(get_current_superuser)):
+    """Latência (média/p95), erros, fallbacks, hedges, recusas e tokens por tarefa; circuit breakers e saídas estruturadas"""
+    from services.llm_gateway import get_llm_metrics, get_resilience_status
+    from services.structured_output import get_structured_metrics
+    return {'tasks': get_llm_metrics(), 'resilience': get_resilience_status(), 'structured': get_structured_metrics()}
+
+@app.get("/api/admin/llm/knowledge-metrics")
+def get_llm_knowledge_metrics(current_user: Usuario = Depends(get_current_superuser)):
+    """Tokens de knowledge injetados vs base completa e tempo de seleção"""
+    from services.knowledge_index import get_knowledge_metrics
+    return get_knowledge_metrics()
+
+@app.get("/api/admin/llm/response-cache")
+def get_llm_response_cache_metrics(current_user: Usuario = Depends(get_current_superuser)):
+    """Taxa de acerto e latência/tokens economizados pelo cache de respostas de FAQ"""
+    from services.response_cache import get_cache_metrics
+    return get_cache_metrics()
+
+@app.get("/api/admin/trinks/availability-cache")
+def get_trinks_availability_cache_stats(current_user: Usuario = Depends(get_current_superuser)):
+    """Acertos do cache de agenda do dia (inclui buscas aproveitadas do prefetch) e invalidações"""
+    from services.availability_cache import get_stats
+    return get_stats()
+
+@app.get("/api/admin/flows/step-metrics")
+def get_flow_step_metrics(current_user: Usuario = Depends(get_current_superuser)):
+    """Tempo por passo dos planos (Rules → Tools) e caminho crítico dos últimos planos executados"""
+    from services.step_graph import get_step_metrics
+    return get_step_metrics()
+
+@app.get("/api/admin/webhook/dedupe/status")
+def get_webhook_dedupe_status(current_user: Usuario = Depends(get_current_superuser)):
+    """Contadores da deduplicação de webhooks por MessageSid (reenvios descartados)"""
+    from services.inbound_dedupe import get_stats
+    return get_stats()
+
+@app.get("/api/admin/clients/identity-cache/status")
+def get_client_identity_cache_status(current_user: Usuario = Depends(get_current_superuser)):
+    """Acertos do cache de identidade de clientes Trinks (buscas de cliente evitadas na API)"""
+    from services.client_identity import get_stats
+    return get_stats()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
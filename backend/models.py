@@ -1,7 +1,7 @@
 from pydantic import BaseModel, Field
 from typing import Optional, List, Dict, Any
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Boolean, Text, TIMESTAMP, ForeignKey, JSON, create_engine, func, UniqueConstraint
+from sqlalchemy import Column, Integer, String, Boolean, Text, TIMESTAMP, ForeignKey, JSON, create_engine, func, UniqueConstraint, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, sessionmaker
 from passlib.hash import bcrypt
@@ -38,6 +38,8 @@ class Mensagem(Base):
     is_bot = Column(Boolean, nullable=False)
     timestamp = Column(TIMESTAMP, server_default=func.now())
     empresa = relationship('Empresa', back_populates='mensagens')
+    # Índice para exportação/histórico por empresa em intervalo de datas
+    __table_args__ = (Index('ix_messages_empresa_timestamp', 'empresa_id', 'timestamp'),)
 
 class Atendimento(Base):
     __tablename__ = 'atendimentos'
@@ -131,6 +133,7 @@ class Log(Base):
     details = Column(JSON)
     timestamp = Column(TIMESTAMP, server_default=func.now())
     empresa = relationship('Empresa')
+    __table_args__ = (Index('ix_logs_empresa_timestamp', 'empresa_id', 'timestamp'),)
 
 class Usuario(Base):
     __tablename__ = 'usuarios'
@@ -142,6 +145,8 @@ class Usuario(Base):
     # Configurações de notificação
     notifications_enabled = Column(Boolean, default=False)  # Usuário ativa/desativa notificações
     smart_agent_error_notifications = Column(Boolean, default=False)  # Notificações de erro do Smart Agent
+    # Versão dos tokens emitidos (incrementada ao trocar senha/remover acesso para revogar JWTs antigos)
+    token_version = Column(Integer, default=0, server_default='0', nullable=False)
     created_at = Column(TIMESTAMP, server_default=func.now())
     empresa = relationship('Empresa')
     __table_args__ = (UniqueConstraint('email', name='_usuario_email_uc'),)
@@ -221,5 +226,76 @@ class Notification(Base):
     empresa = relationship('Empresa')
     __table_args__ = (UniqueConstraint('empresa_id', 'tipo', 'appointment_id', 'execution_date', name='_uniq_notification'),)
 
+class ClassificationQueue(Base):
+    """Fila de mensagens de clientes aguardando classificação por label (worker em background)"""
+    __tablename__ = 'classification_queue'
+    id = Column(Integer, primary_key=True)
+    empresa_id = Column(Integer, ForeignKey('empresas.id'), nullable=False)
+    cliente_id = Column(String(100), nullable=False)
+    message_id = Column(Integer, ForeignKey('messages.id'), nullable=False)
+    status = Column(String(20), nullable=False, default='pending')  # pending | processing | done | error
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text, nullable=True)
+    locked_at = Column(TIMESTAMP, nullable=True)
+    processed_at = Column(TIMESTAMP, nullable=True)
+    created_at = Column(TIMESTAMP, server_default=func.now())
+
+    __table_args__ = (
+        UniqueConstraint('message_id', name='_classification_message_uc'),
+        Index('ix_classification_queue_status', 'status', 'id'),
+    )
+
+class OutboundMessage(Base):
+    """Outbox de mensagens WhatsApp a enviar via Twilio (drenada por workers, em ordem por conversa)"""
+    __tablename__ = 'outbound_messages'
+    id = Column(Integer, primary_key=True)
+    empresa_id = Column(Integer, ForeignKey('empresas.id'), nullable=False)
+    to_number = Column(String(64), nullable=False)  # WaId/telefone do destinatário (chave da conversa)
+    body = Column(Text, nullable=True)
+    template_sid = Column(String(64), nullable=True)
+    variables = Column(JSON, nullable=True)
+    status = Column(String(20), nullable=False, default='pending')  # pending | sending | sent | failed
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(TIMESTAMP, server_default=func.now())
+    last_error = Column(Text, nullable=True)
+    message_sid = Column(String(64), nullable=True)
+    created_at = Column(TIMESTAMP, server_default=func.now())
+    sent_at = Column(TIMESTAMP, nullable=True)
+
+    __table_args__ = (
+        Index('ix_outbound_messages_status', 'status', 'next_attempt_at'),
+        Index('ix_outbound_messages_conversa', 'empresa_id', 'to_number', 'id'),
+    )
+
+class InboundMessageReceipt(Base):
+    """Registro de webhooks recebidos por MessageSid (deduplicação de reenvios do Twilio)"""
+    __tablename__ = 'inbound_message_receipts'
+    id = Column(Integer, primary_key=True)
+    message_sid = Column(String(64), nullable=False, unique=True)
+    empresa_slug = Column(String(100), nullable=True)
+    wa_id = Column(String(64), nullable=True)
+    received_at = Column(TIMESTAMP, server_default=func.now())
+
+    __table_args__ = (
+        Index('ix_inbound_message_receipts_received_at', 'received_at'),
+    )
+
+class ClienteIdentidade(Base):
+    """Cache de identidade por empresa: waid (telefone) / CPF → cliente da Trinks"""
+    __tablename__ = 'trinks_client_identities'
+    id = Column(Integer, primary_key=True)
+    empresa_id = Column(Integer, ForeignKey('empresas.id'), nullable=False)
+    waid = Column(String(64), nullable=False)  # só dígitos (DDI + DDD + número)
+    cpf = Column(String(14), nullable=True)  # só dígitos
+    trinks_cliente_id = Column(String(64), nullable=False)
+    nome = Column(String(255), nullable=True)
+    last_verified_at = Column(TIMESTAMP, server_default=func.now())  # última confirmação na API Trinks
+    created_at = Column(TIMESTAMP, server_default=func.now())
+
+    __table_args__ = (
+        UniqueConstraint('empresa_id', 'waid', name='_trinks_client_identity_waid_uc'),
+        Index('ix_trinks_client_identities_cpf', 'empresa_id', 'cpf'),
+    )
+
 def gerar_hash_senha(senha: str) -> str:
     return bcrypt.hash(senha) 
\ No newline at end of file
@@ -1,6 +1,8 @@
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Mapping, Sequence
 from enum import Enum
 
+from rules.registry import rule_table, load_rule_tables
+
 class GoogleCalendarFlowType(Enum):
     """Tipos de fluxos disponíveis no Google Calendar"""
     CHECK_AVAILABILITY = "check_availability"
@@ -15,12 +17,15 @@ class GoogleCalendarRules:
     Regras estáticas para integração com Google Calendar API
     Contém APENAS configurações, regras e validações estáticas
     """
+
+    API_TYPE = "GOOGLE_CALENDAR"
     
     def __init__(self):
         """Inicializa as regras do Google Calendar"""
         pass
     
-    def get_api_rules(self) -> Dict[str, Any]:
+    @rule_table
+    def get_api_rules(self) -> Mapping[str, Any]:
         """
         Retorna regras gerais da API Google Calendar
         Returns:
@@ -49,15 +54,10 @@ class GoogleCalendarRules:
             ]
         }
     
-    def get_required_fields(self, flow_type: str) -> List[str]:
-        """
-        Retorna campos obrigatórios para cada tipo de fluxo
-        Args:
-            flow_type: Tipo do fluxo (GoogleCalendarFlowType)
-        Returns:
-            Lista de campos obrigatórios
-        """
-        required_fields = {
+    @rule_table
+    def get_required_fields_by_flow(self) -> Mapping[str, Sequence[str]]:
+        """Campos obrigatórios por tipo de fluxo"""
+        return {
             GoogleCalendarFlowType.CHECK_AVAILABILITY.value: [
                 "calendar_id", "date", "time_min", "time_max"
             ],
@@ -75,18 +75,21 @@ class GoogleCalendarRules:
                 "calendar_id", "event_id"
             ]
         }
-        
-        return required_fields.get(flow_type, [])
-    
-    def get_validation_rules(self, flow_type: str) -> Dict[str, Any]:
+
+    def get_required_fields(self, flow_type: str) -> Sequence[str]:
         """
-        Retorna regras de validação para cada fluxo
+        Retorna campos obrigatórios para cada tipo de fluxo
         Args:
-            flow_type: Tipo do fluxo
+            flow_type: Tipo do fluxo (GoogleCalendarFlowType)
         Returns:
-            Dicionário com regras de validação
+            Lista de campos obrigatórios
         """
-        validation_rules = {
+        return self.get_required_fields_by_flow().get(flow_type, ())
+    
+    @rule_table
+    def get_validation_rules_by_flow(self) -> Mapping[str, Mapping[str, Any]]:
+        """Regras de validação por tipo de fluxo"""
+        return {
             GoogleCalendarFlowType.CHECK_AVAILABILITY.value: {
                 "date_format": "YYYY-MM-DD",
                 "time_format": "HH:MM",
@@ -107,10 +110,19 @@ class GoogleCalendarRules:
                 "time_validation": "business_hours"
             }
         }
-        
-        return validation_rules.get(flow_type, {})
+
+    def get_validation_rules(self, flow_type: str) -> Mapping[str, Any]:
+        """
+        Retorna regras de validação para cada fluxo
+        Args:
+            flow_type: Tipo do fluxo
+        Returns:
+            Dicionário com regras de validação
+        """
+        return self.get_validation_rules_by_flow().get(flow_type, {})
     
-    def get_available_flows(self) -> List[Dict[str, Any]]:
+    @rule_table
+    def get_available_flows(self) -> Sequence[Mapping[str, Any]]:
         """
         Retorna todos os fluxos disponíveis no Google Calendar
         Returns:
@@ -157,7 +169,8 @@ class GoogleCalendarRules:
     
     # MÉTODOS DE COMPATIBILIDADE MIGRADOS DO api_rules_engine.py
     
-    def get_availability_check_rules(self) -> Dict[str, Any]:
+    @rule_table
+    def get_availability_check_rules(self) -> Mapping[str, Any]:
         """Retorna regras de verificação de disponibilidade para Google Calendar"""
         return {
             "api_endpoint": "/calendars/{calendar_id}/events",
@@ -168,7 +181,8 @@ class GoogleCalendarRules:
             "advance_booking": self.get_advance_booking_hours()
         }
     
-    def get_reservation_creation_rules(self) -> Dict[str, Any]:
+    @rule_table
+    def get_reservation_creation_rules(self) -> Mapping[str, Any]:
         """Retorna regras de criação de reserva para Google Calendar"""
         return {
             "api_endpoint": "/calendars/{calendar_id}/events",
@@ -181,7 +195,8 @@ class GoogleCalendarRules:
             }
         }
     
-    def get_reservation_management_rules(self) -> Dict[str, Any]:
+    @rule_table
+    def get_reservation_management_rules(self) -> Mapping[str, Any]:
         """Retorna regras de gerenciamento de reserva para Google Calendar"""
         return {
             "api_endpoint": "/calendars/{calendar_id}/events",
@@ -193,7 +208,8 @@ class GoogleCalendarRules:
             }
         }
     
-    def get_business_hours(self) -> Dict[str, Any]:
+    @rule_table
+    def get_business_hours(self) -> Mapping[str, Any]:
         """
         Retorna horário de funcionamento padrão para Google Calendar
         Returns:
@@ -233,7 +249,8 @@ class GoogleCalendarRules:
         """
         return 30  # 30 dias à frente
     
-    def get_cancellation_policy(self) -> Dict[str, Any]:
+    @rule_table
+    def get_cancellation_policy(self) -> Mapping[str, Any]:
         """
         Retorna política de cancelamento para Google Calendar
         Returns:
@@ -245,7 +262,8 @@ class GoogleCalendarRules:
             "refund_policy": "full_refund"
         }
     
-    def get_calendar_settings(self) -> Dict[str, Any]:
+    @rule_table
+    def get_calendar_settings(self) -> Mapping[str, Any]:
         """
         Retorna configurações específicas do calendário
         Returns:
@@ -258,3 +276,6 @@ class GoogleCalendarRules:
             "slot_duration": self.get_slot_duration(),
             "buffer_time": 15  # 15 minutos de buffer entre eventos
         }
+
+
+load_rule_tables(GoogleCalendarRules)
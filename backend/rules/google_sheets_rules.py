@@ -1,6 +1,8 @@
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Mapping, Sequence
 from enum import Enum
 
+from rules.registry import rule_table, load_rule_tables
+
 class GoogleSheetsFlowType(Enum):
     """Tipos de fluxos disponíveis no Google Sheets"""
     READ_DATA = "read_data"
@@ -15,12 +17,15 @@ class GoogleSheetsRules:
     Regras estáticas para integração com Google Sheets API
     Contém APENAS configurações, regras e validações estáticas
     """
+
+    API_TYPE = "GOOGLE_SHEETS"
     
     def __init__(self):
         """Inicializa as regras do Google Sheets"""
         pass
     
-    def get_api_rules(self) -> Dict[str, Any]:
+    @rule_table
+    def get_api_rules(self) -> Mapping[str, Any]:
         """
         Retorna regras gerais da API Google Sheets
         Returns:
@@ -51,15 +56,10 @@ class GoogleSheetsRules:
             ]
         }
     
-    def get_required_fields(self, flow_type: str) -> List[str]:
-        """
-        Retorna campos obrigatórios para cada tipo de fluxo
-        Args:
-            flow_type: Tipo do fluxo (GoogleSheetsFlowType)
-        Returns:
-            Lista de campos obrigatórios
-        """
-        required_fields = {
+    @rule_table
+    def get_required_fields_by_flow(self) -> Mapping[str, Sequence[str]]:
+        """Campos obrigatórios por tipo de fluxo"""
+        return {
             GoogleSheetsFlowType.READ_DATA.value: [
                 "spreadsheet_id", "range"
             ],
@@ -79,18 +79,21 @@ class GoogleSheetsRules:
                 "spreadsheet_id", "sheet_name"
             ]
         }
-        
-        return required_fields.get(flow_type, [])
-    
-    def get_validation_rules(self, flow_type: str) -> Dict[str, Any]:
+
+    def get_required_fields(self, flow_type: str) -> Sequence[str]:
         """
-        Retorna regras de validação para cada fluxo
+        Retorna campos obrigatórios para cada tipo de fluxo
         Args:
-            flow_type: Tipo do fluxo
+            flow_type: Tipo do fluxo (GoogleSheetsFlowType)
         Returns:
-            Dicionário com regras de validação
+            Lista de campos obrigatórios
         """
-        validation_rules = {
+        return self.get_required_fields_by_flow().get(flow_type, ())
+    
+    @rule_table
+    def get_validation_rules_by_flow(self) -> Mapping[str, Mapping[str, Any]]:
+        """Regras de validação por tipo de fluxo"""
+        return {
             GoogleSheetsFlowType.READ_DATA.value: {
                 "spreadsheet_id_validation": "valid_id_format",
                 "range_validation": "valid_range_format",
@@ -113,10 +116,19 @@ class GoogleSheetsRules:
                 "search_term_validation": "non_empty_string"
             }
         }
-        
-        return validation_rules.get(flow_type, {})
+
+    def get_validation_rules(self, flow_type: str) -> Mapping[str, Any]:
+        """
+        Retorna regras de validação para cada fluxo
+        Args:
+            flow_type: Tipo do fluxo
+        Returns:
+            Dicionário com regras de validação
+        """
+        return self.get_validation_rules_by_flow().get(flow_type, {})
     
-    def get_available_flows(self) -> List[Dict[str, Any]]:
+    @rule_table
+    def get_available_flows(self) -> Sequence[Mapping[str, Any]]:
         """
         Retorna todos os fluxos disponíveis no Google Sheets
         Returns:
@@ -163,7 +175,8 @@ class GoogleSheetsRules:
     
     # MÉTODOS DE COMPATIBILIDADE MIGRADOS DO api_rules_engine.py
     
-    def get_client_search_rules(self) -> Dict[str, Any]:
+    @rule_table
+    def get_client_search_rules(self) -> Mapping[str, Any]:
         """Retorna regras de busca de cliente para Google Sheets"""
         return {
             "api_endpoint": "/spreadsheets/{spreadsheet_id}/values/{range}",
@@ -178,7 +191,8 @@ class GoogleSheetsRules:
             "search_by_waid": True
         }
     
-    def get_service_detection_rules(self) -> Dict[str, Any]:
+    @rule_table
+    def get_service_detection_rules(self) -> Mapping[str, Any]:
         """Retorna regras de detecção de serviço para Google Sheets"""
         return {
             "api_endpoint": "/spreadsheets/{spreadsheet_id}/values/{range}",
@@ -187,7 +201,8 @@ class GoogleSheetsRules:
             "default_categories": ["Estética Facial", "Estética Corporal", "Tratamentos"]
         }
     
-    def get_professional_search_rules(self) -> Dict[str, Any]:
+    @rule_table
+    def get_professional_search_rules(self) -> Mapping[str, Any]:
         """Retorna regras de busca de profissionais para Google Sheets"""
         return {
             "api_endpoint": "/spreadsheets/{spreadsheet_id}/values/{range}",
@@ -196,7 +211,8 @@ class GoogleSheetsRules:
             "filter_by_service": True
         }
     
-    def get_availability_check_rules(self) -> Dict[str, Any]:
+    @rule_table
+    def get_availability_check_rules(self) -> Mapping[str, Any]:
         """Retorna regras de verificação de disponibilidade para Google Sheets"""
         return {
             "api_endpoint": "/spreadsheets/{spreadsheet_id}/values/{range}",
@@ -207,7 +223,8 @@ class GoogleSheetsRules:
             "advance_booking": self.get_advance_booking_hours()
         }
     
-    def get_reservation_creation_rules(self) -> Dict[str, Any]:
+    @rule_table
+    def get_reservation_creation_rules(self) -> Mapping[str, Any]:
         """Retorna regras de criação de reserva para Google Sheets"""
         return {
             "api_endpoint": "/spreadsheets/{spreadsheet_id}/values/{range}",
@@ -221,7 +238,8 @@ class GoogleSheetsRules:
             }
         }
     
-    def get_reservation_management_rules(self) -> Dict[str, Any]:
+    @rule_table
+    def get_reservation_management_rules(self) -> Mapping[str, Any]:
         """Retorna regras de gerenciamento de reserva para Google Sheets"""
         return {
             "api_endpoint": "/spreadsheets/{spreadsheet_id}/values/{range}",
@@ -233,7 +251,8 @@ class GoogleSheetsRules:
             }
         }
     
-    def get_sheet_structure(self) -> Dict[str, Any]:
+    @rule_table
+    def get_sheet_structure(self) -> Mapping[str, Any]:
         """
         Retorna estrutura padrão das planilhas
         Returns:
@@ -288,7 +307,8 @@ class GoogleSheetsRules:
             }
         }
     
-    def get_business_hours(self) -> Dict[str, Any]:
+    @rule_table
+    def get_business_hours(self) -> Mapping[str, Any]:
         """
         Retorna horário de funcionamento padrão para Google Sheets
         Returns:
@@ -328,7 +348,8 @@ class GoogleSheetsRules:
         """
         return 30  # 30 dias à frente
     
-    def get_cancellation_policy(self) -> Dict[str, Any]:
+    @rule_table
+    def get_cancellation_policy(self) -> Mapping[str, Any]:
         """
         Retorna política de cancelamento para Google Sheets
         Returns:
@@ -340,7 +361,8 @@ class GoogleSheetsRules:
             "refund_policy": "full_refund"
         }
     
-    def get_sheet_permissions(self) -> Dict[str, Any]:
+    @rule_table
+    def get_sheet_permissions(self) -> Mapping[str, Any]:
         """
         Retorna configurações de permissões das planilhas
         Returns:
@@ -352,3 +374,6 @@ class GoogleSheetsRules:
             "client_permissions": "view",
             "professional_permissions": "edit"
         }
+
+
+load_rule_tables(GoogleSheetsRules)
@@ -0,0 +1,120 @@
+"""
+Tabelas estáticas das regras (Trinks, Google Calendar, Google Sheets, Twilio).
+
+Os métodos get_*_rules das classes de regras montavam dicionários grandes a
+cada chamada (várias vezes por turno, e em toda instância nova de TrinksRules
+criada pelas Tools). Com @rule_table a tabela é montada uma única vez
+(load_rule_tables na importação do módulo), congelada e compartilhada:
+
+- dict → MappingProxyType, list → tuple, set → frozenset (somente leitura);
+- quem precisar de uma cópia mutável/serializável usa thaw();
+- overlay opcional por empresa: `<api>_config.rules_overrides.<tabela>` na
+  configuração da API da empresa (ex.: trinks_config.rules_overrides.business_hours)
+  é mesclado sobre a tabela base; o resultado também fica em cache.
+"""
+import functools
+import json
+import logging
+import threading
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Mapping, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MAX_OVERLAYS = 256
+
+_tables: Dict[str, Any] = {}
+_overlays: Dict[Tuple[str, str], Any] = {}
+_lock = threading.Lock()
+
+
+def freeze(value: Any) -> Any:
+    """Cópia somente leitura (recursiva) de uma tabela de regras"""
+    if isinstance(value, Mapping):
+        return MappingProxyType({k: freeze(v) for k, v in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    if isinstance(value, (set, frozenset)):
+        return frozenset(freeze(v) for v in value)
+    return value
+
+
+def thaw(value: Any) -> Any:
+    """Cópia mutável (dict/list) de uma tabela congelada"""
+    if isinstance(value, Mapping):
+        return {k: thaw(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [thaw(v) for v in value]
+    if isinstance(value, frozenset):
+        return set(thaw(v) for v in value)
+    return value
+
+
+def merge(base: Any, overlay: Any) -> Any:
+    """Mescla overlay sobre a tabela base (dicts recursivamente; o resto é substituído)"""
+    if isinstance(base, Mapping) and isinstance(overlay, Mapping):
+        merged = dict(base)
+        for key, value in overlay.items():
+            merged[key] = merge(base[key], value) if key in base else value
+        return merged
+    return overlay
+
+
+def _tenant_overlay(owner: Any, name: str, empresa_config: Optional[Dict[str, Any]]) -> Any:
+    if not empresa_config:
+        return None
+    api_type = getattr(owner, 'API_TYPE', '')
+    api_config = empresa_config.get(f"{api_type.lower()}_config") or {}
+    overrides = api_config.get('rules_overrides') if isinstance(api_config, dict) else None
+    return overrides.get(name) if isinstance(overrides, dict) else None
+
+
+def rule_table(method: Callable[[Any], Any]) -> Callable[..., Any]:
+    """Transforma um get_* sem parâmetros em acessor de tabela congelada e memoizada.
+
+    O acessor aceita `empresa_config` opcional para aplicar o overlay da empresa.
+    """
+    key = method.__qualname__
+    name = method.__name__[4:] if method.__name__.startswith('get_') else method.__name__
+
+    @functools.wraps(method)
+    def accessor(self, empresa_config: Optional[Dict[str, Any]] = None) -> Any:
+        table = _tables.get(key)
+        if table is None:
+            built = freeze(method(self))
+            with _lock:
+                table = _tables.setdefault(key, built)
+        overlay = _tenant_overlay(type(self), name, empresa_config)
+        if overlay is None:
+            return table
+        try:
+            overlay_key = (key, json.dumps(overlay, sort_keys=True, default=str))
+        except (TypeError, ValueError):
+            logger.warning(f"⚠️ Overlay de regras inválido para {key}; usando tabela padrão")
+            return table
+        with _lock:
+            cached = _overlays.get(overlay_key)
+        if cached is None:
+            cached = freeze(merge(table, overlay))
+            with _lock:
+                if len(_overlays) >= MAX_OVERLAYS:
+                    _overlays.pop(next(iter(_overlays)))
+                _overlays[overlay_key] = cached
+        return cached
+
+    accessor.__rule_table__ = key
+    return accessor
+
+
+def load_rule_tables(cls: type) -> type:
+    """Monta e congela todas as tabelas @rule_table da classe (chamado na importação do módulo)"""
+    instance = cls()
+    for attr in dir(cls):
+        if getattr(getattr(cls, attr), '__rule_table__', None):
+            getattr(instance, attr)()
+    return cls
+
+
+def get_registry_stats() -> Dict[str, Any]:
+    with _lock:
+        return {'tables': sorted(_tables), 'tenant_overlays': len(_overlays)}
@@ -1,4 +1,4 @@
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Mapping, Sequence
 from datetime import datetime
 import json
 try:
@@ -22,8 +22,152 @@ except Exception:
 from enum import Enum
 import logging
 
+from services.llm_gateway import get_llm, INTENT, EXTRACTION, PLANNING
+from rules.registry import rule_table, load_rule_tables
+from services.step_graph import StepSpec
+from services.prompt_templates import register, render
+from services.structured_output import JSON_MODE, ExtractedData, IntentResult, NextSteps, parse, dump, record_fallback
+
 logger = logging.getLogger(__name__)
 
+# Instruções da detecção de intenção (prefixo estável: nada que mude por turno entra aqui)
+register('trinks_rules.detect_intent', """Você é um assistente que analisa mensagens de WhatsApp para agendamentos.
+
+INTENÇÕES SUPORTADAS: {intencoes}
+
+FUNÇÃO PRINCIPAL: Analisar a mensagem e retornar APENAS um objeto JSON com intenção, informações extraídas e instruções de cache.
+
+🚨 REGRA CRÍTICA: Se a mensagem atual NÃO mencionar profissional/procedimento, mas a ÚLTIMA MENSAGEM DO BOT contiver esses dados → EXTRAIA DO CONTEXTO ANTERIOR automaticamente.
+
+ESTRUTURA OBRIGATÓRIA:
+{{
+  "intent": "<intenção_detectada>",
+  "extracted": {{
+    "profissional": "nome da pessoa mencionada (se houver, OU do contexto anterior)",
+    "procedimento": "tipo de serviço/procedimento (se houver, OU do contexto anterior)",
+    "data": "data mencionada (converta para YYYY-MM-DD)",
+    "horario": "horário mencionado (se houver)",
+    "profissional_id": "ID do profissional (se resolvido via cache)",
+    "servico_id": "ID do serviço (se resolvido via cache)",
+    "cpf": "CPF mencionado (se houver)",
+    "nome": "nome do cliente mencionado (se houver)",
+    "email": "email do cliente mencionado (se houver)"
+  }},
+  "cache_instructions": {{
+    "clear_fields": ["lista_de_campos_para_limpar_do_cache"]
+  }}
+}}
+
+REGRAS DE CLASSIFICAÇÃO DE INTENÇÃO:
+- agendar_consulta: Quando o cliente quiser agendar uma consulta 
+- cancelar_consulta: Quando o cliente quer cancelar agendamento existente
+- reagendar_consulta: Quando o cliente quer mudar data/horário de agendamento existente
+- verificar_informacoes: Para mensagens que o usuário quer saber o preço ou como funciona o serviço
+
+EXEMPLOS DE CLASSIFICAÇÃO:
+- "Sim, esse horário de amanhã às 14h está perfeito!" → agendar_consulta
+- "Perfeito, confirma o dia 25 às 15h" → agendar_consulta
+- "Qual o preço da consulta?" → verificar_informacoes
+- "Qual o valor da consulta com a Dra. Juliana?" → verificar_informacoes
+- "Quanto custa a limpeza de pele?" → verificar_informacoes
+
+CONVERSÃO DE DATAS:
+- Se o contexto trouxer DATAS/HORÁRIOS JÁ RESOLVIDOS NA MENSAGEM ATUAL, use exatamente esses valores
+- "25/08" → "2025-08-25"
+- "segunda" → próxima segunda-feira em YYYY-MM-DD
+- "amanhã" → data de amanhã em YYYY-MM-DD
+- "hoje" → data de hoje em YYYY-MM-DD
+
+CONVERSÃO DE CPF: 
+- SEMPRE SEM ".", "-", " "
+- Exemplo: "123.456.789-01", "123456789-01" → "12345678901"
+
+REGRAS CRÍTICAS DE PRIORIDADE:
+1. SEMPRE retorne APENAS JSON válido
+2. A MENSAGEM ATUAL TEM PRIORIDADE sobre o contexto anterior, MAS se a mensagem atual NÃO mencionar profissional/procedimento e a ÚLTIMA MENSAGEM DO BOT contiver esses dados → EXTRAIA DO CONTEXTO ANTERIOR automaticamente
+3. APENAS extraia data caso você tenha sugerido aquele horário anteriormente, nunca extraia data que não verificamos ainda
+4. Se a mensagem atual mencionar nova data, use APENAS ela (ignore datas anteriores)
+5. Se a mensagem atual mencionar novo horário, use APENAS ele (ignore horários anteriores)
+6. Se a mensagem atual mencionar novo profissional, use APENAS ele (ignore profissionais anteriores)
+7. Use o contexto anterior para informações NÃO mencionadas na mensagem atual, ESPECIALMENTE profissional e procedimento da última mensagem do bot
+8. NUNCA mantenha dados antigos se novos foram explicitamente mencionados
+9. REGRA ESPECIAL: Se a mensagem atual só mencionar data/horário mas NÃO mencionar profissional/procedimento, SEMPRE extraia profissional e procedimento da última mensagem do bot disponível no contexto
+10. Avaliação Gratuita é um procedimento também no tinks, caso encontre no historico de mensagem pode extrarir
+
+REGRAS DE LIMPEZA DE CACHE:
+1. SEMPRE que mencionar NOVO profissional → clear_fields: ["profissional_id", "horario"]
+2. SEMPRE que mencionar NOVO procedimento/serviço → clear_fields: ["servico_id", "horario"]
+3. SEMPRE que mencionar NOVA data → clear_fields: ["horario"] (se horário era específico)
+4. SEMPRE que mencionar NOVO horário → clear_fields: [] (não limpa nada)
+5. Se NÃO mencionar mudanças → clear_fields: [] (não limpa nada)
+
+RESOLUÇÃO AUTOMÁTICA DE PROFISSIONAL:
+- Se horário específico for mencionado → use o histórico para tentar identificar qual profissional tem esse horário na última mensagem do bot!
+- Example: "14:30" → verifique se na ultima mensagem do Bot era listado o nome de algum profissional com 14:30 listado
+- Se encontrar → extraia também o profissional_id correspondente
+
+CACHE TEMPORÁRIO DE PROFISSIONAIS:
+- Se disponível no contexto → use para resolver automaticamente profissional por horário
+- Example: Se cache contém "Amabile (ID: 564031): 14h, 15h | Geraldine (ID: 564410): 16h"
+- E usuário diz "15h" → extraia automaticamente:
+  - horario: "15:00"
+  - profissional_id: "564031" (Amabile)
+- Cache expira automaticamente após 2 mensagens
+
+EXEMPLO de resolução automática de profissional:
+Histórico: "Amabile: 14:30, 15:00 | Geraldine: 09:30, 10:00"
+Mensagem: "Pode ser as 14:30"
+Resposta: {{
+    "horario": "14:30",
+    "profissional_id": "564031"
+}}
+
+EXEMPLO OBRIGATÓRIO DE USO DO CONTEXTO ANTERIOR:
+- Última mensagem do Bot: "O Laser Lavien é um tratamento incrível... com a Dra. Amabile. Gostaria de agendar?"
+- Mensagem atual do Usuário: "Sim, pode ser dia 01/09"
+- RESULTADO OBRIGATÓRIO: 
+  - profissional: "Dra. Amabile" (extraído do contexto anterior)
+  - procedimento: "Laser Lavien" (extraído do contexto anterior)
+  - data: "2025-09-01" (extraído da mensagem atual)
+  - cache_instructions: {{"clear_fields": ["horario"]}}
+
+EXEMPLO de resolução automática de profissional:
+Histórico: "Amabile: 14:30, 15:00 | Geraldine: 09:30, 10:00"
+Mensagem: "Pode ser as 14:30"
+Resposta: {{
+    "horario": "14:30",
+    "profissional_id": "564031"
+}}
+
+EXEMPLOS DE CACHE_INSTRUCTIONS:
+- "E para a Maria?" → {{"intent": "agendar_consulta", "extracted": {{"profissional": "maria"}}, "cache_instructions": {{"clear_fields": ["profissional_id", "horario"]}}}}
+- "E para aplicação de enzimas?" → {{"intent": "agendar_consulta", "extracted": {{"procedimento": "aplicação de enzimas"}}, "cache_instructions": {{"clear_fields": ["servico_id", "horario"]}}}}
+- "E para dia 28/08?" → {{"intent": "agendar_consulta", "extracted": {{"data": "2025-08-28"}}, "cache_instructions": {{"clear_fields": ["horario"]}}}}
+- "E para às 15h?" → {{"intent": "agendar_consulta", "extracted": {{"horario": "15:00"}}, "cache_instructions": {{"clear_fields": []}}}}
+- "Oi queria marcar retorno" → {{"intent": "agendar_consulta", "extracted": {{}}, "cache_instructions": {{"clear_fields": []}}}}
+
+EXEMPLOS DE PRIORIDADE:
+- "E para dia 28/08?" → {{"intent": "agendar_consulta", "extracted": {{"data": "2025-08-28"}}}} (IGNORE data anterior)
+- "E para às 15h?" → {{"intent": "agendar_consulta", "extracted": {{"horario": "15:00"}}}} (IGNORE horário anterior)
+- "E para a Maria?" → {{"intent": "agendar_consulta", "extracted": {{"profissional": "maria"}}}} (IGNORE profissional anterior)
+
+EXEMPLOS DE PROCEDIMENTOS:
+- "consulta" → procedimento: "consulta"
+- "retorno" → procedimento: "retorno"
+- "limpeza de pele" → procedimento: "limpeza de pele"
+- "toxina botulínica" → procedimento: "toxina botulínica"
+
+EXEMPLOS DE RESPOSTA COMPLETA:
+- "Oi queria marcar retorno com a amabile" → {{"intent": "agendar_consulta", "extracted": {{"profissional": "amabile", "procedimento": "retorno"}}, "cache_instructions": {{"clear_fields": ["profissional_id", "horario"]}}}}
+- "Para segunda feira" → {{"intent": "agendar_consulta", "extracted": {{"data": "2025-08-18"}}, "cache_instructions": {{"clear_fields": ["horario"]}}}}
+- "as 19 ela tem?" → {{"intent": "agendar_consulta", "extracted": {{"horario": "19:00", "profissional": "amabile"}}, "cache_instructions": {{"clear_fields": ["profissional_id", "horario"]}}}}
+- "Sim, esse horário está perfeito!" → {{"intent": "agendar_consulta", "extracted": {{}}, "cache_instructions": {{"clear_fields": []}}}}
+- "Tanto faz, qualquer um" → {{"intent": "agendar_consulta", "extracted": {{"profissional": "indiferente"}}, "cache_instructions": {{"clear_fields": ["profissional_id", "horario"]}}}}
+
+IMPORTANTE: A mensagem atual SEMPRE tem prioridade sobre o contexto anterior. Se o usuário mencionar uma nova data, horário ou profissional, use APENAS essas informações novas.
+
+FORMATO OBRIGATÓRIO: Retorne APENAS o JSON, sem texto adicional, sem explicações.""", tenant_fields=('intencoes',))
+
 class TrinksFlowType(Enum):
     """Tipos de fluxos disponíveis no Trinks"""
     CHECK_AVAILABILITY = "check_availability"
@@ -39,6 +183,8 @@ class TrinksRules:
     Contém APENAS configurações, regras e validações estáticas
     Seguindo a arquitetura definida em agent-architecture.mdc
     """
+
+    API_TYPE = "TRINKS"
     
     def __init__(self):
         """Inicializa as regras do Trinks"""
@@ -47,25 +193,16 @@ class TrinksRules:
     # ==========================
     # Suporte interno a LLM (Rules → LLM)
     # ==========================
-    def _get_llm(self, empresa_config: Dict[str, Any]):
-        api_key = (empresa_config or {}).get('openai_key') or (empresa_config or {}).get('openai_api_key')
-        return ChatOpenAI(api_key=api_key, temperature=0.2, model="gpt-4o")
+    def _get_llm(self, empresa_config: Dict[str, Any], task: str = PLANNING):
+        """LLM da etapa `task` (modelo/timeout/fallback pela política da empresa no gateway)"""
+        return get_llm(task, empresa_config, temperature=0.2)
 
-    def _clean_llm_json(self, text: str) -> str:
-        try:
-            start = text.find('{')
-            end = text.rfind('}')
-            if start != -1 and end != -1 and end > start:
-                return text[start:end+1].strip()
-            return text.strip()
-        except Exception:
-            return text
-    
     # ========================================
     # 1. REGRAS BÁSICAS DA API
     # ========================================
     
-    def get_api_rules(self) -> Dict[str, Any]:
+    @rule_table
+    def get_api_rules(self) -> Mapping[str, Any]:
         """
         Retorna regras gerais da API Trinks
         Returns:
@@ -97,15 +234,10 @@ class TrinksRules:
             ]
         }
     
-    def get_required_fields(self, flow_type: str) -> List[str]:
-        """
-        Retorna campos obrigatórios para cada tipo de fluxo
-        Args:
-            flow_type: Tipo do fluxo (TrinksFlowType)
-        Returns:
-            Lista de campos obrigatórios
-        """
-        required_fields = {
+    @rule_table
+    def get_required_fields_by_flow(self) -> Mapping[str, Sequence[str]]:
+        """Campos obrigatórios por tipo de fluxo"""
+        return {
             TrinksFlowType.CHECK_AVAILABILITY.value: [
                 "professional_id", "service_id", "date"
             ],
@@ -119,18 +251,21 @@ class TrinksRules:
                 "name", "phone", "email"
             ]
         }
-        
-        return required_fields.get(flow_type, [])
-    
-    def get_validation_rules(self, flow_type: str) -> Dict[str, Any]:
+
+    def get_required_fields(self, flow_type: str) -> Sequence[str]:
         """
-        Retorna regras de validação para cada fluxo
+        Retorna campos obrigatórios para cada tipo de fluxo
         Args:
-            flow_type: Tipo do fluxo
+            flow_type: Tipo do fluxo (TrinksFlowType)
         Returns:
-            Dicionário com regras de validação
+            Lista de campos obrigatórios
         """
-        validation_rules = {
+        return self.get_required_fields_by_flow().get(flow_type, ())
+    
+    @rule_table
+    def get_validation_rules_by_flow(self) -> Mapping[str, Mapping[str, Any]]:
+        """Regras de validação por tipo de fluxo"""
+        return {
             TrinksFlowType.CHECK_AVAILABILITY.value: {
                 "date_format": "YYYY-MM-DD",
                 "date_validation": "future_date_only",
@@ -152,10 +287,19 @@ class TrinksRules:
                 "email_validation": "valid_email_format"
             }
         }
-        
-        return validation_rules.get(flow_type, {})
+
+    def get_validation_rules(self, flow_type: str) -> Mapping[str, Any]:
+        """
+        Retorna regras de validação para cada fluxo
+        Args:
+            flow_type: Tipo do fluxo
+        Returns:
+            Dicionário com regras de validação
+        """
+        return self.get_validation_rules_by_flow().get(flow_type, {})
     
-    def get_available_flows(self) -> List[Dict[str, Any]]:
+    @rule_table
+    def get_available_flows(self) -> Sequence[Mapping[str, Any]]:
         """
         Retorna todos os fluxos disponíveis no Trinks
         Returns:
@@ -204,7 +348,8 @@ class TrinksRules:
     # 2. REGRAS DE CONVERSA ESPECÍFICAS
     # ========================================
     
-    def get_intelligent_match_rules(self) -> Dict[str, Any]:
+    @rule_table
+    def get_intelligent_match_rules(self) -> Mapping[str, Any]:
         """
         Retorna regras específicas do Trinks para match inteligente
         Returns:
@@ -243,7 +388,8 @@ class TrinksRules:
             }
         }
     
-    def get_data_extraction_rules(self) -> Dict[str, Any]:
+    @rule_table
+    def get_data_extraction_rules(self) -> Mapping[str, Any]:
         """
         Retorna regras específicas do Trinks para extração de dados
         Returns:
@@ -306,7 +452,8 @@ class TrinksRules:
             }
         }
     
-    def get_conversation_flow_rules(self) -> Dict[str, Any]:
+    @rule_table
+    def get_conversation_flow_rules(self) -> Mapping[str, Any]:
         """
         Retorna regras para fluxo de conversa específicas do Trinks
         Returns:
@@ -334,7 +481,6 @@ class TrinksRules:
                 ]
             },
             "step_dependencies": {
-                "buscar_servico": ["buscar_profissional"],
                 "verificar_disponibilidade": ["buscar_profissional", "buscar_servico"],
                 "validar_slots": ["verificar_disponibilidade"],
                 "coletar_cliente": ["extrair_dados"],
@@ -359,12 +505,47 @@ class TrinksRules:
                 }
             }
         }
-    
+
+    @rule_table
+    def get_step_specs(self) -> Mapping[str, StepSpec]:
+        """
+        Campos que cada passo de execute_step lê e escreve (via cache_instructions).
+        Usado pelo executor de planos (services/step_graph.py) para rodar em paralelo
+        os passos independentes. Passos que não aparecem aqui (ou com side_effect)
+        rodam sozinhos, na ordem do plano.
+        """
+        return {
+            "buscar_profissional": StepSpec(
+                "buscar_profissional",
+                inputs=frozenset({"profissional", "procedimento"}),
+                outputs=frozenset({"profissional_id", "temp_professional_cache", "temp_cache_expiry"})
+            ),
+            "buscar_servico": StepSpec(
+                "buscar_servico",
+                inputs=frozenset({"procedimento"}),
+                outputs=frozenset({"servico_id", "duracao_em_minutos", "valor"})
+            ),
+            "verificar_disponibilidade": StepSpec(
+                "verificar_disponibilidade",
+                inputs=frozenset({"data", "profissional_id", "servico_id", "duracao_em_minutos", "valor"}),
+                outputs=frozenset({"duracao_em_minutos", "valor", "temp_professional_cache", "temp_cache_expiry"})
+            ),
+            "verificar_informacoes_profissional": StepSpec(
+                "verificar_informacoes_profissional",
+                inputs=frozenset({"profissional_id", "procedimento"})
+            ),
+            "coletar_cliente": StepSpec("coletar_cliente", side_effect=True),
+            "criar_reserva": StepSpec("criar_reserva", side_effect=True),
+            "cancelar_agendamento": StepSpec("cancelar_agendamento", side_effect=True),
+            "confirmar_presenca": StepSpec("confirmar_presenca", side_effect=True),
+        }
+
     # ========================================
     # 3. REGRAS DE NEGÓCIO ESPECÍFICAS
     # ========================================
     
-    def get_business_hours(self) -> Dict[str, Any]:
+    @rule_table
+    def get_business_hours(self) -> Mapping[str, Any]:
         """
         Retorna horário de funcionamento padrão do Trinks
         Returns:
@@ -404,7 +585,8 @@ class TrinksRules:
         """
         return 30  # 30 dias à frente
     
-    def get_cancellation_policy(self) -> Dict[str, Any]:
+    @rule_table
+    def get_cancellation_policy(self) -> Mapping[str, Any]:
         """
         Retorna política de cancelamento
         Returns:
@@ -420,7 +602,8 @@ class TrinksRules:
     # 4. REGRAS DE COMPATIBILIDADE (LEGACY)
     # ========================================
     
-    def get_client_search_rules(self) -> Dict[str, Any]:
+    @rule_table
+    def get_client_search_rules(self) -> Mapping[str, Any]:
         """Retorna regras de busca de cliente para Trinks"""
         return {
             "api_endpoint": "/estabelecimentos/{estabelecimento_id}/clientes",
@@ -433,49 +616,31 @@ class TrinksRules:
             }
         }
     
-    def get_service_detection_rules(self) -> Dict[str, Any]:
-        """Retorna regras de detecção de serviço para Trinks"""
-        return {
-            "api_endpoint": "/estabelecimentos/{estabelecimento_id}/servicos",
-            "search_fields": ["nome", "categoria", "descricao"],
-            "match_strategies": ["keyword_match", "partial_match", "category_match"],
-            "default_categories": ["Estética Facial", "Estética Corporal", "Tratamentos"]
-        }
+    # Os três acessores abaixo eram sombreados por sobrecargas (self, empresa_config)
+    # e nunca devolveram estas tabelas: as chamadas sem argumento em
+    # TrinksIntelligentTools falhavam e caíam no tratamento de erro. Os endpoints
+    # /estabelecimentos/{id}/... também não existem na Trinks. As tabelas vazias
+    # (e "nao_implementado" na criação de reserva) mantêm esses caminhos desligados;
+    # a busca de serviços/profissionais e a criação de agendamentos seguem pelos
+    # passos do fluxo (GET /servicos, /profissionais, POST /agendamentos).
     
-    def get_professional_search_rules(self) -> Dict[str, Any]:
-        """Retorna regras de busca de profissionais para Trinks"""
-        return {
-            "api_endpoint": "/estabelecimentos/{estabelecimento_id}/profissionais",
-            "search_fields": ["nome", "especialidade", "disponibilidade"],
-            "match_strategies": ["name_match", "specialty_match", "availability_match"],
-            "filter_by_service": True
-        }
+    @rule_table
+    def get_service_detection_rules(self) -> Mapping[str, Any]:
+        """Retorna regras de detecção de serviço para Trinks (legado, desativado)"""
+        return {}
     
-    def get_availability_check_rules(self) -> Dict[str, Any]:
-        """Retorna regras de verificação de disponibilidade para Trinks"""
-        return {
-            "api_endpoint": "/estabelecimentos/{estabelecimento_id}/disponibilidade",
-            "required_fields": ["data", "servico_id"],
-            "optional_fields": ["profissional_id"],
-            "slot_duration": 30,
-            "business_hours": self.get_business_hours(),
-            "advance_booking": self.get_advance_booking_hours()
-        }
+    @rule_table
+    def get_professional_search_rules(self) -> Mapping[str, Any]:
+        """Retorna regras de busca de profissionais para Trinks (legado, desativado)"""
+        return {}
     
-    def get_reservation_creation_rules(self) -> Dict[str, Any]:
-        """Retorna regras de criação de reserva para Trinks"""
-        return {
-            "api_endpoint": "/estabelecimentos/{estabelecimento_id}/agendamentos",
-            "required_fields": ["profissional_id", "servico_id", "data", "horario", "cliente_nome"],
-            "optional_fields": ["observacoes", "cliente_telefone", "cliente_email"],
-            "validation_rules": {
-                "data": "future_date_only",
-                "horario": "business_hours",
-                "cliente_nome": "non_empty_string"
-            }
-        }
+    @rule_table
+    def get_reservation_creation_rules(self) -> Mapping[str, Any]:
+        """Retorna regras de criação de reserva para Trinks (legado, desativado)"""
+        return {"status": "nao_implementado"}
     
-    def get_reservation_management_rules(self) -> Dict[str, Any]:
+    @rule_table
+    def get_reservation_management_rules(self) -> Mapping[str, Any]:
         """Retorna regras de gerenciamento de reserva para Trinks"""
         return {
             "api_endpoint": "/estabelecimentos/{estabelecimento_id}/agendamentos",
@@ -519,30 +684,17 @@ class TrinksRules:
     
     # MÉTODOS DELEGADOS PARA AS REGRAS ESPECÍFICAS - COMPATIBILIDADE
     
-    def get_client_search_rules(self, empresa_config: Dict[str, Any]) -> Dict[str, Any]:
-        """Retorna regras de busca de cliente para a API ativa - COMPATIBILIDADE"""
-        return self.get_client_search_rules()
-    
-    def get_service_detection_rules(self, empresa_config: Dict[str, Any]) -> Dict[str, Any]:
-        """Retorna regras de detecção de serviço para a API ativa - COMPATIBILIDADE"""
-        return self.get_service_detection_rules()
-    
-    def get_professional_search_rules(self, empresa_config: Dict[str, Any]) -> Dict[str, Any]:
-        """Retorna regras de busca de profissionais para a API ativa - COMPATIBILIDADE"""
-        return self.get_professional_search_rules()
+    # get_client_search_rules, get_service_detection_rules, get_professional_search_rules e
+    # get_reservation_creation_rules aceitam empresa_config opcional (@rule_table)
     
-    def get_availability_check_rules(self, empresa_config: Dict[str, Any]) -> Dict[str, Any]:
+    def get_availability_check_rules(self, empresa_config: Dict[str, Any] = None) -> Mapping[str, Any]:
         """Retorna regras de verificação de disponibilidade para a API ativa - COMPATIBILIDADE"""
-        return self.get_availability_check_rules_expanded()
-    
-    def get_reservation_creation_rules(self, empresa_config: Dict[str, Any]) -> Dict[str, Any]:
-        """Retorna regras de criação de reserva para a API ativa - COMPATIBILIDADE"""
-        # TODO: Implementar regras específicas de criação de reserva
-        return {"status": "nao_implementado"}
+        return self.get_availability_check_rules_expanded(empresa_config)
     
     # MÉTODOS ESPECÍFICOS DO TRINKS
     
-    def get_availability_check_rules_expanded(self) -> Dict[str, Any]:
+    @rule_table
+    def get_availability_check_rules_expanded(self) -> Mapping[str, Any]:
         """Retorna regras expandidas de verificação de disponibilidade para Trinks"""
         return {
             "flow_type": "check_availability",
@@ -584,7 +736,8 @@ class TrinksRules:
             }
         }
     
-    def get_search_type_rules(self) -> Dict[str, Any]:
+    @rule_table
+    def get_search_type_rules(self) -> Mapping[str, Any]:
         """Retorna regras para determinar o tipo de busca para Trinks"""
         return {
             "por_profissional": {
@@ -680,7 +833,8 @@ class TrinksRules:
             logger.info(f"🔄 Usando fluxo de fallback: {fluxo_fallback}")
             return fluxo_fallback
     
-    def get_preference_rules(self) -> Dict[str, Any]:
+    @rule_table
+    def get_preference_rules(self) -> Mapping[str, Any]:
         """Retorna as regras de preferência de profissional para Trinks"""
         try:
             flows = self.get_available_flows()
@@ -720,7 +874,8 @@ class TrinksRules:
         except Exception as e:
             return {'should_ask': False, 'reason': f'Erro: {str(e)}'}
     
-    def get_slot_validation_rules(self) -> Dict[str, Any]:
+    @rule_table
+    def get_slot_validation_rules(self) -> Mapping[str, Any]:
         """Retorna as regras de validação de slots para Trinks"""
         try:
             flows = self.get_available_flows()
@@ -940,6 +1095,11 @@ class TrinksRules:
                     enriched_data.get('motivo', 'Cliente solicitou cancelamento'), 
                     empresa_config
                 )
+            elif step_name == "confirmar_presenca":
+                return tools_instance.confirmar_presenca_agendamento(
+                    enriched_data.get('agendamento_id'),
+                    empresa_config
+                )
             elif step_name == "verificar_informacoes_profissional":
                 return tools_instance.verificar_informacoes_profissional(
                     enriched_data.get('profissional_id'),  # ID do profissional
@@ -1199,19 +1359,42 @@ class TrinksRules:
             if data.get('cliente_id'):
                 return {"status": "cliente_ja_existe", "cliente_id": data.get('cliente_id')}
             
-            # Se não temos CPF, precisamos perguntar
-            if not data.get('cpf'):
-                return {
-                    "status": "perguntar_cpf"
-                    # ✅ Sem mensagem fixa - Smart Agent gera!
-                }
+            from services.client_identity import lookup as lookup_identity, remember as remember_identity
+            cpf = data.get('cpf')
+            resultado_busca = identidade = None
+            
+            # Sem CPF: cliente que volta é reconhecido pelo waid (cache de identidade)
+            if not cpf:
+                identidade = lookup_identity(empresa_config, waid=waid)
+                if identidade and identidade['fresh']:
+                    logger.info(f"🪪 Cliente reconhecido pelo waid: {identidade.get('nome')} (ID: {identidade['cliente_id']})")
+                    resultado_busca = {
+                        "found": True,
+                        "cliente_id": identidade['cliente_id'],
+                        "nome": identidade.get('nome'),
+                        "cpf": identidade.get('cpf'),
+                        "from_cache": True
+                    }
+                elif identidade and identidade.get('cpf'):
+                    # Entrada vencida: revalida na API pelo CPF já conhecido
+                    cpf = identidade['cpf']
+                else:
+                    # Se não temos CPF, precisamos perguntar
+                    return {
+                        "status": "perguntar_cpf"
+                        # ✅ Sem mensagem fixa - Smart Agent gera!
+                    }
             
             # Buscar cliente por CPF
-            cpf = data.get('cpf')
-            resultado_busca = tools_instance.buscar_cliente_por_cpf(cpf, empresa_config)
+            if resultado_busca is None:
+                resultado_busca = tools_instance.buscar_cliente_por_cpf(cpf, empresa_config)
             
             if resultado_busca.get('found'):
-                # Cliente encontrado
+                # Cliente encontrado: associa ao waid para as próximas conversas
+                if identidade is None or not identidade['fresh']:
+                    remember_identity(empresa_config, resultado_busca.get('cliente_id'), resultado_busca.get('nome'),
+                                      cpf=resultado_busca.get('cpf') or cpf, waid=waid,
+                                      verified_at=resultado_busca.get('verified_at'))
                 return {
                     "status": "cliente_encontrado",
                     "cliente_id": resultado_busca.get('cliente_id'),
@@ -1496,13 +1679,10 @@ REGRAS:
                 HumanMessage(content=f"MENSAGEM_ATUAL: {message}")
             ]
 
-            llm = self._get_llm(empresa_config)
-            response = llm.invoke(messages)
-            raw = (getattr(response, 'content', str(response)) or '').strip()
-            cleaned = self._clean_llm_json(raw)
-            import json
-            data = json.loads(cleaned)
-            return data if isinstance(data, dict) else {}
+            llm = self._get_llm(empresa_config, EXTRACTION)
+            response = llm.invoke(messages, **JSON_MODE)
+            parsed = parse('trinks_rules.extract_data', response, ExtractedData)
+            return dump(parsed) if parsed else {}
         except Exception as e:
             logger.error(f"Erro ao extrair dados: {e}")
             return {}
@@ -1668,19 +1848,21 @@ Você NÃO executa tools - apenas decide o que deve ser feito.
                 HumanMessage(content=f"history=\n{history_str}")
             ]
 
-            llm = self._get_llm(empresa_config)
-            response = llm.invoke(messages)
-            raw = (getattr(response, 'content', str(response)) or '').strip()
-            cleaned = self._clean_llm_json(raw)
-            import json
-            data = json.loads(cleaned)
+            llm = self._get_llm(empresa_config, PLANNING)
+            response = llm.invoke(messages, **JSON_MODE)
+            parsed = parse('trinks_rules.decide_next_steps', response, NextSteps)
+            if parsed is None:
+                record_fallback('trinks_rules.decide_next_steps')
+                return {"action": "ask_user", "agent_response": "Poderia detalhar?"}
+            data = dump(parsed)
+            data.setdefault('action', parsed.action)
             try:
                 logger.info(
                     f"🧭 Próximos passos decididos | action={data.get('action')} | missing={data.get('missing_data')}"
                 )
             except Exception:
                 pass
-            return data if isinstance(data, dict) else {"action": "ask_user", "agent_response": "Poderia detalhar?"}
+            return data
         except Exception as e:
             logger.error(f"Erro ao decidir próximos passos: {e}")
             return {"action": "ask_user", "agent_response": "Poderia repetir, por favor?", "missing_fields": []}
@@ -1718,153 +1900,37 @@ Você NÃO executa tools - apenas decide o que deve ser feito.
             available_intents = list(flows.keys()) if flows else []
             
             # Construir prompt unificado
-            system_prompt = f"""Você é um assistente que analisa mensagens de WhatsApp para agendamentos.
-
-CONTEXTO ATUAL: Hoje é {datetime.now().strftime('%d/%m/%Y')} (DD/MM/YYYY).
-
-INTENÇÕES SUPORTADAS: {', '.join(available_intents) if available_intents else 'Nenhuma intenção específica configurada'}
-
-FUNÇÃO PRINCIPAL: Analisar a mensagem e retornar APENAS um objeto JSON com intenção, informações extraídas e instruções de cache.
-
-🚨 REGRA CRÍTICA: Se a mensagem atual NÃO mencionar profissional/procedimento, mas a ÚLTIMA MENSAGEM DO BOT contiver esses dados → EXTRAIA DO CONTEXTO ANTERIOR automaticamente.
-
-ESTRUTURA OBRIGATÓRIA:
-{{
-  "intent": "<intenção_detectada>",
-  "extracted": {{
-    "profissional": "nome da pessoa mencionada (se houver, OU do contexto anterior)",
-    "procedimento": "tipo de serviço/procedimento (se houver, OU do contexto anterior)",
-    "data": "data mencionada (converta para YYYY-MM-DD)",
-    "horario": "horário mencionado (se houver)",
-    "profissional_id": "ID do profissional (se resolvido via cache)",
-    "servico_id": "ID do serviço (se resolvido via cache)",
-    "cpf": "CPF mencionado (se houver)",
-    "nome": "nome do cliente mencionado (se houver)",
-    "email": "email do cliente mencionado (se houver)"
-  }},
-  "cache_instructions": {{
-    "clear_fields": ["lista_de_campos_para_limpar_do_cache"]
-  }}
-}}
-
-REGRAS DE CLASSIFICAÇÃO DE INTENÇÃO:
-- agendar_consulta: Quando o cliente quiser agendar uma consulta 
-- cancelar_consulta: Quando o cliente quer cancelar agendamento existente
-- reagendar_consulta: Quando o cliente quer mudar data/horário de agendamento existente
-- verificar_informacoes: Para mensagens que o usuário quer saber o preço ou como funciona o serviço
-
-EXEMPLOS DE CLASSIFICAÇÃO:
-- "Sim, esse horário de amanhã às 14h está perfeito!" → agendar_consulta
-- "Perfeito, confirma o dia 25 às 15h" → agendar_consulta
-- "Qual o preço da consulta?" → verificar_informacoes
-- "Qual o valor da consulta com a Dra. Juliana?" → verificar_informacoes
-- "Quanto custa a limpeza de pele?" → verificar_informacoes
-
-CONVERSÃO DE DATAS:
-- "25/08" → "2025-08-25"
-- "segunda" → próxima segunda-feira em YYYY-MM-DD
-- "amanhã" → data de amanhã em YYYY-MM-DD
-- "hoje" → data de hoje em YYYY-MM-DD
-
-CONVERSÃO DE CPF: 
-- SEMPRE SEM ".", "-", " "
-- Exemplo: "123.456.789-01", "123456789-01" → "12345678901"
-
-REGRAS CRÍTICAS DE PRIORIDADE:
-1. SEMPRE retorne APENAS JSON válido
-2. A MENSAGEM ATUAL TEM PRIORIDADE sobre o contexto anterior, MAS se a mensagem atual NÃO mencionar profissional/procedimento e a ÚLTIMA MENSAGEM DO BOT contiver esses dados → EXTRAIA DO CONTEXTO ANTERIOR automaticamente
-3. APENAS extraia data caso você tenha sugerido aquele horário anteriormente, nunca extraia data que não verificamos ainda
-4. Se a mensagem atual mencionar nova data, use APENAS ela (ignore datas anteriores)
-5. Se a mensagem atual mencionar novo horário, use APENAS ele (ignore horários anteriores)
-6. Se a mensagem atual mencionar novo profissional, use APENAS ele (ignore profissionais anteriores)
-7. Use o contexto anterior para informações NÃO mencionadas na mensagem atual, ESPECIALMENTE profissional e procedimento da última mensagem do bot
-8. NUNCA mantenha dados antigos se novos foram explicitamente mencionados
-9. REGRA ESPECIAL: Se a mensagem atual só mencionar data/horário mas NÃO mencionar profissional/procedimento, SEMPRE extraia profissional e procedimento da última mensagem do bot disponível no contexto
-10. Avaliação Gratuita é um procedimento também no tinks, caso encontre no historico de mensagem pode extrarir
-
-REGRAS DE LIMPEZA DE CACHE:
-1. SEMPRE que mencionar NOVO profissional → clear_fields: ["profissional_id", "horario"]
-2. SEMPRE que mencionar NOVO procedimento/serviço → clear_fields: ["servico_id", "horario"]
-3. SEMPRE que mencionar NOVA data → clear_fields: ["horario"] (se horário era específico)
-4. SEMPRE que mencionar NOVO horário → clear_fields: [] (não limpa nada)
-5. Se NÃO mencionar mudanças → clear_fields: [] (não limpa nada)
-
-RESOLUÇÃO AUTOMÁTICA DE PROFISSIONAL:
-- Se horário específico for mencionado → use o histórico para tentar identificar qual profissional tem esse horário na última mensagem do bot!
-- Example: "14:30" → verifique se na ultima mensagem do Bot era listado o nome de algum profissional com 14:30 listado
-- Se encontrar → extraia também o profissional_id correspondente
-
-CACHE TEMPORÁRIO DE PROFISSIONAIS:
-- Se disponível no contexto → use para resolver automaticamente profissional por horário
-- Example: Se cache contém "Amabile (ID: 564031): 14h, 15h | Geraldine (ID: 564410): 16h"
-- E usuário diz "15h" → extraia automaticamente:
-  - horario: "15:00"
-  - profissional_id: "564031" (Amabile)
-- Cache expira automaticamente após 2 mensagens
-
-EXEMPLO de resolução automática de profissional:
-Histórico: "Amabile: 14:30, 15:00 | Geraldine: 09:30, 10:00"
-Mensagem: "Pode ser as 14:30"
-Resposta: {{
-    "horario": "14:30",
-    "profissional_id": "564031"
-}}
-
-EXEMPLO OBRIGATÓRIO DE USO DO CONTEXTO ANTERIOR:
-- Última mensagem do Bot: "O Laser Lavien é um tratamento incrível... com a Dra. Amabile. Gostaria de agendar?"
-- Mensagem atual do Usuário: "Sim, pode ser dia 01/09"
-- RESULTADO OBRIGATÓRIO: 
-  - profissional: "Dra. Amabile" (extraído do contexto anterior)
-  - procedimento: "Laser Lavien" (extraído do contexto anterior)
-  - data: "2025-09-01" (extraído da mensagem atual)
-  - cache_instructions: {{"clear_fields": ["horario"]}}
-
-EXEMPLO de resolução automática de profissional:
-Histórico: "Amabile: 14:30, 15:00 | Geraldine: 09:30, 10:00"
-Mensagem: "Pode ser as 14:30"
-Resposta: {{
-    "horario": "14:30",
-    "profissional_id": "564031"
-}}
-
-EXEMPLOS DE CACHE_INSTRUCTIONS:
-- "E para a Maria?" → {{"intent": "agendar_consulta", "extracted": {{"profissional": "maria"}}, "cache_instructions": {{"clear_fields": ["profissional_id", "horario"]}}}}
-- "E para aplicação de enzimas?" → {{"intent": "agendar_consulta", "extracted": {{"procedimento": "aplicação de enzimas"}}, "cache_instructions": {{"clear_fields": ["servico_id", "horario"]}}}}
-- "E para dia 28/08?" → {{"intent": "agendar_consulta", "extracted": {{"data": "2025-08-28"}}, "cache_instructions": {{"clear_fields": ["horario"]}}}}
-- "E para às 15h?" → {{"intent": "agendar_consulta", "extracted": {{"horario": "15:00"}}, "cache_instructions": {{"clear_fields": []}}}}
-- "Oi queria marcar retorno" → {{"intent": "agendar_consulta", "extracted": {{}}, "cache_instructions": {{"clear_fields": []}}}}
-
-EXEMPLOS DE PRIORIDADE:
-- "E para dia 28/08?" → {{"intent": "agendar_consulta", "extracted": {{"data": "2025-08-28"}}}} (IGNORE data anterior)
-- "E para às 15h?" → {{"intent": "agendar_consulta", "extracted": {{"horario": "15:00"}}}} (IGNORE horário anterior)
-- "E para a Maria?" → {{"intent": "agendar_consulta", "extracted": {{"profissional": "maria"}}}} (IGNORE profissional anterior)
-
-EXEMPLOS DE PROCEDIMENTOS:
-- "consulta" → procedimento: "consulta"
-- "retorno" → procedimento: "retorno"
-- "limpeza de pele" → procedimento: "limpeza de pele"
-- "toxina botulínica" → procedimento: "toxina botulínica"
-
-EXEMPLOS DE RESPOSTA COMPLETA:
-- "Oi queria marcar retorno com a amabile" → {{"intent": "agendar_consulta", "extracted": {{"profissional": "amabile", "procedimento": "retorno"}}, "cache_instructions": {{"clear_fields": ["profissional_id", "horario"]}}}}
-- "Para segunda feira" → {{"intent": "agendar_consulta", "extracted": {{"data": "2025-08-18"}}, "cache_instructions": {{"clear_fields": ["horario"]}}}}
-- "as 19 ela tem?" → {{"intent": "agendar_consulta", "extracted": {{"horario": "19:00", "profissional": "amabile"}}, "cache_instructions": {{"clear_fields": ["profissional_id", "horario"]}}}}
-- "Sim, esse horário está perfeito!" → {{"intent": "agendar_consulta", "extracted": {{}}, "cache_instructions": {{"clear_fields": []}}}}
-- "Tanto faz, qualquer um" → {{"intent": "agendar_consulta", "extracted": {{"profissional": "indiferente"}}, "cache_instructions": {{"clear_fields": ["profissional_id", "horario"]}}}}
-
-IMPORTANTE: A mensagem atual SEMPRE tem prioridade sobre o contexto anterior. Se o usuário mencionar uma nova data, horário ou profissional, use APENAS essas informações novas.
-
-FORMATO OBRIGATÓRIO: Retorne APENAS o JSON, sem texto adicional, sem explicações."""
+            # Prefixo estável: nada que mude por turno (data, cache, histórico) entra aqui
+            intencoes = ', '.join(available_intents) if available_intents else 'Nenhuma intenção específica configurada'
+            system_prompt = render('trinks_rules.detect_intent', intencoes, lambda: {'intencoes': intencoes})
+            
+            # Datas/horários resolvidos localmente (fuso America/Sao_Paulo) entram como fatos
+            from services.temporal_parser import parse_temporal, temporal_facts, apply_temporal_facts
+            temporal = parse_temporal(message)
+            if temporal.get('data') or temporal.get('horario'):
+                logger.info(f"📅 Data/horário resolvidos localmente: {temporal}")
             
             try:
-                messages = [SystemMessage(content=system_prompt)]
+                from services.prompt_builder import PromptBuilder, STATIC, TURN, compact_json, record_usage
+                # Ordem: instruções fixas → histórico → dados do turno → mensagem atual
+                builder = PromptBuilder('trinks_rules.detect_intent')
+                builder.add(STATIC, system_prompt)
+                messages = [SystemMessage(content=builder.build([STATIC]))]
+                
+                # Resumo das mensagens antigas (as recentes vão literais logo abaixo)
+                if context and context.get('conversation_summary'):
+                    messages.append(SystemMessage(content=f"RESUMO DA CONVERSA ANTERIOR:\n{context['conversation_summary']}"))
+                
+                # Adicionar contexto da conversa (últimas 10 mensagens)
+                if context_messages:
+                    messages.extend(context_messages)
+                
+                builder.add(TURN, temporal_facts(temporal))
                 
                 # ✅ NOVO: Adicionar contexto do cache temporário se disponível
                 if temp_professional_cache:
-                    cache_context = f"""
-
-CACHE TEMPORÁRIO DISPONÍVEL (expira em {temp_cache_expiry} mensagens):
-{json.dumps(temp_professional_cache, indent=2, ensure_ascii=False)}
+                    cache_context = f"""CACHE TEMPORÁRIO DISPONÍVEL (expira em {temp_cache_expiry} mensagens):
+{compact_json(temp_professional_cache)}
 
 REGRAS OBRIGATÓRIAS PARA CACHE:
 1. SEMPRE que extrair horário → extraia também o profissional_id correspondente do cache
@@ -1873,73 +1939,46 @@ REGRAS OBRIGATÓRIAS PARA CACHE:
 4. Use o nome do profissional para fazer match exato no cache
 5. EXEMPLO OBRIGATÓRIO: Se usuário diz "09:30" e cache tem "Geraldine Nagel (ID: 564410): ['09:30', '10:00']" → extraia BOTH: "horario": "09:30" E "profissional_id": "564410"
 """
-                    messages.append(SystemMessage(content=cache_context))
+                    builder.add(TURN, cache_context, max_tokens=1500)
                     logger.info(f"🔄 Contexto do cache temporário adicionado ao prompt")
                     logger.info(f"🔄 Cache enviado para LLM: {temp_professional_cache}")
-                    logger.info(f"🔄 Total de mensagens para LLM: {len(messages)}")
                 else:
                     logger.info("📋 Nenhum cache temporário disponível para enviar ao prompt")
                 
-                # Adicionar contexto da conversa (últimas 10 mensagens)
-                if context_messages:
-                    messages.extend(context_messages)
+                messages.append(SystemMessage(content=builder.build([TURN])))
+                logger.info(f"🔄 Total de mensagens para LLM: {len(messages) + 1}")
                 
                 # Adicionar a mensagem atual
                 messages.append(HumanMessage(content=message))
                 
-                llm = self._get_llm(empresa_config)
-                response = llm.invoke(messages)
-                
-                # LOG da resposta bruta do LLM
+                llm = self._get_llm(empresa_config, INTENT)
+                response = llm.invoke(messages, **JSON_MODE)
+                record_usage('trinks_rules.detect_intent', response, builder)
                 logger.info(f"Resposta bruta do LLM unificado: '{response.content}'")
-                logger.info(f"Tamanho da resposta: {len(response.content)}")
                 
-                # Verificar se a resposta está vazia
-                if not response.content or response.content.strip() == "":
-                    logger.error("LLM retornou resposta vazia")
+                # Objeto JSON pedido ao provedor: validação única contra o schema
+                parsed = parse('trinks_rules.detect_intent', response, IntentResult)
+                if parsed is None:
+                    record_fallback('trinks_rules.detect_intent')
                     return {"intent": "verificar_informacoes", "extracted": {}}
                 
-                # Limpar resposta do LLM (remover backticks se existirem)
-                content = response.content.strip()
-                if content.startswith('```json'):
-                    content = content[7:-3]  # Remove ```json e ```
-                elif content.startswith('```'):
-                    content = content[3:-3]  # Remove ``` genérico
+                intent = parsed.intent
+                extracted = apply_temporal_facts(parsed.extracted, temporal)
+                logger.info(f"Resultado do parsing unificado: intent={intent} extracted={extracted}")
                 
-                content = content.strip()
-                logger.info(f"Conteúdo limpo para parse: {content}")
+                # ✅ NOVO: Validar se o cache temporário foi usado corretamente
+                if temp_professional_cache and extracted.get('horario') and not extracted.get('profissional_id'):
+                    logger.warning(f"⚠️ Horário extraído ({extracted.get('horario')}) mas profissional_id não foi resolvido automaticamente")
+                    logger.warning(f"⚠️ Cache disponível: {temp_professional_cache}")
                 
-                # Parsear JSON da resposta
-                try:
-                    parsed = json.loads(content)
-                    logger.info(f"Resultado do parsing unificado: {parsed}")
-                    
-                    # Validar estrutura
-                    if not isinstance(parsed, dict):
-                        logger.error("LLM retornou estrutura inválida")
-                        return {"intent": "verificar_informacoes", "extracted": {}}
-                    
-                    intent = parsed.get("intent", "verificar_informacoes")
-                    extracted = parsed.get("extracted", {})
-                    
-                    # ✅ NOVO: Validar se o cache temporário foi usado corretamente
-                    if temp_professional_cache and extracted.get('horario') and not extracted.get('profissional_id'):
-                        logger.warning(f"⚠️ Horário extraído ({extracted.get('horario')}) mas profissional_id não foi resolvido automaticamente")
-                        logger.warning(f"⚠️ Cache disponível: {temp_professional_cache}")
-                    
-                    # ✅ ACEITAR QUALQUER INTENÇÃO QUE A LLM RETORNE
-                    # A validação de intenções é desnecessária - a LLM sabe o que está fazendo
-                    
-                    return {
-                        "intent": intent,
-                        "extracted": extracted,
-                        "cache_instructions": parsed.get("cache_instructions", {})
-                    }
-                    
-                except json.JSONDecodeError as e:
-                    logger.error(f"Erro ao parsear JSON: {e}")
-                    logger.error(f"Conteúdo que falhou: '{content}'")
-                    return {"intent": "verificar_informacoes", "extracted": {}}
+                # ✅ ACEITAR QUALQUER INTENÇÃO QUE A LLM RETORNE
+                # A validação de intenções é desnecessária - a LLM sabe o que está fazendo
+                
+                return {
+                    "intent": intent,
+                    "extracted": extracted,
+                    "cache_instructions": parsed.cache_instructions
+                }
                 
             except Exception as e:
                 logger.error(f"Erro ao fazer parsing unificado: {e}")
@@ -1947,3 +1986,6 @@ REGRAS OBRIGATÓRIAS PARA CACHE:
         except Exception as e:
             logger.error(f"Erro ao fazer parsing unificado: {e}")
             return {"intent": "verificar_informacoes", "extracted": {}}
+
+
+load_rule_tables(TrinksRules)
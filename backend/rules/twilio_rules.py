@@ -1,6 +1,8 @@
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Mapping, Sequence
 from enum import Enum
 
+from rules.registry import rule_table, load_rule_tables
+
 class TwilioFlowType(Enum):
     """Tipos de fluxos disponíveis no Twilio"""
     SEND_MESSAGE = "send_message"
@@ -14,12 +16,15 @@ class TwilioRules:
     Regras estáticas para integração com Twilio API
     Contém APENAS configurações, regras e validações estáticas
     """
+
+    API_TYPE = "TWILIO"
     
     def __init__(self):
         """Inicializa as regras do Twilio"""
         pass
     
-    def get_api_rules(self) -> Dict[str, Any]:
+    @rule_table
+    def get_api_rules(self) -> Mapping[str, Any]:
         """
         Retorna regras gerais da API Twilio
         Returns:
@@ -47,15 +52,10 @@ class TwilioRules:
             ]
         }
     
-    def get_required_fields(self, flow_type: str) -> List[str]:
-        """
-        Retorna campos obrigatórios para cada tipo de fluxo
-        Args:
-            flow_type: Tipo do fluxo (TwilioFlowType)
-        Returns:
-            Lista de campos obrigatórios
-        """
-        required_fields = {
+    @rule_table
+    def get_required_fields_by_flow(self) -> Mapping[str, Sequence[str]]:
+        """Campos obrigatórios por tipo de fluxo"""
+        return {
             TwilioFlowType.SEND_MESSAGE.value: [
                 "to", "from_", "body"
             ],
@@ -72,18 +72,21 @@ class TwilioRules:
                 "phone_number"
             ]
         }
-        
-        return required_fields.get(flow_type, [])
-    
-    def get_validation_rules(self, flow_type: str) -> Dict[str, Any]:
+
+    def get_required_fields(self, flow_type: str) -> Sequence[str]:
         """
-        Retorna regras de validação para cada fluxo
+        Retorna campos obrigatórios para cada tipo de fluxo
         Args:
-            flow_type: Tipo do fluxo
+            flow_type: Tipo do fluxo (TwilioFlowType)
         Returns:
-            Dicionário com regras de validação
+            Lista de campos obrigatórios
         """
-        validation_rules = {
+        return self.get_required_fields_by_flow().get(flow_type, ())
+    
+    @rule_table
+    def get_validation_rules_by_flow(self) -> Mapping[str, Mapping[str, Any]]:
+        """Regras de validação por tipo de fluxo"""
+        return {
             TwilioFlowType.SEND_MESSAGE.value: {
                 "to_validation": "valid_phone_number",
                 "from_validation": "valid_twilio_number",
@@ -106,10 +109,19 @@ class TwilioRules:
                 "phone_number_validation": "valid_phone_format"
             }
         }
-        
-        return validation_rules.get(flow_type, {})
+
+    def get_validation_rules(self, flow_type: str) -> Mapping[str, Any]:
+        """
+        Retorna regras de validação para cada fluxo
+        Args:
+            flow_type: Tipo do fluxo
+        Returns:
+            Dicionário com regras de validação
+        """
+        return self.get_validation_rules_by_flow().get(flow_type, {})
     
-    def get_available_flows(self) -> List[Dict[str, Any]]:
+    @rule_table
+    def get_available_flows(self) -> Sequence[Mapping[str, Any]]:
         """
         Retorna todos os fluxos disponíveis no Twilio
         Returns:
@@ -150,7 +162,8 @@ class TwilioRules:
     
     # MÉTODOS DE COMPATIBILIDADE MIGRADOS DO api_rules_engine.py
     
-    def get_message_formatting_rules(self) -> Dict[str, Any]:
+    @rule_table
+    def get_message_formatting_rules(self) -> Mapping[str, Any]:
         """Retorna regras de formatação de mensagens para Twilio"""
         return {
             "max_length": 1600,
@@ -160,7 +173,8 @@ class TwilioRules:
             "media_types": ["image/jpeg", "image/png", "image/gif", "audio/mp3", "video/mp4"]
         }
     
-    def get_phone_validation_rules(self) -> Dict[str, Any]:
+    @rule_table
+    def get_phone_validation_rules(self) -> Mapping[str, Any]:
         """Retorna regras de validação de telefone para Twilio"""
         return {
             "supported_countries": ["BR", "US", "CA", "MX", "AR", "CL", "CO", "PE"],
@@ -172,7 +186,8 @@ class TwilioRules:
             "default_country": "BR"
         }
     
-    def get_rate_limiting_rules(self) -> Dict[str, Any]:
+    @rule_table
+    def get_rate_limiting_rules(self) -> Mapping[str, Any]:
         """Retorna regras de limitação de taxa para Twilio"""
         return {
             "requests_per_second": 10,
@@ -181,7 +196,8 @@ class TwilioRules:
             "concurrent_requests": 100
         }
     
-    def get_error_handling_rules(self) -> Dict[str, Any]:
+    @rule_table
+    def get_error_handling_rules(self) -> Mapping[str, Any]:
         """Retorna regras de tratamento de erro para Twilio"""
         return {
             "retry_attempts": 3,
@@ -191,7 +207,8 @@ class TwilioRules:
             "fatal_errors": ["21211", "21214", "21608"]  # Códigos de erro fatais
         }
     
-    def get_webhook_configuration_rules(self) -> Dict[str, Any]:
+    @rule_table
+    def get_webhook_configuration_rules(self) -> Mapping[str, Any]:
         """Retorna regras de configuração de webhook para Twilio"""
         return {
             "supported_methods": ["GET", "POST"],
@@ -201,7 +218,8 @@ class TwilioRules:
             "retry_on_failure": True
         }
     
-    def get_message_templates(self) -> Dict[str, Any]:
+    @rule_table
+    def get_message_templates(self) -> Mapping[str, Any]:
         """Retorna templates de mensagem para Twilio"""
         return {
             "confirmation": "✅ Sua reserva foi confirmada para {data} às {horario}",
@@ -212,7 +230,8 @@ class TwilioRules:
             "error": "❌ Desculpe, ocorreu um erro. Tente novamente."
         }
     
-    def get_media_handling_rules(self) -> Dict[str, Any]:
+    @rule_table
+    def get_media_handling_rules(self) -> Mapping[str, Any]:
         """Retorna regras de manipulação de mídia para Twilio"""
         return {
             "max_file_size": 16 * 1024 * 1024,  # 16MB
@@ -229,7 +248,8 @@ class TwilioRules:
             }
         }
     
-    def get_delivery_status_rules(self) -> Dict[str, Any]:
+    @rule_table
+    def get_delivery_status_rules(self) -> Mapping[str, Any]:
         """Retorna regras de status de entrega para Twilio"""
         return {
             "status_codes": {
@@ -243,7 +263,8 @@ class TwilioRules:
             "status_update_webhook": True
         }
     
-    def get_phone_number_rules(self) -> Dict[str, Any]:
+    @rule_table
+    def get_phone_number_rules(self) -> Mapping[str, Any]:
         """Retorna regras de números de telefone para Twilio"""
         return {
             "number_types": ["local", "toll-free", "mobile"],
@@ -259,7 +280,8 @@ class TwilioRules:
             }
         }
     
-    def get_compliance_rules(self) -> Dict[str, Any]:
+    @rule_table
+    def get_compliance_rules(self) -> Mapping[str, Any]:
         """Retorna regras de conformidade para Twilio"""
         return {
             "gdpr_compliance": True,
@@ -272,3 +294,6 @@ class TwilioRules:
                 "compliance_audits": True
             }
         }
+
+
+load_rule_tables(TwilioRules)
@@ -0,0 +1,81 @@
+"""
+Microbenchmark: tabelas de regras memoizadas (rules/registry.py) vs montar os
+dicionários a cada chamada, como era antes.
+
+Simula as consultas de regras de um turno de agendamento (detecção de intenção,
+extração, match, disponibilidade, validação de slots, Tools instanciando
+TrinksRules) e mede tempo e bytes alocados por turno com tracemalloc.
+
+Como executar:
+  1) Ative o venv:  source venv/bin/activate
+  2) Rode:          python backend/scripts/bench_rules_registry.py [turnos]
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+# Permitir imports relativos ao backend
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from rules.trinks_rules import TrinksRules, TrinksFlowType  # type: ignore
+
+EMPRESA = {'trinks_config': {}}
+
+# Consultas de regras feitas num turno típico (SmartAgent + Rules + Tools)
+TURN_CALLS = [
+    'get_api_rules', 'get_api_rules', 'get_data_extraction_rules', 'get_intelligent_match_rules',
+    'get_intelligent_match_rules', 'get_availability_check_rules_expanded', 'get_availability_check_rules_expanded',
+    'get_available_flows', 'get_preference_rules', 'get_slot_validation_rules', 'get_slot_validation_rules',
+    'get_step_specs', 'get_professional_search_rules', 'get_service_detection_rules',
+]
+TOOLS_INSTANCES_PER_TURN = 4  # execute_step cria TrinksIntelligentTools (e TrinksRules) por passo
+
+
+def turn_memoized() -> None:
+    for _ in range(TOOLS_INSTANCES_PER_TURN):
+        TrinksRules()
+    rules = TrinksRules()
+    for name in TURN_CALLS:
+        getattr(rules, name)(EMPRESA)
+    rules.get_required_fields(TrinksFlowType.CHECK_AVAILABILITY.value)
+
+
+def turn_rebuilt() -> None:
+    for _ in range(TOOLS_INSTANCES_PER_TURN):
+        TrinksRules()
+    rules = TrinksRules()
+    for name in TURN_CALLS:
+        # __wrapped__ = método original, que monta o dicionário a cada chamada
+        getattr(TrinksRules, name).__wrapped__(rules)
+    TrinksRules.get_required_fields_by_flow.__wrapped__(rules).get(TrinksFlowType.CHECK_AVAILABILITY.value, [])
+
+
+def measure(fn, turns: int):
+    """(µs por turno, pico de bytes alocados em um turno)"""
+    fn()  # aquecimento: monta as tabelas memoizadas
+    started = time.perf_counter()
+    for _ in range(turns):
+        fn()
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed / turns * 1e6, peak
+
+
+def run(turns: int = 2000) -> None:
+    rebuilt_us, rebuilt_peak = measure(turn_rebuilt, turns)
+    memo_us, memo_peak = measure(turn_memoized, turns)
+    print(f"{'':<22}{'µs/turno':>12}{'pico bytes/turno':>20}")
+    print(f"{'montado a cada chamada':<22}{rebuilt_us:>12.1f}{rebuilt_peak:>20}")
+    print(f"{'memoizado (registry)':<22}{memo_us:>12.1f}{memo_peak:>20}")
+    if memo_us:
+        print(f"→ {rebuilt_us / memo_us:.1f}x mais rápido, {rebuilt_peak - memo_peak} bytes a menos alocados por turno")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,74 @@
+"""
+Script de medição: reexecuta mensagens reais de clientes contra o índice de
+knowledge da empresa e compara tokens injetados (base completa vs top-k)
+e o tempo de seleção.
+
+Como executar:
+  1) Ative o venv:  source venv/bin/activate
+  2) Rode:          python backend/scripts/replay_knowledge_retrieval.py <empresa_slug> [limite] [top_k]
+"""
+import os
+import sys
+import time
+import logging
+
+# Permitir imports relativos ao backend
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from models import Empresa, Mensagem  # type: ignore
+from services.services import DatabaseService  # type: ignore
+from services.knowledge_index import KnowledgeIndex  # type: ignore
+from services.prompt_builder import estimate_tokens  # type: ignore
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("replay_knowledge_retrieval")
+
+
+def run(empresa_slug: str, limit: int = 500, top_k: int = 6) -> None:
+    db = DatabaseService()
+    session = db.SessionLocal()
+    try:
+        empresa = session.query(Empresa).filter(Empresa.slug == empresa_slug).first()
+        if not empresa:
+            logger.error(f"Empresa não encontrada: {empresa_slug}")
+            return
+        texts = [
+            m.text for m in session.query(Mensagem.text)
+            .filter(Mensagem.empresa_id == empresa.id, Mensagem.is_bot == False)
+            .order_by(Mensagem.id.desc())
+            .limit(limit)
+            .all()
+        ]
+        knowledge = empresa.knowledge_json or {"items": []}
+    finally:
+        session.close()
+
+    started = time.perf_counter()
+    index = KnowledgeIndex(knowledge.get('items', []))
+    build_ms = (time.perf_counter() - started) * 1000
+
+    injected = 0
+    hits = 0
+    started = time.perf_counter()
+    for text in texts:
+        selected = index.search(text, top_k)
+        hits += 1 if selected else 0
+        injected += estimate_tokens("\n".join(index.lines[i] for i in selected))
+    select_ms = (time.perf_counter() - started) * 1000
+
+    full = index.total_tokens * len(texts)
+    logger.info(f"Empresa {empresa_slug}: {len(index)} itens ({index.total_tokens} tokens), índice em {build_ms:.1f}ms")
+    logger.info(f"Mensagens reexecutadas: {len(texts)} | com itens relevantes: {hits}")
+    if texts:
+        logger.info(f"Tokens de knowledge: completo={full} top{top_k}={injected} "
+                    f"(economia {100 * (1 - injected / full) if full else 0:.1f}%)")
+        logger.info(f"Seleção: {select_ms / len(texts):.3f}ms por mensagem")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    run(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 500, int(sys.argv[3]) if len(sys.argv) > 3 else 6)
@@ -0,0 +1,258 @@
+"""
+Listagem de agendamentos da Trinks num intervalo [início, fim) para os lembretes.
+
+Antes: uma chamada com dataInicio/dataFim que ignorava a paginação do `data`
+e, se a API recusasse o range, um GET sequencial por dia. Agora:
+
+- range nativo paginado: a 1ª página informa o total (totalPages /
+  totalRecords); as demais são buscadas em paralelo num pool limitado
+  (Config.TRINKS_RANGE_FETCH_WORKERS). Sem total informado, segue página a
+  página enquanto vierem páginas cheias com agendamentos novos, até
+  MAX_SEQUENTIAL_PAGES (API que ignora `page` devolveria sempre a mesma página);
+- fallback por dia (range recusado): os dias são buscados em paralelo, cada
+  um com suas páginas, filtrando pelo horário de início;
+- os agendamentos são entregues como gerador, na ordem das páginas/dias,
+  assim que cada página chega;
+- página ou dia que falha (status != 200) interrompe a listagem com
+  AppointmentRangeError: uma agenda incompleta faria lembretes serem pulados
+  sem aviso;
+- o resultado completo fica memoizado por (estabelecimento, intervalo)
+  durante a execução dos lembretes (Config.TRINKS_RANGE_MEMO_SECONDS;
+  limpo a cada disparo do agendador), então lembretes e preview do mesmo
+  estabelecimento e janela não repetem a busca.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEZONE = 'America/Sao_Paulo'
+# Limite de páginas quando a API não informa o total
+MAX_SEQUENTIAL_PAGES = 200
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+_memo: Dict[Tuple[str, str, str, str], Tuple[float, List[Dict[str, Any]]]] = {}
+_lock = threading.Lock()
+_stats: Dict[str, int] = {'runs': 0, 'memo_hits': 0, 'pages': 0, 'day_fallbacks': 0, 'page_errors': 0}
+
+
+class AppointmentRangeError(RuntimeError):
+    """Falha ao buscar uma página/dia: a listagem do intervalo não está completa"""
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            from config import Config
+            _executor = ThreadPoolExecutor(max_workers=max(1, Config.TRINKS_RANGE_FETCH_WORKERS),
+                                           thread_name_prefix='trinks-range')
+        return _executor
+
+
+def _connection(empresa_config: Dict[str, Any]) -> Tuple[str, Dict[str, str]]:
+    base_url = (
+        empresa_config.get('trinks_base_url')
+        or (empresa_config.get('trinks_config', {}) or {}).get('base_url')
+        or 'https://api.trinks.com/v1'
+    )
+    headers = {
+        'X-API-KEY': empresa_config.get("trinks_api_key", ""),
+        'estabelecimentoId': str(empresa_config.get('trinks_estabelecimento_id', '') or ''),
+        'Content-Type': 'application/json',
+        'Accept': 'application/json'
+    }
+    return base_url, headers
+
+
+def _get(base_url: str, headers: Dict[str, str], params: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+    """GET /agendamentos → (status_code, payload)"""
+    import requests
+    resp = requests.get(f"{base_url}/agendamentos", headers=headers, params=params, timeout=30)
+    payload = resp.json() if resp.status_code == 200 and resp.content else {}
+    return resp.status_code, payload or {}
+
+
+def _total_pages(payload: Dict[str, Any], page_size: int) -> Optional[int]:
+    """Total de páginas informado pela API (None quando ela não informa)"""
+    for key in ('totalPages', 'totalPaginas'):
+        if payload.get(key):
+            return int(payload[key])
+    for key in ('totalRecords', 'totalRegistros'):
+        if payload.get(key) is not None:
+            return max(1, -(-int(payload[key]) // page_size))
+    return None
+
+
+def _page(base_url: str, headers: Dict[str, str], params: Dict[str, Any], page: int, page_size: int) -> List[Dict[str, Any]]:
+    status, payload = _get(base_url, headers, dict(params, page=page, pageSize=page_size))
+    with _lock:
+        _stats['pages'] += 1
+    if status != 200:
+        with _lock:
+            _stats['page_errors'] += 1
+        raise AppointmentRangeError(f"Trinks agendamentos {params} página {page} -> {status}")
+    return payload.get('data', []) or []
+
+
+def _page_ids(items: List[Dict[str, Any]]) -> set:
+    return {ap.get('id') for ap in items if ap.get('id') is not None}
+
+
+def _sequential_pages(base_url, headers, params, first: List[Dict[str, Any]], page_size: int) -> Iterator[Dict[str, Any]]:
+    """Sem total informado: próximas páginas enquanto vierem cheias.
+
+    Para quando uma página não traz nenhum id novo (API ignorando `page`) ou
+    após MAX_SEQUENTIAL_PAGES, para não prender a thread dos lembretes.
+    """
+    page, items = 1, first
+    seen = _page_ids(first)
+    while len(items) >= page_size:
+        if page >= MAX_SEQUENTIAL_PAGES:
+            raise AppointmentRangeError(f"Trinks agendamentos {params}: mais de {MAX_SEQUENTIAL_PAGES} páginas sem total informado")
+        page += 1
+        items = _page(base_url, headers, params, page, page_size)
+        ids = _page_ids(items)
+        if ids and ids <= seen:
+            logger.warning(f"Trinks agendamentos {params}: página {page} repete a anterior; paginação ignorada pela API")
+            return
+        seen |= ids
+        yield from items
+
+
+def _all_pages(base_url: str, headers: Dict[str, str], params: Dict[str, Any], page_size: int) -> List[Dict[str, Any]]:
+    """Todas as páginas de uma consulta, em sequência (usado dentro do pool, por dia)"""
+    status, payload = _get(base_url, headers, dict(params, page=1, pageSize=page_size))
+    with _lock:
+        _stats['pages'] += 1
+    if status != 200:
+        with _lock:
+            _stats['page_errors'] += 1
+        raise AppointmentRangeError(f"Trinks range day fetch {params.get('data')} -> {status}")
+    items = list(payload.get('data', []) or [])
+    total = _total_pages(payload, page_size)
+    if total is None:
+        items.extend(_sequential_pages(base_url, headers, params, items, page_size))
+    else:
+        for page in range(2, total + 1):
+            items.extend(_page(base_url, headers, params, page, page_size))
+    return items
+
+
+def _parse_dt(value: str, timezone_str: str = DEFAULT_TIMEZONE) -> datetime:
+    dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if dt.tzinfo is None or dt.tzinfo.utcoffset(dt) is None:
+        import pytz
+        dt = pytz.timezone(timezone_str).localize(dt)
+    return dt
+
+
+def _stream_futures(futures) -> Iterator[List[Dict[str, Any]]]:
+    """Resultados na ordem de submissão; cancela o que faltar se o consumidor parar antes"""
+    try:
+        for future in futures:
+            yield future.result()
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def _fetch(empresa_config: Dict[str, Any], start_iso: str, end_iso: str) -> Iterator[Dict[str, Any]]:
+    from config import Config
+    page_size = max(1, Config.TRINKS_RANGE_PAGE_SIZE)
+    base_url, headers = _connection(empresa_config)
+
+    # 1) Range nativo: 1ª página descobre a paginação, as demais em paralelo
+    params = {'dataInicio': start_iso, 'dataFim': end_iso}
+    status, payload = _get(base_url, headers, dict(params, page=1, pageSize=page_size))
+    with _lock:
+        _stats['pages'] += 1
+    if status == 200:
+        first = payload.get('data', []) or []
+        yield from first
+        total = _total_pages(payload, page_size)
+        if total is None:
+            yield from _sequential_pages(base_url, headers, params, first, page_size)
+        elif total > 1:
+            pool = _get_executor()
+            futures = [pool.submit(_page, base_url, headers, params, p, page_size) for p in range(2, total + 1)]
+            for items in _stream_futures(futures):
+                yield from items
+        return
+
+    # 2) Fallback: dias em paralelo + filtro por horário
+    logger.warning(f"Trinks range fetch dataInicio/dataFim -> {status}; fallback por dia")
+    with _lock:
+        _stats['day_fallbacks'] += 1
+    start_dt, end_dt = _parse_dt(start_iso), _parse_dt(end_iso)
+    days = []
+    day = start_dt
+    while day < end_dt:
+        days.append(day.strftime('%Y-%m-%d'))
+        day = day + timedelta(days=1)
+    pool = _get_executor()
+    futures = [pool.submit(_all_pages, base_url, headers, {'data': d}, page_size) for d in days]
+    for items in _stream_futures(futures):
+        for ap in items:
+            inicio = ap.get('dataHoraInicio')
+            if not inicio:
+                continue
+            try:
+                ap_dt = _parse_dt(inicio)
+            except Exception:
+                continue
+            if start_dt <= ap_dt < end_dt:
+                yield ap
+
+
+def iter_appointments_range(empresa_config: Dict[str, Any], start_iso: str, end_iso: str) -> Iterator[Dict[str, Any]]:
+    """Agendamentos no intervalo [start, end), entregues conforme as páginas chegam.
+
+    Agendamentos repetidos entre páginas (agenda mudando durante a busca) saem uma vez só.
+    Levanta AppointmentRangeError se alguma página/dia falhar (nada é memoizado nesse caso).
+    """
+    from config import Config
+    base_url, headers = _connection(empresa_config)
+    key = (base_url, headers['estabelecimentoId'], start_iso, end_iso)
+    with _lock:
+        _stats['runs'] += 1
+        cached = _memo.get(key)
+        if cached and time.time() - cached[0] <= Config.TRINKS_RANGE_MEMO_SECONDS:
+            _stats['memo_hits'] += 1
+        else:
+            cached = None
+    if cached:
+        yield from cached[1]
+        return
+
+    seen = set()
+    collected: List[Dict[str, Any]] = []
+    for ap in _fetch(empresa_config, start_iso, end_iso):
+        ap_id = ap.get('id')
+        if ap_id is not None:
+            if ap_id in seen:
+                continue
+            seen.add(ap_id)
+        collected.append(ap)
+        yield ap
+    # Só memoiza quando o intervalo inteiro foi percorrido sem falhas
+    with _lock:
+        _memo[key] = (time.time(), collected)
+
+
+def clear_memo():
+    """Início de uma nova execução de lembretes: descarta listagens anteriores"""
+    with _lock:
+        _memo.clear()
+
+
+def get_stats() -> Dict[str, Any]:
+    with _lock:
+        stats = dict(_stats)
+        stats['memoized_ranges'] = len(_memo)
+    return stats
@@ -0,0 +1,202 @@
+"""
+Cache de agenda do dia (/agendamentos/profissionais/{data}) com prefetch especulativo.
+
+Assim que o turno tem uma intenção de agendamento com data, o SmartAgent
+dispara em segundo plano a busca da agenda desse dia e do próximo dia útil,
+enquanto o planejamento/match ainda rodam no LLM. A etapa de disponibilidade
+(TrinksIntelligentTools._get_trinks_real_availability, inclusive no looping de
+próximos dias, e _get_working_windows) lê daqui: acerto direto, ou espera a
+busca que já está em andamento em vez de repetir a requisição.
+
+A agenda é guardada por (estabelecimento, dia, serviço): o filtro servicoId
+continua sendo aplicado pela API (o payload da agenda não informa quais
+serviços cada profissional atende); sem serviço, a agenda vem sem filtro.
+O filtro de profissional é aplicado localmente.
+Escritas em /agendamentos (criar, cancelar, confirmar) descartam o cache do
+estabelecimento.
+"""
+import logging
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Intenções em que vale buscar a agenda antes do planejamento terminar
+SCHEDULING_INTENTS = frozenset({'agendar_consulta', 'verificar_disponibilidade', 'reagendar_consulta', 'remarcar_consulta'})
+
+_entries: Dict[Tuple[str, str, str], Tuple[float, List[Dict[str, Any]]]] = {}
+_inflight: Dict[Tuple[str, str, str], Future] = {}
+_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+_stats: Dict[str, int] = defaultdict(int)
+
+
+def tenant_key(empresa_config: Dict[str, Any]) -> str:
+    config = empresa_config or {}
+    trinks = config.get('trinks_config') or {}
+    return str(config.get('trinks_estabelecimento_id') or trinks.get('estabelecimento_id') or '')
+
+
+def next_business_day(data: str) -> Optional[str]:
+    """Próximo dia útil (seg-sex) depois de `data` (YYYY-MM-DD)"""
+    try:
+        day = datetime.strptime(data, '%Y-%m-%d') + timedelta(days=1)
+    except (TypeError, ValueError):
+        return None
+    while day.weekday() >= 5:
+        day += timedelta(days=1)
+    return day.strftime('%Y-%m-%d')
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            from config import Config
+            _executor = ThreadPoolExecutor(max_workers=Config.AVAILABILITY_PREFETCH_WORKERS,
+                                           thread_name_prefix='availability-prefetch')
+        return _executor
+
+
+def _fetch_day(empresa_config: Dict[str, Any], data: str, service_id: str = '') -> Optional[List[Dict[str, Any]]]:
+    """GET da agenda do dia (filtrada por servicoId, se informado). None em caso de erro (não vai para o cache)"""
+    import requests
+    base_url = (
+        empresa_config.get('trinks_base_url')
+        or (empresa_config.get('trinks_config', {}) or {}).get('base_url')
+        or 'https://api.trinks.com/v1'
+    )
+    headers = {
+        'X-API-KEY': empresa_config.get("trinks_api_key", ""),
+        'estabelecimentoId': empresa_config.get('trinks_estabelecimento_id', ''),
+        'Content-Type': 'application/json'
+    }
+    params = {'servicoId': service_id} if service_id else None
+    resp = requests.get(f"{base_url}/agendamentos/profissionais/{data}", headers=headers, params=params, timeout=30)
+    if resp.status_code != 200:
+        logger.warning(f"Agenda de {data} indisponível: HTTP {resp.status_code}")
+        return None
+    payload = resp.json()
+    return payload.get('data') or payload.get('items') or []
+
+
+def _load(key: Tuple[str, str, str], empresa_config: Dict[str, Any], data: str, future: Future) -> None:
+    items = None
+    try:
+        items = _fetch_day(empresa_config, data, key[2])
+    except Exception as e:
+        logger.warning(f"Falha ao buscar agenda de {data}: {e}")
+    finally:
+        with _lock:
+            # Busca descartada por invalidate() no meio do caminho não entra no cache
+            if _inflight.get(key) is future:
+                _inflight.pop(key, None)
+                if items is not None:
+                    _entries[key] = (time.time(), items)
+        future.set_result(items)
+
+
+def _cached(key: Tuple[str, str, str]) -> Optional[List[Dict[str, Any]]]:
+    """Entrada válida do cache (chamar com _lock)"""
+    from config import Config
+    entry = _entries.get(key)
+    if entry and time.time() - entry[0] <= Config.AVAILABILITY_CACHE_TTL_SECONDS:
+        return entry[1]
+    if entry:
+        _entries.pop(key, None)
+    return None
+
+
+def prefetch(empresa_config: Dict[str, Any], dates: List[str], service_id: Optional[str] = None) -> int:
+    """Dispara em segundo plano a busca da agenda das datas que não estão em cache. Retorna quantas disparou"""
+    tenant = tenant_key(empresa_config)
+    if not tenant:
+        return 0
+    started = 0
+    for data in dict.fromkeys(d for d in dates if d):
+        key = (tenant, data, str(service_id or ''))
+        with _lock:
+            if _cached(key) is not None or key in _inflight:
+                continue
+            future: Future = Future()
+            _inflight[key] = future
+            _stats['prefetches'] += 1
+        _get_executor().submit(_load, key, dict(empresa_config), data, future)
+        started += 1
+    if started:
+        logger.info(f"🔮 Prefetch da agenda ({tenant}): {started} dia(s) a partir de {dates[0]}")
+    return started
+
+
+def prefetch_for_turn(empresa_config: Dict[str, Any], intent: str, data: Optional[str],
+                      service_id: Optional[str] = None) -> int:
+    """Prefetch especulativo do turno: data pedida + próximo dia útil (do serviço, se já conhecido),
+    só em intenções de agenda"""
+    from config import Config
+    if not Config.AVAILABILITY_PREFETCH_ENABLED or intent not in SCHEDULING_INTENTS or not data:
+        return 0
+    try:
+        datetime.strptime(data, '%Y-%m-%d')
+    except (TypeError, ValueError):
+        return 0
+    return prefetch(empresa_config, [data, next_business_day(data)], service_id)
+
+
+def get_day(empresa_config: Dict[str, Any], data: str, professional_id: Optional[str] = None,
+            service_id: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
+    """Agenda do dia (do serviço e do profissional, se informados). Usa o cache, a busca em andamento ou um GET direto"""
+    tenant = tenant_key(empresa_config)
+    key = (tenant, data, str(service_id or ''))
+    owner = False
+    with _lock:
+        items = _cached(key) if tenant else None
+        future = None
+        if items is not None:
+            _stats['hits'] += 1
+        else:
+            future = _inflight.get(key) if tenant else None
+            if future is not None:
+                _stats['inflight_waits'] += 1
+            else:
+                _stats['misses'] += 1
+                future, owner = Future(), True
+                if tenant:
+                    _inflight[key] = future
+    if items is None:
+        if owner:
+            _load(key, empresa_config, data, future)
+        try:
+            # A própria requisição tem timeout de 30s
+            items = future.result(timeout=35)
+        except FutureTimeout:
+            items = None
+    if items is None:
+        return None
+    if professional_id:
+        return [p for p in items if str(p.get('id')) == str(professional_id)]
+    return items
+
+
+def invalidate(empresa_config: Dict[str, Any]) -> None:
+    """Descarta a agenda em cache do estabelecimento (após criar/cancelar/confirmar agendamento)"""
+    tenant = tenant_key(empresa_config)
+    with _lock:
+        for key in [k for k in _entries if k[0] == tenant]:
+            _entries.pop(key, None)
+        for key in [k for k in _inflight if k[0] == tenant]:
+            _inflight.pop(key, None)
+        _stats['invalidations'] += 1
+
+
+def get_stats() -> Dict[str, Any]:
+    with _lock:
+        stats = dict(_stats)
+        stats['entries'] = len(_entries)
+        stats['inflight'] = len(_inflight)
+    lookups = stats.get('hits', 0) + stats.get('inflight_waits', 0) + stats.get('misses', 0)
+    stats['hit_rate'] = round((stats.get('hits', 0) + stats.get('inflight_waits', 0)) / lookups, 4) if lookups else 0.0
+    return stats
@@ -0,0 +1,352 @@
+"""
+Worker de classificação de mensagens por label (Atendimento).
+
+Consome a tabela classification_queue em background:
+- reivindica itens pendentes com FOR UPDATE SKIP LOCKED (seguro com várias réplicas),
+  de forma justa entre empresas: no máximo CLAIM_BATCHES_PER_TENANT lotes por empresa
+  em cada iteração, intercalando as empresas, e sem reivindicar itens de empresas que
+  já estão no limite por minuto (senão o backlog de uma empresa limitada ocuparia
+  sempre os mesmos itens e as demais nunca seriam atendidas)
+- agrupa por empresa e classifica várias mensagens por chamada ao LLM
+- respeita um limite de chamadas por minuto por empresa
+- grava os Atendimentos e marca a fila em lote
+
+Sem a fila (CLASSIFICATION_WORKER_ENABLED=false ou tabela indisponível), o
+DatabaseService classifica as mensagens inline com classify_messages_inline.
+"""
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
+
+from sqlalchemy import text
+
+from config import Config
+from models import Atendimento, Mensagem
+from services.services import DatabaseService
+
+logger = logging.getLogger(__name__)
+
+# Itens em 'processing' há mais tempo que isso voltam para a fila (worker caiu no meio)
+STALE_LOCK_SECONDS = 600
+MAX_ATTEMPTS = 3
+CLAIM_LIMIT = 200
+# Lotes (CLASSIFIER_BATCH_SIZE) reivindicados por empresa em cada iteração
+CLAIM_BATCHES_PER_TENANT = 3
+
+
+class TenantRateLimiter:
+    """Janela deslizante de 60s com no máximo N chamadas por empresa"""
+
+    def __init__(self, calls_per_minute: int):
+        self.calls_per_minute = max(1, calls_per_minute)
+        self._calls: Dict[int, deque] = defaultdict(deque)
+        self._lock = threading.Lock()
+
+    def try_acquire(self, empresa_id: int) -> bool:
+        now = time.time()
+        with self._lock:
+            calls = self._calls[empresa_id]
+            while calls and now - calls[0] >= 60:
+                calls.popleft()
+            if len(calls) >= self.calls_per_minute:
+                return False
+            calls.append(now)
+            return True
+
+    def limited_tenants(self) -> List[int]:
+        """Empresas sem chamadas disponíveis na janela atual"""
+        now = time.time()
+        with self._lock:
+            return [
+                empresa_id for empresa_id, calls in self._calls.items()
+                if len([t for t in calls if now - t < 60]) >= self.calls_per_minute
+            ]
+
+
+_rate_limiter = TenantRateLimiter(Config.CLASSIFIER_CALLS_PER_MINUTE)
+_openai_clients: Dict[str, Any] = {}
+_worker_thread: Optional[threading.Thread] = None
+_stop_event = threading.Event()
+
+
+def _get_openai_service(api_key: str):
+    oai = _openai_clients.get(api_key)
+    if oai is None:
+        from integrations.openai_service import OpenAIService
+        oai = OpenAIService(api_key)
+        _openai_clients[api_key] = oai
+    return oai
+
+
+def _claim_pending(db: DatabaseService, limit: int = CLAIM_LIMIT) -> List[Dict[str, Any]]:
+    """Marca até `limit` itens como 'processing' e retorna-os com texto/timestamp da mensagem.
+
+    Justo entre empresas: até `per_tenant` itens por empresa, na ordem (posição na fila da
+    empresa, id), pulando empresas que estão no limite de chamadas por minuto.
+    """
+    per_tenant = max(1, Config.CLASSIFIER_BATCH_SIZE) * CLAIM_BATCHES_PER_TENANT
+    session = db.SessionLocal()
+    try:
+        rows = session.execute(text(
+            """
+            UPDATE classification_queue q
+               SET status = 'processing', attempts = q.attempts + 1, locked_at = now()
+             WHERE q.id IN (
+                    SELECT c.id FROM classification_queue c
+                      JOIN (SELECT id, row_number() OVER (PARTITION BY empresa_id ORDER BY id) AS rn
+                              FROM classification_queue
+                             WHERE (status = 'pending'
+                                    OR (status = 'processing' AND locked_at < now() - make_interval(secs => :stale)))
+                               AND NOT (empresa_id = ANY(:limited))) r ON r.id = c.id
+                     WHERE r.rn <= :per_tenant
+                       -- Revalidado ao travar (outra réplica pode ter reivindicado no meio)
+                       AND (c.status = 'pending'
+                            OR (c.status = 'processing' AND c.locked_at < now() - make_interval(secs => :stale)))
+                     ORDER BY r.rn, c.id
+                     LIMIT :limit
+                     FOR UPDATE OF c SKIP LOCKED)
+            RETURNING q.id, q.empresa_id, q.cliente_id, q.message_id, q.attempts
+            """
+        ), {"limit": limit, "stale": STALE_LOCK_SECONDS, "per_tenant": per_tenant,
+            "limited": _rate_limiter.limited_tenants()}).fetchall()
+        session.commit()
+        if not rows:
+            return []
+
+        message_ids = [r[3] for r in rows]
+        messages = {
+            m.id: m for m in session.query(Mensagem.id, Mensagem.text, Mensagem.timestamp).filter(Mensagem.id.in_(message_ids)).all()
+        }
+        items = []
+        for queue_id, empresa_id, cliente_id, message_id, attempts in rows:
+            msg = messages.get(message_id)
+            items.append({
+                'queue_id': queue_id,
+                'empresa_id': empresa_id,
+                'cliente_id': cliente_id,
+                'message_id': message_id,
+                'attempts': attempts,
+                'text': msg.text if msg else None,
+                'timestamp': msg.timestamp if msg else None,
+            })
+        return items
+    except Exception as e:
+        session.rollback()
+        logger.error(f"Erro ao reivindicar itens da fila de classificação: {e}")
+        return []
+    finally:
+        session.close()
+
+
+def _finish_items(db: DatabaseService, items: List[Dict[str, Any]], status: str, error: Optional[str] = None):
+    if not items:
+        return
+    session = db.SessionLocal()
+    try:
+        session.execute(text(
+            "UPDATE classification_queue SET status = :status, last_error = :error, "
+            "processed_at = CASE WHEN :status IN ('done', 'error') THEN now() ELSE NULL END "
+            "WHERE id = ANY(:ids)"
+        ), {"status": status, "error": error, "ids": [i['queue_id'] for i in items]})
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        logger.error(f"Erro ao atualizar fila de classificação: {e}")
+    finally:
+        session.close()
+
+
+def _release_or_fail(db: DatabaseService, items: List[Dict[str, Any]], error: str):
+    """Devolve itens para a fila ou marca como erro após MAX_ATTEMPTS"""
+    retry = [i for i in items if i['attempts'] < MAX_ATTEMPTS]
+    failed = [i for i in items if i['attempts'] >= MAX_ATTEMPTS]
+    _finish_items(db, retry, 'pending', error)
+    _finish_items(db, failed, 'error', error)
+
+
+def _classify_tenant(db: DatabaseService, empresa_id: int, items: List[Dict[str, Any]]) -> int:
+    """Classifica os itens de uma empresa em lotes de CLASSIFIER_BATCH_SIZE. Retorna quantos foram concluídos."""
+    labels_json, api_key = db.get_classifier_config(empresa_id)
+    if not (labels_json and isinstance(labels_json, dict) and labels_json.get('labels')) or not api_key:
+        # Empresa removeu labels/chave depois de enfileirar: nada a fazer
+        _finish_items(db, items, 'done', 'labels ou chave OpenAI ausentes')
+        return len(items)
+
+    # Mensagens apagadas antes da classificação
+    missing = [i for i in items if not i.get('text')]
+    _finish_items(db, missing, 'done', 'mensagem não encontrada')
+    items = [i for i in items if i.get('text')]
+
+    oai = _get_openai_service(api_key)
+    min_conf = float(labels_json.get('min_confidence', 0.6))
+    batch_size = max(1, Config.CLASSIFIER_BATCH_SIZE)
+    done = len(missing)
+
+    for start in range(0, len(items), batch_size):
+        batch = items[start:start + batch_size]
+        if not _rate_limiter.try_acquire(empresa_id):
+            # Limite da empresa atingido: devolve o restante sem contar tentativa
+            rest = items[start:]
+            _restore_attempts(db, rest)
+            logger.info(f"⏳ Limite de classificação atingido para empresa {empresa_id}; {len(rest)} itens adiados")
+            break
+
+        results = oai.classify_messages([i['text'] for i in batch], labels_json)
+        if results and all(r.get('rationale') == 'exception' for r in results):
+            _release_or_fail(db, batch, 'falha na chamada ao LLM')
+            continue
+
+        atendimentos = []
+        for item, result in zip(batch, results):
+            if result.get('label') and float(result.get('confidence', 0.0)) >= min_conf:
+                atendimentos.append({
+                    'empresa_id': empresa_id,
+                    'cliente_id': item['cliente_id'],
+                    'data_atendimento': item['timestamp'],
+                    'label_slug': result['label'],
+                    'source_message_id': item['message_id'],
+                    'observacoes': result.get('observacoes'),
+                    'confidence': int(round(float(result.get('confidence', 0.0)) * 100)),
+                })
+
+        session = db.SessionLocal()
+        try:
+            if atendimentos:
+                session.bulk_insert_mappings(Atendimento, atendimentos)
+            session.execute(text(
+                "UPDATE classification_queue SET status = 'done', processed_at = now(), last_error = NULL WHERE id = ANY(:ids)"
+            ), {"ids": [i['queue_id'] for i in batch]})
+            session.commit()
+            done += len(batch)
+            logger.info(f"🏷️ Empresa {empresa_id}: {len(batch)} mensagens classificadas, {len(atendimentos)} atendimentos gravados")
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Erro ao gravar atendimentos classificados da empresa {empresa_id}: {e}")
+            _release_or_fail(db, batch, str(e)[:500])
+        finally:
+            session.close()
+    return done
+
+
+def classify_messages_inline(db: DatabaseService, empresa_id: int, cliente_id: str, items: List[Tuple[int, str, Any]]) -> int:
+    """Classificação sem fila (worker desabilitado ou classification_queue ausente).
+
+    items: (message_id, texto, timestamp). Uma chamada ao LLM por lote; retorna atendimentos gravados.
+    """
+    try:
+        labels_json, api_key = db.get_classifier_config(empresa_id)
+        if not (labels_json and isinstance(labels_json, dict) and labels_json.get('labels')) or not api_key:
+            return 0
+        oai = _get_openai_service(api_key)
+        min_conf = float(labels_json.get('min_confidence', 0.6))
+        results = oai.classify_messages([t for _, t, _ in items], labels_json)
+        atendimentos = [
+            {
+                'empresa_id': empresa_id,
+                'cliente_id': cliente_id,
+                'data_atendimento': timestamp,
+                'label_slug': result['label'],
+                'source_message_id': message_id,
+                'observacoes': result.get('observacoes'),
+                'confidence': int(round(float(result.get('confidence', 0.0)) * 100)),
+            }
+            for (message_id, _, timestamp), result in zip(items, results)
+            if result.get('label') and float(result.get('confidence', 0.0)) >= min_conf
+        ]
+        if not atendimentos:
+            return 0
+        session = db.SessionLocal()
+        try:
+            session.bulk_insert_mappings(Atendimento, atendimentos)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+        logger.info(f"🏷️ Empresa {empresa_id}: {len(items)} mensagens classificadas inline, {len(atendimentos)} atendimentos gravados")
+        return len(atendimentos)
+    except Exception as e:
+        logger.error(f"Erro na classificação inline da empresa {empresa_id}: {e}")
+        return 0
+
+
+def _restore_attempts(db: DatabaseService, items: List[Dict[str, Any]]):
+    """Volta itens adiados por rate limit para 'pending' sem consumir tentativa"""
+    if not items:
+        return
+    session = db.SessionLocal()
+    try:
+        session.execute(text(
+            "UPDATE classification_queue SET status = 'pending', attempts = GREATEST(attempts - 1, 0) WHERE id = ANY(:ids)"
+        ), {"ids": [i['queue_id'] for i in items]})
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        logger.error(f"Erro ao devolver itens para a fila de classificação: {e}")
+    finally:
+        session.close()
+
+
+def process_queue_once(executor: Optional[ThreadPoolExecutor] = None) -> int:
+    """Executa 1 iteração: reivindica itens pendentes, classifica por empresa e grava. Retorna itens concluídos."""
+    db = DatabaseService()
+    items = _claim_pending(db)
+    if not items:
+        return 0
+
+    by_tenant: Dict[int, List[Dict[str, Any]]] = defaultdict(list)
+    for item in items:
+        by_tenant[item['empresa_id']].append(item)
+
+    started = time.time()
+    if executor and len(by_tenant) > 1:
+        futures = [executor.submit(_classify_tenant, db, emp_id, tenant_items) for emp_id, tenant_items in by_tenant.items()]
+        done = 0
+        for f in futures:
+            try:
+                done += f.result()
+            except Exception as e:
+                logger.error(f"Erro no lote de classificação: {e}")
+    else:
+        done = sum(_classify_tenant(db, emp_id, tenant_items) for emp_id, tenant_items in by_tenant.items())
+
+    elapsed = time.time() - started
+    logger.info(f"📊 Classificação: {done}/{len(items)} itens de {len(by_tenant)} empresas em {elapsed:.2f}s")
+    return done
+
+
+def classification_loop(stop_event: threading.Event = _stop_event):
+    """Loop do worker: processa a fila continuamente e dorme quando vazia"""
+    logger.info("🏷️ Worker de classificação iniciado")
+    with ThreadPoolExecutor(max_workers=4, thread_name_prefix="classifier") as executor:
+        while not stop_event.is_set():
+            try:
+                processed = process_queue_once(executor)
+            except Exception as e:
+                logger.error(f"Erro no worker de classificação: {e}")
+                processed = 0
+            if not processed:
+                stop_event.wait(Config.CLASSIFIER_POLL_SECONDS)
+    logger.info("🏷️ Worker de classificação finalizado")
+
+
+def start_classification_worker() -> bool:
+    """Inicia o worker em uma thread daemon (idempotente)"""
+    global _worker_thread
+    if not Config.CLASSIFICATION_WORKER_ENABLED:
+        logger.info("Worker de classificação desabilitado (CLASSIFICATION_WORKER_ENABLED=false)")
+        return False
+    if _worker_thread and _worker_thread.is_alive():
+        return True
+    _stop_event.clear()
+    _worker_thread = threading.Thread(target=classification_loop, name="classification-worker", daemon=True)
+    _worker_thread.start()
+    return True
+
+
+def stop_classification_worker():
+    _stop_event.set()
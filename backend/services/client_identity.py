@@ -0,0 +1,190 @@
+"""
+Cache de identidade de clientes Trinks por empresa.
+
+Todo agendamento de um cliente que volta repetia a busca do cliente na Trinks
+(pedir CPF → GET /clientes?cpf=...), em cada conversa e às vezes em cada turno.
+Aqui a primeira resolução (cliente encontrado ou criado) fica registrada:
+
+- waid (telefone só com dígitos) → cliente_id, nome e CPF
+- CPF → a mesma entrada
+
+Duas camadas, como na deduplicação de webhooks:
+- LRU em memória para o caminho quente
+- tabela trinks_client_identities (única por empresa + waid) para sobreviver
+  a reinícios e ser compartilhada entre réplicas
+
+Cada entrada guarda quando foi confirmada na API. Depois de
+Config.CLIENT_IDENTITY_TTL_DAYS ela continua sendo devolvida, mas com
+fresh=False: quem chama revalida na Trinks (pelo CPF conhecido) e chama
+remember() de novo, o que renova a entrada.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_entries: "OrderedDict[Tuple[str, str, str], Dict[str, Any]]" = OrderedDict()
+_lock = threading.Lock()
+_stats: Dict[str, int] = defaultdict(int)
+
+
+def only_digits(value: Any) -> str:
+    return ''.join(ch for ch in str(value or '') if ch.isdigit())
+
+
+def tenant_key(empresa_config: Dict[str, Any]) -> str:
+    config = empresa_config or {}
+    return str(config.get('empresa_id') or config.get('slug') or '')
+
+
+def is_fresh(entry: Dict[str, Any], now: Optional[float] = None) -> bool:
+    from config import Config
+    age = (now or time.time()) - entry.get('verified_at', 0)
+    return age <= Config.CLIENT_IDENTITY_TTL_DAYS * 86400
+
+
+def _memory_get(key: Tuple[str, str, str]) -> Optional[Dict[str, Any]]:
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None:
+            _entries.move_to_end(key)
+        return entry
+
+
+def _memory_put(tenant: str, entry: Dict[str, Any]):
+    from config import Config
+    with _lock:
+        for kind in ('waid', 'cpf'):
+            if entry.get(kind):
+                key = (tenant, kind, entry[kind])
+                _entries[key] = entry
+                _entries.move_to_end(key)
+        while len(_entries) > max(1, Config.CLIENT_IDENTITY_MEMORY_SIZE):
+            _entries.popitem(last=False)
+
+
+def _db_load(empresa_id: Any, waid: str = '', cpf: str = '') -> Optional[Dict[str, Any]]:
+    """Entrada mais recente da tabela para o waid (ou, sem waid, para o CPF)"""
+    from sqlalchemy import text
+    from services.services import DatabaseService
+
+    column, value = ('waid', waid) if waid else ('cpf', cpf)
+    session = DatabaseService().SessionLocal()
+    try:
+        row = session.execute(text(
+            f"SELECT waid, cpf, trinks_cliente_id, nome, last_verified_at FROM trinks_client_identities "
+            f"WHERE empresa_id = :empresa_id AND {column} = :value ORDER BY last_verified_at DESC LIMIT 1"
+        ), {"empresa_id": empresa_id, "value": value}).first()
+    finally:
+        session.close()
+    if not row:
+        return None
+    return {
+        'waid': row.waid, 'cpf': row.cpf or '', 'cliente_id': row.trinks_cliente_id, 'nome': row.nome,
+        'verified_at': row.last_verified_at.timestamp() if row.last_verified_at else 0.0,
+    }
+
+
+def _db_save(empresa_id: Any, entry: Dict[str, Any]):
+    """Upsert por (empresa, waid)"""
+    from datetime import datetime
+    from sqlalchemy.dialects.postgresql import insert as pg_insert
+    from models import ClienteIdentidade
+    from services.services import DatabaseService
+
+    values = {
+        'cpf': entry.get('cpf') or None, 'trinks_cliente_id': str(entry['cliente_id']),
+        'nome': entry.get('nome'), 'last_verified_at': datetime.fromtimestamp(entry['verified_at']),
+    }
+    stmt = pg_insert(ClienteIdentidade.__table__).values(empresa_id=empresa_id, waid=entry['waid'], **values)
+    stmt = stmt.on_conflict_do_update(index_elements=['empresa_id', 'waid'], set_=values)
+    session = DatabaseService().SessionLocal()
+    try:
+        session.execute(stmt)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+def lookup(empresa_config: Dict[str, Any], waid: Optional[str] = None, cpf: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Cliente conhecido pelo waid (prioridade) ou CPF.
+
+    Retorna cópia da entrada {cliente_id, nome, cpf, waid, verified_at, fresh} ou None.
+    Falhas no banco não bloqueiam o atendimento: na dúvida segue para a busca na API.
+    """
+    tenant = tenant_key(empresa_config)
+    waid, cpf = only_digits(waid), only_digits(cpf)
+    if not tenant or not (waid or cpf):
+        return None
+
+    kind, value = ('waid', waid) if waid else ('cpf', cpf)
+    entry = _memory_get((tenant, kind, value))
+    source = 'memory'
+    if entry is None and empresa_config.get('empresa_id'):
+        try:
+            entry = _db_load(empresa_config['empresa_id'], waid=waid, cpf='' if waid else cpf)
+        except Exception as e:
+            with _lock:
+                _stats['db_errors'] += 1
+            logger.warning(f"Tabela trinks_client_identities indisponível, cache de identidade apenas em memória: {e}")
+        if entry is not None:
+            source = 'db'
+            _memory_put(tenant, entry)
+
+    if entry is None:
+        with _lock:
+            _stats['misses'] += 1
+        return None
+    result = dict(entry, fresh=is_fresh(entry))
+    with _lock:
+        _stats[f'hits_{source}'] += 1
+        if not result['fresh']:
+            _stats['stale'] += 1
+    return result
+
+
+def remember(empresa_config: Dict[str, Any], cliente_id: Any, nome: Optional[str] = None,
+             cpf: Optional[str] = None, waid: Optional[str] = None, verified_at: Optional[float] = None):
+    """Registra (ou renova) o cliente resolvido na Trinks.
+
+    `verified_at` só é informado ao associar um waid a uma entrada vinda do
+    próprio cache (mantém a data da última confirmação na API).
+    Só entradas com waid vão para o banco: a identidade persistida é a do
+    telefone da conversa; buscas só por CPF ficam na memória.
+    """
+    tenant = tenant_key(empresa_config)
+    waid, cpf = only_digits(waid), only_digits(cpf)
+    if not tenant or not cliente_id or not (waid or cpf):
+        return
+    entry = {'waid': waid, 'cpf': cpf, 'cliente_id': cliente_id, 'nome': nome, 'verified_at': verified_at or time.time()}
+    # Preserva waid/CPF de uma entrada já conhecida do mesmo cliente
+    known = _memory_get((tenant, 'waid', waid) if waid else (tenant, 'cpf', cpf))
+    if known and str(known.get('cliente_id')) == str(cliente_id):
+        entry['waid'] = entry['waid'] or known.get('waid', '')
+        entry['cpf'] = entry['cpf'] or known.get('cpf', '')
+    _memory_put(tenant, entry)
+    with _lock:
+        _stats['stores'] += 1
+
+    if entry['waid'] and empresa_config.get('empresa_id'):
+        try:
+            _db_save(empresa_config['empresa_id'], entry)
+        except Exception as e:
+            with _lock:
+                _stats['db_errors'] += 1
+            logger.error(f"Erro ao salvar identidade do cliente {cliente_id} ({tenant}): {e}")
+
+
+def get_stats() -> Dict[str, Any]:
+    with _lock:
+        stats = dict(_stats)
+        stats['memory_size'] = len(_entries)
+    lookups = sum(stats.get(k, 0) for k in ('hits_memory', 'hits_db', 'misses'))
+    stats['hit_rate'] = round((lookups - stats.get('misses', 0)) / lookups, 4) if lookups else 0.0
+    return stats
@@ -1,12 +1,21 @@
 from typing import Dict, Any, List, Optional
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import threading
+import time
 import pytz
 
+from config import Config
 from services.services import DatabaseService
 from services.smart_agent_bridge import SmartAgentBridge
+from services.slot_filling import CONFIRMATION_MENU, menu_awaiting
 from services.unified_config_service import get_trinks_config
 from services.trinks_provider import TrinksProvider
 from integrations.twilio_service import TwilioService
+from integrations.trinks_service import TrinksService
+
+logger = logging.getLogger(__name__)
 
 
 def _build_time_window(timezone_str: str, lead_days: int) -> (str, str, str):
@@ -49,21 +58,83 @@ def _map_variables(order: List[str], name: str, time_hhmm: str, professional: st
     return {str(i+1): values.get(order[i], '') for i in range(min(3, len(order)))}
 
 
-def run_company_confirmation(empresa_id: int, empresa_slug: str, cfg: Dict[str, Any]) -> None:
+class _SendRateLimiter:
+    """Limita o ritmo de envios (thread-safe): no máximo `per_second` envios por segundo"""
+
+    def __init__(self, per_second: float):
+        self.interval = 1.0 / per_second if per_second and per_second > 0 else 0.0
+        self._next_at = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_at - now
+            self._next_at = max(now, self._next_at) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+# Cache de detalhes de cliente da Trinks: (empresa_id, cliente_id) -> (expires_at, {'name','phone'})
+CLIENT_CACHE_TTL = 6 * 3600
+_client_cache: Dict[tuple, tuple] = {}
+_client_cache_lock = threading.Lock()
+
+
+def _fetch_client_details(ts: TrinksService, empresa_id: int, cliente_id: str) -> Dict[str, str]:
+    """Busca nome/telefone do cliente na Trinks com cache em memória"""
+    key = (empresa_id, cliente_id)
+    now = time.time()
+    with _client_cache_lock:
+        cached = _client_cache.get(key)
+    if cached and cached[0] > now:
+        return cached[1]
+
+    cli = ts.get_client(cliente_id) or {}
+    if cli.get('error'):
+        logger.warning(f"Erro ao buscar cliente {cliente_id} na Trinks: {cli.get('error')}")
+        return {'name': '', 'phone': ''}
+    details = {
+        'name': (cli.get('nome') or (cli.get('data') or {}).get('nome') or '').strip(),
+        'phone': (cli.get('telefone') or (cli.get('data') or {}).get('telefone') or ''),
+    }
+    with _client_cache_lock:
+        _client_cache[key] = (now + CLIENT_CACHE_TTL, details)
+    return details
+
+
+def run_company_confirmation(empresa_id: int, empresa_slug: str, cfg: Dict[str, Any]) -> Dict[str, Any]:
+    """Envia os lembretes de confirmação de uma empresa e retorna um resumo da execução"""
+    started = time.time()
+    summary = {
+        'empresa_id': empresa_id,
+        'empresa_slug': empresa_slug,
+        'appointments': 0,
+        'clients': 0,
+        'without_phone': 0,
+        'already_sent': 0,
+        'sent': 0,
+        'failed': 0,
+        'elapsed_s': 0.0,
+        'sends_per_second': 0.0,
+    }
+
     db = DatabaseService()
-    # Obter config da Trinks
-    from sqlalchemy import create_engine
-    from sqlalchemy.orm import sessionmaker
-    from config import Config
-    engine = create_engine(Config.POSTGRES_URL)
-    SessionLocal = sessionmaker(bind=engine)
-    session = SessionLocal()
+    from models import Empresa
+    session = db.SessionLocal()
     try:
+        # Obter config da Trinks e credenciais Twilio na mesma sessão
         trinks_cfg = get_trinks_config(session, empresa_id)
+        empresa = session.query(Empresa).filter(Empresa.id == empresa_id).first()
+        if not trinks_cfg or not empresa:
+            return summary
+        twilio_sid = empresa.twilio_sid or ''
+        twilio_token = empresa.twilio_token or ''
+        twilio_from = (empresa.twilio_number or '').lstrip('+')
     finally:
         session.close()
-    if not trinks_cfg:
-        return
 
     empresa_config = {
         'empresa_id': empresa_id,
@@ -76,11 +147,13 @@ def run_company_confirmation(empresa_id: int, empresa_slug: str, cfg: Dict[str,
 
     provider = TrinksProvider(empresa_config)
     start_iso, end_iso, exec_date = _build_time_window(cfg.get('timezone'), cfg.get('lead_days', 1))
-    appointments = provider.list_appointments_range(start_iso, end_iso)
 
-    # Deduplicar por cliente pegando primeiro horário
+    # Deduplicar por cliente pegando primeiro horário (consumindo as páginas conforme chegam).
+    # Falha em qualquer página propaga: a execução é registrada como erro em vez de
+    # enviar lembretes só para parte dos clientes.
     by_client: Dict[str, Dict[str, Any]] = {}
-    for ap in appointments:
+    for ap in provider.iter_appointments_range(start_iso, end_iso):
+        summary['appointments'] += 1
         cliente_id = str((ap.get('cliente') or {}).get('id') or ap.get('clienteId') or '')
         if not cliente_id:
             continue
@@ -88,129 +161,106 @@ def run_company_confirmation(empresa_id: int, empresa_slug: str, cfg: Dict[str,
         if cliente_id not in by_client or (inicio and inicio < by_client[cliente_id].get('dataHoraInicio', '')):
             by_client[cliente_id] = ap
 
+    summary['clients'] = len(by_client)
     if not by_client:
-        return
+        return summary
 
-    # Twilio service
-    from models import Empresa
-    engine = create_engine(Config.POSTGRES_URL)
-    SessionLocal = sessionmaker(bind=engine)
-    session = SessionLocal()
-    try:
-        empresa = session.query(Empresa).filter(Empresa.id == empresa_id).first()
-        if not empresa:
-            return
-        twilio_sid = empresa.twilio_sid or ''
-        twilio_token = empresa.twilio_token or ''
-        twilio_from = (empresa.twilio_number or '').lstrip('+')
-    finally:
-        session.close()
-
-    twilio = TwilioService(twilio_sid, twilio_token, twilio_from)
-
-    # Bridge para semear SmartAgent
-    bridge = SmartAgentBridge(empresa_id, empresa_config)
+    # Buscar detalhes dos clientes (telefone e nome) em paralelo
+    ts = TrinksService(empresa_config)
+    with ThreadPoolExecutor(max_workers=max(1, Config.CONFIRMATION_PREFETCH_WORKERS)) as pool:
+        details = dict(zip(
+            by_client.keys(),
+            pool.map(lambda cid: _fetch_client_details(ts, empresa_id, cid), by_client.keys())
+        ))
 
     # Variáveis e envio
     order = cfg.get('twilio_variable_order') or ["name","time","professional"]
     template_sid = cfg.get('twilio_template_sid')
 
+    jobs: List[Dict[str, Any]] = []
     for cliente_id, ap in by_client.items():
         inicio = ap.get('dataHoraInicio') or ''
         time_hhmm = _format_time_hhmm(inicio, cfg.get('timezone'))
         profissional = (ap.get('profissional') or {}).get('nome') or ''
-        professional_id = (ap.get('profissional') or {}).get('id') or ''
-        appointment_id = str(ap.get('id') or '')
-
-        # Buscar detalhes do cliente (telefone e nome)
-        from integrations.trinks_service import TrinksService
-        ts = TrinksService(empresa_config)
-        cli = ts.get_client(cliente_id)
-        name = (cli.get('nome') or (cli.get('data') or {}).get('nome') or '').strip()
-        phone_raw = (cli.get('telefone') or (cli.get('data') or {}).get('telefone') or '')
-        phone = db.normalize_phone_br(phone_raw)
+        name = details[cliente_id]['name']
+        phone = db.normalize_phone_br(details[cliente_id]['phone'])
         if not phone:
+            summary['without_phone'] += 1
             continue
+        jobs.append({
+            'appointment_id': str(ap.get('id') or ''),
+            'to_number': phone,
+            'name': name,
+            'time_hhmm': time_hhmm,
+            'profissional': profissional,
+            'profissional_id': (ap.get('profissional') or {}).get('id') or '',
+            'variables': _map_variables(order, name, time_hhmm, profissional),
+        })
 
-        variables = _map_variables(order, name, time_hhmm, profissional)
-
-        # Idempotência
-        existing = db.record_notification(
-            empresa_id,
-            'confirmacao',
-            appointment_id,
-            exec_date,
-            phone,
-            variables,
-            None,
-            None
-        )
-        if not existing:
-            # já enviado
-            continue
+    # Idempotência: um único INSERT ... ON CONFLICT DO NOTHING; só envia o que foi inserido agora
+    inserted = db.record_notifications_bulk(empresa_id, 'confirmacao', exec_date, jobs)
+    summary['already_sent'] = len(jobs) - len(inserted)
+    jobs = [j for j in jobs if j['appointment_id'] in inserted]
+    if not jobs:
+        summary['elapsed_s'] = round(time.time() - started, 2)
+        return summary
 
+    # Bridge para semear SmartAgent (agente único: semeadura sequencial)
+    bridge = SmartAgentBridge(empresa_id, empresa_config)
+    for job in jobs:
         # Mensagem do bot (para histórico)
-        bot_message = f"Olá {name}, confirmando seu horário de amanhã às {time_hhmm} com {profissional}. Responda 1 para confirmar, 2 para cancelar, 3 para remarcar."
+        bot_message = f"Olá {job['name']}, confirmando seu horário de amanhã às {job['time_hhmm']} com {job['profissional']}. Responda 1 para confirmar, 2 para cancelar, 3 para remarcar."
         extracted = {
-            'appointment_id': appointment_id,
+            'appointment_id': job['appointment_id'],
             'data': exec_date,
-            'horario': time_hhmm,
-            'profissional': profissional,
-            'profissional_id': professional_id
+            'horario': job['time_hhmm'],
+            'profissional': job['profissional'],
+            'profissional_id': job['profissional_id']
         }
-        waid = phone  # usamos telefone como chave de conversa
-        bridge.seed_context_and_log(waid, extracted, bot_message, cliente_nome=name)
-
-        # Enviar via Twilio template
-        res = twilio.send_whatsapp_template(phone, template_sid, parameters=variables)
-        # Atualizar com SID/status
-        db.record_notification(
-            empresa_id,
-            'confirmacao',
-            appointment_id,
-            exec_date,
-            phone,
-            variables,
-            res.get('message_sid') if isinstance(res, dict) else None,
-            res.get('status') if isinstance(res, dict) else None
-        )
+        waid = job['to_number']  # usamos telefone como chave de conversa
+        bridge.seed_context_and_log(waid, extracted, bot_message, cliente_nome=job['name'],
+                                    awaiting=menu_awaiting('confirmacao_lembrete', CONFIRMATION_MENU))
 
+    # Enviar via Twilio template com paralelismo limitado e ritmo controlado
+    twilio = TwilioService(twilio_sid, twilio_token, twilio_from)
+    limiter = _SendRateLimiter(Config.CONFIRMATION_SENDS_PER_SECOND)
 
-def scheduler_loop_once() -> None:
-    """Executa 1 iteração: encontra o próximo next_run_at e dorme até lá, então roda."""
-    import time
-    from sqlalchemy import create_engine
-    from sqlalchemy.orm import sessionmaker
-    from config import Config
-    from models import EmpresaReminder, Empresa
-
-    engine = create_engine(Config.POSTGRES_URL)
-    SessionLocal = sessionmaker(bind=engine)
-    session = SessionLocal()
-    try:
-        now_utc = datetime.utcnow()
-        rem = session.query(EmpresaReminder, Empresa).join(Empresa, EmpresaReminder.empresa_id == Empresa.id).\
-            filter(EmpresaReminder.enabled == True, EmpresaReminder.next_run_at != None, Empresa.status == 'ativo').\
-            order_by(EmpresaReminder.next_run_at.asc()).first()
-        if not rem:
-            time.sleep(60)
-            return
-        conf, emp = rem
-        sleep_sec = max(0, (conf.next_run_at - now_utc).total_seconds())
-        time.sleep(sleep_sec)
-        # Rodar confirmação para essa empresa
-        db = DatabaseService()
-        configs = db.get_active_reminders()
-        match = [c for c in configs if c['empresa_id'] == conf.empresa_id]
-        if match:
-            cfg = match[0]
-            run_company_confirmation(conf.empresa_id, emp.slug, cfg)
-        # Reagendar para o próximo dia no mesmo horário local
-        tz = pytz.timezone(conf.timezone or 'America/Sao_Paulo')
-        local_next = tz.localize(datetime.now(tz).replace(hour=int((conf.send_time_local or '11:00')[:2]), minute=int((conf.send_time_local or '11:00')[3:5]), second=0, microsecond=0)) + timedelta(days=1)
-        conf.next_run_at = local_next.astimezone(pytz.utc).replace(tzinfo=None)
-        session.commit()
-    finally:
-        session.close()
+    def _send(job: Dict[str, Any]) -> Dict[str, Any]:
+        limiter.acquire()
+        res = twilio.send_whatsapp_template(job['to_number'], template_sid, parameters=job['variables'])
+        res = res if isinstance(res, dict) else {}
+        return {
+            'appointment_id': job['appointment_id'],
+            'success': bool(res.get('success')),
+            'message_sid': res.get('message_sid'),
+            'status': res.get('status') or ('failed' if not res.get('success') else None),
+        }
+
+    send_started = time.time()
+    with ThreadPoolExecutor(max_workers=max(1, Config.CONFIRMATION_SEND_WORKERS)) as pool:
+        results = list(pool.map(_send, jobs))
+    send_elapsed = time.time() - send_started
 
+    # Atualizar com SID/status
+    db.update_notifications_status(empresa_id, 'confirmacao', exec_date, results)
 
+    summary['sent'] = sum(1 for r in results if r['success'])
+    summary['failed'] = len(results) - summary['sent']
+    summary['elapsed_s'] = round(time.time() - started, 2)
+    summary['sends_per_second'] = round(len(results) / send_elapsed, 2) if send_elapsed > 0 else float(len(results))
+    logger.info(
+        f"📨 Confirmações {empresa_slug}: {summary['sent']} enviadas, {summary['failed']} falhas, "
+        f"{summary['already_sent']} já enviadas, {summary['without_phone']} sem telefone "
+        f"({summary['clients']} clientes) em {summary['elapsed_s']}s ({summary['sends_per_second']}/s)"
+    )
+    return summary
+
+
+def scheduler_loop_once() -> None:
+    """Executa 1 iteração do agendador: dispara em paralelo todos os lembretes vencidos.
+    O loop contínuo (com advisory lock e min-heap) vive em services.reminder_scheduler.
+    """
+    from services.reminder_scheduler import get_reminder_scheduler
+    scheduler = get_reminder_scheduler()
+    scheduler.load_all()
+    scheduler.run_due_once()
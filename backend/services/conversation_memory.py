@@ -0,0 +1,143 @@
+"""
+Memória de conversa com resumo incremental.
+
+Mantém as últimas mensagens literais e um resumo das anteriores, atualizado
+em lote e em background (modelo barato), para que o tamanho do prompt não
+cresça com a duração da conversa. Os dados estruturados do atendimento
+(profissional, serviço, data, horário...) continuam em `extracted_data`.
+
+Estrutura da entrada de cache por conversa (SmartAgent._conversation_cache):
+    {
+        'messages': [{'type': 'human'|'ai', 'content': str}, ...],  # ainda não resumidas
+        'base': int,           # posição absoluta da 1ª mensagem de 'messages'
+        'summary': str,        # resumo das mensagens anteriores a 'summary_upto'
+        'summary_upto': int,   # posição absoluta até onde o resumo cobre
+        'summarizing': bool,   # resumo em andamento
+        'extracted_data': {...}
+    }
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from services.prompt_builder import truncate_to_budget
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PROMPT = """Você mantém o resumo de uma conversa de WhatsApp entre um cliente e o assistente de uma empresa.
+Atualize o RESUMO ATUAL incorporando as NOVAS MENSAGENS.
+- Escreva em português, em no máximo 8 frases curtas, em terceira pessoa.
+- Preserve: pedidos do cliente, serviços/profissionais/datas/horários discutidos, opções oferecidas e recusadas,
+  decisões tomadas, dados pessoais informados (nome, CPF, email) e pendências.
+- Descarte saudações, listas longas de horários que não foram escolhidos e repetições.
+Responda APENAS com o novo resumo."""
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def format_messages(messages: List[Dict[str, Any]]) -> str:
+    lines = []
+    for msg in messages:
+        role = "Cliente" if msg.get('type') == 'human' else "Assistente"
+        lines.append(f"• {role}: {msg.get('content', '')}")
+    return "\n".join(lines)
+
+
+def trim_summarized(entry: Dict[str, Any]) -> None:
+    """Remove de entry['messages'] as mensagens já cobertas pelo resumo"""
+    base = int(entry.get('base', 0))
+    upto = int(entry.get('summary_upto', 0))
+    cut = max(0, min(upto - base, len(entry.get('messages', []))))
+    if cut:
+        entry['messages'] = entry['messages'][cut:]
+        entry['base'] = base + cut
+
+
+def plan_summarization(entry: Dict[str, Any], keep_recent: int, batch: int) -> Optional[Tuple[int, List[Dict[str, Any]]]]:
+    """Decide se é hora de resumir. Retorna (posição absoluta final, mensagens a resumir) ou None.
+
+    Resume quando há pelo menos `batch` mensagens além das `keep_recent` mais recentes.
+    """
+    if entry.get('summarizing'):
+        return None
+    messages = entry.get('messages', [])
+    if len(messages) < keep_recent + batch:
+        return None
+    to_summarize = messages[:len(messages) - keep_recent]
+    return int(entry.get('base', 0)) + len(to_summarize), list(to_summarize)
+
+
+def fallback_summary(previous: str, messages: List[Dict[str, Any]], max_tokens: int) -> str:
+    """Resumo sem LLM (falha/timeout): anexa as mensagens encurtadas e corta pelo orçamento"""
+    short = [f"{'Cliente' if m.get('type') == 'human' else 'Assistente'}: {str(m.get('content', ''))[:160]}" for m in messages]
+    text = "\n".join([p for p in [previous] + short if p])
+    return truncate_to_budget(text, max_tokens, keep='tail')
+
+
+def summarize(api_key: str, previous_summary: str, messages: List[Dict[str, Any]]) -> str:
+    """Gera o novo resumo (bloqueante)"""
+    from config import Config
+    from langchain_core.messages import SystemMessage, HumanMessage
+    if not api_key:
+        return fallback_summary(previous_summary, messages, Config.MEMORY_SUMMARY_MAX_TOKENS)
+    try:
+        from services.llm_gateway import get_llm, SUMMARY
+        llm = get_llm(SUMMARY, api_key=api_key)
+        response = llm.invoke([
+            SystemMessage(content=SUMMARY_PROMPT),
+            HumanMessage(content=f"RESUMO ATUAL:\n{previous_summary or '(vazio)'}\n\nNOVAS MENSAGENS:\n{format_messages(messages)}")
+        ])
+        text = (response.content or '').strip()
+        if not text:
+            raise ValueError("resumo vazio")
+        return truncate_to_budget(text, Config.MEMORY_SUMMARY_MAX_TOKENS)
+    except Exception as e:
+        logger.error(f"Erro ao resumir conversa, usando resumo simplificado: {e}")
+        return fallback_summary(previous_summary, messages, Config.MEMORY_SUMMARY_MAX_TOKENS)
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="memory-summary")
+        return _executor
+
+
+def schedule_summarization(cache: Dict[str, Dict[str, Any]], lock: threading.Lock, key: str, api_key: str,
+                           keep_recent: int, batch: int,
+                           runner: Callable[[str, str, List[Dict[str, Any]]], str] = summarize) -> bool:
+    """Agenda (se necessário) a atualização do resumo da conversa `key` em background"""
+    with lock:
+        entry = cache.get(key)
+        if not isinstance(entry, dict):
+            return False
+        plan = plan_summarization(entry, keep_recent, batch)
+        if not plan:
+            return False
+        upto, to_summarize = plan
+        previous = entry.get('summary', '')
+        entry['summarizing'] = True
+
+    def _run():
+        try:
+            new_summary = runner(api_key, previous, to_summarize)
+        except Exception as e:
+            logger.error(f"Erro ao resumir conversa {key}: {e}")
+            new_summary = None
+        with lock:
+            entry['summarizing'] = False
+            current = cache.get(key)
+            if current is not entry:
+                # Conversa reiniciada/limpa enquanto o resumo era gerado
+                return
+            if new_summary is not None:
+                current['summary'] = new_summary
+                current['summary_upto'] = upto
+                trim_summarized(current)
+                logger.info(f"🧠 Resumo da conversa {key} atualizado ({len(to_summarize)} mensagens incorporadas)")
+
+    _get_executor().submit(_run)
+    return True
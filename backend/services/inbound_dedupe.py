@@ -0,0 +1,135 @@
+"""
+Deduplicação de webhooks recebidos do Twilio por MessageSid.
+
+O Twilio reenvia o webhook quando a resposta demora; cada reenvio geraria
+outra mensagem salva e outro turno do LLM. Duas camadas:
+- conjunto limitado em memória (LRU) para o caminho quente
+- tabela inbound_message_receipts (MessageSid único) para durabilidade entre
+  réplicas e reinícios
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import ProgrammingError
+
+from config import Config
+from models import InboundMessageReceipt
+from services.services import DatabaseService
+
+logger = logging.getLogger(__name__)
+
+# Limpeza da tabela de recibos no máximo uma vez por este intervalo
+PURGE_INTERVAL_SECONDS = 3600
+
+_seen: "OrderedDict[str, float]" = OrderedDict()
+_lock = threading.Lock()
+_stats: Dict[str, Any] = {'received': 0, 'duplicates_memory': 0, 'duplicates_db': 0, 'db_errors': 0}
+_last_purge = 0.0
+
+
+def _remember(message_sid: str) -> bool:
+    """Marca o SID em memória. Retorna False se já estava presente."""
+    with _lock:
+        if message_sid in _seen:
+            _seen.move_to_end(message_sid)
+            return False
+        _seen[message_sid] = time.time()
+        while len(_seen) > max(1, Config.INBOUND_DEDUPE_MEMORY_SIZE):
+            _seen.popitem(last=False)
+        return True
+
+
+def _forget(message_sid: str):
+    with _lock:
+        _seen.pop(message_sid, None)
+
+
+def _record_receipt(message_sid: str, empresa_slug: str, wa_id: Optional[str]) -> bool:
+    """Insere o recibo. Retorna False se o SID já existia no banco."""
+    global _last_purge
+    db = DatabaseService()
+    session = db.SessionLocal()
+    try:
+        stmt = pg_insert(InboundMessageReceipt.__table__).values(
+            message_sid=message_sid, empresa_slug=empresa_slug, wa_id=wa_id
+        ).on_conflict_do_nothing(index_elements=['message_sid']).returning(InboundMessageReceipt.__table__.c.id)
+        inserted = session.execute(stmt).first() is not None
+
+        now = time.time()
+        if now - _last_purge > PURGE_INTERVAL_SECONDS:
+            _last_purge = now
+            session.execute(text(
+                "DELETE FROM inbound_message_receipts WHERE received_at < now() - make_interval(hours => :h)"
+            ), {"h": Config.INBOUND_DEDUPE_RETENTION_HOURS})
+        session.commit()
+        return inserted
+    finally:
+        session.close()
+
+
+def register_inbound(message_sid: Optional[str], empresa_slug: str, wa_id: Optional[str] = None) -> bool:
+    """Registra um webhook recebido. Retorna True se é novo (deve ser processado) e False se é reenvio.
+
+    Falhas no banco não bloqueiam o atendimento: na dúvida a mensagem é processada.
+    """
+    if not message_sid:
+        return True
+    with _lock:
+        _stats['received'] += 1
+
+    if not _remember(message_sid):
+        with _lock:
+            _stats['duplicates_memory'] += 1
+        logger.info(f"♻️ Webhook duplicado ignorado (memória): {message_sid} ({empresa_slug})")
+        return False
+
+    try:
+        if _record_receipt(message_sid, empresa_slug, wa_id):
+            return True
+        with _lock:
+            _stats['duplicates_db'] += 1
+        logger.info(f"♻️ Webhook duplicado ignorado (banco): {message_sid} ({empresa_slug})")
+        return False
+    except ProgrammingError as e:
+        # Tabela ainda não criada: segue só com a camada em memória
+        with _lock:
+            _stats['db_errors'] += 1
+        logger.warning(f"Tabela inbound_message_receipts indisponível, deduplicação apenas em memória: {e}")
+        return True
+    except Exception as e:
+        with _lock:
+            _stats['db_errors'] += 1
+        logger.error(f"Erro ao registrar MessageSid {message_sid}: {e}")
+        return True
+
+
+def release_inbound(message_sid: Optional[str]):
+    """Esquece o SID (memória e banco) para que um reenvio do Twilio seja processado.
+
+    Usado quando o webhook falha antes de aceitar a mensagem.
+    """
+    if not message_sid:
+        return
+    _forget(message_sid)
+    db = DatabaseService()
+    session = db.SessionLocal()
+    try:
+        session.execute(text("DELETE FROM inbound_message_receipts WHERE message_sid = :sid"), {"sid": message_sid})
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        logger.error(f"Erro ao liberar MessageSid {message_sid}: {e}")
+    finally:
+        session.close()
+
+
+def get_stats() -> Dict[str, Any]:
+    with _lock:
+        stats = dict(_stats)
+        stats['memory_size'] = len(_seen)
+    return stats
@@ -0,0 +1,205 @@
+"""
+Índice local de recuperação sobre o knowledge_json das empresas.
+
+Em vez de injetar todos os itens de knowledge em cada chamada ao LLM, um
+índice BM25 por empresa seleciona os itens mais relevantes para a mensagem
+atual (e o histórico recente). Bases pequenas continuam indo inteiras.
+
+O índice é construído ao salvar as configurações da empresa e reconstruído
+sob demanda quando o conteúdo muda (impressão digital do JSON), o que cobre
+réplicas que não receberam o salvamento.
+"""
+import hashlib
+import json
+import logging
+import math
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.prompt_builder import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Palavras frequentes em pt-BR que não ajudam a distinguir itens
+STOPWORDS = frozenset("""
+a o as os um uma uns umas de da do das dos d em na no nas nos num numa por pela pelo pelas pelos para pra pro
+com sem sob sobre ate e ou mas que se ja nao sim ao aos a as eu voce voces ele ela eles elas nos meu minha
+seu sua seus suas isso isto esse essa este esta aquele aquela qual quais quem como quando onde porque
+ser estar ter tem tenho tinha foi era sao esta estao vai vou quero queria gostaria poderia pode posso
+mais menos muito muita bem oi ola bom boa dia tarde noite obrigado obrigada favor me te lhe
+""".split())
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_indexes: Dict[int, Tuple[str, 'KnowledgeIndex']] = {}
+_indexes_lock = threading.Lock()
+_metrics: Dict[str, float] = defaultdict(float)
+_metrics_lock = threading.Lock()
+
+
+def normalize(text: str) -> str:
+    """Minúsculas e sem acentos"""
+    text = unicodedata.normalize('NFKD', str(text or '').lower())
+    return ''.join(c for c in text if not unicodedata.combining(c))
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for tok in re.findall(r"[a-z0-9]+", normalize(text)):
+        if tok in STOPWORDS or (len(tok) < 2 and not tok.isdigit()):
+            continue
+        # Plural simples: "consultas" → "consulta", "valores" → "valor"
+        if len(tok) > 4 and tok.endswith('es') and tok[-3] in 'rsz':
+            tok = tok[:-2]
+        elif len(tok) > 3 and tok.endswith('s'):
+            tok = tok[:-1]
+        tokens.append(tok)
+    return tokens
+
+
+def item_text(item: Dict[str, Any]) -> str:
+    return " ".join(str(item.get(f) or '') for f in ('key', 'title', 'description', 'content'))
+
+
+def format_item(item: Dict[str, Any]) -> Optional[str]:
+    """Mesmo formato usado no prompt do SmartAgent ("• chave: descrição")"""
+    key = item.get('key', '')
+    description = item.get('description', '')
+    if key and description:
+        return f"• {key}: {description}"
+    return None
+
+
+def fingerprint(knowledge_json: Any) -> str:
+    raw = json.dumps(knowledge_json or {}, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+class KnowledgeIndex:
+    """BM25 sobre os itens de knowledge de uma empresa"""
+
+    def __init__(self, items: List[Dict[str, Any]]):
+        self.items = [i for i in (items or []) if isinstance(i, dict) and format_item(i)]
+        self.lines = [format_item(i) for i in self.items]
+        self.total_tokens = estimate_tokens("\n".join(self.lines))
+        self._doc_tf: List[Counter] = []
+        self._doc_len: List[int] = []
+        df: Counter = Counter()
+        for item in self.items:
+            # A chave do item pesa mais que a descrição
+            tokens = tokenize(item_text(item)) + tokenize(item.get('key', '')) * 2
+            tf = Counter(tokens)
+            self._doc_tf.append(tf)
+            self._doc_len.append(len(tokens))
+            df.update(tf.keys())
+        n = len(self.items)
+        self._avg_len = (sum(self._doc_len) / n) if n else 0.0
+        self._idf = {term: math.log(1 + (n - f + 0.5) / (f + 0.5)) for term, f in df.items()}
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def score(self, query: str) -> List[Tuple[float, int]]:
+        terms = set(tokenize(query))
+        scored = []
+        for idx, tf in enumerate(self._doc_tf):
+            s = 0.0
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * (self._doc_len[idx] / self._avg_len if self._avg_len else 0))
+            for term in terms:
+                f = tf.get(term)
+                if f:
+                    s += self._idf[term] * f * (BM25_K1 + 1) / (f + norm)
+            if s > 0:
+                scored.append((s, idx))
+        scored.sort(key=lambda x: (-x[0], x[1]))
+        return scored
+
+    def search(self, query: str, top_k: int) -> List[int]:
+        """Índices dos itens mais relevantes, na ordem original da base"""
+        return sorted(idx for _, idx in self.score(query)[:top_k])
+
+
+def build_index(empresa_id: int, knowledge_json: Any) -> KnowledgeIndex:
+    """(Re)constrói e guarda o índice da empresa"""
+    items = (knowledge_json or {}).get('items', []) if isinstance(knowledge_json, dict) else []
+    started = time.perf_counter()
+    index = KnowledgeIndex(items)
+    with _indexes_lock:
+        _indexes[empresa_id] = (fingerprint(knowledge_json), index)
+    logger.info(f"📚 Índice de knowledge da empresa {empresa_id}: {len(index)} itens, "
+                f"{index.total_tokens} tokens, construído em {(time.perf_counter() - started) * 1000:.1f}ms")
+    return index
+
+
+def get_index(empresa_id: int, knowledge_json: Any) -> KnowledgeIndex:
+    fp = fingerprint(knowledge_json)
+    with _indexes_lock:
+        cached = _indexes.get(empresa_id)
+    if cached and cached[0] == fp:
+        return cached[1]
+    return build_index(empresa_id, knowledge_json)
+
+
+def invalidate_index(empresa_id: int):
+    with _indexes_lock:
+        _indexes.pop(empresa_id, None)
+
+
+def select_knowledge(empresa_id: int, knowledge_json: Any, query: str,
+                     top_k: Optional[int] = None, full_max_tokens: Optional[int] = None) -> Tuple[str, str]:
+    """Texto de knowledge para o prompt e o modo usado.
+
+    Base pequena (até `full_max_tokens`) vai inteira ('full', conteúdo estável entre turnos);
+    senão apenas os top-k itens relevantes para `query` ('retrieval', varia por turno).
+    """
+    if top_k is None or full_max_tokens is None:
+        from config import Config
+        top_k = Config.KNOWLEDGE_TOP_K if top_k is None else top_k
+        full_max_tokens = Config.KNOWLEDGE_FULL_MAX_TOKENS if full_max_tokens is None else full_max_tokens
+
+    started = time.perf_counter()
+    index = get_index(empresa_id, knowledge_json)
+    if not len(index):
+        return "Nenhuma informação específica configurada.", 'full'
+
+    if index.total_tokens <= full_max_tokens:
+        selected = index.lines
+        mode = 'full'
+    else:
+        selected = [index.lines[i] for i in index.search(query, top_k)]
+        mode = 'retrieval'
+    text = "\n".join(selected) if selected else "Nenhuma informação da empresa relevante para esta mensagem."
+
+    injected = estimate_tokens(text)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    with _metrics_lock:
+        _metrics['calls'] += 1
+        _metrics[f'calls_{mode}'] += 1
+        _metrics['full_tokens'] += index.total_tokens
+        _metrics['injected_tokens'] += injected
+        _metrics['select_ms'] += elapsed_ms
+    if mode == 'retrieval':
+        logger.info(f"📚 Knowledge empresa {empresa_id}: {len(selected)}/{len(index)} itens, "
+                    f"{injected}/{index.total_tokens} tokens em {elapsed_ms:.1f}ms")
+    return text, mode
+
+
+def get_knowledge_metrics() -> Dict[str, Any]:
+    with _metrics_lock:
+        m = dict(_metrics)
+    full = m.get('full_tokens', 0)
+    calls = m.get('calls', 0)
+    return {
+        'calls': int(calls),
+        'calls_full': int(m.get('calls_full', 0)),
+        'calls_retrieval': int(m.get('calls_retrieval', 0)),
+        'full_tokens': int(full),
+        'injected_tokens': int(m.get('injected_tokens', 0)),
+        'tokens_saved_ratio': round(1 - m.get('injected_tokens', 0) / full, 4) if full else 0.0,
+        'avg_select_ms': round(m.get('select_ms', 0) / calls, 3) if calls else 0.0,
+    }
@@ -0,0 +1,468 @@
+"""
+Gateway de LLM por tipo de tarefa.
+
+Cada ponto de chamada declara a TAREFA (resposta ao cliente, intenção,
+extração, planejamento, match, classificação, resumo) em vez de fixar o
+modelo. Uma política define, por tarefa, modelo, timeout, max_tokens e
+modelo de fallback:
+
+    padrão do módulo → Config.LLM_POLICY (JSON no ambiente)
+    → empresa (openai_config.llm_policy da tabela empresa_apis)
+
+Exemplo de política (parcial; o que não for informado herda o nível anterior):
+    {"matching": {"model": "gpt-4o-mini", "timeout": 8}, "intent": {"model": "gpt-4o-mini"}}
+
+O gateway registra latência, erros, fallbacks e tokens por tarefa, para que
+mover uma etapa para um modelo mais rápido seja só mudar a política.
+
+Resiliência (para o provedor lento não prender todas as threads de turno):
+  - prazo por chamada = min(timeout da política, tempo restante do turno);
+  - semáforo global e por empresa, com espera limitada;
+  - circuit breaker por chave/modelo (aberto → tenta o fallback);
+  - "hedge" opcional (política `hedge: true`): duplica a requisição quando a
+    primeira passa do p95 da tarefa e usa a que responder primeiro.
+Quando o gateway recusa uma chamada (LLMUnavailable), o turno é marcado como
+degradado e o SmartAgent responde com Config.LLM_DEGRADED_REPLY.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Tipos de tarefa
+CHAT = 'chat'                      # resposta ao cliente com o prompt da empresa
+INTENT = 'intent'                  # intenção + extração do turno
+EXTRACTION = 'extraction'          # extração de dados estruturados
+PLANNING = 'planning'              # próximos passos do fluxo
+MATCHING = 'matching'              # match de profissional/serviço
+CLASSIFICATION = 'classification'  # labels, preferências e outras classificações curtas
+SUMMARY = 'summary'                # resumo da memória da conversa
+
+TASKS = (CHAT, INTENT, EXTRACTION, PLANNING, MATCHING, CLASSIFICATION, SUMMARY)
+
+# Padrão: mesmo modelo e sem limite de tokens, como antes (mudanças vêm pela política)
+DEFAULT_POLICY: Dict[str, Dict[str, Any]] = {
+    CHAT: {'model': 'gpt-4o', 'timeout': 30, 'max_tokens': None, 'fallback': 'gpt-4o-mini', 'max_retries': 1, 'hedge': False},
+    INTENT: {'model': 'gpt-4o', 'timeout': 20, 'max_tokens': None, 'fallback': 'gpt-4o-mini', 'max_retries': 1},
+    EXTRACTION: {'model': 'gpt-4o', 'timeout': 20, 'max_tokens': None, 'fallback': 'gpt-4o-mini', 'max_retries': 1},
+    PLANNING: {'model': 'gpt-4o', 'timeout': 20, 'max_tokens': None, 'fallback': 'gpt-4o-mini', 'max_retries': 1},
+    MATCHING: {'model': 'gpt-4o', 'timeout': 15, 'max_tokens': None, 'fallback': 'gpt-4o-mini', 'max_retries': 1},
+    CLASSIFICATION: {'model': 'gpt-4o', 'timeout': 15, 'max_tokens': None, 'fallback': 'gpt-4o-mini', 'max_retries': 1},
+    SUMMARY: {'model': None, 'timeout': 20, 'max_tokens': 400, 'fallback': None, 'max_retries': 1},
+}
+
+LATENCY_WINDOW = 200
+HEDGE_MIN_SAMPLES = 20        # amostras de latência antes de confiar no p95 para o hedge
+MIN_CALL_SECONDS = 1.0        # abaixo disso não vale a pena chamar o LLM dentro do turno
+
+_models: Dict[tuple, Any] = {}
+_models_lock = threading.Lock()
+_env_policy: Optional[Dict[str, Dict[str, Any]]] = None
+_metrics: Dict[str, Dict[str, Any]] = defaultdict(lambda: {
+    'calls': 0, 'errors': 0, 'fallbacks': 0, 'latency_ms': 0.0,
+    'rejected': 0, 'breaker_skips': 0, 'hedges': 0, 'hedge_wins': 0,
+    'prompt_tokens': 0, 'completion_tokens': 0, 'models': defaultdict(int),
+    'recent_ms': deque(maxlen=LATENCY_WINDOW),
+})
+_metrics_lock = threading.Lock()
+
+_breakers: Dict[tuple, 'CircuitBreaker'] = {}
+_breakers_lock = threading.Lock()
+_global_slots: Optional[threading.BoundedSemaphore] = None
+_tenant_slots: Dict[str, threading.BoundedSemaphore] = {}
+_slots_lock = threading.Lock()
+_hedge_executor: Optional[ThreadPoolExecutor] = None
+
+# Estado do turno (por thread: o turno do agente roda inteiro numa thread do pipeline)
+_turn = threading.local()
+
+
+class LLMUnavailable(Exception):
+    """Chamada recusada pelo gateway: circuito aberto, fila cheia ou prazo do turno esgotado"""
+
+
+class CircuitBreaker:
+    """Circuit breaker simples: abre após N falhas seguidas e libera uma tentativa após o cooldown"""
+
+    def __init__(self, failure_threshold: int, cooldown_seconds: float, clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown_seconds = cooldown_seconds
+        self.clock = clock
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            now = self.clock()
+            if now - self.opened_at >= self.cooldown_seconds:
+                # Uma chamada de teste por cooldown (também se a anterior não chegou a ser registrada)
+                self.state = 'half_open'
+                self.opened_at = now
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                if self.state != 'open':
+                    self.times_opened += 1
+                self.state = 'open'
+                self.opened_at = self.clock()
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'state': self.state, 'failures': self.failures, 'times_opened': self.times_opened}
+
+
+@contextmanager
+def turn_budget(seconds: Optional[float] = None):
+    """Define o prazo do turno na thread atual; turnos aninhados reaproveitam o prazo externo"""
+    current = getattr(_turn, 'state', None)
+    if current is not None:
+        yield current
+        return
+    if seconds is None:
+        from config import Config
+        seconds = Config.LLM_TURN_BUDGET_SECONDS
+    _turn.state = {'deadline': time.monotonic() + seconds, 'degraded': None}
+    try:
+        yield _turn.state
+    finally:
+        _turn.state = None
+
+
+def current_turn() -> Optional[Dict[str, Any]]:
+    """Estado do turno da thread atual (para repassar a threads de trabalho)"""
+    return getattr(_turn, 'state', None)
+
+
+@contextmanager
+def bind_turn(state: Optional[Dict[str, Any]]):
+    """Executa o bloco em outra thread com o prazo/estado do turno de origem"""
+    previous = getattr(_turn, 'state', None)
+    _turn.state = state
+    try:
+        yield state
+    finally:
+        _turn.state = previous
+
+
+def remaining_budget() -> Optional[float]:
+    """Segundos restantes do turno atual (None fora de um turno)"""
+    state = getattr(_turn, 'state', None)
+    return None if state is None else state['deadline'] - time.monotonic()
+
+
+def _degrade(reason: str) -> LLMUnavailable:
+    state = getattr(_turn, 'state', None)
+    if state is not None and not state['degraded']:
+        state['degraded'] = reason
+        logger.warning(f"🚧 Turno degradado: {reason}")
+    return LLMUnavailable(reason)
+
+
+def _breaker(api_key: Optional[str], model: str) -> CircuitBreaker:
+    # Por chave+modelo: empresas com a mesma chave compartilham o estado; chave inválida não afeta as outras
+    key = (hashlib.sha1(str(api_key).encode()).hexdigest()[:12], model)
+    with _breakers_lock:
+        breaker = _breakers.get(key)
+        if breaker is None:
+            from config import Config
+            breaker = CircuitBreaker(Config.LLM_BREAKER_FAILURES, Config.LLM_BREAKER_COOLDOWN_SECONDS)
+            _breakers[key] = breaker
+        return breaker
+
+
+def _semaphores(tenant: Optional[str]) -> List[threading.BoundedSemaphore]:
+    global _global_slots
+    from config import Config
+    with _slots_lock:
+        if _global_slots is None:
+            _global_slots = threading.BoundedSemaphore(Config.LLM_MAX_CONCURRENCY)
+        slots = [_global_slots]
+        if tenant:
+            if tenant not in _tenant_slots:
+                _tenant_slots[tenant] = threading.BoundedSemaphore(Config.LLM_TENANT_MAX_CONCURRENCY)
+            slots.insert(0, _tenant_slots[tenant])
+        return slots
+
+
+def _acquire(slots: List[threading.BoundedSemaphore], timeout: float) -> bool:
+    """Adquire todos os semáforos (empresa, depois global) dentro do tempo; tudo ou nada"""
+    deadline = time.monotonic() + max(0.0, timeout)
+    acquired = []
+    for sem in slots:
+        if not sem.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            for held in acquired:
+                held.release()
+            return False
+        acquired.append(sem)
+    return True
+
+
+def _release(slots: List[threading.BoundedSemaphore]) -> None:
+    for sem in slots:
+        sem.release()
+
+
+def _get_hedge_executor() -> ThreadPoolExecutor:
+    global _hedge_executor
+    with _slots_lock:
+        if _hedge_executor is None:
+            from config import Config
+            _hedge_executor = ThreadPoolExecutor(max_workers=Config.LLM_HEDGE_WORKERS, thread_name_prefix='llm-hedge')
+        return _hedge_executor
+
+
+def _task_p95(task: str) -> Optional[float]:
+    """p95 recente da tarefa em segundos (None com poucas amostras)"""
+    with _metrics_lock:
+        recent = sorted(_metrics[task]['recent_ms']) if task in _metrics else []
+    if len(recent) < HEDGE_MIN_SAMPLES:
+        return None
+    return recent[min(len(recent) - 1, int(len(recent) * 0.95))] / 1000
+
+
+def _count(task: str, field: str) -> None:
+    with _metrics_lock:
+        _metrics[task][field] += 1
+
+
+def _load_env_policy() -> Dict[str, Dict[str, Any]]:
+    global _env_policy
+    if _env_policy is None:
+        from config import Config
+        try:
+            _env_policy = json.loads(Config.LLM_POLICY) if Config.LLM_POLICY else {}
+        except ValueError as e:
+            logger.error(f"LLM_POLICY inválida, usando política padrão: {e}")
+            _env_policy = {}
+    return _env_policy
+
+
+def _tenant_policy(empresa_config: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    if not isinstance(empresa_config, dict):
+        return {}
+    policy = (empresa_config.get('openai_config') or {}).get('llm_policy') or empresa_config.get('llm_policy')
+    return policy if isinstance(policy, dict) else {}
+
+
+def resolve_policy(task: str, empresa_config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Política efetiva da tarefa (padrão → ambiente → empresa)"""
+    policy = dict(DEFAULT_POLICY.get(task, DEFAULT_POLICY[CHAT]))
+    if task == SUMMARY and not policy.get('model'):
+        from config import Config
+        policy['model'] = Config.MEMORY_SUMMARY_MODEL
+    for source in (_load_env_policy(), _tenant_policy(empresa_config)):
+        override = source.get(task)
+        if isinstance(override, dict):
+            policy.update({k: v for k, v in override.items() if k in DEFAULT_POLICY[CHAT]})
+    return policy
+
+
+def resolve_api_key(empresa_config: Optional[Dict[str, Any]]) -> Optional[str]:
+    config = empresa_config or {}
+    return config.get('openai_key') or config.get('openai_api_key') or (config.get('openai_config') or {}).get('openai_key')
+
+
+def _chat_model(api_key: str, model: str, temperature: float, policy: Dict[str, Any]):
+    key = (api_key, model, temperature, policy.get('timeout'), policy.get('max_tokens'), policy.get('max_retries'))
+    with _models_lock:
+        llm = _models.get(key)
+        if llm is None:
+            try:
+                from langchain_openai import ChatOpenAI
+            except ImportError:
+                from langchain.chat_models import ChatOpenAI
+            kwargs = {'api_key': api_key, 'temperature': temperature, 'model': model,
+                      'timeout': policy.get('timeout'), 'max_retries': policy.get('max_retries', 1)}
+            if policy.get('max_tokens'):
+                kwargs['max_tokens'] = policy['max_tokens']
+            llm = ChatOpenAI(**kwargs)
+            _models[key] = llm
+        return llm
+
+
+def record_call(task: str, model: str, elapsed_ms: float, response: Any = None,
+                error: bool = False, fallback: bool = False) -> None:
+    """Registra uma chamada (também usado por clientes fora do LangChain, ex.: SDK OpenAI)"""
+    from services.prompt_builder import _extract_usage
+    usage = _extract_usage(response) if response is not None else {}
+    with _metrics_lock:
+        m = _metrics[task]
+        m['calls'] += 1
+        m['errors'] += int(error)
+        m['fallbacks'] += int(fallback)
+        m['latency_ms'] += elapsed_ms
+        m['recent_ms'].append(elapsed_ms)
+        m['models'][model] += 1
+        m['prompt_tokens'] += usage.get('prompt_tokens', 0)
+        m['completion_tokens'] += usage.get('completion_tokens', 0)
+
+
+class GatewayLLM:
+    """Modelo resolvido para uma tarefa, com a mesma interface `invoke` do LangChain"""
+
+    def __init__(self, task: str, api_key: Optional[str], policy: Dict[str, Any], temperature: float,
+                 tenant: Optional[str] = None):
+        self.task = task
+        self.api_key = api_key
+        self.policy = policy
+        self.temperature = temperature
+        self.tenant = tenant
+
+    @property
+    def model_name(self) -> str:
+        return self.policy.get('model')
+
+    def _call_timeout(self) -> float:
+        timeout = float(self.policy.get('timeout') or 30)
+        remaining = remaining_budget()
+        if remaining is None:
+            return timeout
+        if remaining < MIN_CALL_SECONDS:
+            _count(self.task, 'rejected')
+            raise _degrade(f"prazo do turno esgotado antes de {self.task}")
+        return min(timeout, remaining)
+
+    def _run(self, model: str, messages: Any, timeout: float, slots: List[threading.BoundedSemaphore], kwargs: Dict[str, Any]) -> Any:
+        """Executa a chamada e libera os semáforos ao terminar (mesmo se o resultado não for mais usado)"""
+        try:
+            return _chat_model(self.api_key, model, self.temperature, self.policy).invoke(messages, timeout=timeout, **kwargs)
+        finally:
+            _release(slots)
+
+    def _call(self, model: str, messages: Any, timeout: float, kwargs: Dict[str, Any]) -> Any:
+        slots = _semaphores(self.tenant)
+        from config import Config
+        if not _acquire(slots, min(timeout, Config.LLM_QUEUE_TIMEOUT_SECONDS)):
+            _count(self.task, 'rejected')
+            raise _degrade(f"fila do LLM cheia ({self.task}, empresa {self.tenant or '-'})")
+
+        hedge_after = _task_p95(self.task) if self.policy.get('hedge') else None
+        if not hedge_after or hedge_after >= timeout:
+            return self._run(model, messages, timeout, slots, kwargs)
+
+        # Hedge: dispara a primeira requisição e, se passar do p95, uma duplicata (se houver vaga)
+        executor = _get_hedge_executor()
+        started = time.monotonic()
+        futures = [executor.submit(self._run, model, messages, timeout, slots, kwargs)]
+        done, _ = wait(futures, timeout=hedge_after)
+        if not done:
+            hedge_slots = _semaphores(self.tenant)
+            if _acquire(hedge_slots, 0):
+                _count(self.task, 'hedges')
+                remaining = max(MIN_CALL_SECONDS, timeout - (time.monotonic() - started))
+                futures.append(executor.submit(self._run, model, messages, remaining, hedge_slots, kwargs))
+        pending = set(futures)
+        last_error: Optional[Exception] = None
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, timeout - (time.monotonic() - started)) + 1,
+                                 return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    if future is not futures[0]:
+                        _count(self.task, 'hedge_wins')
+                    return future.result()
+                last_error = future.exception()
+        raise last_error or TimeoutError(f"LLM {self.task}/{model} excedeu {timeout:.1f}s")
+
+    def invoke(self, messages: Any, **kwargs) -> Any:
+        state = getattr(_turn, 'state', None)
+        if state is not None and state['degraded']:
+            # Turno já degradado: não enfileira mais chamadas
+            raise LLMUnavailable(state['degraded'])
+
+        primary = self.policy.get('model')
+        fallback = self.policy.get('fallback')
+        models = [primary] + ([fallback] if fallback and fallback != primary else [])
+        last_error: Optional[Exception] = None
+        for attempt, model in enumerate(models):
+            breaker = _breaker(self.api_key, model)
+            if not breaker.allow():
+                _count(self.task, 'breaker_skips')
+                logger.warning(f"⛔ LLM {self.task}/{model}: circuito aberto, pulando")
+                continue
+            timeout = self._call_timeout()
+            started = time.perf_counter()
+            try:
+                response = self._call(model, messages, timeout, kwargs)
+            except LLMUnavailable:
+                raise
+            except Exception as e:
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                breaker.record_failure()
+                record_call(self.task, model, elapsed_ms, error=True, fallback=attempt > 0)
+                logger.warning(f"⚠️ LLM {self.task}/{model} falhou em {elapsed_ms:.0f}ms: {e}")
+                last_error = e
+                continue
+            breaker.record_success()
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            record_call(self.task, model, elapsed_ms, response, fallback=attempt > 0)
+            if attempt > 0:
+                logger.info(f"🔁 LLM {self.task}: resposta do fallback {model} em {elapsed_ms:.0f}ms")
+            return response
+        if last_error is None:
+            raise _degrade(f"circuito aberto para {', '.join(models)} ({self.task})")
+        raise last_error
+
+
+def _tenant_key(empresa_config: Optional[Dict[str, Any]]) -> Optional[str]:
+    if not isinstance(empresa_config, dict):
+        return None
+    tenant = empresa_config.get('empresa_id') or empresa_config.get('empresa_slug') or empresa_config.get('slug')
+    return str(tenant) if tenant else None
+
+
+def get_llm(task: str, empresa_config: Optional[Dict[str, Any]] = None, temperature: float = 0.0,
+            api_key: Optional[str] = None) -> GatewayLLM:
+    """LLM da tarefa conforme a política da empresa"""
+    return GatewayLLM(task, api_key or resolve_api_key(empresa_config), resolve_policy(task, empresa_config),
+                      temperature, tenant=_tenant_key(empresa_config))
+
+
+def get_resilience_status() -> Dict[str, Any]:
+    """Estado dos circuit breakers e ocupação dos semáforos"""
+    with _breakers_lock:
+        breakers = {f"{key}/{model}": b.status() for (key, model), b in _breakers.items()}
+    with _slots_lock:
+        tenants = {tenant: sem._value for tenant, sem in _tenant_slots.items()}
+        global_free = _global_slots._value if _global_slots is not None else None
+    return {'breakers': breakers, 'global_free_slots': global_free, 'tenant_free_slots': tenants}
+
+
+def get_llm_metrics() -> Dict[str, Dict[str, Any]]:
+    """Totais por tarefa: chamadas, erros, fallbacks, latência média/p95 e tokens"""
+    with _metrics_lock:
+        snapshot = {
+            task: dict(m, models=dict(m['models']), recent_ms=sorted(m['recent_ms']))
+            for task, m in _metrics.items()
+        }
+    result = {}
+    for task, m in snapshot.items():
+        recent = m.pop('recent_ms')
+        calls = m['calls']
+        m['avg_ms'] = round(m.pop('latency_ms') / calls, 1) if calls else 0.0
+        m['p95_ms'] = round(recent[min(len(recent) - 1, int(len(recent) * 0.95))], 1) if recent else 0.0
+        result[task] = m
+    return result
@@ -0,0 +1,290 @@
+"""
+Outbox de mensagens WhatsApp (Twilio).
+
+O caminho do agente apenas enfileira as respostas na tabela outbound_messages
+(com OUTBOX_WORKER_ENABLED=false o envio é direto, ver main._enqueue_bot_reply);
+workers em background drenam a fila:
+- ordem garantida por conversa (empresa_id, to_number)
+- cada conversa é enviada em um worker; quem termina libera a vaga e a fila é
+  reivindicada de novo, sem esperar as demais conversas do mesmo lote
+- limite de envios por segundo por número remetente
+- novas tentativas com backoff exponencial para erros transitórios
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
+
+from sqlalchemy import text
+
+from config import Config
+from models import Empresa, OutboundMessage
+from services.services import DatabaseService
+
+logger = logging.getLogger(__name__)
+
+# Chave do pg_advisory_xact_lock que serializa a reivindicação entre réplicas
+CLAIM_LOCK_KEY = 727002
+CLAIM_LIMIT = 200
+# Itens em 'sending' há mais tempo que isso voltam para a fila (worker caiu no meio)
+STALE_SENDING_SECONDS = 300
+# Credenciais Twilio por empresa ficam em cache por este tempo
+CREDENTIALS_TTL = 300
+
+_wakeup = threading.Event()
+_stop_event = threading.Event()
+_worker_thread: Optional[threading.Thread] = None
+_credentials_cache: Dict[int, Tuple[float, Tuple[str, str, str]]] = {}
+
+
+class SenderRateLimiter:
+    """Ritmo máximo de envios por número remetente (thread-safe)"""
+
+    def __init__(self, per_second: float):
+        self.interval = 1.0 / per_second if per_second and per_second > 0 else 0.0
+        self._next_at: Dict[str, float] = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def acquire(self, sender: str) -> None:
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait_s = self._next_at[sender] - now
+            self._next_at[sender] = max(now, self._next_at[sender]) + self.interval
+        if wait_s > 0:
+            time.sleep(wait_s)
+
+
+_rate_limiter = SenderRateLimiter(Config.OUTBOX_SENDS_PER_SECOND)
+
+
+def enqueue_messages(empresa_id: int, to_number: str, parts: List[str]) -> List[int]:
+    """Enfileira as partes de uma resposta (em ordem) para envio. Retorna os IDs criados."""
+    parts = [p for p in (parts or []) if p]
+    if not parts:
+        return []
+    db = DatabaseService()
+    session = db.SessionLocal()
+    try:
+        rows = [OutboundMessage(empresa_id=empresa_id, to_number=to_number, body=p, status='pending', attempts=0) for p in parts]
+        session.add_all(rows)
+        session.commit()
+        ids = [r.id for r in rows]
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+    _wakeup.set()
+    logger.info(f"📮 {len(ids)} mensagens enfileiradas para {empresa_id}:{to_number}")
+    return ids
+
+
+def _get_credentials(db: DatabaseService, empresa_id: int) -> Tuple[str, str, str]:
+    now = time.time()
+    cached = _credentials_cache.get(empresa_id)
+    if cached and cached[0] > now:
+        return cached[1]
+    session = db.SessionLocal()
+    try:
+        empresa = session.query(Empresa).filter(Empresa.id == empresa_id).first()
+        creds = (
+            (empresa.twilio_sid or '') if empresa else '',
+            (empresa.twilio_token or '') if empresa else '',
+            (empresa.twilio_number or '') if empresa else '',
+        )
+    finally:
+        session.close()
+    _credentials_cache[empresa_id] = (now + CREDENTIALS_TTL, creds)
+    return creds
+
+
+def _claim(db: DatabaseService, limit: int = CLAIM_LIMIT) -> List[Dict[str, Any]]:
+    """Reivindica mensagens prontas, sem ultrapassar mensagens anteriores da mesma conversa
+    que ainda estejam em envio ou aguardando nova tentativa.
+    """
+    session = db.SessionLocal()
+    try:
+        session.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": CLAIM_LOCK_KEY})
+        rows = session.execute(text(
+            """
+            UPDATE outbound_messages o
+               SET status = 'sending', attempts = o.attempts + 1, next_attempt_at = now()
+             WHERE o.id IN (
+                    SELECT c.id FROM outbound_messages c
+                     WHERE ((c.status = 'pending' AND c.next_attempt_at <= now())
+                         OR (c.status = 'sending' AND c.next_attempt_at < now() - make_interval(secs => :stale)))
+                       AND NOT EXISTS (
+                            SELECT 1 FROM outbound_messages p
+                             WHERE p.empresa_id = c.empresa_id
+                               AND p.to_number = c.to_number
+                               AND p.id < c.id
+                               AND (p.status = 'sending' OR (p.status = 'pending' AND p.next_attempt_at > now())))
+                     ORDER BY c.id
+                     LIMIT :limit
+                     FOR UPDATE SKIP LOCKED)
+            RETURNING o.id, o.empresa_id, o.to_number, o.body, o.template_sid, o.variables, o.attempts
+            """
+        ), {"limit": limit, "stale": STALE_SENDING_SECONDS}).fetchall()
+        session.commit()
+        return [
+            {'id': r[0], 'empresa_id': r[1], 'to_number': r[2], 'body': r[3],
+             'template_sid': r[4], 'variables': r[5], 'attempts': r[6]}
+            for r in rows
+        ]
+    except Exception as e:
+        session.rollback()
+        logger.error(f"Erro ao reivindicar mensagens do outbox: {e}")
+        return []
+    finally:
+        session.close()
+
+
+def _mark(db: DatabaseService, ids: List[int], status: str, error: Optional[str] = None,
+          message_sid: Optional[str] = None, retry_in: Optional[float] = None, refund_attempt: bool = False):
+    if not ids:
+        return
+    session = db.SessionLocal()
+    try:
+        session.execute(text(
+            """
+            UPDATE outbound_messages
+               SET status = :status,
+                   last_error = :error,
+                   message_sid = COALESCE(:message_sid, message_sid),
+                   sent_at = CASE WHEN :status = 'sent' THEN now() ELSE sent_at END,
+                   next_attempt_at = CASE WHEN :retry_in > 0 THEN now() + make_interval(secs => :retry_in) ELSE next_attempt_at END,
+                   attempts = CASE WHEN :refund THEN GREATEST(attempts - 1, 0) ELSE attempts END
+             WHERE id = ANY(:ids)
+            """
+        ), {"status": status, "error": error, "message_sid": message_sid, "retry_in": float(retry_in or 0),
+            "refund": refund_attempt, "ids": ids})
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        logger.error(f"Erro ao atualizar outbox: {e}")
+    finally:
+        session.close()
+
+
+def _is_retryable(result: Dict[str, Any]) -> bool:
+    status_code = result.get('status_code')
+    # 4xx (exceto 429) são erros definitivos (número inválido, template inválido...)
+    return status_code is None or status_code == 429 or status_code >= 500
+
+
+def _send_conversation(db: DatabaseService, items: List[Dict[str, Any]]):
+    """Envia, em ordem, as mensagens de uma conversa. Para na primeira falha para preservar a ordem."""
+    from integrations.twilio_service import TwilioService
+
+    empresa_id = items[0]['empresa_id']
+    sid, token, from_number = _get_credentials(db, empresa_id)
+    twilio = TwilioService(sid, token, from_number)
+
+    for pos, item in enumerate(items):
+        if pos > 0 and Config.OUTBOX_PART_DELAY_SECONDS:
+            # Pequena pausa entre partes para manter a ordem de entrega no WhatsApp
+            time.sleep(Config.OUTBOX_PART_DELAY_SECONDS)
+        _rate_limiter.acquire(from_number or str(empresa_id))
+
+        if item.get('template_sid'):
+            result = twilio.send_whatsapp_template(item['to_number'], item['template_sid'], parameters=item.get('variables'))
+        else:
+            result = twilio.send_whatsapp_message(item['to_number'], item.get('body') or '')
+
+        if result.get('success'):
+            _mark(db, [item['id']], 'sent', message_sid=result.get('message_sid'))
+            continue
+
+        error = str(result.get('error') or 'erro desconhecido')[:500]
+        if _is_retryable(result) and item['attempts'] < Config.OUTBOX_MAX_ATTEMPTS:
+            backoff = min(300, 2 ** item['attempts'])
+            logger.warning(f"🔁 Envio {item['id']} para {item['to_number']} falhou (tentativa {item['attempts']}), nova tentativa em {backoff}s: {error}")
+            _mark(db, [item['id']], 'pending', error=error, retry_in=backoff)
+        else:
+            logger.error(f"❌ Envio {item['id']} para {item['to_number']} falhou definitivamente: {error}")
+            _mark(db, [item['id']], 'failed', error=error)
+            # Falha definitiva não bloqueia o restante da conversa
+            continue
+
+        # Devolve as próximas mensagens da conversa sem consumir tentativa (aguardam a anterior)
+        rest = [i['id'] for i in items[pos + 1:]]
+        _mark(db, rest, 'pending', refund_attempt=True)
+        return
+
+
+def _conversation_done(future: Future):
+    if future.exception():
+        logger.error(f"Erro ao enviar conversa do outbox: {future.exception()}")
+    # Vaga liberada: o loop reivindica de novo sem esperar as outras conversas
+    _wakeup.set()
+
+
+def process_outbox_once(executor: ThreadPoolExecutor, in_flight: Optional[Dict[Tuple[int, str], Future]] = None) -> int:
+    """Executa 1 iteração: reivindica mensagens e submete cada conversa a um worker, sem esperar o envio.
+
+    `in_flight` guarda as conversas em envio neste processo; conversas concluídas são
+    removidas a cada iteração. Retorna quantas mensagens foram reivindicadas.
+    """
+    in_flight = {} if in_flight is None else in_flight
+    for key in [k for k, f in in_flight.items() if f.done()]:
+        in_flight.pop(key)
+    if len(in_flight) >= max(1, Config.OUTBOX_WORKERS):
+        return 0
+
+    db = DatabaseService()
+    items = _claim(db)
+    if not items:
+        return 0
+
+    conversations: "OrderedDict[Tuple[int, str], List[Dict[str, Any]]]" = OrderedDict()
+    for item in items:
+        conversations.setdefault((item['empresa_id'], item['to_number']), []).append(item)
+
+    # O claim não devolve mensagens de conversas com envio em andamento ('sending'),
+    # então cada conversa tem no máximo um envio em curso
+    for key, conv_items in conversations.items():
+        future = executor.submit(_send_conversation, db, conv_items)
+        in_flight[key] = future
+        future.add_done_callback(_conversation_done)
+    logger.info(f"📤 Outbox: {len(items)} mensagens de {len(conversations)} conversas submetidas ({len(in_flight)} em envio)")
+    return len(items)
+
+
+def outbox_loop(stop_event: threading.Event = _stop_event):
+    logger.info("📤 Worker do outbox iniciado")
+    in_flight: Dict[Tuple[int, str], Future] = {}
+    with ThreadPoolExecutor(max_workers=max(1, Config.OUTBOX_WORKERS), thread_name_prefix="outbox") as executor:
+        while not stop_event.is_set():
+            try:
+                processed = process_outbox_once(executor, in_flight)
+            except Exception as e:
+                logger.error(f"Erro no worker do outbox: {e}")
+                processed = 0
+            if not processed:
+                # Acorda imediatamente quando algo é enfileirado ou uma conversa termina neste processo
+                _wakeup.wait(1.0)
+                _wakeup.clear()
+    logger.info("📤 Worker do outbox finalizado")
+
+
+def start_outbox_worker() -> bool:
+    """Inicia o worker em uma thread daemon (idempotente)"""
+    global _worker_thread
+    if not Config.OUTBOX_WORKER_ENABLED:
+        logger.info("Worker do outbox desabilitado (OUTBOX_WORKER_ENABLED=false)")
+        return False
+    if _worker_thread and _worker_thread.is_alive():
+        return True
+    _stop_event.clear()
+    _worker_thread = threading.Thread(target=outbox_loop, name="outbox-worker", daemon=True)
+    _worker_thread.start()
+    return True
+
+
+def stop_outbox_worker():
+    _stop_event.set()
+    _wakeup.set()
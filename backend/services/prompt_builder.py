@@ -0,0 +1,169 @@
+"""
+Montagem de prompts em camadas com prefixo estável.
+
+Os provedores (OpenAI) reaproveitam em cache o PREFIXO idêntico de prompts
+recentes. Para isso o conteúdo é ordenado do mais estável para o mais volátil:
+
+    STATIC (instruções globais) → TENANT (prompt/knowledge da empresa)
+    → CONVERSATION (histórico) → TURN (dados do turno, data atual, tools)
+
+Cada segmento pode ter orçamento de tokens; JSON é serializado de forma
+compacta. `record_usage` registra tokens de prompt e a fração servida do
+cache por chamada.
+"""
+import json
+import logging
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+STATIC = 0
+TENANT = 1
+CONVERSATION = 2
+TURN = 3
+
+_encoder = None
+_encoder_loaded = False
+
+
+def compact_json(data: Any) -> str:
+    """JSON sem indentação/espaços (menos tokens que indent=2)"""
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=str)
+
+
+def _get_encoder():
+    global _encoder, _encoder_loaded
+    if not _encoder_loaded:
+        _encoder_loaded = True
+        try:
+            import tiktoken
+            _encoder = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            _encoder = None
+    return _encoder
+
+
+def estimate_tokens(text: str) -> int:
+    """Conta tokens com tiktoken quando disponível; senão aproxima por ~4 caracteres/token"""
+    if not text:
+        return 0
+    encoder = _get_encoder()
+    if encoder is not None:
+        return len(encoder.encode(text))
+    return (len(text) + 3) // 4
+
+
+def truncate_to_budget(text: str, max_tokens: Optional[int], keep: str = 'head') -> str:
+    """Corta o texto para caber no orçamento. keep='tail' preserva o final (ex.: histórico recente)"""
+    if not text or not max_tokens or estimate_tokens(text) <= max_tokens:
+        return text
+    marker = "[...]"
+    encoder = _get_encoder()
+    if encoder is not None:
+        tokens = encoder.encode(text)
+        kept = tokens[-max_tokens:] if keep == 'tail' else tokens[:max_tokens]
+        body = encoder.decode(kept)
+    else:
+        limit = max_tokens * 4
+        body = text[-limit:] if keep == 'tail' else text[:limit]
+    return f"{marker}\n{body}" if keep == 'tail' else f"{body}\n{marker}"
+
+
+class PromptBuilder:
+    """Acumula segmentos e monta o prompt em ordem de estabilidade"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._segments: List[Dict[str, Any]] = []
+
+    def add(self, level: int, content: Any, title: Optional[str] = None,
+            max_tokens: Optional[int] = None, keep: str = 'head') -> 'PromptBuilder':
+        if content is None or content == '' or content == {} or content == []:
+            return self
+        if not isinstance(content, str):
+            content = compact_json(content)
+        content = truncate_to_budget(content, max_tokens, keep)
+        self._segments.append({'level': level, 'title': title, 'content': content})
+        return self
+
+    def segments(self) -> List[Dict[str, Any]]:
+        # sorted() é estável: segmentos do mesmo nível mantêm a ordem de inserção
+        return sorted(self._segments, key=lambda s: s['level'])
+
+    def build(self, levels: Optional[List[int]] = None) -> str:
+        """Prompt final; `levels` restringe aos níveis informados (ex.: só [STATIC] ou só [TURN])"""
+        parts = []
+        for seg in self.segments():
+            if levels is not None and seg['level'] not in levels:
+                continue
+            parts.append(f"{seg['title']}:\n{seg['content']}" if seg['title'] else seg['content'])
+        return "\n\n".join(parts)
+
+    def token_breakdown(self) -> Dict[str, int]:
+        names = {STATIC: 'static', TENANT: 'tenant', CONVERSATION: 'conversation', TURN: 'turn'}
+        breakdown: Dict[str, int] = defaultdict(int)
+        for seg in self._segments:
+            breakdown[names.get(seg['level'], str(seg['level']))] += estimate_tokens(seg['content'])
+        return dict(breakdown)
+
+
+# ============================================================================
+# MÉTRICAS DE USO (tokens de prompt e cache do provedor)
+# ============================================================================
+
+_metrics: Dict[str, Dict[str, int]] = defaultdict(lambda: {'calls': 0, 'prompt_tokens': 0, 'cached_tokens': 0, 'completion_tokens': 0})
+_metrics_lock = threading.Lock()
+
+
+def _extract_usage(response: Any) -> Dict[str, int]:
+    """Lê o uso de tokens de uma resposta LangChain (response_metadata) ou do SDK OpenAI (usage)"""
+    usage: Any = None
+    metadata = getattr(response, 'response_metadata', None)
+    if isinstance(metadata, dict):
+        usage = metadata.get('token_usage') or metadata.get('usage')
+    if usage is None:
+        usage = getattr(response, 'usage', None)
+    if usage is not None and not isinstance(usage, dict):
+        usage = usage.model_dump() if hasattr(usage, 'model_dump') else dict(getattr(usage, '__dict__', {}))
+    usage = usage or {}
+    details = usage.get('prompt_tokens_details') or {}
+    if not isinstance(details, dict):
+        details = details.model_dump() if hasattr(details, 'model_dump') else dict(getattr(details, '__dict__', {}))
+    return {
+        'prompt_tokens': int(usage.get('prompt_tokens') or 0),
+        'cached_tokens': int(details.get('cached_tokens') or 0),
+        'completion_tokens': int(usage.get('completion_tokens') or 0),
+    }
+
+
+def record_usage(call_name: str, response: Any, builder: Optional[PromptBuilder] = None) -> Dict[str, int]:
+    """Registra e loga tokens de prompt/cache de uma chamada ao LLM"""
+    try:
+        usage = _extract_usage(response)
+        with _metrics_lock:
+            m = _metrics[call_name]
+            m['calls'] += 1
+            m['prompt_tokens'] += usage['prompt_tokens']
+            m['cached_tokens'] += usage['cached_tokens']
+            m['completion_tokens'] += usage['completion_tokens']
+        ratio = (usage['cached_tokens'] / usage['prompt_tokens']) if usage['prompt_tokens'] else 0.0
+        breakdown = f" | segmentos: {builder.token_breakdown()}" if builder else ""
+        logger.info(
+            f"🧮 Prompt {call_name}: {usage['prompt_tokens']} tokens, "
+            f"{usage['cached_tokens']} em cache ({ratio:.0%}){breakdown}"
+        )
+        return usage
+    except Exception as e:
+        logger.debug(f"Não foi possível registrar uso de tokens de {call_name}: {e}")
+        return {'prompt_tokens': 0, 'cached_tokens': 0, 'completion_tokens': 0}
+
+
+def get_prompt_metrics() -> Dict[str, Dict[str, Any]]:
+    """Totais por chamada, com fração de tokens de prompt servidos do cache"""
+    with _metrics_lock:
+        snapshot = {name: dict(m) for name, m in _metrics.items()}
+    for m in snapshot.values():
+        m['cached_ratio'] = round(m['cached_tokens'] / m['prompt_tokens'], 4) if m['prompt_tokens'] else 0.0
+    return snapshot
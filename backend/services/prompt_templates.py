@@ -0,0 +1,142 @@
+"""
+Templates de prompt pré-compilados com cache dos trechos fixos por empresa.
+
+Os prompts grandes (detecção de intenção, match de profissional/serviço) eram
+montados com f-strings a cada chamada, interpolando o repr de listas inteiras.
+Aqui cada template é registrado uma vez (register) e compilado em trechos
+literais + campos `{nome}` (mesma sintaxe de str.format, `{{`/`}}` são chaves literais).
+
+Os campos se dividem em dois tipos:
+
+- fixos da empresa (`tenant_fields`): catálogo de profissionais/serviços,
+  texto de regras. São renderizados uma vez por (template, versão) e o
+  resultado fica em cache (LRU). A versão é um hash do conteúdo que os gera
+  (ex.: catalog_version), então empresas com o mesmo catálogo compartilham a entrada;
+- do turno: os demais campos, os únicos substituídos a cada chamada.
+
+Templates cujo prefixo só tem trechos fixos produzem bytes idênticos entre
+chamadas, o que permite o cache de prefixo do provedor.
+"""
+import hashlib
+import logging
+import string
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from services.prompt_builder import compact_json
+
+logger = logging.getLogger(__name__)
+
+MAX_BOUND = 512
+
+# Trecho compilado: str literal ou (nome_do_campo,) a preencher no turno
+Chunk = Union[str, Tuple[str]]
+
+_templates: Dict[str, 'PromptTemplate'] = {}
+_bound: 'OrderedDict[Tuple[str, str], List[Chunk]]' = OrderedDict()
+_lock = threading.Lock()
+_metrics: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+
+class PromptTemplate:
+    """Template compilado uma vez em trechos literais e campos"""
+
+    def __init__(self, name: str, text: str, tenant_fields: Iterable[str] = ()):
+        self.name = name
+        self.chunks: List[Chunk] = []
+        for literal, field, spec, conversion in string.Formatter().parse(text):
+            if literal:
+                self.chunks.append(literal)
+            if field is None:
+                continue
+            if not field.isidentifier() or spec or conversion:
+                raise ValueError(f"Template {name}: campo inválido '{{{field}}}' (use apenas {{nome}})")
+            self.chunks.append((field,))
+        self.fields = frozenset(c[0] for c in self.chunks if isinstance(c, tuple))
+        self.tenant_fields = frozenset(tenant_fields)
+        unknown = self.tenant_fields - self.fields
+        if unknown:
+            raise ValueError(f"Template {name}: campos fixos inexistentes {sorted(unknown)}")
+        self.turn_fields = self.fields - self.tenant_fields
+
+    def bind(self, tenant_values: Dict[str, Any]) -> List[Chunk]:
+        """Substitui os campos fixos e junta literais vizinhos"""
+        bound: List[Chunk] = []
+        for chunk in self.chunks:
+            if isinstance(chunk, tuple) and chunk[0] in self.tenant_fields:
+                chunk = str(tenant_values.get(chunk[0], ''))
+            if isinstance(chunk, str) and bound and isinstance(bound[-1], str):
+                bound[-1] += chunk
+            elif chunk != '':
+                bound.append(chunk)
+        return bound
+
+
+def register(name: str, text: str, tenant_fields: Iterable[str] = ()) -> PromptTemplate:
+    """Compila e registra o template (chamar na importação do módulo que o usa)"""
+    template = PromptTemplate(name, text, tenant_fields)
+    with _lock:
+        _templates[name] = template
+        for key in [k for k in _bound if k[0] == name]:
+            _bound.pop(key, None)
+    return template
+
+
+def render(name: str, version: str = '', tenant_values: Optional[Callable[[], Dict[str, Any]]] = None,
+           **turn_values: Any) -> str:
+    """Renderiza o template. `tenant_values` (chamável) só é executado quando (template, versão) não está em cache"""
+    template = _templates[name]
+    missing = template.turn_fields - turn_values.keys()
+    if missing:
+        raise KeyError(f"Template {name}: faltam campos do turno {sorted(missing)}")
+    key = (name, version)
+    with _lock:
+        bound = _bound.get(key)
+        if bound is not None:
+            _bound.move_to_end(key)
+            _metrics[name]['hits'] += 1
+    if bound is None:
+        values = tenant_values() if (tenant_values and template.tenant_fields) else {}
+        bound = template.bind(values)
+        with _lock:
+            _bound[key] = bound
+            _bound.move_to_end(key)
+            while len(_bound) > MAX_BOUND:
+                _bound.popitem(last=False)
+            _metrics[name]['misses'] += 1
+    return ''.join(c if isinstance(c, str) else str(turn_values[c[0]]) for c in bound)
+
+
+def catalog_version(items: Sequence[Dict[str, Any]], fields: Sequence[str]) -> str:
+    """Hash só dos campos usados na renderização do catálogo (muda quando o catálogo muda)"""
+    digest = hashlib.sha1()
+    for item in items or []:
+        for field in fields:
+            digest.update(str(item.get(field, '')).encode('utf-8'))
+            digest.update(b'\x1f')
+        digest.update(b'\x1e')
+    return digest.hexdigest()
+
+
+def render_catalog(items: Sequence[Dict[str, Any]], fields: Sequence[str]) -> str:
+    """Uma linha JSON compacta por item, só com os campos informados (ordem estável)"""
+    lines = []
+    for item in items or []:
+        row = {f: item[f] for f in fields if item.get(f) not in (None, '')}
+        if row:
+            lines.append(compact_json(row))
+    return "\n".join(lines)
+
+
+def get_template_metrics() -> Dict[str, Dict[str, Any]]:
+    with _lock:
+        snapshot = {name: dict(m) for name, m in _metrics.items()}
+        cached = defaultdict(int)
+        for name, _ in _bound:
+            cached[name] += 1
+    for name, m in snapshot.items():
+        total = m.get('hits', 0) + m.get('misses', 0)
+        m['hit_rate'] = round(m.get('hits', 0) / total, 4) if total else 0.0
+        m['cached_versions'] = cached.get(name, 0)
+    return snapshot
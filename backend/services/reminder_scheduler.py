@@ -0,0 +1,330 @@
+"""
+Agendador de lembretes de confirmação (multi-empresa).
+
+- min-heap em memória com o next_run_at de cada lembrete ativo
+- atualizado incrementalmente pelos endpoints de lembretes (refresh/remove)
+  e ressincronizado do banco periodicamente
+- executa TODOS os lembretes vencidos em paralelo (pool de workers)
+- advisory lock do Postgres: apenas uma réplica agenda
+- recupera execuções perdidas (até REMINDER_CATCHUP_HOURS de atraso)
+- métricas de duração por lembrete
+"""
+import heapq
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+
+import pytz
+from sqlalchemy import text
+
+from config import Config
+from services.services import DatabaseService
+
+logger = logging.getLogger(__name__)
+
+# Chave fixa do pg_advisory_lock do agendador
+ADVISORY_LOCK_KEY = 727001
+# Ressincronização completa com o banco (mudanças feitas em outras réplicas)
+RESYNC_SECONDS = 300
+# Intervalo máximo entre verificações do loop
+MAX_IDLE_SECONDS = 60
+
+
+def compute_next_run_at(timezone_str: str, send_time_local: str, after: Optional[datetime] = None) -> datetime:
+    """Próxima ocorrência (UTC naive) do horário local `send_time_local` estritamente após `after` (default: agora)"""
+    tz = pytz.timezone(timezone_str or 'America/Sao_Paulo')
+    now = after.replace(tzinfo=pytz.utc).astimezone(tz) if after else datetime.now(tz)
+    try:
+        hh, mm = (send_time_local or '11:00').split(':')
+        target = now.replace(hour=int(hh), minute=int(mm), second=0, microsecond=0)
+        if target <= now:
+            target = target + timedelta(days=1)
+        return target.astimezone(pytz.utc).replace(tzinfo=None)
+    except Exception:
+        target = now.replace(hour=11, minute=0, second=0, microsecond=0) + timedelta(days=1)
+        return target.astimezone(pytz.utc).replace(tzinfo=None)
+
+
+class ReminderScheduler:
+    """Min-heap de (next_run_at, reminder_id) com remoção preguiçosa de entradas obsoletas"""
+
+    def __init__(self):
+        self.db = DatabaseService()
+        self._heap: List[Tuple[datetime, int]] = []
+        self._scheduled: Dict[int, datetime] = {}  # reminder_id -> next_run_at vigente
+        self._configs: Dict[int, Dict[str, Any]] = {}
+        self._running: set = set()
+        self._metrics: Dict[int, Dict[str, Any]] = {}
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock_conn = None
+        self._last_resync = 0.0
+
+    # ------------------------------------------------------------------
+    # Estado do heap
+    # ------------------------------------------------------------------
+    def _push(self, cfg: Dict[str, Any], next_run_at: datetime):
+        reminder_id = cfg['reminder_id']
+        self._configs[reminder_id] = cfg
+        self._scheduled[reminder_id] = next_run_at
+        heapq.heappush(self._heap, (next_run_at, reminder_id))
+
+    def _schedule_from_config(self, cfg: Dict[str, Any], now: datetime):
+        """Define o próximo horário, aplicando a regra de recuperação de execuções perdidas"""
+        next_run_at = cfg.get('next_run_at')
+        if next_run_at is None:
+            next_run_at = compute_next_run_at(cfg['timezone'], cfg['send_time_local'])
+            self.db.update_reminder_next_run(cfg['reminder_id'], next_run_at)
+        elif next_run_at < now - timedelta(hours=Config.REMINDER_CATCHUP_HOURS):
+            # Atraso grande demais para recuperar: pula para a próxima ocorrência
+            logger.warning(f"⏭️ Lembrete {cfg['reminder_id']} ({cfg['empresa_slug']}) perdeu a execução de {next_run_at}; reagendando")
+            next_run_at = compute_next_run_at(cfg['timezone'], cfg['send_time_local'])
+            self.db.update_reminder_next_run(cfg['reminder_id'], next_run_at)
+        elif next_run_at < now:
+            logger.info(f"🔁 Recuperando execução perdida do lembrete {cfg['reminder_id']} ({cfg['empresa_slug']}) de {next_run_at}")
+        self._push(cfg, next_run_at)
+
+    def load_all(self):
+        """Recarrega todos os lembretes ativos do banco"""
+        configs = self.db.get_active_reminders()
+        now = datetime.utcnow()
+        with self._cond:
+            self._heap = []
+            self._scheduled = {}
+            self._configs = {}
+            for cfg in configs:
+                self._schedule_from_config(cfg, now)
+            self._last_resync = time.time()
+            self._cond.notify_all()
+        logger.info(f"📅 Agendador carregou {len(configs)} lembretes ativos")
+
+    def refresh(self, reminder_id: int):
+        """Atualiza um lembrete após criação/edição (ou remove se desativado)"""
+        configs = self.db.get_active_reminders(reminder_id=reminder_id)
+        with self._cond:
+            if not configs:
+                self._scheduled.pop(reminder_id, None)
+                self._configs.pop(reminder_id, None)
+            else:
+                self._schedule_from_config(configs[0], datetime.utcnow())
+            self._cond.notify_all()
+
+    def remove(self, reminder_id: int):
+        with self._cond:
+            self._scheduled.pop(reminder_id, None)
+            self._configs.pop(reminder_id, None)
+            self._cond.notify_all()
+
+    def _pop_due(self, now: datetime) -> List[Dict[str, Any]]:
+        """Remove do heap todos os lembretes vencidos (ignorando entradas obsoletas)"""
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            run_at, reminder_id = heapq.heappop(self._heap)
+            if self._scheduled.get(reminder_id) != run_at:
+                continue
+            if reminder_id in self._running:
+                # Reagendado (refresh) durante a execução: _run_job volta a colocá-lo no heap
+                self._scheduled.pop(reminder_id, None)
+                continue
+            self._scheduled.pop(reminder_id, None)
+            due.append(self._configs[reminder_id])
+        return due
+
+    def _seconds_until_next(self, now: datetime) -> float:
+        while self._heap and self._scheduled.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        if not self._heap:
+            return MAX_IDLE_SECONDS
+        return max(0.0, min(MAX_IDLE_SECONDS, (self._heap[0][0] - now).total_seconds()))
+
+    # ------------------------------------------------------------------
+    # Execução
+    # ------------------------------------------------------------------
+    def _run_job(self, cfg: Dict[str, Any]):
+        from services.confirmation_worker import run_company_confirmation
+
+        reminder_id = cfg['reminder_id']
+        started = time.time()
+        summary = None
+        error = None
+        try:
+            summary = run_company_confirmation(cfg['empresa_id'], cfg['empresa_slug'], cfg)
+        except Exception as e:
+            error = str(e)
+            logger.error(f"❌ Erro no lembrete {reminder_id} ({cfg['empresa_slug']}): {e}")
+        duration = time.time() - started
+
+        # Reagendar para a próxima ocorrência no mesmo horário local (config mais recente,
+        # caso o lembrete tenha sido editado durante a execução)
+        with self._cond:
+            latest = self._configs.get(reminder_id, cfg)
+        next_run_at = compute_next_run_at(latest['timezone'], latest['send_time_local'])
+        self.db.update_reminder_next_run(reminder_id, next_run_at)
+
+        with self._cond:
+            m = self._metrics.setdefault(reminder_id, {
+                'empresa_slug': cfg['empresa_slug'], 'runs': 0, 'failures': 0,
+                'total_duration_s': 0.0, 'last_duration_s': None, 'last_run_at': None,
+                'last_error': None, 'last_summary': None,
+            })
+            m['runs'] += 1
+            m['failures'] += 1 if error else 0
+            m['total_duration_s'] += duration
+            m['last_duration_s'] = round(duration, 2)
+            m['last_run_at'] = datetime.utcnow().isoformat()
+            m['last_error'] = error
+            m['last_summary'] = summary
+            self._running.discard(reminder_id)
+            # Pode ter sido desativado durante a execução
+            if reminder_id in self._configs and reminder_id not in self._scheduled:
+                cfg = dict(self._configs[reminder_id], next_run_at=next_run_at)
+                self._push(cfg, next_run_at)
+            self._cond.notify_all()
+        logger.info(f"⏱️ Lembrete {reminder_id} ({cfg['empresa_slug']}) executado em {duration:.2f}s; próximo: {next_run_at}")
+
+    def run_due_once(self) -> int:
+        """Dispara em paralelo todos os lembretes vencidos. Retorna quantos foram disparados."""
+        with self._cond:
+            due = self._pop_due(datetime.utcnow())
+            for cfg in due:
+                self._running.add(cfg['reminder_id'])
+        if not due:
+            return 0
+        logger.info(f"🚀 Disparando {len(due)} lembretes vencidos: {[c['empresa_slug'] for c in due]}")
+        # Listagens de agenda memoizadas valem para os lembretes deste disparo
+        from services.appointment_range import clear_memo
+        clear_memo()
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=max(1, Config.REMINDER_SCHEDULER_WORKERS), thread_name_prefix="reminder")
+        for cfg in due:
+            self._executor.submit(self._run_job, cfg)
+        return len(due)
+
+    # ------------------------------------------------------------------
+    # Liderança (advisory lock)
+    # ------------------------------------------------------------------
+    def _try_acquire_leadership(self) -> bool:
+        if self._lock_conn is not None:
+            try:
+                self._lock_conn.execute(text("SELECT 1"))
+                return True
+            except Exception as e:
+                logger.warning(f"Conexão do advisory lock perdida: {e}")
+                self._release_leadership()
+        try:
+            conn = self.db.engine.connect()
+            acquired = conn.execute(text("SELECT pg_try_advisory_lock(:k)"), {"k": ADVISORY_LOCK_KEY}).scalar()
+            if acquired:
+                self._lock_conn = conn
+                logger.info("🔒 Agendador de lembretes é o líder desta réplica")
+                self.load_all()
+                return True
+            conn.close()
+        except Exception as e:
+            logger.error(f"Erro ao obter advisory lock do agendador: {e}")
+        return False
+
+    def _release_leadership(self):
+        if self._lock_conn is None:
+            return
+        try:
+            self._lock_conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": ADVISORY_LOCK_KEY})
+        except Exception:
+            pass
+        try:
+            self._lock_conn.close()
+        except Exception:
+            pass
+        self._lock_conn = None
+
+    # ------------------------------------------------------------------
+    # Loop
+    # ------------------------------------------------------------------
+    def _loop(self):
+        logger.info("📅 Agendador de lembretes iniciado")
+        while not self._stop.is_set():
+            try:
+                if not self._try_acquire_leadership():
+                    # Outra réplica agenda; tentar novamente mais tarde
+                    self._stop.wait(MAX_IDLE_SECONDS)
+                    continue
+                if time.time() - self._last_resync >= RESYNC_SECONDS:
+                    self.load_all()
+                self.run_due_once()
+                with self._cond:
+                    wait = self._seconds_until_next(datetime.utcnow())
+                    if wait > 0:
+                        self._cond.wait(wait)
+            except Exception as e:
+                logger.error(f"Erro no loop do agendador de lembretes: {e}")
+                self._stop.wait(5)
+        self._release_leadership()
+        logger.info("📅 Agendador de lembretes finalizado")
+
+    def start(self) -> bool:
+        if self._thread and self._thread.is_alive():
+            return True
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="reminder-scheduler", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._executor:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def status(self) -> Dict[str, Any]:
+        with self._cond:
+            upcoming = sorted(
+                ({'reminder_id': rid, 'empresa_slug': self._configs[rid]['empresa_slug'], 'next_run_at': at.isoformat()}
+                 for rid, at in self._scheduled.items() if rid in self._configs),
+                key=lambda x: x['next_run_at']
+            )
+            metrics = {}
+            for rid, m in self._metrics.items():
+                metrics[rid] = dict(m, avg_duration_s=round(m['total_duration_s'] / m['runs'], 2) if m['runs'] else None)
+            return {
+                'leader': self._lock_conn is not None,
+                'running': sorted(self._running),
+                'upcoming': upcoming,
+                'metrics': metrics,
+            }
+
+
+_scheduler: Optional[ReminderScheduler] = None
+
+
+def get_reminder_scheduler() -> ReminderScheduler:
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = ReminderScheduler()
+    return _scheduler
+
+
+def start_reminder_scheduler() -> bool:
+    if not Config.REMINDER_SCHEDULER_ENABLED:
+        logger.info("Agendador de lembretes desabilitado (REMINDER_SCHEDULER_ENABLED=false)")
+        return False
+    return get_reminder_scheduler().start()
+
+
+def notify_reminder_changed(reminder_id: Optional[int], deleted: bool = False):
+    """Chamado pelos endpoints de lembretes para atualizar o heap sem recarregar tudo"""
+    if _scheduler is None or reminder_id is None:
+        return
+    try:
+        if deleted:
+            _scheduler.remove(reminder_id)
+        else:
+            _scheduler.refresh(reminder_id)
+    except Exception as e:
+        logger.error(f"Erro ao atualizar agendador para o lembrete {reminder_id}: {e}")
@@ -0,0 +1,196 @@
+"""
+Cache de respostas do LLM da empresa para perguntas frequentes.
+
+Perguntas como "qual o endereço?" ou "quanto custa a limpeza de pele?" são
+respondidas por `_analyze_with_company_llm` sempre da mesma forma a partir do
+mesmo prompt + knowledge_json. Para turnos classificados como independentes
+do contexto (`is_context_free`), a resposta fica guardada por empresa com a chave:
+
+    (versão do conhecimento, estado da conversa, mensagem normalizada)
+
+- versão do conhecimento: hash de nome + prompt + knowledge_json da empresa;
+  quando muda, as entradas antigas da empresa são descartadas;
+- estado da conversa: início de conversa ou conversa em andamento (a saudação muda);
+- camada léxica opcional: se não houver chave exata, reaproveita uma pergunta
+  com tokens muito parecidos (Jaccard >= Config.RESPONSE_CACHE_SIMILARITY; 0 desativa).
+
+Turnos que podem ir para o cache são respondidos com um prompt sem dados do
+cliente (só instruções, empresa e knowledge; ver SmartAgent._build_analysis_prompt),
+já que a resposta guardada é servida a todos os clientes da empresa.
+
+Entradas expiram após Config.RESPONSE_CACHE_TTL_SECONDS.
+"""
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, FrozenSet, Optional, Tuple
+
+from services.knowledge_index import fingerprint, tokenize
+from services.slot_filling import normalize, parse_cpf
+
+logger = logging.getLogger(__name__)
+
+# Assuntos de FAQ que a empresa responde do prompt/knowledge
+_FAQ_RE = re.compile(
+    r'\b(endereco|onde fica|onde voces ficam|localizacao|como chego|como chegar|estacionamento'
+    r'|horario de (funcionamento|atendimento)|que horas (abre|fecha)|abre[mn]?|fecha[mn]?|funciona[mn]?'
+    r'|preco|valor|quanto custa|quanto e|quanto fica|quanto sai|tabela'
+    r'|pagamento|pix|cartao|parcel\w*|dinheiro|convenio|plano de saude|aceita[mn]?'
+    r'|telefone|whatsapp|instagram|site|email|e-mail'
+    r'|quais (servicos|procedimentos|tratamentos)|voces fazem|tem (servico|procedimento)|o que e)\b'
+)
+
+# Pedidos de ação ou mensagens que dependem de algo dito antes
+_NOT_FAQ_RE = re.compile(
+    r'\b(agend\w*|marc\w*|desmarc\w*|cancel\w*|remarc\w*|reagend\w*|confirm\w*|reserv\w*|disponi\w*|vaga\w*'
+    r'|isso|disso|nisso|esse|essa|desse|dessa|nesse|nessa|ele|ela|dele|dela|tambem|mesm[oa]|anterior'
+    r'|meu|minha|meus|minhas|eu)\b'
+    r'|^(e|mas) '
+)
+
+MAX_WORDS = 15
+
+_entries: Dict[Any, 'OrderedDict[Tuple[str, str], Dict[str, Any]]'] = {}
+_versions: Dict[Any, str] = {}
+_lock = threading.Lock()
+_metrics: Dict[str, float] = defaultdict(float)
+
+
+def knowledge_version(empresa_config: Dict[str, Any]) -> str:
+    """Hash do que define as respostas da empresa (nome, prompt e knowledge_json)"""
+    config = empresa_config or {}
+    raw = "\x1f".join([str(config.get('nome') or ''), str(config.get('prompt') or ''),
+                       fingerprint(config.get('knowledge_json') or {})])
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def conversation_state(has_history: bool) -> str:
+    return 'andamento' if has_history else 'inicio'
+
+
+def is_context_free(message: str, awaiting: Any = None) -> bool:
+    """Turno de FAQ que pode ser respondido sem o histórico da conversa"""
+    if awaiting:
+        return False
+    text = normalize(message)
+    if not text or len(text.split()) > MAX_WORDS or not _FAQ_RE.search(text) or _NOT_FAQ_RE.search(text):
+        return False
+    if parse_cpf(message):
+        return False
+    # Datas e horários pedem disponibilidade, não FAQ
+    from services.temporal_parser import parse_temporal
+    temporal = parse_temporal(message)
+    return not (temporal.get('data') or temporal.get('horario'))
+
+
+def _message_key(message: str) -> str:
+    return re.sub(r'[^\w\s]', '', normalize(message)).strip()
+
+
+def _tokens(message: str) -> FrozenSet[str]:
+    return frozenset(tokenize(message))
+
+
+def _jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _tenant_entries(tenant: Any, version: str) -> 'OrderedDict[Tuple[str, str], Dict[str, Any]]':
+    """Entradas da empresa; descarta todas se o prompt/knowledge mudou (chamar com _lock)"""
+    if _versions.get(tenant) != version:
+        if tenant in _entries and _entries[tenant]:
+            _metrics['invalidations'] += 1
+            logger.info(f"🧹 Cache de respostas da empresa {tenant} descartado: prompt/knowledge mudou")
+        _entries[tenant] = OrderedDict()
+        _versions[tenant] = version
+    return _entries[tenant]
+
+
+def lookup(tenant: Any, version: str, message: str, state: str) -> Optional[str]:
+    """Resposta em cache (exata ou por similaridade léxica) ou None"""
+    from config import Config
+    now = time.time()
+    key = (state, _message_key(message))
+    with _lock:
+        _metrics['lookups'] += 1
+        entries = _tenant_entries(tenant, version)
+        entry = entries.get(key)
+        kind = 'exact_hits'
+        if entry is not None and now - entry['created'] > Config.RESPONSE_CACHE_TTL_SECONDS:
+            entries.pop(key, None)
+            entry = None
+        if entry is None and Config.RESPONSE_CACHE_SIMILARITY > 0:
+            tokens = _tokens(message)
+            best, best_score = None, 0.0
+            for (entry_state, _), candidate in entries.items():
+                if entry_state != state or now - candidate['created'] > Config.RESPONSE_CACHE_TTL_SECONDS:
+                    continue
+                score = _jaccard(tokens, candidate['tokens'])
+                if score > best_score:
+                    best, best_score = candidate, score
+            if best is not None and best_score >= Config.RESPONSE_CACHE_SIMILARITY:
+                entry, kind = best, 'similar_hits'
+        if entry is None:
+            _metrics['misses'] += 1
+            return None
+        entries.move_to_end(entry['key'])
+        _metrics[kind] += 1
+        _metrics['saved_ms'] += entry['latency_ms']
+        _metrics['saved_tokens'] += entry['tokens_used']
+    logger.info(f"⚡ Resposta do cache ({kind}) para empresa {tenant}: '{message[:50]}'")
+    return entry['response']
+
+
+def store(tenant: Any, version: str, message: str, state: str, response: str,
+          latency_ms: float, tokens_used: int = 0) -> None:
+    from config import Config
+    key = (state, _message_key(message))
+    with _lock:
+        entries = _tenant_entries(tenant, version)
+        entries[key] = {
+            'key': key, 'response': response, 'created': time.time(), 'tokens': _tokens(message),
+            'latency_ms': latency_ms, 'tokens_used': tokens_used,
+        }
+        entries.move_to_end(key)
+        while len(entries) > Config.RESPONSE_CACHE_MAX_ENTRIES:
+            entries.popitem(last=False)
+        _metrics['stores'] += 1
+
+
+def count_skip() -> None:
+    with _lock:
+        _metrics['skipped'] += 1
+
+
+def invalidate_tenant(tenant: Any) -> None:
+    """Descarta as respostas da empresa (ao salvar prompt/knowledge)"""
+    with _lock:
+        if _entries.pop(tenant, None):
+            _metrics['invalidations'] += 1
+        _versions.pop(tenant, None)
+
+
+def get_cache_metrics() -> Dict[str, Any]:
+    with _lock:
+        m = dict(_metrics)
+        entries = sum(len(e) for e in _entries.values())
+    lookups = m.get('lookups', 0)
+    hits = m.get('exact_hits', 0) + m.get('similar_hits', 0)
+    return {
+        'lookups': int(lookups),
+        'exact_hits': int(m.get('exact_hits', 0)),
+        'similar_hits': int(m.get('similar_hits', 0)),
+        'misses': int(m.get('misses', 0)),
+        'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+        'skipped_not_context_free': int(m.get('skipped', 0)),
+        'stores': int(m.get('stores', 0)),
+        'invalidations': int(m.get('invalidations', 0)),
+        'entries': entries,
+        'latency_saved_ms': round(m.get('saved_ms', 0), 1),
+        'tokens_saved': int(m.get('saved_tokens', 0)),
+    }
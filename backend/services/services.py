@@ -1,8 +1,10 @@
 import json
 import logging
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 import re
+import time
 
 from config import Config
 from sqlalchemy import create_engine, func
@@ -11,26 +13,48 @@ from models import Mensagem, Cliente, Atendimento, Atividade, Empresa, EmpresaRe
 
 logger = logging.getLogger(__name__)
 
+# TTL (segundos) do cache de labels_json/openai_key usado pela classificação
+CLASSIFIER_CONFIG_TTL = 60
+
+_shared_engine = None
+
+def _get_shared_engine():
+    """Engine único por processo (evita criar um pool de conexões por instância do serviço)"""
+    global _shared_engine
+    if _shared_engine is None:
+        _shared_engine = create_engine(Config.POSTGRES_URL, pool_pre_ping=True)
+    return _shared_engine
+
 class DatabaseService:
     """Serviço para gerenciar dados no banco de dados"""
+
+    # Classificação inline (fallback quando a fila classification_queue não está disponível)
+    _classification_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="classifier-inline")
+    # Cache de labels_json/openai_key por empresa usado pela fila de classificação
+    _classifier_config_cache: Dict[int, Tuple[float, Optional[Dict[str, Any]], Optional[str]]] = {}
     
     def __init__(self):
-        self.engine = create_engine(Config.POSTGRES_URL)
+        self.engine = _get_shared_engine()
         self.SessionLocal = sessionmaker(bind=self.engine)
 
-    def get_active_reminders(self) -> List[Dict[str, Any]]:
-        """Retorna configurações ativas de lembretes por empresa"""
+    def get_active_reminders(self, reminder_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Retorna configurações ativas de lembretes por empresa (opcionalmente de um único lembrete)"""
         session = self.SessionLocal()
         try:
             from sqlalchemy.orm import Session as SASession
             s: SASession = session
-            rows = s.query(EmpresaReminder, Empresa).join(Empresa, EmpresaReminder.empresa_id == Empresa.id).filter(
+            query = s.query(EmpresaReminder, Empresa).join(Empresa, EmpresaReminder.empresa_id == Empresa.id).filter(
                 EmpresaReminder.enabled == True,
                 Empresa.status == 'ativo'
-            ).all()
+            )
+            if reminder_id is not None:
+                query = query.filter(EmpresaReminder.id == reminder_id)
+            rows = query.all()
             configs = []
             for rem, emp in rows:
                 configs.append({
+                    'reminder_id': rem.id,
+                    'next_run_at': rem.next_run_at,
                     'empresa_id': rem.empresa_id,
                     'empresa_slug': emp.slug,
                     'timezone': rem.timezone or 'America/Sao_Paulo',
@@ -48,6 +72,20 @@ class DatabaseService:
         finally:
             session.close()
 
+    def update_reminder_next_run(self, reminder_id: int, next_run_at: Optional[datetime]) -> None:
+        """Persiste o próximo horário de execução de um lembrete (UTC naive)"""
+        session = self.SessionLocal()
+        try:
+            session.query(EmpresaReminder).filter(EmpresaReminder.id == reminder_id).update(
+                {EmpresaReminder.next_run_at: next_run_at}, synchronize_session=False
+            )
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Erro ao atualizar next_run_at do lembrete {reminder_id}: {e}")
+        finally:
+            session.close()
+
     def save_bot_message(self, empresa_id: int, cliente_id: str, text: str, cliente_nome: Optional[str] = None):
         """Salva mensagem do bot para compor conversation_history com o SmartAgent"""
         return self.save_message(empresa_id=empresa_id, cliente_id=cliente_id, text=text, is_bot=True, cliente_nome=cliente_nome)
@@ -100,6 +138,86 @@ class DatabaseService:
         finally:
             session.close()
     
+    def _upsert_cliente(self, session, empresa_id: int, cliente_id: str, cliente_nome: Optional[str] = None):
+        """Cria ou atualiza o cliente em um único INSERT ... ON CONFLICT (sem read-then-write)"""
+        from sqlalchemy.dialects.postgresql import insert as pg_insert
+        stmt = pg_insert(Cliente.__table__).values(
+            empresa_id=empresa_id,
+            cliente_id=cliente_id,
+            nome=cliente_nome
+        )
+        stmt = stmt.on_conflict_do_update(
+            constraint='_cliente_empresa_uc',
+            set_={
+                'ultimo_atendimento': func.now(),
+                # Só preenche o nome se ainda não houver um salvo
+                'nome': func.coalesce(Cliente.__table__.c.nome, stmt.excluded.nome),
+            }
+        )
+        session.execute(stmt)
+
+    def record_notifications_bulk(self, empresa_id: int, tipo: str, execution_date: str, rows: List[Dict[str, Any]]) -> set:
+        """Registra várias notificações em um único INSERT ... ON CONFLICT DO NOTHING.
+        rows: [{'appointment_id', 'to_number', 'variables'}]
+        Retorna os appointment_id inseridos agora (os demais já tinham sido enviados).
+        """
+        if not rows:
+            return set()
+        from sqlalchemy.dialects.postgresql import insert as pg_insert
+        table = Notification.__table__
+        session = self.SessionLocal()
+        try:
+            stmt = pg_insert(table).values([
+                {
+                    'empresa_id': empresa_id,
+                    'tipo': tipo,
+                    'appointment_id': r['appointment_id'],
+                    'execution_date': execution_date,
+                    'to_number': r['to_number'],
+                    'variables': r.get('variables'),
+                }
+                for r in rows
+            ]).on_conflict_do_nothing(constraint='_uniq_notification').returning(table.c.appointment_id)
+            inserted = {row[0] for row in session.execute(stmt).fetchall()}
+            session.commit()
+            return inserted
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Erro ao registrar notificações em lote: {e}")
+            return set()
+        finally:
+            session.close()
+
+    def update_notifications_status(self, empresa_id: int, tipo: str, execution_date: str, results: List[Dict[str, Any]]) -> None:
+        """Atualiza message_sid/status de várias notificações em uma única transação.
+        results: [{'appointment_id', 'message_sid', 'status'}]
+        """
+        if not results:
+            return
+        from sqlalchemy import text as sql_text
+        session = self.SessionLocal()
+        try:
+            session.execute(sql_text(
+                "UPDATE notifications SET message_sid = :message_sid, status = :status "
+                "WHERE empresa_id = :empresa_id AND tipo = :tipo AND appointment_id = :appointment_id AND execution_date = :execution_date"
+            ), [
+                {
+                    'message_sid': r.get('message_sid'),
+                    'status': r.get('status'),
+                    'empresa_id': empresa_id,
+                    'tipo': tipo,
+                    'appointment_id': r['appointment_id'],
+                    'execution_date': execution_date,
+                }
+                for r in results
+            ])
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Erro ao atualizar status das notificações: {e}")
+        finally:
+            session.close()
+    
     def save_message(self, empresa_id: int, cliente_id: str, text: str, is_bot: bool = False, cliente_nome: str = None):
         """Salva mensagem no banco de dados e atualiza informações do cliente"""
         session = self.SessionLocal()
@@ -114,67 +232,19 @@ class DatabaseService:
             session.add(mensagem)
             
             # Atualizar ou criar registro do cliente
-            cliente = session.query(Cliente).filter(
-                Cliente.empresa_id == empresa_id,
-                Cliente.cliente_id == cliente_id
-            ).first()
-            
-            if cliente:
-                # Atualizar último atendimento
-                cliente.ultimo_atendimento = datetime.now()
-                if cliente_nome and not cliente.nome:
-                    cliente.nome = cliente_nome
-            else:
-                # Criar novo cliente
-                cliente = Cliente(
-                    empresa_id=empresa_id,
-                    cliente_id=cliente_id,
-                    nome=cliente_nome
-                )
-                session.add(cliente)
+            self._upsert_cliente(session, empresa_id, cliente_id, cliente_nome)
+
+            # Classificação LLM opcional: apenas para mensagens do cliente (fila processada em background)
+            queued = True
+            if not is_bot:
+                session.flush()
+                queued = self._enqueue_classification(session, empresa_id, cliente_id, [mensagem.id])
             
             session.commit()
             session.refresh(mensagem)  # Atualiza o objeto com o ID gerado
             logger.info(f"Mensagem salva no banco: {empresa_id}:{cliente_id}")
-
-            # Classificação LLM opcional: apenas para mensagens do cliente
-            try:
-                if not is_bot:
-                    # Carregar labels_json e openai_key
-                    from sqlalchemy.orm import Session as SASession
-                    from services.unified_config_service import get_openai_config
-                    s2: SASession = self.SessionLocal()
-                    try:
-                        empresa = s2.query(Empresa).filter(Empresa.id == empresa_id).first()
-                        labels_json = getattr(empresa, 'labels_json', None) if empresa else None
-                        if labels_json and isinstance(labels_json, dict) and labels_json.get('labels'):
-                            openai_cfg = get_openai_config(s2, empresa_id) or {}
-                            api_key = openai_cfg.get('openai_key')
-                            if api_key:
-                                from integrations.openai_service import OpenAIService
-                                oai = OpenAIService(api_key)
-                                result = oai.classify_message(text, labels_json)
-                                min_conf = labels_json.get('min_confidence', 0.6)
-                                if result.get('label') and float(result.get('confidence', 0.0)) >= float(min_conf):
-                                    atend = Atendimento(
-                                        empresa_id=empresa_id,
-                                        cliente_id=cliente_id,
-                                        data_atendimento=mensagem.timestamp,
-                                        label_slug=result['label'],
-                                        source_message_id=mensagem.id,
-                                        observacoes=result.get('observacoes'),
-                                        confidence=int(round(float(result.get('confidence', 0.0)) * 100))
-                                    )
-                                    s2.add(atend)
-                                    try:
-                                        s2.commit()
-                                    except Exception as ce:
-                                        s2.rollback()
-                                        logger.warning(f"Não foi possível salvar atendimento classificado (provável duplicado): {ce}")
-                    finally:
-                        s2.close()
-            except Exception as ce:
-                logger.error(f"Erro na classificação opcional: {ce}")
+            if not queued:
+                self._classify_inline(empresa_id, cliente_id, [(mensagem.id, text, mensagem.timestamp)])
 
             return mensagem
         except Exception as e:
@@ -183,7 +253,117 @@ class DatabaseService:
             raise
         finally:
             session.close()
-    
+
+    def save_messages_bulk(self, empresa_id: int, cliente_id: str, texts: List[str], is_bot: bool = False, cliente_nome: str = None) -> List[int]:
+        """Salva várias mensagens do mesmo cliente em um único INSERT e uma única transação.
+        As mensagens entram na fila de classificação na mesma transação.
+        Retorna os IDs das mensagens salvas, na ordem recebida.
+        """
+        texts = [t for t in (texts or []) if t is not None]
+        if not texts:
+            return []
+        session = self.SessionLocal()
+        try:
+            from sqlalchemy import insert
+            stmt = insert(Mensagem.__table__).values([
+                {'empresa_id': empresa_id, 'cliente_id': cliente_id, 'text': t, 'is_bot': is_bot}
+                for t in texts
+            ]).returning(Mensagem.__table__.c.id, Mensagem.__table__.c.timestamp)
+            rows = session.execute(stmt).fetchall()
+
+            self._upsert_cliente(session, empresa_id, cliente_id, cliente_nome)
+            queued = True
+            if not is_bot:
+                queued = self._enqueue_classification(session, empresa_id, cliente_id, [row[0] for row in rows])
+            session.commit()
+            logger.info(f"{len(rows)} mensagens salvas no banco em lote: {empresa_id}:{cliente_id}")
+            if not queued:
+                self._classify_inline(empresa_id, cliente_id, [(row[0], t, row[1]) for row, t in zip(rows, texts)])
+
+            return [row[0] for row in rows]
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Erro ao salvar mensagens em lote: {e}")
+            raise
+        finally:
+            session.close()
+
+    def update_message_text(self, message_id: int, text: str) -> None:
+        """Substitui o texto de uma mensagem já salva (ex.: placeholder de áudio → transcrição)"""
+        session = self.SessionLocal()
+        try:
+            session.query(Mensagem).filter(Mensagem.id == message_id).update({'text': text})
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Erro ao atualizar texto da mensagem {message_id}: {e}")
+            raise
+        finally:
+            session.close()
+
+    def _enqueue_classification(self, session, empresa_id: int, cliente_id: str, message_ids: List[int]) -> bool:
+        """Insere as mensagens na fila de classificação (classification_queue) dentro da transação atual.
+        Empresas sem labels/chave OpenAI não geram itens na fila.
+        Retorna False quando as mensagens precisam ser classificadas inline (worker
+        desabilitado ou tabela da fila indisponível).
+        """
+        if not message_ids:
+            return True
+        try:
+            labels_json, api_key = self.get_classifier_config(empresa_id)
+            if not (labels_json and isinstance(labels_json, dict) and labels_json.get('labels')) or not api_key:
+                return True
+            if not Config.CLASSIFICATION_WORKER_ENABLED:
+                return False
+            from sqlalchemy.dialects.postgresql import insert as pg_insert
+            from models import ClassificationQueue
+            # Savepoint: se a tabela da fila não existir (schema antigo), a mensagem ainda é salva
+            with session.begin_nested():
+                session.execute(
+                    pg_insert(ClassificationQueue.__table__).values([
+                        {'empresa_id': empresa_id, 'cliente_id': cliente_id, 'message_id': mid, 'status': 'pending', 'attempts': 0}
+                        for mid in message_ids
+                    ]).on_conflict_do_nothing(constraint='_classification_message_uc')
+                )
+            return True
+        except Exception as e:
+            logger.warning(f"Não foi possível enfileirar classificação para {empresa_id}:{cliente_id}, classificando inline: {e}")
+            return False
+
+    def _classify_inline(self, empresa_id: int, cliente_id: str, items: List[Tuple[int, str, Any]]):
+        """Classifica fora do caminho da requisição, sem passar pela fila (items: (id, texto, timestamp))"""
+        try:
+            from services.classification_worker import classify_messages_inline
+            DatabaseService._classification_executor.submit(classify_messages_inline, self, empresa_id, cliente_id, items)
+        except Exception as e:
+            logger.error(f"Erro ao agendar classificação inline: {e}")
+
+    def get_classifier_config(self, empresa_id: int) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """Retorna (labels_json, openai_key) da empresa com cache curto para não reconsultar a cada mensagem"""
+        now = time.time()
+        cached = DatabaseService._classifier_config_cache.get(empresa_id)
+        if cached and cached[0] > now:
+            return cached[1], cached[2]
+
+        from services.unified_config_service import get_openai_config
+        session = self.SessionLocal()
+        try:
+            empresa = session.query(Empresa).filter(Empresa.id == empresa_id).first()
+            labels_json = getattr(empresa, 'labels_json', None) if empresa else None
+            api_key = None
+            if labels_json and isinstance(labels_json, dict) and labels_json.get('labels'):
+                openai_cfg = get_openai_config(session, empresa_id) or {}
+                api_key = openai_cfg.get('openai_key')
+            DatabaseService._classifier_config_cache[empresa_id] = (now + CLASSIFIER_CONFIG_TTL, labels_json, api_key)
+            return labels_json, api_key
+        finally:
+            session.close()
+
+    @classmethod
+    def invalidate_classifier_config(cls, empresa_id: int):
+        """Descarta labels/chave em cache (ex.: após salvar configurações da empresa)"""
+        cls._classifier_config_cache.pop(empresa_id, None)
+
     def get_conversation_history(self, empresa_id: int, cliente_id: str, limit: int = 20) -> List[Dict]:
         """Busca histórico de conversa do banco de dados"""
         session = self.SessionLocal()
@@ -0,0 +1,229 @@
+"""
+Preenchimento determinístico de campos aguardados.
+
+Quando o turno anterior do bot pediu um campo específico (CPF, nome, horário
+ou uma opção numérica de menu, como no lembrete de confirmação "1/2/3"), a
+conversa guarda o que está sendo aguardado em `awaiting`. A resposta seguinte
+é resolvida por parsers locais e segue direto para a execução dos passos; os
+LLMs só entram quando o parser não reconhece a mensagem.
+
+Estrutura de `awaiting` (em SmartAgent._conversation_cache[waid]['awaiting']):
+    {
+        'fields': ['cpf', 'nome'] | ['data'] | ['horario'] | ['menu'],
+        'intent': 'agendar_consulta' | 'confirmacao_lembrete' | ...,
+        'options': {'1': 'confirmar', '2': 'cancelar', '3': 'remarcar'}  # só para 'menu'
+    }
+"""
+import re
+import unicodedata
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+# Campos que os parsers locais conseguem resolver
+FAST_PATH_FIELDS = ('cpf', 'nome', 'data', 'horario', 'menu')
+
+# Menu do lembrete de confirmação (services/confirmation_worker.py)
+CONFIRMATION_MENU = {'1': 'confirmar', '2': 'cancelar', '3': 'remarcar'}
+
+_MENU_KEYWORDS = {
+    'confirmar': ('confirm', 'sim', 'vou sim', 'estarei', 'ok'),
+    'cancelar': ('cancel', 'desmarc'),
+    'remarcar': ('remarc', 'reagend', 'outro horario', 'outro dia', 'mudar'),
+}
+
+# Palavras que indicam que a mensagem não é (só) um nome
+_NOT_NAME_WORDS = frozenset("""
+nao sim quero queria gostaria pode posso qual quais quando onde como porque oi ola obrigado obrigada
+cpf tenho nome meu minha horario hora dia amanha hoje cancelar remarcar confirmar agendar ok
+""".split())
+
+_CPF_RE = re.compile(r'(?<!\d)(\d{3}\.?\s?\d{3}\.?\s?\d{3}\s?-?\s?\d{2})(?!\d)')
+_TIME_HM_RE = re.compile(r'(?<![\d/])([01]?\d|2[0-3])\s*(?::|h)\s*([0-5]\d)(?!\d)')
+_TIME_H_RE = re.compile(r'(?<![\d/:])([01]?\d|2[0-3])\s*(?:h|hs|hrs?|horas?)(?![a-z0-9])')
+_TIME_AS_RE = re.compile(r'\bas\s+([01]?\d|2[0-3])(?![\d/:h])')
+_TIME_PERIOD_RE = re.compile(r'(?<![\d/:])(\d{1,2})(?:\s*(?:h|horas?))?\s+da\s+(manha|tarde|noite)\b')
+
+
+def normalize(text: str) -> str:
+    """Minúsculas, sem acentos e com espaços colapsados"""
+    text = unicodedata.normalize('NFKD', str(text or '').lower())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def is_valid_cpf(digits: str) -> bool:
+    """Valida os dígitos verificadores de um CPF (11 dígitos, sem máscara)"""
+    if not digits or len(digits) != 11 or not digits.isdigit() or digits == digits[0] * 11:
+        return False
+    for size in (9, 10):
+        total = sum(int(digits[i]) * (size + 1 - i) for i in range(size))
+        check = (total * 10) % 11 % 10
+        if check != int(digits[size]):
+            return False
+    return True
+
+
+def parse_cpf(message: str) -> Optional[str]:
+    """CPF válido na mensagem (somente dígitos) ou None"""
+    for match in _CPF_RE.finditer(str(message or '')):
+        digits = re.sub(r'\D', '', match.group(1))
+        if is_valid_cpf(digits):
+            return digits
+    return None
+
+
+def parse_time(message: str) -> Optional[str]:
+    """Horário único na mensagem no formato HH:MM ("15:30", "15h", "às 15", "3 da tarde", "meio-dia").
+
+    Retorna None quando não há horário ou quando há mais de um (ambíguo).
+    """
+    text = normalize(message)
+    text = _CPF_RE.sub(' ', text)
+    found = set()
+
+    for m in _TIME_PERIOD_RE.finditer(text):
+        hour = int(m.group(1))
+        if hour > 12:
+            continue
+        if m.group(2) in ('tarde', 'noite') and hour < 12:
+            hour += 12
+        found.add((hour, 0))
+    text = _TIME_PERIOD_RE.sub(' ', text)
+
+    for m in _TIME_HM_RE.finditer(text):
+        found.add((int(m.group(1)), int(m.group(2))))
+    text = _TIME_HM_RE.sub(' ', text)
+
+    for regex in (_TIME_H_RE, _TIME_AS_RE):
+        for m in regex.finditer(text):
+            found.add((int(m.group(1)), 0))
+        text = regex.sub(' ', text)
+
+    if re.search(r'\bmeio[ -]?dia\b', text):
+        found.add((12, 0))
+
+    # Mensagem que é só a hora ("15")
+    if not found:
+        bare = re.fullmatch(r'([01]?\d|2[0-3])', text)
+        if bare and 6 <= int(bare.group(1)) <= 22:
+            found.add((int(bare.group(1)), 0))
+
+    if len(found) != 1:
+        return None
+    hour, minute = found.pop()
+    return f"{hour:02d}:{minute:02d}"
+
+
+def parse_menu_choice(message: str, options: Dict[str, str]) -> Optional[str]:
+    """Opção do menu escolhida ("1", "2)", "quero cancelar"...) ou None"""
+    if not options:
+        return None
+    text = normalize(message)
+    digit = re.fullmatch(r'(?:opcao\s*)?(\d)\s*[.)!]?', text)
+    if digit:
+        return options.get(digit.group(1))
+    # Palavras-chave só em mensagens curtas e sem negação ("não quero cancelar")
+    words = re.findall(r'[a-z0-9]+', text)
+    if not words or len(words) > 6 or 'nao' in words:
+        return None
+    chosen = set()
+    for value in options.values():
+        for keyword in _MENU_KEYWORDS.get(value, ()):
+            if re.search(r'\b' + re.escape(keyword), text):
+                chosen.add(value)
+    return chosen.pop() if len(chosen) == 1 else None
+
+
+def parse_name(message: str) -> Optional[str]:
+    """Nome informado pelo cliente ("Maria Souza", "meu nome é Maria Souza") ou None.
+
+    Aceita apenas textos curtos, só com letras, para não confundir perguntas com nomes.
+    """
+    text = _CPF_RE.sub(' ', str(message or ''))
+    text = re.sub(r"(?i)\b(meu nome (é|e)|me chamo|sou (a|o)|sou|nome:?|cpf:?)(?![\wÀ-ÿ])\s*", ' ', text)
+    text = re.sub(r'[,;.!]+', ' ', text)
+    text = re.sub(r'\s+', ' ', text).strip()
+    if not text or '?' in text or re.search(r'\d', text):
+        return None
+    words = text.split(' ')
+    if not 1 < len(words) <= 6 or any(len(w) < 2 and w.lower() not in ('e',) for w in words):
+        return None
+    if not all(re.fullmatch(r"[A-Za-zÀ-ÿ']+", w) for w in words):
+        return None
+    if any(normalize(w) in _NOT_NAME_WORDS for w in words):
+        return None
+    return ' '.join(w if w.lower() in ('da', 'de', 'do', 'das', 'dos', 'e') else w.capitalize() for w in words)
+
+
+def resolve_awaited(awaiting: Optional[Dict[str, Any]], message: str, now: Optional[datetime] = None) -> Dict[str, Any]:
+    """Resolve localmente os campos aguardados presentes na mensagem. Dict vazio = não reconhecido.
+
+    Horário de hoje que já passou ("hoje às 9" às 10h) não é resolvido: o bot pede o horário de novo.
+    """
+    if not isinstance(awaiting, dict):
+        return {}
+    fields = awaiting.get('fields') or []
+    resolved: Dict[str, Any] = {}
+    if 'menu' in fields:
+        choice = parse_menu_choice(message, awaiting.get('options') or {})
+        if choice:
+            resolved['menu'] = choice
+        return resolved
+    if 'cpf' in fields:
+        cpf = parse_cpf(message)
+        if cpf:
+            resolved['cpf'] = cpf
+    if 'nome' in fields:
+        nome = parse_name(message)
+        if nome:
+            resolved['nome'] = nome
+    horario_passado = False
+    if 'data' in fields:
+        # Só respostas que são apenas data/horário ("amanhã às 15h"); o resto vai para o LLM
+        from services.temporal_parser import parse_temporal
+        temporal = parse_temporal(message, now=now)
+        horario_passado = bool(temporal.get('horario_passado'))
+        if temporal.get('data') and temporal.get('somente_data_hora'):
+            resolved['data'] = temporal['data']
+            if temporal.get('horario') and not horario_passado:
+                resolved['horario'] = temporal['horario']
+    if 'horario' in fields and 'horario' not in resolved and not horario_passado:
+        horario = parse_time(message)
+        if horario:
+            resolved['horario'] = horario
+    return resolved
+
+
+def build_awaiting(intent: str, missing_data: List[str], extracted_data: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    """Estado `awaiting` a partir dos campos que o bot acabou de pedir.
+
+    Só registra quando TODOS os campos pedidos têm parser local (ex.: pedir
+    'profissional' continua indo para o LLM) e, para horário, quando já há data.
+    O parser de data/horário só é usado em agendamentos.
+    """
+    fields = [f for f in (missing_data or []) if f]
+    if not fields or any(f not in FAST_PATH_FIELDS or f == 'menu' for f in fields):
+        return None
+    data = extracted_data or {}
+    if 'horario' in fields and not data.get('data') and 'data' not in fields:
+        return None
+    if ('data' in fields or 'horario' in fields) and intent != 'agendar_consulta':
+        return None
+    return {'fields': fields, 'intent': intent}
+
+
+def menu_awaiting(intent: str, options: Dict[str, str]) -> Dict[str, Any]:
+    return {'fields': ['menu'], 'intent': intent, 'options': dict(options)}
+
+
+def slot_available(availability: Any, horario: str) -> bool:
+    """Verifica se `horario` (HH:MM) aparece nos horários vagos retornados por verificar_disponibilidade"""
+    if not isinstance(availability, dict) or not horario:
+        return False
+    if isinstance(availability.get('result'), dict):
+        availability = availability['result']
+    slots = list(availability.get('available_slots') or availability.get('horariosVagos') or [])
+    for prof in availability.get('by_professional') or []:
+        if isinstance(prof, dict):
+            slots.extend(prof.get('slots') or prof.get('horariosVagos') or [])
+    return any(str(s)[:5] == horario for s in slots)
@@ -12,14 +12,27 @@ class SmartAgentBridge:
         self.db = DatabaseService()
         self.agent = SmartAgent(empresa_config)
 
-    def seed_context_and_log(self, waid: str, extracted_data: Dict[str, Any], bot_message: str, cliente_nome: Optional[str] = None) -> None:
-        """Adiciona mensagem do bot ao histórico e semeia extracted_data no cache do agente."""
+    def seed_context_and_log(self, waid: str, extracted_data: Dict[str, Any], bot_message: str,
+                             cliente_nome: Optional[str] = None, awaiting: Optional[Dict[str, Any]] = None) -> None:
+        """Adiciona mensagem do bot ao histórico e semeia extracted_data no cache do agente.
+
+        `awaiting` registra o campo que a mensagem pede (ex.: menu 1/2/3), para que a
+        resposta do cliente seja resolvida sem LLM (services/slot_filling.py).
+        """
+        # Carregar a conversa deste waid (o agente é compartilhado entre vários clientes)
+        try:
+            self.agent._load_conversation_context(waid)
+        except Exception:
+            pass
+
         # Adicionar mensagem como AI na memória do agente
         try:
             self.agent.memory.chat_memory.add_ai_message(bot_message)
         except Exception:
             pass
 
+        self.agent._awaiting = awaiting
+
         # Salvar conversa + extracted_data no cache interno do agente
         try:
             self.agent._save_conversation_context(waid, extracted_data)
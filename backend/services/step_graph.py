@@ -0,0 +1,184 @@
+"""
+Execução de planos de passos (Rules → Tools) como grafo de dependências.
+
+Cada passo declara os campos de `extracted_data` que lê (inputs) e os que
+escreve via cache_instructions (outputs) em TrinksRules.get_step_specs().
+Dentro de um plano (ex.: ["buscar_profissional", "buscar_servico",
+"verificar_disponibilidade"]), um passo depende dos anteriores que escrevem
+algo que ele lê ou escreve. Passos sem declaração ou com efeito colateral
+(criar reserva, cancelar...) são barreiras: rodam sozinhos, na ordem do plano.
+
+Passos independentes rodam em paralelo, em ondas. Ao fim de cada onda os
+resultados são aplicados na ordem do plano (mesmo resultado da execução
+sequencial); no primeiro erro, os passos seguintes do plano são descartados.
+Um passo que levanta exceção conta como erro ({'status': 'erro', 'error': ...}),
+esteja sozinho na onda ou em paralelo com outros.
+O tempo de cada passo e o caminho crítico ficam em get_step_metrics().
+"""
+import logging
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class StepSpec:
+    name: str
+    inputs: FrozenSet[str] = field(default_factory=frozenset)
+    outputs: FrozenSet[str] = field(default_factory=frozenset)
+    side_effect: bool = False
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+_metrics: Dict[str, Dict[str, float]] = defaultdict(lambda: {'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+_last_plans: List[Dict[str, Any]] = []
+_metrics_lock = threading.Lock()
+LAST_PLANS_KEPT = 20
+
+
+def build_dependencies(steps: List[str], specs: Dict[str, StepSpec]) -> List[Set[int]]:
+    """Dependências por posição no plano (índices de passos anteriores)"""
+    deps: List[Set[int]] = []
+    for i, name in enumerate(steps):
+        spec = specs.get(name)
+        if spec is None or spec.side_effect:
+            deps.append(set(range(i)))
+            continue
+        mine = set()
+        for j in range(i):
+            other = specs.get(steps[j])
+            if other is None or other.side_effect:
+                mine.add(j)
+            elif other.outputs & (spec.inputs | spec.outputs):
+                mine.add(j)
+        deps.append(mine)
+    return deps
+
+
+def build_waves(deps: List[Set[int]]) -> List[List[int]]:
+    """Ondas de execução: cada passo entra na onda seguinte à da sua dependência mais tardia"""
+    level: List[int] = []
+    for i, d in enumerate(deps):
+        level.append(1 + max((level[j] for j in d), default=-1))
+    waves: Dict[int, List[int]] = defaultdict(list)
+    for i, lv in enumerate(level):
+        waves[lv].append(i)
+    return [waves[lv] for lv in sorted(waves)]
+
+
+def critical_path(steps: List[str], deps: List[Set[int]], elapsed_ms: Dict[int, float]) -> List[str]:
+    """Cadeia de dependências com maior tempo somado (entre os passos executados)"""
+    best: Dict[int, float] = {}
+    prev: Dict[int, Optional[int]] = {}
+    for i in range(len(steps)):
+        if i not in elapsed_ms:
+            continue
+        parent = max((j for j in deps[i] if j in best), key=lambda j: best[j], default=None)
+        best[i] = elapsed_ms[i] + (best[parent] if parent is not None else 0.0)
+        prev[i] = parent
+    if not best:
+        return []
+    node: Optional[int] = max(best, key=lambda i: best[i])
+    path = []
+    while node is not None:
+        path.append(steps[node])
+        node = prev[node]
+    return list(reversed(path))
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            from config import Config
+            _executor = ThreadPoolExecutor(max_workers=Config.FLOW_STEP_WORKERS, thread_name_prefix='flow-step')
+        return _executor
+
+
+def execute_plan(steps: List[str], specs: Dict[str, StepSpec], data: Dict[str, Any],
+                 run_step: Callable[[str, Dict[str, Any]], Dict[str, Any]],
+                 apply_result: Callable[[str, Dict[str, Any]], None],
+                 is_error: Callable[[Dict[str, Any]], bool]) -> Dict[str, Any]:
+    """Executa o plano e retorna {'results', 'executed', 'failed', 'timings', 'critical_path'}.
+
+    `run_step(nome, cópia_dos_dados)` executa um passo; `apply_result(nome, resultado)`
+    incorpora o resultado em `data` (chamado na thread de quem executa o plano, na ordem do plano).
+    """
+    deps = build_dependencies(steps, specs)
+    waves = build_waves(deps)
+    plan_started = time.perf_counter()
+    results: Dict[str, Any] = {}
+    executed: List[str] = []
+    timings: Dict[int, Dict[str, float]] = {}
+    failed: Optional[str] = None
+
+    def _timed(i: int, snapshot: Dict[str, Any]):
+        # Exceção do passo vira resultado de erro, com ou sem paralelismo na onda
+        started = time.perf_counter()
+        try:
+            return run_step(steps[i], snapshot)
+        except Exception as e:
+            logger.error(f"❌ Passo {steps[i]} levantou exceção: {e}")
+            return {'status': 'erro', 'error': str(e)}
+        finally:
+            ended = time.perf_counter()
+            timings[i] = {'start_ms': (started - plan_started) * 1000, 'elapsed_ms': (ended - started) * 1000}
+
+    for wave in waves:
+        if len(wave) == 1:
+            outcomes = {wave[0]: _timed(wave[0], dict(data))}
+        else:
+            futures = {i: _get_executor().submit(_timed, i, dict(data)) for i in wave}
+            outcomes = {i: future.result() for i, future in futures.items()}
+        for i in wave:  # ondas já estão na ordem do plano
+            result = outcomes[i] if isinstance(outcomes[i], dict) else {'status': 'erro', 'error': 'resultado inválido'}
+            apply_result(steps[i], result)
+            results[steps[i]] = result
+            executed.append(steps[i])
+            if is_error(result):
+                failed = steps[i]
+                break
+        if failed:
+            break
+
+    executed_idx = {i for i in timings if steps[i] in results}
+    elapsed = {i: timings[i]['elapsed_ms'] for i in executed_idx}
+    path = critical_path(steps, deps, elapsed)
+    total_ms = (time.perf_counter() - plan_started) * 1000
+    report = [
+        {'step': steps[i], 'start_ms': round(timings[i]['start_ms'], 1), 'elapsed_ms': round(timings[i]['elapsed_ms'], 1)}
+        for i in sorted(executed_idx)
+    ]
+    _record(report, path, total_ms, len(waves))
+    logger.info(f"⏱️ Plano {steps} em {total_ms:.0f}ms ({len(waves)} ondas) | caminho crítico: {' → '.join(path)} | "
+                + ", ".join(f"{r['step']}={r['elapsed_ms']:.0f}ms" for r in report))
+    return {'results': results, 'executed': executed, 'failed': failed, 'timings': report,
+            'critical_path': path, 'total_ms': round(total_ms, 1)}
+
+
+def _record(report: List[Dict[str, Any]], path: List[str], total_ms: float, waves: int) -> None:
+    with _metrics_lock:
+        for r in report:
+            m = _metrics[r['step']]
+            m['calls'] += 1
+            m['total_ms'] += r['elapsed_ms']
+            m['max_ms'] = max(m['max_ms'], r['elapsed_ms'])
+        _last_plans.append({'steps': [r['step'] for r in report], 'total_ms': round(total_ms, 1),
+                            'waves': waves, 'critical_path': path, 'timings': report})
+        del _last_plans[:-LAST_PLANS_KEPT]
+
+
+def get_step_metrics() -> Dict[str, Any]:
+    with _metrics_lock:
+        steps = {
+            name: {'calls': int(m['calls']), 'avg_ms': round(m['total_ms'] / m['calls'], 1) if m['calls'] else 0.0,
+                   'max_ms': round(m['max_ms'], 1)}
+            for name, m in _metrics.items()
+        }
+        return {'steps': steps, 'last_plans': list(_last_plans)}
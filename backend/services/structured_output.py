@@ -0,0 +1,146 @@
+"""
+Saídas estruturadas dos LLMs (intenção, extração, planejamento e match).
+
+As chamadas pedem JSON ao provedor (`JSON_MODE`, response_format json_object),
+então a resposta já chega como um objeto JSON, sem cercas ``` nem prefixos.
+A resposta é validada uma única vez pelo modelo pydantic da etapa
+(`model_validate_json`, parse + validação num só passo). Se o modelo não
+respeitar o formato, há uma única tentativa de recorte do trecho {...};
+falhando, quem chamou usa o seu fallback local.
+
+Contadores por etapa (ok, recortado, falha, fallback) ficam em
+get_structured_metrics().
+"""
+import logging
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Type, TypeVar, Union
+
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, field_validator
+
+logger = logging.getLogger(__name__)
+
+# kwargs de invoke para pedir um objeto JSON ao provedor (o prompt precisa mencionar "JSON")
+JSON_MODE = {'response_format': {'type': 'json_object'}}
+
+T = TypeVar('T', bound=BaseModel)
+Scalar = Optional[Union[str, int, float]]
+
+_metrics: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+_metrics_lock = threading.Lock()
+
+
+class ExtractedData(BaseModel):
+    """Campos extraídos da conversa; chaves extras do LLM são preservadas"""
+    model_config = ConfigDict(extra='allow')
+
+    profissional: Scalar = None
+    profissional_id: Scalar = None
+    procedimento: Scalar = None
+    servico_id: Scalar = None
+    data: Scalar = None
+    horario: Scalar = None
+    cpf: Scalar = None
+    nome: Scalar = None
+    email: Scalar = None
+
+
+class IntentResult(BaseModel):
+    """Intenção + dados do turno (TrinksRules.detect_intent_and_extract)"""
+    model_config = ConfigDict(extra='allow')
+
+    intent: str = 'verificar_informacoes'
+    extracted: Dict[str, Any] = Field(default_factory=dict)
+    cache_instructions: Dict[str, Any] = Field(default_factory=dict)
+
+    @field_validator('intent', mode='before')
+    @classmethod
+    def _intent(cls, v):
+        return v or 'verificar_informacoes'
+
+    @field_validator('extracted', 'cache_instructions', mode='before')
+    @classmethod
+    def _dict_or_empty(cls, v):
+        return v if isinstance(v, dict) else {}
+
+
+class NextSteps(BaseModel):
+    """Decisão de próximos passos (TrinksRules.decide_next_steps)"""
+    model_config = ConfigDict(extra='allow')
+
+    action: Union[str, List[str]] = 'ask_user'
+    missing_data: List[str] = Field(default_factory=list)
+    business_rules: List[str] = Field(default_factory=list)
+
+    @field_validator('missing_data', 'business_rules', mode='before')
+    @classmethod
+    def _as_list(cls, v):
+        if v is None:
+            return []
+        return [str(i) for i in v] if isinstance(v, (list, tuple)) else [str(v)]
+
+
+class MatchResult(BaseModel):
+    """Match de profissional/serviço contra a lista real"""
+    model_config = ConfigDict(extra='allow')
+
+    id: Scalar = None
+    nome: Optional[str] = None
+    confianca: Optional[str] = None
+    razao: Optional[str] = None
+
+
+class ProfessionalPreference(BaseModel):
+    model_config = ConfigDict(extra='allow')
+
+    tem_preferencia: bool = True
+    profissional_especifico: Optional[str] = None
+    razao: Optional[str] = None
+
+
+def _count(stage: str, outcome: str) -> None:
+    with _metrics_lock:
+        _metrics[stage][outcome] += 1
+
+
+def parse(stage: str, response: Any, model: Type[T]) -> Optional[T]:
+    """Valida a resposta do LLM contra `model`. None = inválida (quem chamou usa o fallback)"""
+    text = (getattr(response, 'content', response) or '')
+    if not isinstance(text, str):
+        text = str(text)
+    try:
+        result = model.model_validate_json(text)
+        _count(stage, 'ok')
+        return result
+    except ValidationError as first_error:
+        # Recorte só quando o problema é o texto em volta do JSON (não o conteúdo)
+        start, end = text.find('{'), text.rfind('}')
+        json_invalid = any(err.get('type') == 'json_invalid' for err in first_error.errors())
+        if json_invalid and 0 <= start < end:
+            try:
+                result = model.model_validate_json(text[start:end + 1])
+                _count(stage, 'repaired')
+                return result
+            except ValidationError:
+                pass
+        _count(stage, 'failed')
+        logger.warning(f"⚠️ Saída estruturada inválida em {stage}: {first_error.errors()[:2]} | {text[:200]}")
+        return None
+
+
+def dump(result: BaseModel) -> Dict[str, Any]:
+    """Dict só com as chaves que o LLM devolveu (inclui extras)"""
+    return result.model_dump(exclude_unset=True)
+
+
+def record_fallback(stage: str) -> None:
+    _count(stage, 'fallback')
+
+
+def get_structured_metrics() -> Dict[str, Dict[str, Any]]:
+    with _metrics_lock:
+        snapshot = {stage: dict(m) for stage, m in _metrics.items()}
+    for m in snapshot.values():
+        total = m.get('ok', 0) + m.get('repaired', 0) + m.get('failed', 0)
+        m['failure_rate'] = round(m.get('failed', 0) / total, 4) if total else 0.0
+    return snapshot
@@ -0,0 +1,241 @@
+"""
+Parser local de expressões de data/horário em pt-BR.
+
+Resolve, no fuso America/Sao_Paulo, expressões como "hoje", "amanhã",
+"sexta que vem", "segunda da semana que vem", "dia 12", "12/05", "12 de maio",
+"daqui a 3 dias", "às 15h" e períodos como "de manhã" ou "depois do almoço".
+
+A extração (detect_intent_and_extract / extract_data_with_llm) usa o resultado
+primeiro e repassa ao LLM as datas ISO já resolvidas como fatos, em vez de
+pedir que o modelo faça a conversão.
+"""
+import re
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.slot_filling import normalize, parse_time
+
+TIMEZONE = 'America/Sao_Paulo'
+
+WEEKDAYS = {
+    'segunda': 0, 'terca': 1, 'quarta': 2, 'quinta': 3, 'sexta': 4, 'sabado': 5, 'domingo': 6,
+}
+WEEKDAY_NAMES = ['segunda-feira', 'terça-feira', 'quarta-feira', 'quinta-feira', 'sexta-feira', 'sábado', 'domingo']
+
+MONTHS = {
+    'janeiro': 1, 'jan': 1, 'fevereiro': 2, 'fev': 2, 'marco': 3, 'mar': 3, 'abril': 4, 'abr': 4,
+    'maio': 5, 'mai': 5, 'junho': 6, 'jun': 6, 'julho': 7, 'jul': 7, 'agosto': 8, 'ago': 8,
+    'setembro': 9, 'set': 9, 'outubro': 10, 'out': 10, 'novembro': 11, 'nov': 11, 'dezembro': 12, 'dez': 12,
+}
+
+NUMBER_WORDS = {
+    'um': 1, 'uma': 1, 'dois': 2, 'duas': 2, 'tres': 3, 'quatro': 4, 'cinco': 5, 'seis': 6, 'sete': 7,
+    'oito': 8, 'nove': 9, 'dez': 10, 'quinze': 15,
+}
+
+# Períodos do dia: (nome, a partir de, até)
+PERIODS = [
+    (re.compile(r'\b(depois|apos) (do|o) almoco\b'), ('tarde', '13:00', '18:00')),
+    (re.compile(r'\b(fim|final) da tarde\b'), ('tarde', '16:00', '18:00')),
+    (re.compile(r'\b(antes|hora) do almoco\b'), ('manha', '08:00', '12:00')),
+    (re.compile(r'\b(de|pela|na|a|no periodo da) manha\b|\bmanha cedo\b'), ('manha', '08:00', '12:00')),
+    (re.compile(r'\b(de|pela|na|a|no periodo da) tarde\b'), ('tarde', '12:00', '18:00')),
+    (re.compile(r'\b(de|pela|na|a|no periodo da) noite\b'), ('noite', '18:00', '22:00')),
+]
+
+_WEEKDAY_RE = r'(segunda|terca|quarta|quinta|sexta|sabado|domingo)(?:[ -]feira)?'
+_MONTH_RE = r'(' + '|'.join(sorted(MONTHS, key=len, reverse=True)) + r')'
+
+_DATE_PATTERNS: List[Tuple[str, re.Pattern]] = [
+    ('relative', re.compile(r'\b(depois de amanha|amanha|hoje)\b')),
+    ('in_days', re.compile(r'\b(?:daqui a|daqui|em|dentro de) (\d{1,2}|' + '|'.join(NUMBER_WORDS) + r') (dias?|semanas?)\b')),
+    ('weekday_next_week', re.compile(r'\b' + _WEEKDAY_RE + r' (?:da|na) (?:semana que vem|proxima semana)\b')),
+    ('weekday', re.compile(r'\b(?:(proxim[ao]|nest[ae]|ess[ae]|est[ae]) )?' + _WEEKDAY_RE + r'(?: (que vem))?\b')),
+    ('numeric', re.compile(r'(?<![\d:])(\d{1,2})[/\-.](\d{1,2})(?:[/\-.](\d{2,4}))?(?![\d:])')),
+    ('month_name', re.compile(r'\b(\d{1,2}) de ' + _MONTH_RE + r'\b(?: de (\d{4}))?')),
+    ('day_only', re.compile(r'\bdia (\d{1,2})\b(?!\s*(?:/|-|de \D))')),
+]
+
+# Palavras que podem acompanhar uma resposta só de data sem mudar o sentido
+_FILLER_WORDS = frozenset("""
+pode ser para pra o a no na dia da do as às de e ok sim por favor entao então que tal melhor prefiro quero
+horario hora horas h hs manha tarde noite meio
+""".split())
+
+
+def now_local(tz_name: str = TIMEZONE) -> datetime:
+    """Agora no fuso da empresa (naive, no horário local)"""
+    try:
+        import pytz
+        return datetime.now(pytz.timezone(tz_name)).replace(tzinfo=None)
+    except Exception:
+        return datetime.now()
+
+
+def _to_int(token: str) -> Optional[int]:
+    if token.isdigit():
+        return int(token)
+    return NUMBER_WORDS.get(token)
+
+
+def _safe_date(year: int, month: int, day: int) -> Optional[date]:
+    try:
+        return date(year, month, day)
+    except ValueError:
+        return None
+
+
+def _next_weekday(today: date, weekday: int, include_today: bool = False) -> date:
+    delta = (weekday - today.weekday()) % 7
+    if delta == 0 and not include_today:
+        delta = 7
+    return today + timedelta(days=delta)
+
+
+def _resolve(kind: str, m: re.Match, today: date) -> Optional[date]:
+    if kind == 'relative':
+        return today + timedelta(days={'hoje': 0, 'amanha': 1, 'depois de amanha': 2}[m.group(1)])
+
+    if kind == 'in_days':
+        n = _to_int(m.group(1))
+        if n is None:
+            return None
+        return today + timedelta(days=n * (7 if m.group(2).startswith('semana') else 1))
+
+    if kind == 'weekday_next_week':
+        next_monday = today + timedelta(days=7 - today.weekday())
+        return next_monday + timedelta(days=WEEKDAYS[m.group(1)])
+
+    if kind == 'weekday':
+        prefix, name, que_vem = m.group(1), m.group(2), m.group(3)
+        # "nesta/essa sexta" pode ser hoje; "sexta", "sexta que vem", "próxima sexta" = próxima ocorrência
+        include_today = bool(prefix) and not prefix.startswith('proxim') and not que_vem
+        return _next_weekday(today, WEEKDAYS[name], include_today=include_today)
+
+    if kind == 'numeric':
+        day, month = int(m.group(1)), int(m.group(2))
+        year = m.group(3)
+        if year:
+            year = int(year) + (2000 if len(year) == 2 else 0)
+            return _safe_date(year, month, day)
+        resolved = _safe_date(today.year, month, day)
+        if resolved and resolved < today:
+            resolved = _safe_date(today.year + 1, month, day)
+        return resolved
+
+    if kind == 'month_name':
+        day, month = int(m.group(1)), MONTHS[m.group(2)]
+        if m.group(3):
+            return _safe_date(int(m.group(3)), month, day)
+        resolved = _safe_date(today.year, month, day)
+        if resolved and resolved < today:
+            resolved = _safe_date(today.year + 1, month, day)
+        return resolved
+
+    if kind == 'day_only':
+        day = int(m.group(1))
+        year, month = today.year, today.month
+        # Dia já passado (ou inexistente neste mês) → próximo mês que tenha esse dia
+        for _ in range(3):
+            resolved = _safe_date(year, month, day)
+            if resolved and resolved >= today:
+                return resolved
+            month += 1
+            if month > 12:
+                year, month = year + 1, 1
+        return None
+
+    return None
+
+
+def parse_temporal(message: str, now: Optional[datetime] = None) -> Dict[str, Any]:
+    """Extrai data/horário/período da mensagem.
+
+    Retorna {'data': 'YYYY-MM-DD'|None, 'horario': 'HH:MM'|None, 'periodo': str|None,
+             'a_partir_de': 'HH:MM'|None, 'ate': 'HH:MM'|None, 'expressoes': [...], 'somente_data_hora': bool}.
+    Datas ambíguas (duas datas diferentes na mesma mensagem) não são resolvidas.
+    """
+    now = now or now_local()
+    today = now.date()
+    text = normalize(message)
+    result: Dict[str, Any] = {
+        'data': None, 'horario': None, 'periodo': None, 'a_partir_de': None, 'ate': None,
+        'expressoes': [], 'somente_data_hora': False,
+    }
+    remaining = text
+    dates = set()
+
+    for kind, regex in _DATE_PATTERNS:
+        def _consume(m: re.Match) -> str:
+            resolved = _resolve(kind, m, today)
+            if not resolved:
+                return m.group(0)
+            dates.add(resolved)
+            result['expressoes'].append(m.group(0))
+            return ' '
+        remaining = regex.sub(_consume, remaining)
+
+    if len(dates) == 1:
+        result['data'] = dates.pop().isoformat()
+
+    for regex, (periodo, start, end) in PERIODS:
+        m = regex.search(remaining)
+        if m:
+            result.update(periodo=periodo, a_partir_de=start, ate=end)
+            result['expressoes'].append(m.group(0))
+            remaining = regex.sub(' ', remaining)
+            break
+
+    # Número solto ("15") sozinho é ambíguo entre dia e hora: não resolve aqui
+    horario = None if re.fullmatch(r'\s*\d{1,2}\s*', remaining) else parse_time(remaining)
+    if horario:
+        result['horario'] = horario
+        result['expressoes'].append(horario)
+        # "hoje às 9" quando já passou das 9 não é um horário válido para hoje
+        if result['data'] == today.isoformat() and horario <= now.strftime('%H:%M'):
+            result['horario_passado'] = True
+
+    if result['data'] or result['horario']:
+        leftover = re.sub(r'[\d:]+|[^\w\s]', ' ', remaining)
+        words = [w for w in leftover.split() if w not in _FILLER_WORDS]
+        result['somente_data_hora'] = not words
+    return result
+
+
+def temporal_facts(parsed: Dict[str, Any], now: Optional[datetime] = None) -> str:
+    """Texto para o prompt: data de hoje e o que já foi resolvido na mensagem (fatos, não conversão)"""
+    now = now or now_local()
+    lines = [f"CONTEXTO ATUAL: Hoje é {now.strftime('%d/%m/%Y')} ({WEEKDAY_NAMES[now.weekday()]}), "
+             f"{now.strftime('%H:%M')} no horário de Brasília."]
+    facts = []
+    if parsed.get('data'):
+        d = datetime.strptime(parsed['data'], '%Y-%m-%d')
+        facts.append(f"data = {parsed['data']} ({WEEKDAY_NAMES[d.weekday()]})")
+    if parsed.get('horario_passado'):
+        facts.append(f"horario {parsed['horario']} de hoje JÁ PASSOU (não use; peça outro horário)")
+    elif parsed.get('horario'):
+        facts.append(f"horario = {parsed['horario']}")
+    if parsed.get('periodo'):
+        facts.append(f"período = {parsed['periodo']} (entre {parsed['a_partir_de']} e {parsed['ate']})")
+    if facts:
+        lines.append("DATAS/HORÁRIOS JÁ RESOLVIDOS NA MENSAGEM ATUAL (use exatamente estes valores, não recalcule): "
+                     + "; ".join(facts))
+    return "\n".join(lines)
+
+
+def apply_temporal_facts(extracted: Dict[str, Any], parsed: Dict[str, Any]) -> Dict[str, Any]:
+    """Garante que data/horário resolvidos localmente prevaleçam sobre o que o LLM devolveu.
+
+    Horário de hoje que já passou (horario_passado) é descartado: o fluxo volta a pedir o horário.
+    """
+    if not isinstance(extracted, dict):
+        return extracted
+    if parsed.get('horario_passado'):
+        extracted.pop('horario', None)
+        extracted['data'] = parsed['data']
+        return extracted
+    for field in ('data', 'horario'):
+        value = parsed.get(field)
+        if value and extracted.get(field) != value:
+            extracted[field] = value
+    return extracted
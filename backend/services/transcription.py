@@ -0,0 +1,101 @@
+"""
+Etapa de transcrição de áudios recebidos pelo WhatsApp.
+
+As transcrições rodam em um pool de threads (fora do event loop e em paralelo
+entre conversas) e o resultado fica em cache por media SID do Twilio, para
+que reenvios e reprocessamentos não paguem o Whisper de novo.
+"""
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Any, Optional
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+_cache: "OrderedDict[str, str]" = OrderedDict()
+_inflight: Dict[str, Future] = {}
+_cache_lock = threading.Lock()
+_openai_clients: Dict[str, Any] = {}
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max(1, Config.TRANSCRIPTION_WORKERS), thread_name_prefix="transcription")
+        return _executor
+
+
+def _get_openai_service(api_key: str):
+    oai = _openai_clients.get(api_key)
+    if oai is None:
+        from integrations.openai_service import OpenAIService
+        oai = OpenAIService(api_key)
+        _openai_clients[api_key] = oai
+    return oai
+
+
+def media_sid_from_url(media_url: str) -> str:
+    """Extrai o media SID da URL do Twilio (.../Messages/MMxxx/Media/MExxx)"""
+    return (media_url or '').rstrip('/').rsplit('/', 1)[-1]
+
+
+def is_audio_message(webhook_data: Dict[str, Any]) -> bool:
+    message_type = webhook_data.get('MessageType', 'text')
+    media_type = str(webhook_data.get('MediaContentType0', ''))
+    try:
+        has_media = int(webhook_data.get('NumMedia', '0') or 0) > 0
+    except Exception:
+        has_media = False
+    return bool(webhook_data.get('MediaUrl0')) and (message_type == 'audio' or (has_media and media_type.startswith('audio')))
+
+
+def _transcribe(media_sid: str, media_url: str, api_key: str, twilio_sid: str, twilio_token: str) -> str:
+    try:
+        oai = _get_openai_service(api_key)
+        transcript = oai.transcribe_audio(media_url, twilio_sid, twilio_token, max_bytes=Config.TRANSCRIPTION_MAX_BYTES)
+        if transcript:
+            with _cache_lock:
+                _cache[media_sid] = transcript
+                while len(_cache) > max(1, Config.TRANSCRIPTION_CACHE_SIZE):
+                    _cache.popitem(last=False)
+            logger.info(f"🎙️ Transcrição de áudio concluída ({media_sid})")
+        return transcript
+    finally:
+        with _cache_lock:
+            _inflight.pop(media_sid, None)
+
+
+def submit_transcription(media_url: str, api_key: str, twilio_sid: str, twilio_token: str) -> Future:
+    """Agenda a transcrição e retorna um Future com o texto ('' em caso de falha).
+
+    Áudios já transcritos (ou em transcrição) com o mesmo media SID reaproveitam o resultado.
+    """
+    media_sid = media_sid_from_url(media_url)
+    with _cache_lock:
+        cached = _cache.get(media_sid)
+        if cached is not None:
+            _cache.move_to_end(media_sid)
+            done: Future = Future()
+            done.set_result(cached)
+            logger.info(f"🎙️ Transcrição reaproveitada do cache ({media_sid})")
+            return done
+        future = _inflight.get(media_sid)
+        if future is not None:
+            return future
+        future = _get_executor().submit(_transcribe, media_sid, media_url, api_key, twilio_sid, twilio_token)
+        _inflight[media_sid] = future
+        return future
+
+
+def shutdown_transcription_pool():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+            _executor = None
@@ -1,4 +1,4 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, Iterator, List
 from tools.trinks_intelligent_tools import TrinksIntelligentTools
 
 
@@ -31,20 +31,21 @@ class TrinksProvider:
         self.empresa_config = normalized
         self.tools = TrinksIntelligentTools(self.empresa_config)
 
-    def list_appointments_range(self, start_iso: str, end_iso: str) -> List[Dict[str, Any]]:
-        resp = self.tools.list_appointments_range(start_iso, end_iso, self.empresa_config)
-        if resp.get('success'):
-            # Filtrar cancelados (status.nome == 'Cancelado' ou id == 9)
-            data = resp.get('data', [])
-            filtered = []
-            for ap in data:
-                st = ap.get('status') or {}
-                nome = (st.get('nome') or '').strip().lower()
-                sid = st.get('id')
-                if nome == 'cancelado' or sid == 9:
-                    continue
-                filtered.append(ap)
-            return filtered
-        return []
+    def iter_appointments_range(self, start_iso: str, end_iso: str) -> Iterator[Dict[str, Any]]:
+        """Agendamentos não cancelados do intervalo, entregues conforme as páginas chegam.
 
+        Falhas na busca (AppointmentRangeError, erros de rede) propagam: quem consome
+        não deve agir sobre uma agenda incompleta.
+        """
+        from services.appointment_range import iter_appointments_range
+        for ap in iter_appointments_range(self.empresa_config, start_iso, end_iso):
+            # Filtrar cancelados (status.nome == 'Cancelado' ou id == 9)
+            st = ap.get('status') or {}
+            nome = (st.get('nome') or '').strip().lower()
+            sid = st.get('id')
+            if nome == 'cancelado' or sid == 9:
+                continue
+            yield ap
 
+    def list_appointments_range(self, start_iso: str, end_iso: str) -> List[Dict[str, Any]]:
+        return list(self.iter_appointments_range(start_iso, end_iso))
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Teste da listagem paginada/paralela de agendamentos por intervalo (lembretes)
+"""
+
+import sys
+import os
+import threading
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from config import Config
+from services import appointment_range
+from services.appointment_range import iter_appointments_range, clear_memo, get_stats, AppointmentRangeError
+
+Config.TRINKS_RANGE_PAGE_SIZE = 2
+EMPRESA = {'trinks_base_url': 'http://trinks.local', 'trinks_api_key': 'x', 'trinks_estabelecimento_id': '99'}
+START, END = '2025-01-17T00:00:00-03:00', '2025-01-19T00:00:00-03:00'
+calls = []
+calls_lock = threading.Lock()
+
+
+def ap(i, inicio='2025-01-17T09:00:00-03:00'):
+    return {'id': i, 'dataHoraInicio': inicio}
+
+
+def fake_range_get(base_url, headers, params):
+    """Range nativo com 3 páginas informadas em totalPages"""
+    with calls_lock:
+        calls.append(params)
+    pages = {1: [ap(1), ap(2)], 2: [ap(3), ap(4)], 3: [ap(4), ap(5)]}  # ap 4 repetido entre páginas
+    if params['page'] > 1:
+        time.sleep(0.1 * (4 - params['page']))  # página 3 chega antes da 2
+    return 200, {'data': pages[params['page']], 'totalPages': 3}
+
+
+def fake_day_get(base_url, headers, params):
+    """Range recusado; por dia, sem total informado (páginas cheias continuam)"""
+    with calls_lock:
+        calls.append(params)
+    if 'dataInicio' in params:
+        return 400, {}
+    por_dia = {
+        '2025-01-17': [ap(10, '2025-01-17T08:00:00-03:00'), ap(11, '2025-01-17T10:00:00-03:00'), ap(12, '2025-01-17T11:00:00-03:00')],
+        '2025-01-18': [ap(20, '2025-01-18T09:00:00-03:00'), ap(21, '2025-01-19T09:00:00-03:00')],  # 21 fora da janela
+    }
+    items = por_dia.get(params['data'], [])
+    size = params['pageSize']
+    return 200, {'data': items[(params['page'] - 1) * size: params['page'] * size]}
+
+
+def test_native_range_pages():
+    print("🧪 Testando range nativo com páginas em paralelo")
+    clear_memo()
+    calls.clear()
+    appointment_range._get = fake_range_get
+    ids = [a['id'] for a in iter_appointments_range(EMPRESA, START, END)]
+    assert ids == [1, 2, 3, 4, 5]  # ordem das páginas, sem repetidos
+    assert sorted(c['page'] for c in calls) == [1, 2, 3]
+    print("   ✅ 3 páginas, ordem preservada e repetido descartado")
+
+
+def test_memo_and_streaming():
+    print("🧪 Testando memoização por (estabelecimento, intervalo)")
+    calls.clear()
+    assert [a['id'] for a in iter_appointments_range(EMPRESA, START, END)] == [1, 2, 3, 4, 5]
+    assert calls == []  # reaproveitado
+    clear_memo()
+    gen = iter_appointments_range(EMPRESA, START, END)
+    assert next(gen)['id'] == 1  # primeira página entregue antes das demais
+    gen.close()
+    calls.clear()
+    list(iter_appointments_range(EMPRESA, START, END))
+    assert calls  # consumo parcial não memoiza
+    print(f"   ✅ Listagem reaproveitada; stats={get_stats()}")
+
+
+def test_day_fallback():
+    print("🧪 Testando fallback por dia")
+    clear_memo()
+    calls.clear()
+    appointment_range._get = fake_day_get
+    ids = sorted(a['id'] for a in iter_appointments_range(EMPRESA, START, END))
+    assert ids == [10, 11, 12, 20]
+    day_pages = sorted((c['data'], c['page']) for c in calls if 'data' in c)
+    assert day_pages == [('2025-01-17', 1), ('2025-01-17', 2), ('2025-01-18', 1), ('2025-01-18', 2)]
+    print("   ✅ Dias em paralelo, páginas seguidas enquanto cheias, filtro pela janela")
+
+
+def fake_failing_get(base_url, headers, params):
+    """Página 2 do range falha com 500"""
+    with calls_lock:
+        calls.append(params)
+    if params['page'] == 2:
+        return 500, {}
+    return 200, {'data': [ap(params['page'] * 10), ap(params['page'] * 10 + 1)], 'totalPages': 3}
+
+
+def test_page_error_not_memoized():
+    print("🧪 Testando falha numa página (500)")
+    clear_memo()
+    appointment_range._get = fake_failing_get
+    received = []
+    try:
+        for item in iter_appointments_range(EMPRESA, START, END):
+            received.append(item['id'])
+        raise AssertionError("deveria falhar com a página 2 em erro")
+    except AppointmentRangeError:
+        pass
+    assert received == [10, 11]  # só a 1ª página chegou antes da falha
+    assert get_stats()['memoized_ranges'] == 0  # listagem incompleta não é memoizada
+    try:
+        list(iter_appointments_range(EMPRESA, START, END))  # nova tentativa busca de novo
+        raise AssertionError("deveria falhar de novo")
+    except AppointmentRangeError:
+        pass
+    print("   ✅ Falha propagada ao consumidor e nada memoizado")
+
+
+def fake_ignored_page_get(base_url, headers, params):
+    """Range sem total informado e que ignora `page`: sempre a mesma página cheia"""
+    with calls_lock:
+        calls.append(params)
+    return 200, {'data': [ap(1), ap(2)]}
+
+
+def fake_endless_get(base_url, headers, params):
+    """Sem total informado e sempre uma página cheia com ids novos"""
+    page = params['page']
+    return 200, {'data': [ap(page * 10), ap(page * 10 + 1)]}
+
+
+def test_pagination_without_total_terminates():
+    print("🧪 Testando paginação sem total que a API ignora")
+    clear_memo()
+    calls.clear()
+    appointment_range._get = fake_ignored_page_get
+    assert [a['id'] for a in iter_appointments_range(EMPRESA, START, END)] == [1, 2]
+    assert len(calls) == 2  # a 2ª página repetiu a 1ª: para
+    clear_memo()
+    appointment_range._get = fake_endless_get
+    original_max = appointment_range.MAX_SEQUENTIAL_PAGES
+    appointment_range.MAX_SEQUENTIAL_PAGES = 5
+    try:
+        list(iter_appointments_range(EMPRESA, START, END))
+        raise AssertionError("deveria parar no limite de páginas")
+    except AppointmentRangeError:
+        pass
+    finally:
+        appointment_range.MAX_SEQUENTIAL_PAGES = original_max
+    assert get_stats()['memoized_ranges'] == 0
+    print("   ✅ Página repetida encerra a listagem; limite de páginas evita loop infinito")
+
+
+if __name__ == "__main__":
+    test_native_range_pages()
+    test_memo_and_streaming()
+    test_day_fallback()
+    test_page_error_not_memoized()
+    test_pagination_without_total_terminates()
+    print("🎯 Testes da listagem de agendamentos por intervalo concluídos!")
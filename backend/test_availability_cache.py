@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Teste do cache de agenda do dia com prefetch especulativo
+"""
+
+import sys
+import os
+import threading
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services import availability_cache
+from services.availability_cache import prefetch_for_turn, get_day, invalidate, next_business_day, get_stats
+
+EMPRESA = {'trinks_estabelecimento_id': '99', 'trinks_api_key': 'x', 'trinks_base_url': 'http://trinks.local'}
+calls = []
+
+
+def fake_fetch_day(empresa_config, data, service_id=''):
+    # Payload real da agenda: sem lista de serviços por profissional; a API filtra por servicoId
+    calls.append(data if not service_id else (data, service_id))
+    time.sleep(0.2)  # requisição lenta: a etapa de disponibilidade chega antes de terminar
+    if service_id == '7':
+        return [{'id': 2, 'nome': 'Bia', 'horariosVagos': ['10:00']}]
+    return [{'id': 1, 'nome': 'Ana', 'horariosVagos': ['09:00']}, {'id': 2, 'nome': 'Bia', 'horariosVagos': ['10:00']}]
+
+
+def test_next_business_day():
+    print("🧪 Testando próximo dia útil")
+    assert next_business_day('2025-01-16') == '2025-01-17'  # quinta → sexta
+    assert next_business_day('2025-01-17') == '2025-01-20'  # sexta → segunda
+    assert next_business_day('data inválida') is None
+    print("   ✅ Fins de semana pulados")
+
+
+def test_prefetch_single_flight():
+    print("🧪 Testando prefetch + busca em andamento")
+    availability_cache._fetch_day = fake_fetch_day
+    assert prefetch_for_turn(EMPRESA, 'cancelar_consulta', '2025-01-17') == 0
+    assert prefetch_for_turn(EMPRESA, 'agendar_consulta', '2025-01-17') == 2
+    assert prefetch_for_turn(EMPRESA, 'agendar_consulta', '2025-01-17') == 0  # já em andamento
+
+    results = []
+    workers = [threading.Thread(target=lambda: results.append(get_day(EMPRESA, '2025-01-17', '2'))) for _ in range(3)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    assert all(r == [{'id': 2, 'nome': 'Bia', 'horariosVagos': ['10:00']}] for r in results)
+    assert len(get_day(EMPRESA, '2025-01-20')) == 2  # próximo dia útil já em cache
+    assert sorted(calls) == ['2025-01-17', '2025-01-20']  # um GET por dia
+    print(f"   ✅ Uma requisição por dia; stats={get_stats()}")
+
+
+def test_service_keyed_cache():
+    print("🧪 Testando agenda por serviço (filtro servicoId na API)")
+    # A agenda sem filtro já está em cache, mas não diz quem atende o serviço: nova busca com servicoId
+    assert [p['id'] for p in get_day(EMPRESA, '2025-01-17', service_id='7')] == [2]
+    assert [p['id'] for p in get_day(EMPRESA, '2025-01-17', service_id=7)] == [2]  # mesma entrada
+    assert get_day(EMPRESA, '2025-01-17', '1', service_id='7') == []  # Ana não faz o serviço 7
+    assert calls.count(('2025-01-17', '7')) == 1
+    assert len(get_day(EMPRESA, '2025-01-17')) == 2  # agenda sem filtro segue intacta
+    print("   ✅ Uma entrada por serviço; profissional fora do serviço não é oferecido")
+
+
+def test_invalidation():
+    print("🧪 Testando invalidação após escrita na agenda")
+    invalidate(EMPRESA)
+    get_day(EMPRESA, '2025-01-17')
+    assert calls.count('2025-01-17') == 2
+    print("   ✅ Agenda buscada de novo após invalidação")
+
+
+if __name__ == "__main__":
+    original_fetch_day = availability_cache._fetch_day
+    try:
+        test_next_business_day()
+        test_prefetch_single_flight()
+        test_service_keyed_cache()
+        test_invalidation()
+    finally:
+        availability_cache._fetch_day = original_fetch_day
+    print("🎯 Testes do cache de agenda concluídos!")
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Teste da etapa de disponibilidade servida pela agenda do dia em cache:
+depois do prefetch do turno, verificar disponibilidade (inclusive o looping para
+o próximo dia útil) não faz nenhum GET em /agendamentos/profissionais/{data}.
+"""
+
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import requests
+from services import availability_cache
+from services.availability_cache import prefetch_for_turn, get_stats
+from tools.trinks_intelligent_tools import TrinksIntelligentTools
+
+EMPRESA = {'trinks_enabled': True, 'trinks_estabelecimento_id': '77', 'trinks_api_key': 'x',
+           'trinks_base_url': 'http://trinks.local', 'auto_looping_disponibilidade': True}
+AGENDA = {
+    '2025-01-17': [{'id': 2, 'nome': 'Bia', 'horariosVagos': ['10:00', '11:00']}, {'id': 3, 'nome': 'Carla', 'horariosVagos': []}],
+    '2025-01-20': [{'id': 2, 'nome': 'Bia', 'horariosVagos': ['09:00']}, {'id': 3, 'nome': 'Carla', 'horariosVagos': ['14:00']}],
+}
+# Quem atende o serviço 5 (a agenda não traz lista de serviços; só a API sabe)
+SERVICE_5 = {'2'}
+gets = []
+api_calls = []
+
+
+class _Response:
+    def __init__(self, payload):
+        self.status_code = 200
+        self._payload = payload
+        self.content = b'{}'
+
+    def json(self):
+        return self._payload
+
+
+def fake_get(url, headers=None, params=None, timeout=None):
+    service_id = (params or {}).get('servicoId')
+    gets.append(url if not service_id else (url, service_id))
+    data = url.rsplit('/', 1)[-1]
+    items = AGENDA.get(data, [])
+    if service_id == '5':
+        items = [p for p in items if str(p['id']) in SERVICE_5]
+    return _Response({'data': items})
+
+
+def _wait_prefetch():
+    for _ in range(100):
+        if not availability_cache._inflight:
+            return
+        time.sleep(0.01)
+
+
+def test_availability_from_prefetch():
+    print("🧪 Testando disponibilidade servida pelo prefetch")
+    tools = TrinksIntelligentTools(EMPRESA)
+    tools.api_tools.call_api = lambda *a, **k: api_calls.append((a, k)) or '{}'
+    assert prefetch_for_turn(EMPRESA, 'agendar_consulta', '2025-01-17') == 2
+    _wait_prefetch()
+    assert sorted(gets) == ['http://trinks.local/agendamentos/profissionais/2025-01-17',
+                            'http://trinks.local/agendamentos/profissionais/2025-01-20']
+    gets.clear()
+
+    result = tools.check_professional_availability('2025-01-17', None, EMPRESA, professional_id='2')
+    assert result['available_slots'] == ['10:00', '11:00']
+    assert gets == [] and api_calls == []  # nenhuma requisição na etapa de disponibilidade
+    print("   ✅ Horários do dia pedido sem requisições")
+
+
+def test_looping_from_prefetch():
+    print("🧪 Testando looping para o próximo dia útil já pré-carregado")
+    tools = TrinksIntelligentTools(EMPRESA)
+    tools.api_tools.call_api = lambda *a, **k: api_calls.append((a, k)) or '{}'
+    result = tools.check_professional_availability('2025-01-17', None, EMPRESA, professional_id='3')
+    assert result.get('next_available_date') == '2025-01-20' and result['available_slots'] == ['14:00']
+    assert gets == [] and api_calls == []
+    print(f"   ✅ Próximo dia útil servido do cache; stats={get_stats()}")
+
+
+def test_service_filter_by_api():
+    print("🧪 Testando filtro de serviço sem lista de serviços no payload")
+    tools = TrinksIntelligentTools(EMPRESA)
+    tools.api_tools.call_api = lambda *a, **k: api_calls.append((a, k)) or '{}'
+    result = tools._get_trinks_real_availability('2025-01-20', EMPRESA, service_id='5')
+    offered = {p['id'] for p in result.get('by_professional', [])}
+    assert offered == {'2'}, result  # Carla tem horário, mas não faz o serviço 5
+    assert gets == [('http://trinks.local/agendamentos/profissionais/2025-01-20', '5')]
+    tools._get_trinks_real_availability('2025-01-20', EMPRESA, service_id='5')
+    assert len(gets) == 1  # agenda do serviço em cache
+    print("   ✅ servicoId enviado à API e agenda do serviço reaproveitada")
+
+
+if __name__ == "__main__":
+    original_get = requests.get
+    requests.get = fake_get
+    try:
+        test_availability_from_prefetch()
+        test_looping_from_prefetch()
+        test_service_filter_by_api()
+    finally:
+        requests.get = original_get
+    print("🎯 Testes da disponibilidade via cache de agenda concluídos!")
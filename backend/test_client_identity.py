@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Teste do cache de identidade de clientes Trinks (waid/CPF → cliente_id)
+"""
+
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services import client_identity
+from services.client_identity import lookup, remember, get_stats
+
+EMPRESA = {'empresa_id': 7, 'slug': 'clinica'}
+db_rows = {}
+
+
+def fake_db_load(empresa_id, waid='', cpf=''):
+    for row in db_rows.values():
+        if row['empresa_id'] == empresa_id and ((waid and row['waid'] == waid) or (not waid and row['cpf'] == cpf)):
+            return {k: v for k, v in row.items() if k != 'empresa_id'}
+    return None
+
+
+def fake_db_save(empresa_id, entry):
+    db_rows[(empresa_id, entry['waid'])] = dict(entry, empresa_id=empresa_id)
+
+
+client_identity._db_load = fake_db_load
+client_identity._db_save = fake_db_save
+
+
+def test_remember_and_lookup():
+    print("🧪 Testando registro e consulta por waid e CPF")
+    assert lookup(EMPRESA, waid='5541999990000') is None
+    remember(EMPRESA, 123, 'Ana', cpf='123.456.789-01', waid='whatsapp:+5541999990000')
+    by_waid = lookup(EMPRESA, waid='5541999990000')
+    by_cpf = lookup(EMPRESA, cpf='12345678901')
+    assert by_waid['cliente_id'] == by_cpf['cliente_id'] == 123 and by_waid['fresh']
+    assert by_waid['cpf'] == '12345678901'
+    assert lookup({'empresa_id': 8}, waid='5541999990000') is None  # outra empresa
+    assert (7, '5541999990000') in db_rows
+    print("   ✅ Mesmo cliente pelo waid e pelo CPF, isolado por empresa")
+
+
+def test_db_layer_after_restart():
+    print("🧪 Testando leitura do banco quando a memória está vazia")
+    client_identity._entries.clear()
+    entry = lookup(EMPRESA, waid='5541999990000')
+    assert entry and entry['cliente_id'] == 123
+    assert lookup(EMPRESA, cpf='12345678901')['cliente_id'] == 123  # aquecido na memória
+    stats = get_stats()
+    assert stats['hits_db'] == 1 and stats['hits_memory'] >= 3
+    print(f"   ✅ Entrada recuperada do banco; stats={stats}")
+
+
+def test_stale_entry():
+    print("🧪 Testando entrada vencida (revalidação preguiçosa)")
+    old = time.time() - 400 * 86400
+    remember(EMPRESA, 555, 'Bia', cpf='98765432100', waid='5511988887777', verified_at=old)
+    entry = lookup(EMPRESA, waid='5511988887777')
+    assert entry and not entry['fresh'] and entry['cpf'] == '98765432100'
+    remember(EMPRESA, 555, 'Bia', cpf='98765432100')  # revalidado na API pelo CPF
+    assert lookup(EMPRESA, waid='5511988887777')['fresh']  # waid preservado e entrada renovada
+    print("   ✅ Entrada vencida devolvida com fresh=False e renovada após revalidar")
+
+
+if __name__ == "__main__":
+    test_remember_and_lookup()
+    test_db_layer_after_restart()
+    test_stale_entry()
+    print("🎯 Testes do cache de identidade concluídos!")
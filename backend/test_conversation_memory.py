@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Teste da memória de conversa com resumo incremental
+"""
+
+import sys
+import os
+import threading
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.conversation_memory import plan_summarization, trim_summarized, schedule_summarization, fallback_summary
+
+
+def _msgs(start, end):
+    return [{'type': 'human' if i % 2 == 0 else 'ai', 'content': f"mensagem {i}"} for i in range(start, end)]
+
+
+def test_plan():
+    print("🧪 Testando quando resumir")
+    entry = {'messages': _msgs(0, 10), 'base': 0}
+    assert plan_summarization(entry, keep_recent=6, batch=6) is None
+    entry['messages'] = _msgs(0, 12)
+    upto, to_summarize = plan_summarization(entry, keep_recent=6, batch=6)
+    assert upto == 6 and [m['content'] for m in to_summarize] == [f"mensagem {i}" for i in range(6)]
+    entry['summarizing'] = True
+    assert plan_summarization(entry, keep_recent=6, batch=6) is None
+    print("   ✅ Resume apenas lotes completos, um por vez")
+
+
+def test_trim_after_concurrent_turn():
+    print("🧪 Testando descarte de mensagens já resumidas")
+    # Turno salvou 14 mensagens a partir da posição 0, mas o resumo já cobre até 6
+    entry = {'messages': _msgs(0, 14), 'base': 0, 'summary_upto': 6}
+    trim_summarized(entry)
+    assert entry['base'] == 6 and entry['messages'][0]['content'] == "mensagem 6" and len(entry['messages']) == 8
+    trim_summarized(entry)  # idempotente
+    assert entry['base'] == 6 and len(entry['messages']) == 8
+    print("   ✅ Mensagens resumidas removidas sem perder as novas")
+
+
+def test_schedule_background():
+    print("🧪 Testando resumo em background")
+    cache = {'5511999999999': {'messages': _msgs(0, 12), 'base': 0, 'summary': ''}}
+    lock = threading.Lock()
+    calls = []
+
+    def fake_runner(api_key, previous, messages):
+        calls.append(len(messages))
+        return f"resumo de {len(messages)} mensagens"
+
+    assert schedule_summarization(cache, lock, '5511999999999', 'key', 6, 6, runner=fake_runner)
+    for _ in range(50):
+        if not cache['5511999999999'].get('summarizing'):
+            break
+        time.sleep(0.02)
+    entry = cache['5511999999999']
+    assert calls == [6], calls
+    assert entry['summary'] == "resumo de 6 mensagens"
+    assert entry['base'] == 6 and len(entry['messages']) == 6
+    assert not schedule_summarization(cache, lock, '5511999999999', 'key', 6, 6, runner=fake_runner)
+    print(f"   ✅ Resumo aplicado: {entry['summary']} | {len(entry['messages'])} mensagens literais")
+
+
+def test_fallback_budget():
+    print("🧪 Testando resumo simplificado com orçamento")
+    text = fallback_summary("resumo antigo", _msgs(0, 200), max_tokens=50)
+    assert text.endswith("mensagem 199") and len(text) < 400, text
+    print("   ✅ Resumo limitado ao orçamento")
+
+
+if __name__ == "__main__":
+    test_plan()
+    test_trim_after_concurrent_turn()
+    test_schedule_background()
+    test_fallback_budget()
+    print("🎯 Testes da memória de conversa concluídos!")
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Teste do índice de recuperação de knowledge (BM25 por empresa)
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.knowledge_index import (
+    KnowledgeIndex, tokenize, select_knowledge, build_index, get_index, get_knowledge_metrics
+)
+
+ITEMS = [
+    {"key": "Endereço", "description": "Rua das Flores, 123 - Centro, Florianópolis"},
+    {"key": "Horário de funcionamento", "description": "Segunda a sexta das 9h às 19h, sábados das 9h às 13h"},
+    {"key": "Estacionamento", "description": "Temos convênio com o estacionamento ao lado"},
+    {"key": "Formas de pagamento", "description": "Pix, cartão de crédito em até 6x e dinheiro"},
+    {"key": "Limpeza de pele", "description": "Valor: R$ 180,00. Duração de 1h30"},
+    {"key": "Toxina botulínica", "description": "Valor a partir de R$ 1.200,00, avaliação gratuita"},
+    {"key": "Cancelamento", "description": "Cancelamentos com menos de 24h de antecedência são cobrados"},
+    {"key": "Item sem descrição"},
+]
+
+
+def test_tokenize():
+    print("🧪 Testando normalização de termos")
+    assert tokenize("Qual o VALOR das Consultas?") == ["valor", "consulta"], tokenize("Qual o VALOR das Consultas?")
+    assert tokenize("endereço") == tokenize("ENDERECO")
+    print("   ✅ Acentos, caixa, stopwords e plurais tratados")
+
+
+def test_search():
+    print("🧪 Testando busca BM25")
+    index = KnowledgeIndex(ITEMS)
+    assert len(index) == 7  # item sem descrição não entra (mesma regra do prompt)
+    top = [index.items[i]['key'] for i in index.search("quanto custa a limpeza de pele?", 2)]
+    assert "Limpeza de pele" in top, top
+    top = [index.items[i]['key'] for i in index.search("onde fica o endereço de vocês?", 1)]
+    assert top == ["Endereço"], top
+    top = [index.items[i]['key'] for i in index.search("aceita pix ou cartão?", 1)]
+    assert top == ["Formas de pagamento"], top
+    assert index.search("xyzzy", 3) == []
+    print("   ✅ Itens relevantes no topo")
+
+
+def test_select_modes():
+    print("🧪 Testando base pequena (completa) vs recuperação")
+    knowledge = {"items": ITEMS}
+    text, mode = select_knowledge(1, knowledge, "qual o endereço?", top_k=2, full_max_tokens=10_000)
+    assert mode == 'full' and text.count("•") == 7, (mode, text)
+
+    text, mode = select_knowledge(1, knowledge, "qual o endereço?", top_k=2, full_max_tokens=20)
+    assert mode == 'retrieval', mode
+    assert "Rua das Flores" in text and text.count("•") <= 2, text
+
+    text, mode = select_knowledge(2, {"items": []}, "oi", top_k=2, full_max_tokens=20)
+    assert text == "Nenhuma informação específica configurada."
+
+    metrics = get_knowledge_metrics()
+    assert metrics['calls_retrieval'] >= 1 and metrics['injected_tokens'] < metrics['full_tokens'], metrics
+    print(f"   ✅ Modos corretos; métricas: {metrics}")
+
+
+def test_rebuild_on_change():
+    print("🧪 Testando reconstrução do índice quando o knowledge muda")
+    build_index(3, {"items": ITEMS[:2]})
+    assert len(get_index(3, {"items": ITEMS[:2]})) == 2
+    assert len(get_index(3, {"items": ITEMS[:5]})) == 5
+    print("   ✅ Índice acompanha o conteúdo salvo")
+
+
+if __name__ == "__main__":
+    test_tokenize()
+    test_search()
+    test_select_modes()
+    test_rebuild_on_change()
+    print("🎯 Testes do índice de knowledge concluídos!")
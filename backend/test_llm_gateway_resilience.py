@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Teste da camada de resiliência do gateway de LLM (breaker, semáforos, prazo do turno)
+"""
+
+import sys
+import os
+import threading
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.llm_gateway import (
+    CircuitBreaker, LLMUnavailable, GatewayLLM, _acquire, _release, turn_budget, remaining_budget
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_circuit_breaker():
+    print("🧪 Testando circuit breaker")
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=3, cooldown_seconds=30, clock=clock)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.allow() and breaker.state == 'closed'
+    breaker.record_failure()
+    assert breaker.state == 'open' and not breaker.allow()
+    clock.now = 31
+    assert breaker.allow() and breaker.state == 'half_open'
+    assert not breaker.allow()  # só uma chamada de teste
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    clock.now = 62
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == 'closed' and breaker.failures == 0
+    assert breaker.status()['times_opened'] == 2
+    print("   ✅ Abre após falhas seguidas, meia-abertura com uma tentativa, fecha no sucesso")
+
+
+def test_semaphores():
+    print("🧪 Testando semáforos empresa/global")
+    tenant, global_ = threading.BoundedSemaphore(1), threading.BoundedSemaphore(2)
+    assert _acquire([tenant, global_], 0.1)
+    assert not _acquire([tenant, global_], 0.05)  # empresa no limite
+    assert global_._value == 1  # nada ficou preso no global
+    _release([tenant, global_])
+    assert tenant._value == 1 and global_._value == 2
+    print("   ✅ Aquisição tudo-ou-nada com espera limitada")
+
+
+def test_turn_budget():
+    print("🧪 Testando prazo do turno")
+    assert remaining_budget() is None
+    with turn_budget(5) as turn:
+        assert 4 < remaining_budget() <= 5
+        with turn_budget(100) as inner:
+            assert inner is turn and remaining_budget() <= 5  # aninhado reaproveita o prazo
+    assert remaining_budget() is None
+
+    policy = {'model': 'gpt-4o', 'fallback': None, 'timeout': 20}
+    llm = GatewayLLM('intent', 'sk-test', policy, 0.0, tenant='1')
+    with turn_budget(0.5) as turn:
+        try:
+            llm.invoke([])
+            assert False, "deveria recusar sem prazo"
+        except LLMUnavailable:
+            pass
+        assert turn['degraded']
+        # Turno degradado não enfileira novas chamadas
+        try:
+            llm.invoke([])
+            assert False
+        except LLMUnavailable:
+            pass
+    with turn_budget(10):
+        assert llm._call_timeout() <= 10
+    print("   ✅ Timeout limitado ao restante do turno; turno degradado recusa novas chamadas")
+
+
+if __name__ == "__main__":
+    test_circuit_breaker()
+    test_semaphores()
+    test_turn_budget()
+    print("🎯 Testes de resiliência do gateway concluídos!")
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Teste do montador de prompts em camadas (prefixo estável para cache de prompt)
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.prompt_builder import (
+    PromptBuilder, STATIC, TENANT, CONVERSATION, TURN,
+    compact_json, estimate_tokens, truncate_to_budget, record_usage, get_prompt_metrics
+)
+
+
+def _build(historico: str, dados: dict) -> str:
+    builder = PromptBuilder('teste')
+    # Inserção fora de ordem: o builder deve reordenar por estabilidade
+    builder.add(TURN, dados, title="DADOS DO TURNO")
+    builder.add(CONVERSATION, historico, title="HISTÓRICO")
+    builder.add(TENANT, "Prompt da Clínica Teste", title="PROMPT DA EMPRESA")
+    builder.add(STATIC, "INSTRUÇÕES FIXAS")
+    return builder.build()
+
+
+def test_stable_prefix():
+    """Turnos diferentes da mesma empresa compartilham o prefixo estático + empresa"""
+    print("🧪 Testando prefixo estável")
+    a = _build("• Cliente: oi", {"data": "2025-09-01"})
+    b = _build("• Cliente: oi\n• Assistente: olá", {"data": "2025-09-02", "horario": "15:00"})
+    prefix = "INSTRUÇÕES FIXAS\n\nPROMPT DA EMPRESA:\nPrompt da Clínica Teste"
+    assert a.startswith(prefix), a
+    assert b.startswith(prefix), b
+    assert a.index("HISTÓRICO") < a.index("DADOS DO TURNO")
+    print("   ✅ Prefixo idêntico entre turnos e dados voláteis no final")
+
+
+def test_compact_json():
+    print("🧪 Testando JSON compacto")
+    data = {"profissional": "Amabile", "slots": ["14:00", "15:00"]}
+    assert compact_json(data) == '{"profissional":"Amabile","slots":["14:00","15:00"]}'
+    print("   ✅ JSON sem espaços/indentação")
+
+
+def test_budget():
+    print("🧪 Testando orçamento de tokens por segmento")
+    texto = "\n".join(f"• Cliente: mensagem número {i}" for i in range(500))
+    cortado = truncate_to_budget(texto, 50, keep='tail')
+    assert estimate_tokens(cortado) <= 60, estimate_tokens(cortado)
+    assert cortado.endswith("mensagem número 499"), cortado[-40:]
+    cortado = truncate_to_budget(texto, 50)
+    assert cortado.startswith("• Cliente: mensagem número 0")
+    assert truncate_to_budget("curto", 50) == "curto"
+
+    builder = PromptBuilder('teste')
+    builder.add(CONVERSATION, texto, max_tokens=100, keep='tail')
+    breakdown = builder.token_breakdown()
+    assert breakdown['conversation'] <= 110, breakdown
+    print(f"   ✅ Segmento limitado: {breakdown}")
+
+
+def test_levels_and_empty_segments():
+    print("🧪 Testando seleção de níveis e segmentos vazios")
+    builder = PromptBuilder('teste')
+    builder.add(STATIC, "FIXO")
+    builder.add(TURN, {})
+    builder.add(TURN, None)
+    builder.add(TURN, "Hoje é 01/09/2025")
+    assert builder.build([STATIC]) == "FIXO"
+    assert builder.build([TURN]) == "Hoje é 01/09/2025"
+    print("   ✅ Níveis separados e vazios ignorados")
+
+
+def test_usage_metrics():
+    print("🧪 Testando métricas de uso de tokens")
+
+    class FakeResponse:
+        response_metadata = {
+            'token_usage': {
+                'prompt_tokens': 2000,
+                'completion_tokens': 50,
+                'prompt_tokens_details': {'cached_tokens': 1536}
+            }
+        }
+
+    usage = record_usage('teste.metricas', FakeResponse())
+    assert usage == {'prompt_tokens': 2000, 'cached_tokens': 1536, 'completion_tokens': 50}, usage
+    record_usage('teste.metricas', "resposta sem metadados")
+    metrics = get_prompt_metrics()['teste.metricas']
+    assert metrics['calls'] == 2
+    assert metrics['cached_ratio'] == 0.768, metrics
+    print(f"   ✅ Métricas: {metrics}")
+
+
+if __name__ == "__main__":
+    test_stable_prefix()
+    test_compact_json()
+    test_budget()
+    test_levels_and_empty_segments()
+    test_usage_metrics()
+    print("🎯 Testes do montador de prompts concluídos!")
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Teste dos templates de prompt pré-compilados (cache dos trechos fixos por empresa)
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.prompt_templates import register, render, render_catalog, catalog_version, get_template_metrics
+
+FIELDS = ('id', 'nome')
+register('teste.match', """Regras fixas com {{"json": "literal"}}
+
+CATÁLOGO:
+{catalogo}
+
+PROCURADO: "{nome}\"""", tenant_fields=('catalogo',))
+
+
+def test_tenant_segment_cached():
+    print("🧪 Testando cache do trecho fixo (catálogo)")
+    catalogo = [{'id': 1, 'nome': 'Ana', 'cpf': '123'}, {'id': 2, 'nome': 'Bia', 'horarios': ['09:00']}]
+    calls = []
+
+    def tenant_values():
+        calls.append(1)
+        return {'catalogo': render_catalog(catalogo, FIELDS)}
+
+    version = catalog_version(catalogo, FIELDS)
+    a = render('teste.match', version, tenant_values, nome='ana')
+    b = render('teste.match', version, tenant_values, nome='bia')
+    assert len(calls) == 1  # catálogo renderizado uma vez
+    assert a.startswith('Regras fixas com {"json": "literal"}')
+    assert '{"id":1,"nome":"Ana"}\n{"id":2,"nome":"Bia"}' in a and 'cpf' not in a
+    assert a.endswith('PROCURADO: "ana"') and b.endswith('PROCURADO: "bia"')
+    assert a[:a.index('PROCURADO')] == b[:b.index('PROCURADO')]  # prefixo byte a byte idêntico
+    print("   ✅ Catálogo renderizado uma vez; só o campo do turno muda")
+
+
+def test_catalog_version_changes():
+    print("🧪 Testando nova versão quando o catálogo muda")
+    v1 = catalog_version([{'id': 1, 'nome': 'Ana'}], FIELDS)
+    v2 = catalog_version([{'id': 1, 'nome': 'Ana Paula'}], FIELDS)
+    v3 = catalog_version([{'id': 1, 'nome': 'Ana', 'horarios': ['10:00']}], FIELDS)
+    assert v1 != v2 and v1 == v3  # campos fora da renderização não mudam a versão
+    new = render('teste.match', v2, lambda: {'catalogo': render_catalog([{'id': 1, 'nome': 'Ana Paula'}], FIELDS)}, nome='x')
+    assert 'Ana Paula' in new
+    metrics = get_template_metrics()['teste.match']
+    assert metrics['hits'] == 1 and metrics['misses'] == 2
+    print(f"   ✅ Versões por conteúdo; métricas={metrics}")
+
+
+def test_missing_turn_field():
+    print("🧪 Testando campo do turno ausente")
+    try:
+        render('teste.match', 'v', lambda: {'catalogo': ''})
+        raise AssertionError("deveria exigir o campo 'nome'")
+    except KeyError:
+        pass
+    print("   ✅ Campo do turno obrigatório")
+
+
+if __name__ == "__main__":
+    test_tenant_segment_cached()
+    test_catalog_version_changes()
+    test_missing_turn_field()
+    print("🎯 Testes dos templates de prompt concluídos!")
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Teste do cache de respostas de FAQ por empresa
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services import response_cache
+from services.response_cache import is_context_free, knowledge_version, lookup, store, get_cache_metrics
+
+EMPRESA = {'nome': 'Clínica', 'prompt': 'Seja cordial.', 'knowledge_json': {'items': [{'key': 'endereco', 'description': 'Rua A, 10'}]}}
+
+
+def test_context_free():
+    print("🧪 Testando classificação de turnos independentes do contexto")
+    assert is_context_free("Qual o endereço?")
+    assert is_context_free("quanto custa a limpeza de pele?")
+    assert is_context_free("vocês aceitam pix?")
+    assert not is_context_free("quero agendar limpeza de pele")
+    assert not is_context_free("quanto custa isso?")
+    assert not is_context_free("e o valor?")
+    assert not is_context_free("tem horário amanhã às 15h?")
+    assert not is_context_free("qual o endereço?", awaiting={'fields': ['cpf']})
+    assert not is_context_free("oi, tudo bem?")
+    print("   ✅ Só perguntas de FAQ sem referência ao histórico")
+
+
+def test_lookup_and_invalidation():
+    print("🧪 Testando acerto exato, similar e invalidação")
+    version = knowledge_version(EMPRESA)
+    assert lookup(1, version, "Qual o endereço?", 'inicio') is None
+    store(1, version, "Qual o endereço?", 'inicio', "Rua A, 10", 1200.0, 900)
+    assert lookup(1, version, "qual o endereco", 'inicio') == "Rua A, 10"
+    assert lookup(1, version, "Qual o endereço?", 'andamento') is None  # outro estado da conversa
+    assert lookup(2, version, "Qual o endereço?", 'inicio') is None  # outra empresa
+    assert lookup(1, version, "qual é o endereço de vocês?", 'inicio') == "Rua A, 10"  # similar
+    assert lookup(1, version, "qual o telefone?", 'inicio') is None
+
+    changed = knowledge_version(dict(EMPRESA, prompt='Seja breve.'))
+    assert changed != version
+    assert lookup(1, changed, "Qual o endereço?", 'inicio') is None  # prompt mudou
+    assert lookup(1, version, "Qual o endereço?", 'inicio') is None  # entradas antigas descartadas
+
+    m = get_cache_metrics()
+    assert m['exact_hits'] == 1 and m['similar_hits'] == 1 and m['invalidations'] >= 1
+    assert m['latency_saved_ms'] == 2400.0 and m['tokens_saved'] == 1800
+    print(f"   ✅ hit_rate={m['hit_rate']}, latência economizada={m['latency_saved_ms']}ms")
+
+
+def test_ttl():
+    print("🧪 Testando expiração")
+    version = knowledge_version(EMPRESA)
+    store(3, version, "aceita cartão?", 'inicio', "Sim", 800.0)
+    response_cache._entries[3][('inicio', 'aceita cartao')]['created'] -= 10 ** 6
+    assert lookup(3, version, "aceita cartão?", 'inicio') is None
+    print("   ✅ Entradas vencidas não são usadas")
+
+
+if __name__ == "__main__":
+    test_context_free()
+    test_lookup_and_invalidation()
+    test_ttl()
+    print("🎯 Testes do cache de respostas concluídos!")
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Teste de isolamento do cache de respostas de FAQ entre clientes da mesma empresa:
+a resposta guardada vem de um prompt sem dados da conversa do cliente.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from agents.smart_agent import SmartAgent, COMPANY_LLM_INSTRUCTIONS
+
+EMPRESA = {'empresa_id': 41, 'nome': 'Clínica', 'prompt': 'Seja cordial.',
+           'knowledge_json': {'items': [{'key': 'endereco', 'description': 'Rua A, 10'}]}}
+
+
+class _Msg:
+    def __init__(self, content):
+        self.content = content
+
+
+class _Response:
+    def __init__(self, content):
+        self.content = content
+        self.response_metadata = {}
+
+
+class EchoLLM:
+    """Responde com o prompt de sistema: qualquer dado do cliente no prompt apareceria na resposta"""
+    def __init__(self):
+        self.prompts = []
+
+    def invoke(self, messages):
+        self.prompts.append(messages[0].content)
+        return _Response(messages[0].content.replace(COMPANY_LLM_INSTRUCTIONS, ''))  # sem as instruções fixas
+
+
+def _agent(llm, history, summary, extracted):
+    agent = SmartAgent.__new__(SmartAgent)
+    agent.empresa_config = EMPRESA
+    agent.llm = llm
+    agent._awaiting = None
+    agent._conversation_summary = summary
+    agent.memory = type('Memory', (), {'chat_memory': type('Chat', (), {'messages': [_Msg(m) for m in history]})()})()
+    return agent, {'extracted_data': extracted, 'results': {'valor': 180, 'cliente_nome': 'Maria Souza'}}
+
+
+def test_faq_answer_without_customer_data():
+    print("🧪 Testando FAQ em conversas diferentes da mesma empresa")
+    llm = EchoLLM()
+    maria, ctx_maria = _agent(llm, ["Oi, sou a Maria Souza", "Meu CPF é 123.456.789-01"],
+                              "Maria agendou limpeza de pele sexta 15h", {'nome': 'Maria Souza', 'cpf': '12345678901'})
+    joao, ctx_joao = _agent(llm, ["Oi, aqui é o João", "Quero saber de botox"], "João perguntou de botox", {'nome': 'João'})
+
+    first = maria._analyze_with_company_llm("qual o endereço?", ctx_maria)
+    second = joao._analyze_with_company_llm("qual o endereço?", ctx_joao)
+    assert len(llm.prompts) == 1  # segunda conversa servida do cache
+    assert second == first
+    for dado in ('Maria', '123.456.789-01', '12345678901', 'limpeza de pele sexta', '180'):
+        assert dado not in first, dado
+    assert 'Rua A, 10' in first  # knowledge da empresa continua no prompt
+    print("   ✅ Resposta compartilhada não carrega dados do cliente")
+
+
+def test_non_faq_keeps_context():
+    print("🧪 Testando turno comum com contexto do cliente")
+    llm = EchoLLM()
+    maria, ctx = _agent(llm, ["Oi, sou a Maria Souza"], "", {'nome': 'Maria Souza'})
+    reply = maria._analyze_with_company_llm("quero agendar amanhã", ctx)
+    assert 'Maria Souza' in reply  # prompt completo fora do cache
+    print("   ✅ Prompt completo (histórico e dados extraídos) fora do cache")
+
+
+if __name__ == "__main__":
+    test_faq_answer_without_customer_data()
+    test_non_faq_keeps_context()
+    print("🎯 Testes de isolamento do cache de respostas concluídos!")
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Teste das tabelas de regras memoizadas (rules/registry.py)
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from rules.registry import thaw, get_registry_stats
+from rules.trinks_rules import TrinksRules, TrinksFlowType
+from rules.twilio_rules import TwilioRules
+
+
+def test_memoized_and_frozen():
+    print("🧪 Testando tabelas memoizadas e somente leitura")
+    a, b = TrinksRules(), TrinksRules()
+    assert a.get_api_rules() is b.get_api_rules()  # montada uma vez, compartilhada entre instâncias
+    assert a.get_intelligent_match_rules() is b.get_intelligent_match_rules()
+    try:
+        a.get_api_rules()['email_required'] = True
+        raise AssertionError("tabela deveria ser somente leitura")
+    except TypeError:
+        pass
+    copy = thaw(a.get_api_rules())
+    copy['email_required'] = True
+    assert a.get_api_rules()['email_required'] is False
+    assert 'TrinksRules.get_api_rules' in get_registry_stats()['tables']
+    print("   ✅ Mesma tabela em todas as instâncias; thaw() devolve cópia mutável")
+
+
+def test_flow_lookups():
+    print("🧪 Testando consultas por tipo de fluxo")
+    rules = TrinksRules()
+    assert list(rules.get_required_fields(TrinksFlowType.BOOK_APPOINTMENT.value))[:2] == ["professional_id", "service_id"]
+    assert list(rules.get_required_fields('inexistente')) == []
+    assert rules.get_validation_rules('inexistente') == {}
+    # Acessores legados com empresa_config continuam funcionando
+    assert rules.get_availability_check_rules({}) is rules.get_availability_check_rules_expanded()
+    # Legados que nunca chegaram a ser usados continuam desligados
+    assert not rules.get_professional_search_rules({}) and not rules.get_service_detection_rules()
+    assert 'api_endpoint' not in rules.get_reservation_creation_rules({})
+    print("   ✅ Campos/validações por fluxo e acessores de compatibilidade")
+
+
+def test_tenant_overlay():
+    print("🧪 Testando overlay de regras por empresa")
+    rules = TrinksRules()
+    empresa = {'trinks_config': {'rules_overrides': {'business_hours': {'saturday': {'active': False}}}}}
+    custom = rules.get_business_hours(empresa)
+    assert custom['saturday'] == {'start': '09:00', 'end': '17:00', 'active': False}
+    assert custom['monday'] == rules.get_business_hours()['monday']
+    assert rules.get_business_hours()['saturday']['active'] is True  # base intacta
+    assert rules.get_business_hours(empresa) is custom  # overlay também memoizado
+    # Overlay de outra API não afeta a Trinks
+    assert TwilioRules().get_api_rules({'trinks_config': {'rules_overrides': {'api_rules': {'x': 1}}}}) is TwilioRules().get_api_rules()
+    print("   ✅ Overlay mesclado sobre a base, por API e em cache")
+
+
+if __name__ == "__main__":
+    test_memoized_and_frozen()
+    test_flow_lookups()
+    test_tenant_overlay()
+    print("🎯 Testes das tabelas de regras concluídos!")
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Teste dos parsers locais de campos aguardados (slot-filling)
+"""
+
+import sys
+import os
+from datetime import datetime
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.slot_filling import (
+    parse_cpf, parse_time, parse_menu_choice, parse_name, resolve_awaited,
+    build_awaiting, slot_available, CONFIRMATION_MENU, menu_awaiting
+)
+
+
+def test_cpf():
+    print("🧪 Testando CPF")
+    assert parse_cpf("meu cpf é 529.982.247-25") == "52998224725"
+    assert parse_cpf("52998224725") == "52998224725"
+    assert parse_cpf("529.982.247-26") is None  # dígito verificador errado
+    assert parse_cpf("111.111.111-11") is None
+    assert parse_cpf("não sei meu cpf") is None
+    print("   ✅ CPF com e sem máscara, dígitos verificadores validados")
+
+
+def test_time():
+    print("🧪 Testando horário")
+    cases = {
+        "15:30": "15:30",
+        "pode ser às 15h": "15:00",
+        "as 9": "09:00",
+        "15h30 tá ótimo": "15:30",
+        "3 da tarde": "15:00",
+        "10 da manhã": "10:00",
+        "meio-dia": "12:00",
+        "14": "14:00",
+        "16 horas": "16:00",
+    }
+    for text, expected in cases.items():
+        assert parse_time(text) == expected, (text, parse_time(text))
+    assert parse_time("entre 14h e 16h") is None  # ambíguo
+    assert parse_time("dia 12/05") is None
+    assert parse_time("qualquer horário") is None
+    assert parse_time("2") is None
+    print(f"   ✅ {len(cases)} formatos reconhecidos, ambíguos ignorados")
+
+
+def test_menu():
+    print("🧪 Testando menu 1/2/3")
+    assert parse_menu_choice("1", CONFIRMATION_MENU) == "confirmar"
+    assert parse_menu_choice(" 2. ", CONFIRMATION_MENU) == "cancelar"
+    assert parse_menu_choice("3", CONFIRMATION_MENU) == "remarcar"
+    assert parse_menu_choice("4", CONFIRMATION_MENU) is None
+    assert parse_menu_choice("quero cancelar", CONFIRMATION_MENU) == "cancelar"
+    assert parse_menu_choice("Confirmo!", CONFIRMATION_MENU) == "confirmar"
+    assert parse_menu_choice("não quero cancelar", CONFIRMATION_MENU) is None
+    assert parse_menu_choice("1 pessoa a mais vai comigo, posso levar?", CONFIRMATION_MENU) is None
+    print("   ✅ Dígitos e palavras-chave, sem negação")
+
+
+def test_name():
+    print("🧪 Testando nome")
+    assert parse_name("maria da silva") == "Maria da Silva"
+    assert parse_name("Meu nome é João Souza") == "João Souza"
+    assert parse_name("qual o valor?") is None
+    assert parse_name("não tenho") is None
+    assert parse_name("Maria") is None  # nome completo
+    print("   ✅ Nomes curtos aceitos, perguntas recusadas")
+
+
+def test_resolve_and_awaiting():
+    print("🧪 Testando estado aguardado")
+    awaiting = build_awaiting('agendar_consulta', ['cpf', 'nome'], {'data': '2025-01-10', 'horario': '15:00'})
+    assert awaiting == {'fields': ['cpf', 'nome'], 'intent': 'agendar_consulta'}
+    assert resolve_awaited(awaiting, "Ana Lima 529.982.247-25") == {'cpf': '52998224725', 'nome': 'Ana Lima'}
+    assert resolve_awaited(awaiting, "pode ser amanhã?") == {}
+    # Pedir 'profissional' depende do LLM; data/horário só em agendamentos e horário só com data conhecida
+    assert build_awaiting('agendar_consulta', ['profissional'], {}) is None
+    assert build_awaiting('cancelar_consulta', ['data'], {}) is None
+    data_awaiting = build_awaiting('agendar_consulta', ['data'], {})
+    assert data_awaiting == {'fields': ['data'], 'intent': 'agendar_consulta'}
+    assert 'data' in resolve_awaited(data_awaiting, "pode ser amanhã às 15h")
+    assert resolve_awaited(data_awaiting, "tem algum horário com a Ana amanhã?") == {}
+    # "hoje às 9" enviado às 10h: só a data é resolvida, o horário volta a ser pedido
+    now = datetime(2025, 1, 15, 10, 0)
+    assert resolve_awaited(data_awaiting, "hoje às 9", now=now) == {'data': '2025-01-15'}
+    assert resolve_awaited({'fields': ['data', 'horario']}, "hoje às 9", now=now) == {'data': '2025-01-15'}
+    assert resolve_awaited(data_awaiting, "hoje às 11", now=now) == {'data': '2025-01-15', 'horario': '11:00'}
+    assert build_awaiting('agendar_consulta', ['horario'], {}) is None
+    assert build_awaiting('agendar_consulta', ['horario'], {'data': '2025-01-10'})['fields'] == ['horario']
+    menu = menu_awaiting('confirmacao_lembrete', CONFIRMATION_MENU)
+    assert resolve_awaited(menu, "2") == {'menu': 'cancelar'}
+    assert slot_available({'available_slots': ['14:00', '15:00']}, '15:00')
+    assert slot_available({'by_professional': [{'slots': ['09:00:00']}]}, '09:00')
+    assert not slot_available({'available_slots': ['14:00']}, '15:00')
+    print("   ✅ Estado registrado apenas para campos com parser local")
+
+
+if __name__ == "__main__":
+    test_cpf()
+    test_time()
+    test_menu()
+    test_name()
+    test_resolve_and_awaiting()
+    print("🎯 Testes de slot-filling concluídos!")
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Teste do executor de planos por grafo de dependências (services/step_graph.py)
+"""
+
+import sys
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services import step_graph
+from services.step_graph import StepSpec, build_dependencies, build_waves, execute_plan
+
+# Mesmas declarações de TrinksRules.get_step_specs() para os passos do teste
+SPECS = {
+    'buscar_profissional': StepSpec('buscar_profissional', frozenset({'profissional', 'procedimento'}),
+                                    frozenset({'profissional_id', 'temp_professional_cache'})),
+    'buscar_servico': StepSpec('buscar_servico', frozenset({'procedimento'}), frozenset({'servico_id', 'valor'})),
+    'verificar_disponibilidade': StepSpec('verificar_disponibilidade',
+                                          frozenset({'data', 'profissional_id', 'servico_id', 'valor'}),
+                                          frozenset({'valor', 'temp_professional_cache'})),
+    'criar_reserva': StepSpec('criar_reserva', side_effect=True),
+}
+
+FAKE_STEPS = {
+    'buscar_profissional': (0.2, {'profissional_id': 7}),
+    'buscar_servico': (0.2, {'servico_id': 3, 'valor': 150}),
+    'verificar_disponibilidade': (0.05, {}),
+    'criar_reserva': (0.0, {}),
+}
+
+
+def run_fake(action, data):
+    delay, fields = FAKE_STEPS[action]
+    time.sleep(delay)
+    if action == 'verificar_disponibilidade' and not (data.get('profissional_id') and data.get('servico_id')):
+        return {'status': 'erro', 'error': 'ids ausentes'}
+    return {'status': 'ok', 'cache_instructions': {'update_fields': fields}}
+
+
+def apply(data):
+    def _apply(action, result):
+        data.update(result.get('cache_instructions', {}).get('update_fields', {}))
+    return _apply
+
+
+def is_error(result):
+    return result.get('status') == 'erro'
+
+
+def test_waves():
+    print("🧪 Testando ondas do plano")
+    steps = ['buscar_profissional', 'buscar_servico', 'verificar_disponibilidade', 'criar_reserva']
+    waves = build_waves(build_dependencies(steps, SPECS))
+    assert waves == [[0, 1], [2], [3]], waves
+    # Passo sem declaração é barreira
+    assert build_waves(build_dependencies(['buscar_servico', 'listar_agendamentos', 'buscar_profissional'], SPECS)) == [[0], [1], [2]]
+    print("   ✅ Buscas independentes na mesma onda; disponibilidade e reserva depois")
+
+
+def test_parallel_execution():
+    print("🧪 Testando execução paralela e merge determinístico")
+    step_graph._executor = ThreadPoolExecutor(max_workers=4)
+    data = {'profissional': 'ana', 'procedimento': 'limpeza', 'data': '2025-01-17'}
+    started = time.perf_counter()
+    plan = execute_plan(['buscar_profissional', 'buscar_servico', 'verificar_disponibilidade'],
+                        SPECS, data, run_fake, apply(data), is_error)
+    elapsed = time.perf_counter() - started
+    assert elapsed < 0.38, elapsed  # sequencial seria ~0.45s
+    assert plan['failed'] is None
+    assert plan['executed'] == ['buscar_profissional', 'buscar_servico', 'verificar_disponibilidade']
+    assert list(plan['results']) == plan['executed']
+    assert data['profissional_id'] == 7 and data['servico_id'] == 3
+    assert plan['critical_path'][-1] == 'verificar_disponibilidade' and len(plan['critical_path']) == 2
+    print(f"   ✅ {elapsed * 1000:.0f}ms | caminho crítico: {plan['critical_path']}")
+
+
+def test_stop_on_error():
+    print("🧪 Testando parada no primeiro erro")
+    data = {'data': '2025-01-17'}
+    plan = execute_plan(['verificar_disponibilidade', 'criar_reserva'], SPECS, data, run_fake, apply(data), is_error)
+    assert plan['failed'] == 'verificar_disponibilidade'
+    assert list(plan['results']) == ['verificar_disponibilidade']
+    metrics = step_graph.get_step_metrics()
+    assert metrics['steps']['verificar_disponibilidade']['calls'] == 2
+    print("   ✅ Reserva não executada após erro na disponibilidade")
+
+
+def test_exception_is_step_error():
+    print("🧪 Testando exceção de passo em onda única e em onda paralela")
+
+    def run_raising(action, data):
+        if action in ('buscar_servico', 'verificar_disponibilidade'):
+            raise RuntimeError(f"falha em {action}")
+        return run_fake(action, data)
+
+    for steps in (['verificar_disponibilidade', 'criar_reserva'], ['buscar_profissional', 'buscar_servico', 'criar_reserva']):
+        data = {'profissional': 'ana', 'procedimento': 'limpeza', 'data': '2025-01-17'}
+        plan = execute_plan(steps, SPECS, data, run_raising, apply(data), is_error)
+        assert plan['failed'] in ('verificar_disponibilidade', 'buscar_servico'), plan
+        assert plan['results'][plan['failed']] == {'status': 'erro', 'error': f"falha em {plan['failed']}"}
+        assert 'criar_reserva' not in plan['results']
+    print("   ✅ Mesmo resultado de erro com um ou vários passos na onda")
+
+
+if __name__ == "__main__":
+    test_waves()
+    test_parallel_execution()
+    test_stop_on_error()
+    test_exception_is_step_error()
+    print("🎯 Testes do executor de planos concluídos!")
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Teste da validação de saídas estruturadas dos LLMs
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.structured_output import (
+    IntentResult, NextSteps, MatchResult, ExtractedData, parse, dump, record_fallback, get_structured_metrics
+)
+
+
+class FakeResponse:
+    def __init__(self, content):
+        self.content = content
+
+
+def test_intent_and_extraction():
+    print("🧪 Testando intenção e extração")
+    r = parse('t.intent', FakeResponse('{"intent": "agendar_consulta", "extracted": {"data": "2025-01-16", "cpf": 52998224725}}'), IntentResult)
+    assert r.intent == 'agendar_consulta' and r.extracted['data'] == '2025-01-16' and r.cache_instructions == {}
+    r = parse('t.intent', FakeResponse('{"intent": null, "extracted": null}'), IntentResult)
+    assert r.intent == 'verificar_informacoes' and r.extracted == {}
+    data = dump(parse('t.extract', FakeResponse('{"profissional": "Ana", "horario": null, "observacao": "x"}'), ExtractedData))
+    assert data == {'profissional': 'Ana', 'horario': None, 'observacao': 'x'}  # só chaves devolvidas, extras preservadas
+    print("   ✅ Defaults, nulos e chaves extras tratados pelo schema")
+
+
+def test_repair_and_failures():
+    print("🧪 Testando recorte único e falhas")
+    r = parse('t.match', FakeResponse('```json\n{"id": 12, "nome": "Ana", "confianca": "ALTA"}\n```'), MatchResult)
+    assert r.id == 12 and r.nome == 'Ana'
+    assert parse('t.match', FakeResponse('não encontrei'), MatchResult) is None
+    assert parse('t.match', FakeResponse('{"id": {"x": 1}}'), MatchResult) is None
+    steps = parse('t.steps', FakeResponse('{"action": ["buscar_servico"], "business_rules": "regra"}'), NextSteps)
+    assert steps.action == ['buscar_servico'] and steps.business_rules == ['regra'] and steps.missing_data == []
+    record_fallback('t.match')
+    m = get_structured_metrics()['t.match']
+    assert m == {'repaired': 1, 'failed': 2, 'fallback': 1, 'failure_rate': round(2 / 3, 4)}
+    print(f"   ✅ Métricas: {m}")
+
+
+if __name__ == "__main__":
+    test_intent_and_extraction()
+    test_repair_and_failures()
+    print("🎯 Testes de saídas estruturadas concluídos!")
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Teste do parser local de datas/horários em pt-BR
+"""
+
+import sys
+import os
+from datetime import datetime
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.temporal_parser import parse_temporal, temporal_facts, apply_temporal_facts
+
+# Quarta-feira, 15/01/2025, 10:30 (horário de Brasília)
+NOW = datetime(2025, 1, 15, 10, 30)
+
+
+def _data(text):
+    return parse_temporal(text, now=NOW)['data']
+
+
+def test_relative_days():
+    print("🧪 Testando hoje/amanhã/daqui a N dias")
+    assert _data("hoje") == "2025-01-15"
+    assert _data("Amanhã") == "2025-01-16"
+    assert _data("depois de amanhã") == "2025-01-17"
+    assert _data("daqui a 3 dias") == "2025-01-18"
+    assert _data("daqui a uma semana") == "2025-01-22"
+    print("   ✅ Datas relativas resolvidas")
+
+
+def test_weekdays():
+    print("🧪 Testando dias da semana")
+    assert _data("sexta") == "2025-01-17"
+    assert _data("sexta que vem") == "2025-01-17"
+    assert _data("próxima segunda-feira") == "2025-01-20"
+    assert _data("quarta") == "2025-01-22"  # hoje é quarta: próxima ocorrência
+    assert _data("nesta quarta") == "2025-01-15"
+    assert _data("terça da semana que vem") == "2025-01-21"
+    assert _data("sábado") == "2025-01-18"
+    print("   ✅ Dias da semana resolvidos para a próxima ocorrência")
+
+
+def test_explicit_dates():
+    print("🧪 Testando datas explícitas")
+    assert _data("dia 20") == "2025-01-20"
+    assert _data("dia 12") == "2025-02-12"  # já passou neste mês
+    assert _data("dia 31 de janeiro") == "2025-01-31"
+    assert _data("30/01") == "2025-01-30"
+    assert _data("10/01") == "2026-01-10"  # já passou neste ano
+    assert _data("05/03/2025") == "2025-03-05"
+    assert _data("12 de maio") == "2025-05-12"
+    assert _data("31/02") is None
+    assert _data("dia 12 ou dia 20") is None  # ambíguo
+    print("   ✅ Datas numéricas e por extenso resolvidas")
+
+
+def test_time_and_period():
+    print("🧪 Testando horários e períodos")
+    r = parse_temporal("amanhã às 15h", now=NOW)
+    assert (r['data'], r['horario']) == ("2025-01-16", "15:00")
+    assert r['somente_data_hora']
+    r = parse_temporal("sexta depois do almoço", now=NOW)
+    assert (r['data'], r['periodo'], r['a_partir_de']) == ("2025-01-17", "tarde", "13:00")
+    r = parse_temporal("dia 20 às 9 da manhã", now=NOW)
+    assert (r['data'], r['horario']) == ("2025-01-20", "09:00")
+    r = parse_temporal("hoje às 9", now=NOW)
+    assert r.get('horario_passado')
+    r = parse_temporal("quanto custa a limpeza de pele amanhã?", now=NOW)
+    assert r['data'] == "2025-01-16" and not r['somente_data_hora']
+    assert parse_temporal("15", now=NOW)['horario'] is None
+    assert parse_temporal("meu cpf é 529.982.247-25", now=NOW)['data'] is None
+    print("   ✅ Horários, períodos e respostas só de data/hora")
+
+
+def test_facts():
+    print("🧪 Testando fatos para o LLM")
+    parsed = parse_temporal("sexta às 14:30", now=NOW)
+    text = temporal_facts(parsed, now=NOW)
+    assert "15/01/2025 (quarta-feira)" in text and "data = 2025-01-17 (sexta-feira)" in text and "horario = 14:30" in text
+    extracted = apply_temporal_facts({'data': '2025-17-01', 'profissional': 'Ana'}, parsed)
+    assert extracted == {'data': '2025-01-17', 'profissional': 'Ana', 'horario': '14:30'}
+    # "hoje às 9" depois das 9: horário descartado e sinalizado para o LLM
+    parsed = parse_temporal("hoje às 9", now=NOW)
+    assert "09:00 de hoje JÁ PASSOU" in temporal_facts(parsed, now=NOW)
+    extracted = apply_temporal_facts({'data': '2025-01-15', 'horario': '09:00', 'profissional': 'Ana'}, parsed)
+    assert extracted == {'data': '2025-01-15', 'profissional': 'Ana'}
+    print("   ✅ Datas resolvidas prevalecem sobre a saída do LLM; horário passado de hoje descartado")
+
+
+if __name__ == "__main__":
+    test_relative_days()
+    test_weekdays()
+    test_explicit_dates()
+    test_time_and_period()
+    test_facts()
+    print("🎯 Testes do parser de datas concluídos!")
@@ -14,6 +14,9 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from rules.trinks_rules import TrinksRules
+from services.llm_gateway import get_llm, resolve_api_key, INTENT, EXTRACTION, MATCHING
+from services.structured_output import JSON_MODE, ExtractedData, MatchResult, parse, dump, record_fallback
+from services.prompt_templates import register, render, render_catalog, catalog_version
 from .api_tools import APITools
 import requests
 from langchain.schema import SystemMessage, HumanMessage, AIMessage
@@ -26,17 +29,278 @@ except Exception:
 import math
 from difflib import SequenceMatcher
 
-# Corrigir importação deprecated do OpenAI
-try:
-    from langchain_openai import OpenAI
-except ImportError:
-    try:
-        from langchain_community.llms import OpenAI
-    except ImportError:
-        from langchain.llms import OpenAI
-
 logger = logging.getLogger(__name__)
 
+# Instruções fixas da extração de dados (prefixo estável do prompt, reaproveitado em cache pelo provedor)
+DATA_EXTRACTION_INSTRUCTIONS = """Você é um assistente especializado em extrair informações de mensagens de WhatsApp para agendamento no sistema Trinks.
+
+⚠️ REGRA CRÍTICA: Você DEVE responder APENAS com o JSON puro, sem repetir o histórico, sem explicações, sem texto adicional.
+
+CAMPOS PARA EXTRAIR:
+- profissional: Nome do profissional mencionado (deve existir no Trinks)
+- procedimento: Nome do procedimento/tratamento (deve existir no Trinks)
+- data: Data mencionada (formato YYYY-MM-DD, SEMPRE futura, mínimo 2h de antecedência; se o contexto trouxer DATAS/HORÁRIOS JÁ RESOLVIDOS, use exatamente esses valores)
+- horario: Horário mencionado (formato HH:MM, dentro do horário de funcionamento)
+- servico_id: ID do serviço mencionado (deve existir no Trinks)
+- profissional_id: ID do profissional mencionado (deve existir no Trinks)
+- cpf: CPF do cliente mencionado
+- client_id: ID do cliente mencionado (deve existir no Trinks)
+- nome: Nome que o cliente informou no whatsapp
+- email: Email que o cliente informou no whatsapp
+
+REGRAS CRÍTICAS DE PRIORIDADE E CONTEXTO:
+1. ✅ A MENSAGEM ATUAL TEM PRIORIDADE sobre qualquer dado do histórico/cache
+2. ✅ Se a mensagem atual mencionar nova data, use ESSA nova data e mantenha os demais campos do contexto
+3. ✅ Se a mensagem atual mencionar novo horário, use ESSE novo horário e mantenha os demais campos do contexto
+4. ✅ Se a mensagem atual mencionar novo profissional, use ESSE novo profissional e mantenha os demais campos do contexto
+5. ✅ Se a mensagem atual mencionar novo procedimento, use ESSE novo procedimento e mantenha os demais campos do contexto
+6. ✅ Use o histórico apenas para preencher campos NÃO mencionados na mensagem atual
+
+REGRAS ESPECÍFICAS PARA EXTRAÇÃO DE NOMES:
+1. 🔍 Se a mensagem contém APENAS um nome (ex: "Ruan Gimenes Hey"), SEMPRE extraia como nome do cliente
+2. 🔍 Se a mensagem contém frases como "meu nome é", "sou", "chamo-me", extraia o nome
+3. 🔍 Nomes podem ter 1, 2, 3 ou mais palavras - preserve a formatação original
+4. 🔍 Se a mensagem não contém contexto de agendamento, mas contém nomes, extraia como nome do cliente
+5. 🔍 Preserve acentos, espaços e formatação original dos nomes
+
+EXEMPLOS DE PRIORIDADE DA MENSAGEM ATUAL:
+- Histórico: "procedimento: AAA TESTE, data: 29/08, servico_id: 1234567890, profissional_id: 1234567890"
+- Nova mensagem: "E para dia 01/09?"
+- Resultado: {"procedimento": "AAA TESTE", "data": "2025-09-01"} ← PROCEDIMENTO PRESERVADO!
+- servico_id: 1234567890
+- profissional_id: 1234567890
+
+- Histórico: "procedimento: AAA TESTE, data: 29/08, profissional: Maria"
+- Nova mensagem: "E às 15h?"
+- Resultado: {"procedimento": "AAA TESTE", "data": "2025-08-29", "profissional": "Maria", "horario": "15:00"} ← TUDO PRESERVADO!
+
+- Histórico: "profissional: Amabile, procedimento: AAA TESTE, data: 29/08, servico_id: 1234567890, profissional_id: 1234567890"
+- Nova mensagem: "troca para a Geraldine dia 01/09"
+- Resultado: {"profissional": "Geraldine", "procedimento": "AAA TESTE", "data": "2025-09-01", "servico_id": "1234567890", "profissional_id": novo id baseado na busca} ← NOVOS CAMPOS DA MENSAGEM ATUAL PRIORITÁRIOS!
+
+EXEMPLOS ESPECÍFICOS DE EXTRAÇÃO DE NOMES:
+- Mensagem: "Meu nome é João Silva" → {"nome": "João Silva"}
+- Mensagem: "Sou a Maria Santos" → {"nome": "Maria Santos"}
+- Mensagem: "Ruan Gimenes Hey" → {"nome": "Ruan Gimenes Hey"}
+- Mensagem: "Ana Paula Costa" → {"nome": "Ana Paula Costa"}
+- Mensagem: "Carlos Eduardo" → {"nome": "Carlos Eduardo"}
+- Mensagem: "João" → {"nome": "João"}
+- Mensagem: "Maria" → {"nome": "Maria"}
+
+REGRAS PARA EXTRAÇÃO DE NOMES:
+1. Se a mensagem contém APENAS um nome (sem contexto de agendamento), extraia como nome do cliente
+2. Se a mensagem contém "meu nome é", "sou", "chamo-me", extraia como nome do cliente
+3. Se a mensagem contém apenas palavras que parecem nomes próprios, extraia como nome do cliente
+4. Nomes podem ter 1, 2, 3 ou mais palavras (ex: "João", "João Silva", "João Silva Santos")
+5. Preserve acentos e formatação original do nome
+
+EXEMPLOS ESPECÍFICOS DE EXTRAÇÃO DE CPF:
+- Mensagem: "Meu CPF é 123.456.789-00" → {"cpf": "12345678900"}
+- Mensagem: "CPF 987.654.321-00" → {"cpf": "98765432100"}
+- Mensagem: "05286655963" → {"cpf": "05286655963"}
+
+EXEMPLOS ESPECÍFICOS DE EXTRAÇÃO DE EMAIL:
+- Mensagem: "meu email é joao@email.com" → {"email": "joao@email.com"}
+- Mensagem: "maria.santos@gmail.com" → {"email": "maria.santos@gmail.com"}
+
+INSTRUÇÕES:
+1. Analise TODAS as mensagens do histórico em ordem cronológica
+2. Identifique o contexto estabelecido (procedimento, profissional, etc.)
+3. Preserve esse contexto APENAS onde a mensagem atual NÃO trouxe novos valores ou nao tiver conectado (Ex: Profissional ID e profissioanl | Servico ID e servico)
+4. Atualize campos que foram explicitamente mencionados na mensagem atual (data/profissional/procedimento/horário)
+5. Use o histórico para preencher somente campos ausentes na mensagem atual
+6. NUNCA em hipotee alguma inclua algo a mais na sua saida que não seja o JSON puro assim como tem nas regras de formatação
+
+REGRAS DE VALIDAÇÃO:
+1. DATAS: SEMPRE devem ser FUTURAS em relação à data atual
+2. Se a mensagem mencionar "dia 29/08", interprete como "29/08/2025" (ano atual)
+3. Se a data mencionada for passada, use null
+4. PROCEDIMENTOS: SEMPRE extraia o nome mencionado, mesmo com erros de digitação
+5. Se mencionar "AAA TEste", extraia exatamente isso como procedimento
+
+FORMATAÇÃO OBRIGATÓRIA:
+- NUNCA use prefixos como "System:", "Resposta:", "JSON:", "Human:", etc.
+- NUNCA adicione texto explicativo antes ou depois do JSON
+- NUNCA use aspas duplas no texto, apenas no JSON
+- SEMPRE extraia procedimentos mencionados, mesmo com erros de digitação
+- NUNCA repita a mensagem do usuário
+- NUNCA adicione "Human:" ou qualquer prefixo
+- NUNCA inclua o histórico da conversa na resposta
+
+EXEMPLO DE RESPOSTA CORRETA:
+{
+    "profissional": "Maria",
+    "procedimento": "AAA TESTE", 
+    "data": "2025-09-01",
+    "horario": null,
+    "servico_id": "1234567890",
+    "profissional_id": "1234567890"
+}
+
+IMPORTANTE: 
+- RESPONDA APENAS o JSON, sem "System:", sem "Resposta:", sem nenhum prefixo
+- O JSON deve começar diretamente com { e terminar com }
+- SEMPRE preserve o contexto da conversa anterior
+- NUNCA perca informações já estabelecidas
+- NUNCA repita o histórico da conversa
+- NUNCA adicione texto explicativo
+- NUNCA inclua a mensagem do usuário
+- APENAS o JSON puro, nada mais
+
+FORMATO DE RESPOSTA (JSON):
+{
+    "profissional": "nome ou null",
+    "procedimento": "nome ou null", 
+    "data": "YYYY-MM-DD ou null",
+    "horario": "HH:MM ou null"
+}
+
+RESPONDA APENAS o JSON acima, sem nenhum texto adicional, sem aspas, sem prefixos."""
+
+
+# Campos dos catálogos enviados aos prompts de match (cadastro completo não vai ao LLM)
+PROFESSIONAL_CATALOG_FIELDS = ('id', 'nome', 'apelido', 'especialidade', 'especialidades')
+SERVICE_NAME_FIELDS = ('nome',)
+SERVICE_CATALOG_FIELDS = ('id', 'nome', 'descricao', 'categoria', 'duracaoEmMinutos', 'preco')
+
+register('trinks_tools.match_professional', """Você é um assistente especializado em identificar profissionais de saúde no sistema Trinks.
+
+TAREFA: Identificar qual profissional da lista corresponde ao nome mencionado pelo usuário.
+
+LISTA DE PROFISSIONAIS DISPONÍVEIS:
+{catalogo}
+
+CARACTERÍSTICAS DO TRINKS:
+- Profissionais podem ter apelidos ou nomes abreviados
+- Especialidades são importantes para identificação
+- Nomes podem ter variações de acentuação
+- Sistema brasileiro com nomes em português
+
+REGRAS CRÍTICAS:
+1. NUNCA invente IDs, nomes ou dados que não existam na lista
+2. SEMPRE use APENAS dados reais da lista fornecida
+3. Se não encontrar match, retorne null para id e nome
+4. NUNCA crie profissionais fictícios
+
+INSTRUÇÕES:
+1. Analise o nome procurado e compare com a lista
+2. Considere variações, apelidos e especialidades
+3. Retorne o profissional com maior confiança de match
+4. Se houver ambiguidade, escolha o mais provável
+5. Se não encontrar match, retorne null (não invente dados)
+
+FORMATAÇÃO OBRIGATÓRIA:
+- NUNCA use prefixos como "System:", "Resposta:", "JSON:", etc.
+- NUNCA adicione texto explicativo antes ou depois do JSON
+- NUNCA use aspas duplas no texto, apenas no JSON
+- NUNCA invente dados - use apenas os dados reais da lista
+
+EXEMPLO DE RESPOSTA CORRETA:
+{{
+    "id": "12345",
+    "nome": "Dr. João Silva",
+    "confianca": "ALTA",
+    "razao": "Nome exato encontrado na lista"
+}}
+
+EXEMPLO DE RESPOSTA INCORRETA:
+System: {{
+    "id": "12345",
+    "nome": "Dr. João Silva",
+    "confianca": "ALTA",
+    "razao": "Nome exato encontrado na lista"
+}}
+
+IMPORTANTE: 
+- RESPONDA APENAS o JSON, sem "System:", sem "Resposta:", sem nenhum prefixo
+- O JSON deve começar diretamente com {{ e terminar com }}
+- Se usar qualquer prefixo, a resposta será inválida e causará erro
+- NUNCA invente dados - use apenas os dados reais da lista
+
+FORMATO DE RESPOSTA (JSON):
+{{
+    "id": "ID_REAL_DA_LISTA ou null",
+    "nome": "NOME_REAL_DA_LISTA ou null",
+    "confianca": "ALTA|MEDIA|BAIXA",
+    "razao": "Explicação do match considerando características do Trinks"
+}}
+
+RESPONDA APENAS o JSON acima, sem nenhum texto adicional, sem aspas, sem prefixos.""", tenant_fields=('catalogo',))
+
+register('trinks_tools.match_service', """Você é um assistente especializado em identificar serviços de saúde no sistema Trinks.
+
+TAREFA: Identificar qual serviço da lista corresponde ao nome mencionado pelo usuário.
+
+LISTA DE NOMES DE SERVIÇOS DISPONÍVEIS:
+{catalogo}
+
+INSTRUÇÕES:
+1. Analise o nome procurado e identifique palavras-chave
+2. Procure por serviços que contenham essas palavras-chave
+3. Considere correspondências parciais
+4. SEMPRE tente encontrar um match, mesmo que não seja perfeito
+
+REGRAS CRÍTICAS:
+1. NUNCA invente nomes que não existam na lista
+2. Use correspondência parcial - não exija match exato
+3. Se não encontrar match, retorne null para nome
+4. NUNCA crie serviços fictícios
+
+FORMATAÇÃO OBRIGATÓRIA:
+- NUNCA use prefixos como "System:", "Resposta:", "JSON:", etc.
+- NUNCA adicione texto explicativo antes ou depois do JSON
+- NUNCA use aspas duplas no texto, apenas no JSON
+- NUNCA invente dados - use apenas os dados reais da lista
+
+EXEMPLO DE RESPOSTA CORRETA:
+{{
+    "nome": "AAA TEste",
+    "confianca": "ALTA",
+    "razao": "Match exato encontrado na lista"
+}}
+
+EXEMPLO DE RESPOSTA INCORRETA:
+System: {{
+    "nome": "AAA TEste",
+    "confianca": "ALTA",
+    "razao": "Match exato encontrado na lista"
+}}
+
+IMPORTANTE: 
+- RESPONDA APENAS o JSON, sem "System:", sem "Resposta:", sem nenhum prefixo
+- O JSON deve começar diretamente com {{ e terminar com }}
+- Se usar qualquer prefixo, a resposta será inválida e causará erro
+- NUNCA invente dados - use apenas os dados reais da lista
+
+FORMATO DE RESPOSTA (JSON):
+{{
+    "nome": "NOME_REAL_DA_LISTA ou null",
+    "confianca": "ALTA|MEDIA|BAIXA",
+    "razao": "Explicação do match"
+}}
+
+RESPONDA APENAS o JSON acima, sem nenhum texto adicional, sem aspas, sem prefixos.""", tenant_fields=('catalogo',))
+
+register('trinks_tools.match_procedimento', """Você é um assistente especializado em fazer match entre procedimentos médicos mencionados e serviços cadastrados.
+
+SERVIÇOS DISPONÍVEIS (um por linha):
+{catalogo}
+
+INSTRUÇÕES:
+1. Analise o procedimento mencionado pelo usuário
+2. Compare com os serviços disponíveis
+3. Identifique o serviço que melhor corresponde
+4. Considere sinônimos, variações e abreviações
+5. Retorne APENAS o JSON do serviço escolhido (com o campo "id")
+
+PROCEDIMENTO MENCIONADO PELO USUÁRIO: "{procedimento}"
+
+RESPOSTA (apenas JSON):""", tenant_fields=('catalogo',))
+
+register('trinks_tools.match_request', """NOME PROCURADO: "{nome_procurado}"
+Encontre o {alvo} mais adequado para: {nome_procurado}""")
+
+
 class TrinksIntelligentTools:
     """Ferramentas inteligentes para operações com API Trinks"""
     
@@ -45,27 +309,19 @@ class TrinksIntelligentTools:
         self.empresa_config = empresa_config
         # Inicializa as regras do Trinks diretamente
         self.trinks_rules = TrinksRules() if empresa_config else None
-        # Inicializa o LLM com configuração dinâmica
-        self.llm = None  # Será configurado quando necessário
     
-    def _get_llm(self, empresa_config: Dict[str, Any] = None):
-        """Configura e retorna o LLM com a API key da empresa"""
-        if self.llm is None:
-            # Usar empresa_config passado ou armazenado na instância
-            config = empresa_config or self.empresa_config
-            if not config:
-                raise ValueError("Configuração da empresa não fornecida")
-            
-            # Buscar a chave OpenAI da configuração da empresa
-            openai_key = config.get('openai_config', {}).get('openai_key')
-            if not openai_key:
-                raise ValueError("OpenAI API key não configurada para esta empresa")
-            
-            self.llm = OpenAI(
-                api_key=openai_key,
-                temperature=0.7
-            )
-        return self.llm
+    def _get_llm(self, empresa_config: Dict[str, Any] = None, task: str = EXTRACTION):
+        """Retorna o LLM da etapa `task` com a API key da empresa (modelo pela política do gateway)"""
+        # Usar empresa_config passado ou armazenado na instância
+        config = empresa_config or self.empresa_config
+        if not config:
+            raise ValueError("Configuração da empresa não fornecida")
+        
+        # Buscar a chave OpenAI da configuração da empresa
+        if not resolve_api_key(config):
+            raise ValueError("OpenAI API key não configurada para esta empresa")
+        
+        return get_llm(task, config, temperature=0.2)
     
     def _is_trinks_api(self, empresa_config: Dict[str, Any]) -> bool:
         """Verifica se é API Trinks"""
@@ -90,6 +346,18 @@ class TrinksIntelligentTools:
             # Limpar CPF (remover pontos e traços)
             cpf_limpo = re.sub(r'[^\d]', '', cpf)
             
+            # Cliente já resolvido antes (cache de identidade) dispensa a busca na API
+            from services.client_identity import lookup as lookup_identity, remember as remember_identity
+            identidade = lookup_identity(empresa_config, cpf=cpf_limpo)
+            if identidade and identidade['fresh']:
+                cliente = {"id": identidade['cliente_id'], "nome": identidade.get('nome'), "cpf": cpf_limpo}
+                return {
+                    "found": True,
+                    "cliente": cliente,
+                    "from_cache": True,
+                    "message": f"Cliente encontrado: {cliente.get('nome') or 'N/A'}"
+                }
+            
             # Preparar parâmetros da busca
             search_params = {
                 "cpf": cpf_limpo,
@@ -119,6 +387,7 @@ class TrinksIntelligentTools:
             if result_data and isinstance(result_data, dict):
                 if 'data' in result_data and result_data['data']:
                     cliente = result_data['data'][0] if isinstance(result_data['data'], list) else result_data['data']
+                    remember_identity(empresa_config, cliente.get('id'), cliente.get('nome'), cpf=cpf_limpo)
                     return {
                         "found": True,
                         "cliente": cliente,
@@ -126,6 +395,7 @@ class TrinksIntelligentTools:
                     }
                 elif 'items' in result_data and result_data['items']:
                     cliente = result_data['items'][0] if isinstance(result_data['items'], list) else result_data['items']
+                    remember_identity(empresa_config, cliente.get('id'), cliente.get('nome'), cpf=cpf_limpo)
                     return {
                         "found": True,
                         "cliente": cliente,
@@ -385,30 +655,16 @@ class TrinksIntelligentTools:
             return None
 
     def _get_working_windows(self, data: str, empresa_config: Dict[str, Any], professional_id: Optional[str]) -> Optional[List[Dict[str, str]]]:
-        """Busca janelas reais de trabalho via /agendamentos/profissionais/{data}."""
+        """Busca janelas reais de trabalho via /agendamentos/profissionais/{data}.
+
+        Lê do cache de agenda do dia (services/availability_cache), que pode já ter
+        sido preenchido pelo prefetch especulativo do turno.
+        """
         try:
             if not data:
                 return None
-            # Fallback seguro de base_url
-            safe_base_url = (
-                empresa_config.get('trinks_base_url')
-                or (empresa_config.get('trinks_config', {}) or {}).get('base_url')
-                or 'https://api.trinks.com/v1'
-            )
-            headers = {
-                'X-API-KEY': empresa_config.get("trinks_api_key", ""),
-                'estabelecimentoId': empresa_config.get('trinks_estabelecimento_id', ''),
-                'Content-Type': 'application/json'
-            }
-            params = {}
-            if professional_id:
-                params['profissionalId'] = professional_id
-            import requests
-            resp = requests.get(f"{safe_base_url}/agendamentos/profissionais/{data}", headers=headers, params=params, timeout=30)
-            if resp.status_code == 200:
-                payload = resp.json()
-                return payload.get('data') or payload.get('items') or []
-            return None
+            from services.availability_cache import get_day
+            return get_day(empresa_config, data, professional_id)
         except Exception as e:
             logger.warning(f"Falha ao obter janelas de trabalho: {e}")
             return None
@@ -557,10 +813,8 @@ class TrinksIntelligentTools:
                     if resolved:
                         professional_id = resolved
 
-            # 2. Buscar agendamentos existentes para a data (filtrando por profissional se houver)
-            existing_appointments = self._get_existing_appointments(data, empresa_config, professional_id)
-            if existing_appointments.get('error'):
-                return existing_appointments
+            # 2. Agendamentos existentes só são buscados no fallback interno de _calculate_available_slots
+            #    (a disponibilidade vem da agenda do dia em cache)
             
             # 3. Calcular slots disponíveis considerando duração real
             # 3.1 Tentar obter janelas reais de trabalho e ajustar working_hours
@@ -594,7 +848,7 @@ class TrinksIntelligentTools:
             detailed = self._calculate_available_slots(
                 data,
                 service_duration,
-                existing_appointments.get('appointments', []),
+                None,
                 avail_rules,
                 empresa_config, # Passar a configuração da empresa para o cálculo
                 professional_id=professional_id,
@@ -745,78 +999,17 @@ class TrinksIntelligentTools:
 
     def list_appointments_range(self, start_iso: str, end_iso: str, empresa_config: Dict[str, Any]) -> Dict[str, Any]:
         """Lista agendamentos no intervalo [start, end).
-        Preferência: chamada única com dataInicio/dataFim; fallback: por dia."""
+        Range nativo paginado (páginas em paralelo); fallback: dias em paralelo.
+        Ver services.appointment_range (que também entrega os agendamentos como gerador)."""
         try:
-            import requests
-            from datetime import datetime, timedelta
-            if dtparser is None:
-                raise RuntimeError("dateutil não disponível para parsing de datas")
-
-            safe_base_url = (
-                empresa_config.get('trinks_base_url')
-                or (empresa_config.get('trinks_config', {}) or {}).get('base_url')
-                or 'https://api.trinks.com/v1'
-            )
-            headers = {
-                'X-API-KEY': empresa_config.get("trinks_api_key", ""),
-                'estabelecimentoId': empresa_config.get('trinks_estabelecimento_id', ''),
-                'Content-Type': 'application/json',
-                'Accept': 'application/json'
-            }
-
-            # 1) Tentar range nativo
-            params = {
-                'dataInicio': start_iso,
-                'dataFim': end_iso
-            }
-            resp = requests.get(f"{safe_base_url}/agendamentos", headers=headers, params=params, timeout=30)
-            if resp.status_code == 200:
-                payload = resp.json() if resp.content else {}
-                data_list = (payload or {}).get('data', [])
-                return {'success': True, 'data': data_list}
-            logger.warning(f"Trinks range fetch dataInicio/dataFim -> {resp.status_code}; fallback por dia")
-
-            # 2) Fallback: por dia + filtro por horário
-            start_dt = dtparser.isoparse(start_iso)
-            end_dt = dtparser.isoparse(end_iso)
-            def _ensure_aware(dt):
-                try:
-                    if dt.tzinfo is None or dt.tzinfo.utcoffset(dt) is None:
-                        tzinfo = dttz.gettz('America/Sao_Paulo') if dttz else None
-                        if tzinfo is not None:
-                            return dt.replace(tzinfo=tzinfo)
-                except Exception:
-                    pass
-                return dt
-            start_dt = _ensure_aware(start_dt)
-            end_dt = _ensure_aware(end_dt)
-
-            day = start_dt
-            results = []
-            while day < end_dt:
-                day_str = day.strftime('%Y-%m-%d')
-                r = requests.get(f"{safe_base_url}/agendamentos", headers=headers, params={'data': day_str}, timeout=30)
-                if r.status_code == 200:
-                    for ap in (r.json() or {}).get('data', []) or []:
-                        inicio = ap.get('dataHoraInicio')
-                        if not inicio:
-                            continue
-                        try:
-                            ap_dt = _ensure_aware(dtparser.isoparse(inicio))
-                        except Exception:
-                            continue
-                        if start_dt <= ap_dt < end_dt:
-                            results.append(ap)
-                else:
-                    logger.warning(f"Trinks range day fetch {day_str} -> {r.status_code}")
-                day = day + timedelta(days=1)
-            return {'success': True, 'data': results}
+            from services.appointment_range import iter_appointments_range
+            return {'success': True, 'data': list(iter_appointments_range(empresa_config, start_iso, end_iso))}
         except Exception as e:
             logger.error(f"Erro em list_appointments_range: {e}")
             return {'success': False, 'error': str(e)}
     
     def _calculate_available_slots(self, data: str, service_duration: int, 
-                                  existing_appointments: List[Dict], 
+                                  existing_appointments: Optional[List[Dict]], 
                                   avail_rules: Dict[str, Any],
                                   empresa_config: Dict[str, Any],
                                   professional_id: Optional[str] = None,
@@ -854,7 +1047,12 @@ class TrinksIntelligentTools:
             start_hour = int(working_hours.get('start', '08:00').split(':')[0])
             end_hour = int(working_hours.get('end', '18:00').split(':')[0])
             
-            # Converter agendamentos existentes para horários ocupados
+            # Converter agendamentos existentes para horários ocupados (buscados só aqui, se não informados)
+            if existing_appointments is None:
+                existing = self._get_existing_appointments(data, empresa_config, professional_id)
+                if existing.get('error'):
+                    return {"available_slots": [], "matched_professional_id": professional_id, "error": existing['error']}
+                existing_appointments = existing.get('appointments', [])
             occupied_slots = self._convert_appointments_to_occupied_slots(existing_appointments)
             
             # Gerar slots de horário considerando duração real
@@ -941,8 +1139,8 @@ class TrinksIntelligentTools:
         try:
             # Obter regras de mapeamento das Rules
             from rules.trinks_rules import TrinksRules
-            rules = TrinksRules()
-            api_rules = rules.get_availability_check_rules_expanded()
+            rules = self.trinks_rules or TrinksRules()
+            api_rules = rules.get_availability_check_rules_expanded(self.empresa_config)
             mapping_rules = api_rules.get('api_response_mapping', {}).get('trinks_format', {})
             
             # Mapear campos conforme regras
@@ -1009,71 +1207,16 @@ class TrinksIntelligentTools:
             
             logger.info(f"🔍 Regras obtidas: {avail_rules.keys() if avail_rules else 'None'}")
             
-            # Endpoint para verificar disponibilidade
-            endpoint = avail_rules.get('api_endpoint', '/agendamentos/profissionais/{data}')
-            endpoint = endpoint.replace('{data}', data)
-            
-            # Parâmetros obrigatórios
-            params = {
-                'estabelecimentoId': empresa_config.get('trinks_estabelecimento_id') or empresa_config.get('estabelecimentoId')
-            }
-            
-            # CORREÇÃO: Enviar apenas os parâmetros necessários
-            # A API Trinks aceita apenas estabelecimentoId como obrigatório
-            # Os outros são filtros opcionais
-            if professional_id:
-                params['profissionalId'] = professional_id
-            if service_id:
-                params['servicoId'] = service_id
-            
-            # NÃO enviar 'data' como parâmetro - ela já está na URL
-            # params['data'] = data  # ← REMOVIDO
-            
-            # LOGS DETALHADOS PARA DEBUG
-            logger.info(f"🔍 ===== DEBUG ENDPOINT =====")
-            logger.info(f"🔍 Regras obtidas: {avail_rules}")
-            logger.info(f"🔍 api_endpoint das regras: {avail_rules.get('api_endpoint', 'NÃO DEFINIDO')}")
-            logger.info(f"🔍 Endpoint final: {endpoint}")
-            logger.info(f"🔍 Base URL: {empresa_config.get('trinks_base_url') or empresa_config.get('trinks_config', {}).get('base_url', 'NÃO DEFINIDO')}")
-            logger.info(f"🔍 URL completa: {(empresa_config.get('trinks_base_url') or empresa_config.get('trinks_config', {}).get('base_url', '')) + endpoint}")
-            logger.info(f"🔍 Params: {params}")
-            logger.info(f"🔍 =========================")
-            
-            # Fazer chamada para API Trinks
-            logger.info(f"🔍 Chamando API Trinks: {endpoint} com params: {params}")
-            logger.info(f"🔍 Tipo de chamada: GET com query parameters")
-            
-            result = self.api_tools.call_api(
-                api_name="Trinks",
-                endpoint_path=endpoint,
-                method="GET",
-                config=empresa_config.get('trinks_config', empresa_config),
-                **params
-            )
-            
-            logger.info(f"📡 Resposta da API Trinks: {result[:200]}...")
-            
-            # Processar resposta
-            if isinstance(result, str):
-                try:
-                    import json
-                    # Alguns chamadores retornam string com prefixo
-                    # "Sucesso na operação <API> <endpoint>: { ...json... }"
-                    if result.strip().startswith("Sucesso na operação"):
-                        brace_idx = result.find('{')
-                        if brace_idx != -1:
-                            result_json_str = result[brace_idx:]
-                            result_data = json.loads(result_json_str)
-                        else:
-                            logger.error("Resposta de sucesso sem corpo JSON")
-                            return {"available_slots": [], "matched_professional_id": None}
-                    else:
-                        result_data = json.loads(result)
-                except Exception as _:
-                    logger.error("Falha ao fazer parse da resposta JSON da API Trinks")
-                    return {"available_slots": [], "matched_professional_id": None}
-            else:
-                result_data = result
+            # Agenda do dia (/agendamentos/profissionais/{data}?servicoId=...) via services/availability_cache:
+            # reaproveita o prefetch especulativo do turno (ou a busca em andamento).
+            # O serviço é filtrado pela API (cache por serviço); o profissional, localmente.
+            from services.availability_cache import get_day
+            day = get_day(empresa_config, data, professional_id, service_id)
+            if day is None:
+                logger.warning(f"Agenda de {data} indisponível na API Trinks")
+                return {"available_slots": [], "matched_professional_id": None}
+            result_data = {'data': day}
+            logger.info(f"📅 Agenda de {data}: {len(result_data['data'])} profissionais (profissional={professional_id}, serviço={service_id})")
             
             # Extrair horários disponíveis
             available_slots = []
@@ -1249,7 +1392,7 @@ class TrinksIntelligentTools:
             
             # Obter regras de criação de reserva
             reservation_rules = self.trinks_rules.get_reservation_creation_rules()
-            if not reservation_rules:
+            if not reservation_rules or 'api_endpoint' not in reservation_rules:
                 return {"error": "Regras de criação de reserva não configuradas"}
             
             # Validar campos obrigatórios
@@ -1497,12 +1640,7 @@ class TrinksIntelligentTools:
             logger.info(f"📊 Lista de profissionais recebida: {len(profissionais_list)} profissionais")
             logger.info(f"🔍 Tipo da lista: {type(profissionais_list)}")
             
-            # Log detalhado de cada profissional na lista
-            if profissionais_list:
-                logger.info(f"📋 Profissionais disponíveis para match:")
-                for i, prof in enumerate(profissionais_list):
-                    logger.info(f"   {i+1}. {prof}")
-            else:
+            if not profissionais_list:
                 logger.warning(f"⚠️ LISTA DE PROFISSIONAIS VAZIA!")
             
             # Verificar se é API Trinks
@@ -1511,256 +1649,125 @@ class TrinksIntelligentTools:
                 return {"error": "API Trinks não está ativa para esta empresa"}
             
             # Obter regras de match
-            match_rules = self.trinks_rules.get_intelligent_match_rules()
+            match_rules = self.trinks_rules.get_intelligent_match_rules(empresa_config)
             if not match_rules:
                 logger.error(f"❌ Regras de match não configuradas")
                 return {"error": "Regras de match não configuradas"}
             
-            # Prompt LLM para match de profissional
-            prompt = f"""Você é um assistente especializado em identificar profissionais de saúde no sistema Trinks.
-
-TAREFA: Identificar qual profissional da lista corresponde ao nome mencionado pelo usuário.
-
-NOME PROCURADO: "{nome_procurado}"
-
-LISTA DE PROFISSIONAIS DISPONÍVEIS:
-{profissionais_list}
-
-CARACTERÍSTICAS DO TRINKS:
-- Profissionais podem ter apelidos ou nomes abreviados
-- Especialidades são importantes para identificação
-- Nomes podem ter variações de acentuação
-- Sistema brasileiro com nomes em português
-
-REGRAS CRÍTICAS:
-1. NUNCA invente IDs, nomes ou dados que não existam na lista
-2. SEMPRE use APENAS dados reais da lista fornecida
-3. Se não encontrar match, retorne null para id e nome
-4. NUNCA crie profissionais fictícios
-
-INSTRUÇÕES:
-1. Analise o nome procurado e compare com a lista
-2. Considere variações, apelidos e especialidades
-3. Retorne o profissional com maior confiança de match
-4. Se houver ambiguidade, escolha o mais provável
-5. Se não encontrar match, retorne null (não invente dados)
-
-FORMATAÇÃO OBRIGATÓRIA:
-- NUNCA use prefixos como "System:", "Resposta:", "JSON:", etc.
-- NUNCA adicione texto explicativo antes ou depois do JSON
-- NUNCA use aspas duplas no texto, apenas no JSON
-- NUNCA invente dados - use apenas os dados reais da lista
-
-EXEMPLO DE RESPOSTA CORRETA:
-{{
-    "id": "12345",
-    "nome": "Dr. João Silva",
-    "confianca": "ALTA",
-    "razao": "Nome exato encontrado na lista"
-}}
-
-EXEMPLO DE RESPOSTA INCORRETA:
-System: {{
-    "id": "12345",
-    "nome": "Dr. João Silva",
-    "confianca": "ALTA",
-    "razao": "Nome exato encontrado na lista"
-}}
-
-IMPORTANTE: 
-- RESPONDA APENAS o JSON, sem "System:", sem "Resposta:", sem nenhum prefixo
-- O JSON deve começar diretamente com {{ e terminar com }}
-- Se usar qualquer prefixo, a resposta será inválida e causará erro
-- NUNCA invente dados - use apenas os dados reais da lista
-
-FORMATO DE RESPOSTA (JSON):
-{{
-    "id": "ID_REAL_DA_LISTA ou null",
-    "nome": "NOME_REAL_DA_LISTA ou null",
-    "confianca": "ALTA|MEDIA|BAIXA",
-    "razao": "Explicação do match considerando características do Trinks"
-}}
-
-RESPONDA APENAS o JSON acima, sem nenhum texto adicional, sem aspas, sem prefixos."""
+            # Prompt LLM para match de profissional: instruções + catálogo (fixos por versão do catálogo)
+            versao_catalogo = catalog_version(profissionais_list, PROFESSIONAL_CATALOG_FIELDS)
+            prompt = render(
+                'trinks_tools.match_professional',
+                versao_catalogo,
+                lambda: {'catalogo': render_catalog(profissionais_list, PROFESSIONAL_CATALOG_FIELDS)}
+            )
 
-            # Log do prompt sendo enviado para o LLM
+            # Log do prompt sendo enviado para o LLM (só tamanho e versão do catálogo)
             logger.info(f"📝 PROMPT enviado para o LLM:")
             logger.info(f"   Nome procurado: '{nome_procurado}'")
-            logger.info(f"   Lista de profissionais: {profissionais_list}")
+            logger.info(f"   Catálogo de profissionais: {len(profissionais_list)} itens (versão {versao_catalogo})")
             
             # Obter LLM configurado
-            llm = self._get_llm(empresa_config)
+            llm = self._get_llm(empresa_config, MATCHING)
             
             # Construir mensagens para o LLM
             messages = [
                 SystemMessage(content=prompt),
-                HumanMessage(content=f"Encontre o profissional mais adequado para: {nome_procurado}")
+                HumanMessage(content=render('trinks_tools.match_request', alvo='profissional', nome_procurado=nome_procurado))
             ]
             
             # Log das mensagens sendo enviadas
             logger.info(f"💬 Mensagens enviadas para o LLM: {len(messages)} mensagens")
             
-            # Chamar LLM
-            logger.info(f"🤖 Chamando LLM para match de profissional...")
-            response = llm.invoke(messages)
-            
-            # Log da resposta bruta do LLM
-            logger.info(f"📡 Resposta bruta do LLM: {type(response)}")
-            logger.info(f"📡 Conteúdo da resposta: {response}")
-            
-            # Processar resposta - o LLM pode retornar string diretamente ou objeto
-            response_text = response.content if hasattr(response, 'content') else str(response)
-            logger.info(f"📝 Texto extraído da resposta: '{response_text}'")
-            
-            try:
-                import json
-                logger.info(f"🔍 Tentando fazer parse JSON da resposta...")
-                match_result = json.loads(response_text.strip())
-                logger.info(f"✅ Parse JSON bem-sucedido: {match_result}")
-                
-                # VALIDAÇÃO: Verificar se os dados são reais
-                logger.info(f"🔍 Iniciando validação do resultado...")
-                match_result = self._validate_match_result(match_result, profissionais_list, "profissional")
-                logger.info(f"✅ Validação concluída: {match_result}")
-                
-                logger.info(f"✅ Match de profissional via LLM: {match_result}")
-                return match_result
-            except json.JSONDecodeError as json_error:
-                logger.warning(f"⚠️ Resposta do LLM não é JSON válido: {response_text}")
-                logger.warning(f"⚠️ Erro JSON: {json_error}")
-                # Fallback para match local
-                logger.info(f"🔄 Usando fallback para match local...")
-                return self._fallback_match_professional(nome_procurado, profissionais_list, match_rules)
-            
-        except Exception as e:
-            logger.error(f"❌ Erro no match inteligente de profissional: {e}")
-            logger.error(f"❌ Tipo do erro: {type(e)}")
-            import traceback
-            logger.error(f"❌ Stack trace: {traceback.format_exc()}")
-            return {"error": f"Erro no match: {str(e)}"}
-    
-    def intelligent_match_service(self, nome_procurado: str, servicos_list: List[Dict[str, Any]], empresa_config: Dict[str, Any]) -> Dict[str, Any]:
-        """
-        Faz match inteligente de serviço usando LLM com apenas nomes (solução simples)
-        Args:
-            nome_procurado: Nome do serviço procurado
-            servicos_list: Lista de serviços disponíveis
-            empresa_config: Configuração da empresa
-        Returns:
-            Dict com resultado do match
-        """
-        try:
-            # Verificar se é API Trinks
-            if not self._is_trinks_api(empresa_config):
-                return {"error": "API Trinks não está ativa para esta empresa"}
-            
-            # SOLUÇÃO SIMPLES: Extrair apenas nomes para o LLM
-            nomes_servicos = [servico.get('nome', '') for servico in servicos_list if servico.get('nome')]
-            logger.info(f"🔍 Enviando {len(nomes_servicos)} nomes de serviços para o LLM")
-            
-            # Prompt LLM para match de serviço (apenas com nomes)
-            prompt = f"""Você é um assistente especializado em identificar serviços de saúde no sistema Trinks.
-
-TAREFA: Identificar qual serviço da lista corresponde ao nome mencionado pelo usuário.
-
-NOME PROCURADO: "{nome_procurado}"
-
-LISTA DE NOMES DE SERVIÇOS DISPONÍVEIS:
-{nomes_servicos}
-
-INSTRUÇÕES:
-1. Analise o nome procurado e identifique palavras-chave
-2. Procure por serviços que contenham essas palavras-chave
-3. Considere correspondências parciais
-4. SEMPRE tente encontrar um match, mesmo que não seja perfeito
-
-REGRAS CRÍTICAS:
-1. NUNCA invente nomes que não existam na lista
-2. Use correspondência parcial - não exija match exato
-3. Se não encontrar match, retorne null para nome
-4. NUNCA crie serviços fictícios
-
-FORMATAÇÃO OBRIGATÓRIA:
-- NUNCA use prefixos como "System:", "Resposta:", "JSON:", etc.
-- NUNCA adicione texto explicativo antes ou depois do JSON
-- NUNCA use aspas duplas no texto, apenas no JSON
-- NUNCA invente dados - use apenas os dados reais da lista
-
-EXEMPLO DE RESPOSTA CORRETA:
-{{
-    "nome": "AAA TEste",
-    "confianca": "ALTA",
-    "razao": "Match exato encontrado na lista"
-}}
-
-EXEMPLO DE RESPOSTA INCORRETA:
-System: {{
-    "nome": "AAA TEste",
-    "confianca": "ALTA",
-    "razao": "Match exato encontrado na lista"
-}}
-
-IMPORTANTE: 
-- RESPONDA APENAS o JSON, sem "System:", sem "Resposta:", sem nenhum prefixo
-- O JSON deve começar diretamente com {{ e terminar com }}
-- Se usar qualquer prefixo, a resposta será inválida e causará erro
-- NUNCA invente dados - use apenas os dados reais da lista
-
-FORMATO DE RESPOSTA (JSON):
-{{
-    "nome": "NOME_REAL_DA_LISTA ou null",
-    "confianca": "ALTA|MEDIA|BAIXA",
-    "razao": "Explicação do match"
-}}
-
-RESPONDA APENAS o JSON acima, sem nenhum texto adicional, sem aspas, sem prefixos."""
+            # Chamar LLM (objeto JSON validado contra o schema de match)
+            logger.info(f"🤖 Chamando LLM para match de profissional...")
+            response = llm.invoke(messages, **JSON_MODE)
+            logger.info(f"📡 Conteúdo da resposta: {getattr(response, 'content', response)}")
+            
+            parsed = parse('trinks_tools.match_professional', response, MatchResult)
+            if parsed is None:
+                # Fallback para match local
+                logger.info(f"🔄 Usando fallback para match local...")
+                record_fallback('trinks_tools.match_professional')
+                return self._fallback_match_professional(nome_procurado, profissionais_list, match_rules)
+            
+            # VALIDAÇÃO: Verificar se os dados são reais
+            match_result = self._validate_match_result(dump(parsed), profissionais_list, "profissional")
+            logger.info(f"✅ Match de profissional via LLM: {match_result}")
+            return match_result
+            
+        except Exception as e:
+            logger.error(f"❌ Erro no match inteligente de profissional: {e}")
+            logger.error(f"❌ Tipo do erro: {type(e)}")
+            import traceback
+            logger.error(f"❌ Stack trace: {traceback.format_exc()}")
+            return {"error": f"Erro no match: {str(e)}"}
+    
+    def intelligent_match_service(self, nome_procurado: str, servicos_list: List[Dict[str, Any]], empresa_config: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Faz match inteligente de serviço usando LLM com apenas nomes (solução simples)
+        Args:
+            nome_procurado: Nome do serviço procurado
+            servicos_list: Lista de serviços disponíveis
+            empresa_config: Configuração da empresa
+        Returns:
+            Dict com resultado do match
+        """
+        try:
+            # Verificar se é API Trinks
+            if not self._is_trinks_api(empresa_config):
+                return {"error": "API Trinks não está ativa para esta empresa"}
+            
+            # SOLUÇÃO SIMPLES: Extrair apenas nomes para o LLM
+            logger.info(f"🔍 Enviando {sum(1 for s in servicos_list if s.get('nome'))} nomes de serviços para o LLM")
+            
+            # Prompt LLM para match de serviço (apenas com nomes; fixo por versão do catálogo)
+            prompt = render(
+                'trinks_tools.match_service',
+                catalog_version(servicos_list, SERVICE_NAME_FIELDS),
+                lambda: {'catalogo': render_catalog(servicos_list, SERVICE_NAME_FIELDS)}
+            )
 
             # Obter LLM configurado
-            llm = self._get_llm(empresa_config)
+            llm = self._get_llm(empresa_config, MATCHING)
             
             # Construir mensagens para o LLM
             messages = [
                 SystemMessage(content=prompt),
-                HumanMessage(content=f"Encontre o serviço mais adequado para: {nome_procurado}")
+                HumanMessage(content=render('trinks_tools.match_request', alvo='serviço', nome_procurado=nome_procurado))
             ]
             
-            # Chamar LLM
-            response = llm.invoke(messages)
+            # Chamar LLM (objeto JSON validado contra o schema de match)
+            response = llm.invoke(messages, **JSON_MODE)
+            parsed = parse('trinks_tools.match_service', response, MatchResult)
+            if parsed is None:
+                record_fallback('trinks_tools.match_service')
+                return {"error": "Resposta do LLM não é JSON válido"}
+            match_result = dump(parsed)
             
-            # Processar resposta
-            response_text = response.content if hasattr(response, 'content') else str(response)
+            # BUSCAR SERVIÇO COMPLETO pelo nome retornado
+            if match_result.get('nome'):
+                nome_encontrado = match_result.get('nome')
+                for servico in servicos_list:
+                    if servico.get('nome') == nome_encontrado:
+                        # ✅ CORRIGIDO: Retornar serviço completo com TODOS os campos
+                        resultado_final = {
+                            "id": servico.get('id'),
+                            "nome": servico.get('nome'),
+                            "confianca": match_result.get('confianca', 'ALTA'),
+                            "razao": match_result.get('razao', 'Match encontrado'),
+                            "match_type": "llm_with_names",
+                            "duracaoEmMinutos": servico.get('duracaoEmMinutos'),  # ✅ NOVO: Duração do serviço
+                            "preco": servico.get('preco'),  # ✅ NOVO: Preço do serviço
+                            "categoria": servico.get('categoria'),  # ✅ NOVO: Categoria do serviço
+                            "descricao": servico.get('descricao')  # ✅ NOVO: Descrição do serviço
+                        }
+                        logger.info(f"✅ Match de serviço via LLM: {resultado_final}")
+                        return resultado_final
             
-            try:
-                import json
-                match_result = json.loads(response_text.strip())
-                
-                # BUSCAR SERVIÇO COMPLETO pelo nome retornado
-                if match_result.get('nome'):
-                    nome_encontrado = match_result.get('nome')
-                    for servico in servicos_list:
-                        if servico.get('nome') == nome_encontrado:
-                            # ✅ CORRIGIDO: Retornar serviço completo com TODOS os campos
-                            resultado_final = {
-                                "id": servico.get('id'),
-                                "nome": servico.get('nome'),
-                                "confianca": match_result.get('confianca', 'ALTA'),
-                                "razao": match_result.get('razao', 'Match encontrado'),
-                                "match_type": "llm_with_names",
-                                "duracaoEmMinutos": servico.get('duracaoEmMinutos'),  # ✅ NOVO: Duração do serviço
-                                "preco": servico.get('preco'),  # ✅ NOVO: Preço do serviço
-                                "categoria": servico.get('categoria'),  # ✅ NOVO: Categoria do serviço
-                                "descricao": servico.get('descricao')  # ✅ NOVO: Descrição do serviço
-                            }
-                            logger.info(f"✅ Match de serviço via LLM: {resultado_final}")
-                            return resultado_final
-                
-                # Se não encontrou o serviço completo
-                logger.warning(f"⚠️ Nome retornado pelo LLM não encontrado na lista: {match_result.get('nome')}")
-                return {"error": "Nome retornado pelo LLM não encontrado na lista"}
-                
-            except json.JSONDecodeError:
-                logger.warning(f"⚠️ Resposta do LLM não é JSON válido: {response_text}")
-                return {"error": "Resposta do LLM não é JSON válido"}
+            # Se não encontrou o serviço completo
+            logger.warning(f"⚠️ Nome retornado pelo LLM não encontrado na lista: {match_result.get('nome')}")
+            return {"error": "Nome retornado pelo LLM não encontrado na lista"}
             
         except Exception as e:
             logger.error(f"Erro no match inteligente de serviço: {e}")
@@ -1783,7 +1790,7 @@ RESPONDA APENAS o JSON acima, sem nenhum texto adicional, sem aspas, sem prefixo
                 return {"error": "API Trinks não está ativa para esta empresa"}
             
             # ✅ OBTER REGRAS de extração (seguindo arquitetura)
-            extraction_rules = self.trinks_rules.get_data_extraction_rules()
+            extraction_rules = self.trinks_rules.get_data_extraction_rules(empresa_config)
             if not extraction_rules:
                 return {"error": "Regras de extração não configuradas"}
             
@@ -1791,154 +1798,40 @@ RESPONDA APENAS o JSON acima, sem nenhum texto adicional, sem aspas, sem prefixo
             conversation_history = context.get('conversation_history', [])
             logger.info(f"📚 Histórico recebido para extração: {len(conversation_history)} mensagens")
             
-            # ✅ CONSTRUIR PROMPT INTELIGENTE com histórico completo (mensagem atual PRIORITÁRIA)
-            prompt = f"""Você é um assistente especializado em extrair informações de mensagens de WhatsApp para agendamento no sistema Trinks.
-
-⚠️ REGRA CRÍTICA: Você DEVE responder APENAS com o JSON puro, sem repetir o histórico, sem explicações, sem texto adicional.
-
-CONTEXTO ATUAL: Hoje é {datetime.now().strftime('%d/%m/%Y')} (DD/MM/YYYY)
-
-DADOS JÁ EXTRAÍDOS ANTERIORMENTE:
-{self._format_extracted_data_context(context.get('extracted_data', {}))}
-
-HISTÓRICO COMPLETO DA CONVERSA:
-{self._format_conversation_history(conversation_history)}
-
-MENSAGEM ATUAL: "{message}"
-
-CAMPOS PARA EXTRAIR:
-- profissional: Nome do profissional mencionado (deve existir no Trinks)
-- procedimento: Nome do procedimento/tratamento (deve existir no Trinks)
-- data: Data mencionada (formato YYYY-MM-DD, SEMPRE futura, mínimo 2h de antecedência)
-- horario: Horário mencionado (formato HH:MM, dentro do horário de funcionamento)
-- servico_id: ID do serviço mencionado (deve existir no Trinks)
-- profissional_id: ID do profissional mencionado (deve existir no Trinks)
-- cpf: CPF do cliente mencionado
-- client_id: ID do cliente mencionado (deve existir no Trinks)
-- nome: Nome que o cliente informou no whatsapp
-- email: Email que o cliente informou no whatsapp
-
-REGRAS CRÍTICAS DE PRIORIDADE E CONTEXTO:
-1. ✅ A MENSAGEM ATUAL TEM PRIORIDADE sobre qualquer dado do histórico/cache
-2. ✅ Se a mensagem atual mencionar nova data, use ESSA nova data e mantenha os demais campos do contexto
-3. ✅ Se a mensagem atual mencionar novo horário, use ESSE novo horário e mantenha os demais campos do contexto
-4. ✅ Se a mensagem atual mencionar novo profissional, use ESSE novo profissional e mantenha os demais campos do contexto
-5. ✅ Se a mensagem atual mencionar novo procedimento, use ESSE novo procedimento e mantenha os demais campos do contexto
-6. ✅ Use o histórico apenas para preencher campos NÃO mencionados na mensagem atual
-
-REGRAS ESPECÍFICAS PARA EXTRAÇÃO DE NOMES:
-1. 🔍 Se a mensagem contém APENAS um nome (ex: "Ruan Gimenes Hey"), SEMPRE extraia como nome do cliente
-2. 🔍 Se a mensagem contém frases como "meu nome é", "sou", "chamo-me", extraia o nome
-3. 🔍 Nomes podem ter 1, 2, 3 ou mais palavras - preserve a formatação original
-4. 🔍 Se a mensagem não contém contexto de agendamento, mas contém nomes, extraia como nome do cliente
-5. 🔍 Preserve acentos, espaços e formatação original dos nomes
-
-EXEMPLOS DE PRIORIDADE DA MENSAGEM ATUAL:
-- Histórico: "procedimento: AAA TESTE, data: 29/08, servico_id: 1234567890, profissional_id: 1234567890"
-- Nova mensagem: "E para dia 01/09?"
-- Resultado: {{"procedimento": "AAA TESTE", "data": "2025-09-01"}} ← PROCEDIMENTO PRESERVADO!
-- servico_id: 1234567890
-- profissional_id: 1234567890
-
-- Histórico: "procedimento: AAA TESTE, data: 29/08, profissional: Maria"
-- Nova mensagem: "E às 15h?"
-- Resultado: {{"procedimento": "AAA TESTE", "data": "2025-08-29", "profissional": "Maria", "horario": "15:00"}} ← TUDO PRESERVADO!
-
-- Histórico: "profissional: Amabile, procedimento: AAA TESTE, data: 29/08, servico_id: 1234567890, profissional_id: 1234567890"
-- Nova mensagem: "troca para a Geraldine dia 01/09"
-- Resultado: {{"profissional": "Geraldine", "procedimento": "AAA TESTE", "data": "2025-09-01", "servico_id": "1234567890", "profissional_id": novo id baseado na busca}} ← NOVOS CAMPOS DA MENSAGEM ATUAL PRIORITÁRIOS!
-
-EXEMPLOS ESPECÍFICOS DE EXTRAÇÃO DE NOMES:
-- Mensagem: "Meu nome é João Silva" → {{"nome": "João Silva"}}
-- Mensagem: "Sou a Maria Santos" → {{"nome": "Maria Santos"}}
-- Mensagem: "Ruan Gimenes Hey" → {{"nome": "Ruan Gimenes Hey"}}
-- Mensagem: "Ana Paula Costa" → {{"nome": "Ana Paula Costa"}}
-- Mensagem: "Carlos Eduardo" → {{"nome": "Carlos Eduardo"}}
-- Mensagem: "João" → {{"nome": "João"}}
-- Mensagem: "Maria" → {{"nome": "Maria"}}
-
-REGRAS PARA EXTRAÇÃO DE NOMES:
-1. Se a mensagem contém APENAS um nome (sem contexto de agendamento), extraia como nome do cliente
-2. Se a mensagem contém "meu nome é", "sou", "chamo-me", extraia como nome do cliente
-3. Se a mensagem contém apenas palavras que parecem nomes próprios, extraia como nome do cliente
-4. Nomes podem ter 1, 2, 3 ou mais palavras (ex: "João", "João Silva", "João Silva Santos")
-5. Preserve acentos e formatação original do nome
-
-EXEMPLOS ESPECÍFICOS DE EXTRAÇÃO DE CPF:
-- Mensagem: "Meu CPF é 123.456.789-00" → {{"cpf": "12345678900"}}
-- Mensagem: "CPF 987.654.321-00" → {{"cpf": "98765432100"}}
-- Mensagem: "05286655963" → {{"cpf": "05286655963"}}
-
-EXEMPLOS ESPECÍFICOS DE EXTRAÇÃO DE EMAIL:
-- Mensagem: "meu email é joao@email.com" → {{"email": "joao@email.com"}}
-- Mensagem: "maria.santos@gmail.com" → {{"email": "maria.santos@gmail.com"}}
-
-INSTRUÇÕES:
-1. Analise TODAS as mensagens do histórico em ordem cronológica
-2. Identifique o contexto estabelecido (procedimento, profissional, etc.)
-3. Preserve esse contexto APENAS onde a mensagem atual NÃO trouxe novos valores ou nao tiver conectado (Ex: Profissional ID e profissioanl | Servico ID e servico)
-4. Atualize campos que foram explicitamente mencionados na mensagem atual (data/profissional/procedimento/horário)
-5. Use o histórico para preencher somente campos ausentes na mensagem atual
-6. NUNCA em hipotee alguma inclua algo a mais na sua saida que não seja o JSON puro assim como tem nas regras de formatação
-
-REGRAS DE VALIDAÇÃO:
-1. DATAS: SEMPRE devem ser FUTURAS em relação à data atual
-2. Se a mensagem mencionar "dia 29/08", interprete como "29/08/2025" (ano atual)
-3. Se a data mencionada for passada, use null
-4. PROCEDIMENTOS: SEMPRE extraia o nome mencionado, mesmo com erros de digitação
-5. Se mencionar "AAA TEste", extraia exatamente isso como procedimento
-
-FORMATAÇÃO OBRIGATÓRIA:
-- NUNCA use prefixos como "System:", "Resposta:", "JSON:", "Human:", etc.
-- NUNCA adicione texto explicativo antes ou depois do JSON
-- NUNCA use aspas duplas no texto, apenas no JSON
-- SEMPRE extraia procedimentos mencionados, mesmo com erros de digitação
-- NUNCA repita a mensagem do usuário
-- NUNCA adicione "Human:" ou qualquer prefixo
-- NUNCA inclua o histórico da conversa na resposta
-
-EXEMPLO DE RESPOSTA CORRETA:
-{{
-    "profissional": "Maria",
-    "procedimento": "AAA TESTE", 
-    "data": "2025-09-01",
-    "horario": null,
-    "servico_id": "1234567890",
-    "profissional_id": "1234567890"
-}}
-
-IMPORTANTE: 
-- RESPONDA APENAS o JSON, sem "System:", sem "Resposta:", sem nenhum prefixo
-- O JSON deve começar diretamente com {{ e terminar com }}
-- SEMPRE preserve o contexto da conversa anterior
-- NUNCA perca informações já estabelecidas
-- NUNCA repita o histórico da conversa
-- NUNCA adicione texto explicativo
-- NUNCA inclua a mensagem do usuário
-- APENAS o JSON puro, nada mais
-
-FORMATO DE RESPOSTA (JSON):
-{{
-    "profissional": "nome ou null",
-    "procedimento": "nome ou null", 
-    "data": "YYYY-MM-DD ou null",
-    "horario": "HH:MM ou null"
-}}
-
-RESPONDA APENAS o JSON acima, sem nenhum texto adicional, sem aspas, sem prefixos."""
+            # ✅ PROMPT EM CAMADAS: instruções fixas → histórico → dados do turno → mensagem atual
+            from services.prompt_builder import PromptBuilder, STATIC, TURN, record_usage
+            builder = PromptBuilder('trinks_tools.extract_data')
+            builder.add(STATIC, DATA_EXTRACTION_INSTRUCTIONS)
+            # Datas/horários resolvidos localmente vão como fatos (o LLM não converte datas)
+            from services.temporal_parser import parse_temporal, temporal_facts, apply_temporal_facts
+            temporal = parse_temporal(message)
+            builder.add(TURN, temporal_facts(temporal))
+            builder.add(TURN, self._format_extracted_data_context(context.get('extracted_data', {})),
+                        title="DADOS JÁ EXTRAÍDOS ANTERIORMENTE", max_tokens=500)
+            builder.add(TURN, f'MENSAGEM ATUAL: "{message}"')
 
             # Obter LLM configurado
-            llm = self._get_llm(empresa_config)
+            llm = self._get_llm(empresa_config, EXTRACTION)
             
-            # ✅ ADICIONAR HISTÓRICO da conversa para o LLM
-            conversation_history = context.get('conversation_history', [])
-            logger.info(f"📚 Histórico recebido para extração: {len(conversation_history)} mensagens")
+            # Construir mensagens para o LLM: o prefixo fixo vem primeiro
+            messages = [SystemMessage(content=builder.build([STATIC]))]
             
-            # Construir mensagens para o LLM
-            messages = [
-                SystemMessage(content=prompt),
-                HumanMessage(content=message)
-            ]
+            # Resumo das mensagens antigas (as recentes vão literais logo abaixo)
+            if context.get('conversation_summary'):
+                messages.append(SystemMessage(content=f"RESUMO DA CONVERSA ANTERIOR:\n{context['conversation_summary']}"))
+            
+            # ✅ ADICIONAR HISTÓRICO como contexto para o LLM
+            if conversation_history:
+                # Adicionar mensagens do histórico como contexto
+                for msg in conversation_history:
+                    if hasattr(msg, 'type'):
+                        if msg.type == 'human':
+                            messages.append(HumanMessage(content=f"Histórico - Usuário: {msg.content}"))
+                        elif msg.type == 'ai':
+                            messages.append(AIMessage(content=f"Histórico - Bot: {msg.content}"))
+                    else:
+                        # Fallback para diferentes tipos de mensagem
+                        messages.append(HumanMessage(content=f"Histórico: {str(msg.content)}"))
 
             # Injetar previous_data (ids/estado atual) no contexto da extração
             try:
@@ -1962,20 +1855,8 @@ RESPONDA APENAS o JSON acima, sem nenhum texto adicional, sem aspas, sem prefixo
                     'nome': previous_data.get('nome'),
                     'email': previous_data.get('email')
                 }
-                messages.append(SystemMessage(content=f"ESTADO ATUAL (previous_data): {prev_summary}"))
-            
-            # ✅ ADICIONAR HISTÓRICO como contexto para o LLM
-            if conversation_history:
-                # Adicionar mensagens do histórico como contexto
-                for msg in conversation_history:
-                    if hasattr(msg, 'type'):
-                        if msg.type == 'human':
-                            messages.append(HumanMessage(content=f"Histórico - Usuário: {msg.content}"))
-                        elif msg.type == 'ai':
-                            messages.append(AIMessage(content=f"Histórico - Bot: {msg.content}"))
-                    else:
-                        # Fallback para diferentes tipos de mensagem
-                        messages.append(HumanMessage(content=f"Histórico: {str(msg.content)}"))
+                prev_summary = {k: v for k, v in prev_summary.items() if v is not None and v != ""}
+                builder.add(TURN, prev_summary, title="ESTADO ATUAL (previous_data)")
             
             # Injetar previous_data + extracted_data para validação de campos completos
             previous_data = (context or {}).get('previous_data', {}) if isinstance(context, dict) else {}
@@ -1997,36 +1878,34 @@ RESPONDA APENAS o JSON acima, sem nenhum texto adicional, sem aspas, sem prefixo
                 non_empty_fields = {k: v for k, v in current_summary.items() if v is not None and v != ""}
                 
                 if non_empty_fields:
-                    messages.append(SystemMessage(content=f"🗄️ ESTADO ATUAL (para decisão): {non_empty_fields}"))
+                    builder.add(TURN, non_empty_fields, title="🗄️ ESTADO ATUAL (para decisão)")
                     logger.info(f"📊 Estado enviado para LLM: {non_empty_fields}")
                 else:
-                    messages.append(SystemMessage(content="🗄️ ESTADO ATUAL: Nenhum dado coletado ainda"))
+                    builder.add(TURN, "🗄️ ESTADO ATUAL: Nenhum dado coletado ainda")
                     logger.info("📊 Estado enviado para LLM: Nenhum dado coletado ainda")
             
-            # Chamar LLM
-            response = llm.invoke(messages)
-            
-            # Processar resposta - o LLM pode retornar string diretamente ou objeto
-            response_text = response.content if hasattr(response, 'content') else str(response)
+            # Dados voláteis do turno ficam no fim, logo antes da mensagem atual
+            messages.append(SystemMessage(content=builder.build([TURN])))
+            messages.append(HumanMessage(content=message))
             
-            # ✅ LIMPEZA AUTOMÁTICA: Remover prefixos comuns do LLM
-            cleaned_response = self._clean_llm_response(response_text)
+            # Chamar LLM (objeto JSON validado contra o schema de extração)
+            response = llm.invoke(messages, **JSON_MODE)
+            record_usage('trinks_tools.extract_data', response, builder)
             
-            try:
-                import json
-                extracted_data = json.loads(cleaned_response.strip())
-                
-                # VALIDAÇÃO PÓS-EXTRAÇÃO
-                extracted_data = self._validate_extracted_data(extracted_data)
-                
-                logger.info(f"✅ Dados extraídos via LLM: {extracted_data}")
-                return extracted_data
-            except json.JSONDecodeError:
-                logger.warning(f"⚠️ Resposta do LLM não é JSON válido após limpeza: {cleaned_response}")
-                logger.warning(f"⚠️ Resposta original: {response_text}")
+            parsed = parse('trinks_tools.extract_data', response, ExtractedData)
+            if parsed is None:
                 # Fallback para extração local
+                record_fallback('trinks_tools.extract_data')
                 return self._fallback_extract_data(message, extraction_rules)
             
+            extracted_data = apply_temporal_facts(dump(parsed), temporal)
+            
+            # VALIDAÇÃO PÓS-EXTRAÇÃO
+            extracted_data = self._validate_extracted_data(extracted_data)
+            
+            logger.info(f"✅ Dados extraídos via LLM: {extracted_data}")
+            return extracted_data
+            
         except Exception as e:
             logger.error(f"Erro na extração de dados com LLM: {e}")
             return {"error": f"Erro na extração: {str(e)}"}
@@ -2131,7 +2010,7 @@ RESPOSTA: Retorne APENAS a intenção, sem aspas, sem texto adicional, sem prefi
             messages.append(HumanMessage(content=message))
             
             # Obter LLM configurado
-            llm = self._get_llm(empresa_config)
+            llm = self._get_llm(empresa_config, INTENT)
             
             # Chamar LLM
             response = llm.invoke(messages)
@@ -2254,7 +2133,11 @@ RESPOSTA: Retorne APENAS a intenção, sem aspas, sem texto adicional, sem prefi
                         extracted_data['procedimento'] = match.group(1).strip()
                         break
             
-            # TODO: Implementar extração de data e horário
+            # Data e horário pelo parser local
+            from services.temporal_parser import parse_temporal
+            temporal = parse_temporal(message)
+            extracted_data['data'] = temporal.get('data')
+            extracted_data['horario'] = temporal.get('horario')
             
             return extracted_data
             
@@ -2267,9 +2150,10 @@ RESPOSTA: Retorne APENAS a intenção, sem aspas, sem texto adicional, sem prefi
         """
         try:
             from datetime import datetime, timedelta
+            from services.temporal_parser import now_local
             
-            # Data atual
-            hoje = datetime.now()
+            # Data atual (fuso da empresa; hoje continua válido)
+            hoje = now_local().replace(hour=0, minute=0, second=0, microsecond=0)
             
             # Validar data
             if extracted_data.get('data'):
@@ -2440,6 +2324,20 @@ RESPOSTA: Retorne APENAS a intenção, sem aspas, sem texto adicional, sem prefi
         try:
             logger.info(f"🔍 Buscando cliente por CPF: {cpf}")
             
+            # Cliente já resolvido antes (cache de identidade) dispensa a busca na API
+            from services.client_identity import lookup as lookup_identity, remember as remember_identity
+            identidade = lookup_identity(empresa_config, cpf=cpf)
+            if identidade and identidade['fresh']:
+                logger.info(f"🪪 Cliente do cache de identidade: {identidade.get('nome')} (ID: {identidade['cliente_id']})")
+                return {
+                    "found": True,
+                    "cliente_id": identidade['cliente_id'],
+                    "nome": identidade.get('nome'),
+                    "cpf": identidade.get('cpf') or cpf,
+                    "from_cache": True,
+                    "verified_at": identidade['verified_at']
+                }
+            
             # Importar serviço Trinks
             from integrations.trinks_service import TrinksService
             trinks_service = TrinksService(empresa_config)
@@ -2453,12 +2351,12 @@ RESPOSTA: Retorne APENAS a intenção, sem aspas, sem texto adicional, sem prefi
             
             # ✅ API já retorna apenas clientes com o CPF específico
             clientes = response.get('data', [])
-            
-            if clientes and len(clientes) > 0:
-                cliente_encontrado = clientes[0]  # Primeiro resultado
+            cliente_encontrado = clientes[0] if clientes else None  # Primeiro resultado
             
             if cliente_encontrado:
                 logger.info(f"✅ Cliente encontrado: {cliente_encontrado.get('nome')} (ID: {cliente_encontrado.get('id')})")
+                remember_identity(empresa_config, cliente_encontrado.get('id'), cliente_encontrado.get('nome'),
+                                  cpf=cliente_encontrado.get('cpf') or cpf)
                 return {
                     "found": True,
                     "cliente_id": cliente_encontrado.get('id'),
@@ -2745,6 +2643,44 @@ RESPOSTA: Retorne APENAS a intenção, sem aspas, sem texto adicional, sem prefi
                 }
             }
 
+    def confirmar_presenca_agendamento(self, agendamento_id: str, empresa_config: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Confirma na API Trinks um agendamento existente (resposta "1" ao lembrete de confirmação)
+        Args:
+            agendamento_id: ID do agendamento
+            empresa_config: Configuração da empresa
+        Returns:
+            Dicionário com resultado da confirmação
+        """
+        try:
+            if not agendamento_id:
+                return {"success": False, "error": "ID do agendamento não informado"}
+            
+            logger.info(f"✅ Confirmando presença no agendamento {agendamento_id}")
+            
+            from integrations.trinks_service import TrinksService
+            trinks_service = TrinksService(empresa_config)
+            response = trinks_service.confirm_appointment(agendamento_id)
+            
+            if response.get('error'):
+                logger.error(f"❌ Erro ao confirmar agendamento: {response.get('error')}")
+                return {"success": False, "error": f"Erro na API: {response.get('error')}"}
+            
+            return {
+                "success": True,
+                "message": "Agendamento confirmado pelo cliente",
+                "agendamento_id": agendamento_id,
+                "cache_instructions": {
+                    "update_fields": {
+                        "status": "confirmado"
+                    }
+                }
+            }
+            
+        except Exception as e:
+            logger.error(f"❌ Erro ao confirmar agendamento: {e}")
+            return {"success": False, "error": str(e)}
+
     def criar_cliente(self, dados_cliente: Dict[str, Any], empresa_config: Dict[str, Any], waid: str) -> Dict[str, Any]:
         """
         Cria novo cliente na API Trinks usando telefone derivado do waid
@@ -2802,6 +2738,8 @@ RESPOSTA: Retorne APENAS a intenção, sem aspas, sem texto adicional, sem prefi
                 return {"success": False, "error": "Cliente criado mas sem ID retornado"}
             
             logger.info(f"✅ Cliente criado com sucesso: ID {cliente_id}")
+            from services.client_identity import remember as remember_identity
+            remember_identity(empresa_config, cliente_id, dados_cliente.get('nome'), cpf=dados_cliente.get('cpf'), waid=waid)
             return {
                 "success": True,
                 "cliente_id": cliente_id,
@@ -2991,40 +2929,6 @@ RESPOSTA: Retorne APENAS a intenção, sem aspas, sem texto adicional, sem prefi
         
         return f"DADOS JÁ EXTRAÍDOS ANTERIORMENTE: {json.dumps(relevant_data, indent=2)}"
 
-    def _clean_llm_response(self, response_text: str) -> str:
-        """Remove common prefixes and extracts only the JSON part from LLM responses"""
-        try:
-            # 1. Remover prefixos comuns
-            prefixes_to_remove = ["System:", "Resposta:", "JSON:", "Human:", "AI:", "Assistant:"]
-            for prefix in prefixes_to_remove:
-                if response_text.startswith(prefix):
-                    response_text = response_text[len(prefix):].strip()
-            
-            # 2. Procurar pelo primeiro { (início do JSON)
-            json_start = response_text.find('{')
-            if json_start != -1:
-                response_text = response_text[json_start:]
-            
-            # 3. Procurar pelo último } (fim do JSON)
-            json_end = response_text.rfind('}')
-            if json_end != -1:
-                response_text = response_text[:json_end + 1]
-            
-            # 4. Limpeza final
-            response_text = response_text.strip()
-            
-            # 5. Validar se é JSON válido
-            import json
-            json.loads(response_text)  # Teste se é válido
-            
-            logger.info(f"🧹 Resposta limpa com sucesso: {response_text[:100]}...")
-            return response_text
-            
-        except Exception as e:
-            logger.warning(f"⚠️ Erro na limpeza da resposta: {e}")
-            # Se falhar na limpeza, retornar original
-            return response_text
-
     def check_professional_availability_with_looping(self, data: str, service_id: str, empresa_config: Dict[str, Any], 
                                                    professional_id: str = None, max_attempts: int = 7) -> Dict[str, Any]:
         """
@@ -3137,69 +3041,34 @@ RESPOSTA: Retorne APENAS a intenção, sem aspas, sem texto adicional, sem prefi
             Serviço que melhor corresponde ao procedimento mencionado
         """
         try:
-            import json
-            
-            # Preparar contexto para o LLM
-            servicos_info = []
-            for serv in servicos:
-                servicos_info.append({
-                    "id": serv.get('id'),
-                    "nome": serv.get('nome'),
-                    "descricao": serv.get('descricao', ''),
-                    "categoria": serv.get('categoria', ''),
-                    "duracao": serv.get('duracaoEmMinutos'),
-                    "preco": serv.get('preco')
-                })
-            
-            # Prompt para o LLM
-            prompt = f"""
-            Você é um assistente especializado em fazer match entre procedimentos médicos mencionados e serviços cadastrados.
-            
-            PROCEDIMENTO MENCIONADO PELO USUÁRIO: "{procedimento_mencoado}"
-            
-            SERVIÇOS DISPONÍVEIS:
-            {json.dumps(servicos_info, indent=2, ensure_ascii=False)}
-            
-            INSTRUÇÕES:
-            1. Analise o procedimento mencionado pelo usuário
-            2. Compare com os serviços disponíveis
-            3. Identifique o serviço que melhor corresponde
-            4. Considere sinônimos, variações e abreviações
-            5. Retorne APENAS o JSON do serviço escolhido
-            
-            RESPOSTA (apenas JSON):
-            """
-            
-            # ✅ Usar o mesmo padrão que trinks_rules.py
-            from langchain_openai import ChatOpenAI
+            # Instruções + catálogo fixos por versão do catálogo; só o procedimento muda por chamada
+            prompt = render(
+                'trinks_tools.match_procedimento',
+                catalog_version(servicos, SERVICE_CATALOG_FIELDS),
+                lambda: {'catalogo': render_catalog(servicos, SERVICE_CATALOG_FIELDS)},
+                procedimento=procedimento_mencoado
+            )
             
             # Obter API key da configuração da empresa
-            api_key = (empresa_config or {}).get('openai_key') or (empresa_config or {}).get('openai_api_key')
-            if not api_key:
+            if not resolve_api_key(empresa_config):
                 logger.error("❌ OpenAI API key não encontrada na configuração da empresa")
                 return None
             
-            # Criar instância do LLM
-            llm = ChatOpenAI(api_key=api_key, temperature=0.1, model="gpt-4o")
+            # LLM de match (modelo pela política da empresa no gateway)
+            llm = get_llm(MATCHING, empresa_config, temperature=0.1)
             
             # Chamar LLM
             from langchain_core.messages import HumanMessage
-            response = llm.invoke([HumanMessage(content=prompt)])
-            response_text = getattr(response, 'content', str(response)) or ''
-            
-            # Limpar e parsear resposta
-            cleaned_response = self._clean_llm_response(response_text)
-            
-            try:
-                match_data = json.loads(cleaned_response)
-                # Encontrar o serviço correspondente na lista original
-                for serv in servicos:
-                    if serv.get('id') == match_data.get('id'):
-                        return serv
-            except Exception as e:
-                logger.warning(f"⚠️ Erro ao parsear resposta do LLM: {e}")
+            response = llm.invoke([HumanMessage(content=prompt)], **JSON_MODE)
+            parsed = parse('trinks_tools.match_procedimento', response, MatchResult)
+            if parsed is None:
                 return None
             
+            # Encontrar o serviço correspondente na lista original
+            for serv in servicos:
+                if str(serv.get('id')) == str(parsed.id):
+                    return serv
+            
             return None
             
         except Exception as e: